@@ -21,6 +21,7 @@ from case_management import (
     create_timeline_entry, generate_handoff_summary,
     PROTECTIVE_FACTORS, WARNING_SIGNS, SESSION_ACTIONS, REFERRAL_SERVICES
 )
+from services.principals import resolve_principal
 
 # Will be set by main server
 db = None
@@ -105,12 +106,7 @@ class ShareCaseRequest(BaseModel):
 
 async def get_user_with_role_check(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user and verify they're a counsellor, peer, or admin"""
-    user = await get_current_user(credentials)
-    # Convert User model to dict if necessary
-    if hasattr(user, 'dict'):
-        user = user.dict() if callable(user.dict) else dict(user)
-    elif hasattr(user, '__dict__'):
-        user = vars(user)
+    user = await resolve_principal(credentials.credentials, db)
     
     role = user.get("role", "")
     # Allow peers to access case management (for their own cases)
@@ -31,17 +31,21 @@ sys.path.insert(0, str(SCRIPT_DIR))
 def run_shift_reminders():
     """Run the shift reminders script"""
     print("[CRON] Running shift reminders...")
-    from scripts.shift_reminders import main
+    from scripts.shift_reminders import check_and_send_reminders
+    from services.database import close_client
     import asyncio
-    asyncio.run(main())
+    asyncio.run(check_and_send_reminders())
+    close_client()
     print("[CRON] Shift reminders completed")
 
 def run_data_retention():
     """Run the data retention/cleanup script"""
     print("[CRON] Running data retention cleanup...")
-    from scripts.data_retention import main
+    from scripts.data_retention import run_retention_cleanup
+    from services.database import close_client
     import asyncio
-    asyncio.run(main())
+    asyncio.run(run_retention_cleanup())
+    close_client()
     print("[CRON] Data retention completed")
 
 def main():
@@ -4,8 +4,17 @@ AES-256 encryption for sensitive data fields
 """
 
 import os
+import asyncio
 import base64
+import contextvars
 import hashlib
+import hmac
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bson.binary import Binary
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
@@ -13,96 +22,329 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Cache for Fernet instance
-_fernet_cache = None
+# ============================================================================
+# KEYS
+# ============================================================================
+# Values are stored as "ENC:<key id>:<Fernet token>". The key id says which
+# secret encrypted the value, so keys can be rotated without downtime:
+#
+#   ENCRYPTION_KEY             current secret (all new values)
+#   ENCRYPTION_KEY_ID          optional id for it (default: a fingerprint)
+#   ENCRYPTION_PREVIOUS_KEYS   comma-separated older secrets ("secret" or
+#                              "id:secret"), still accepted for decryption
+#
+# Each key id derives its Fernet key with its own salt. Values written
+# before key ids existed ("ENC:<token>") used a static salt and are tried
+# against every configured secret, current first.
+#
+# After rotating, re-encrypt stored values with services/reencryption.py
+# and then drop the old secret.
+#
+# Collections in BINARY_ENVELOPE_COLLECTIONS store the same ciphertext as a
+# BSON Binary envelope instead (see BINARY ENVELOPE below); both forms are
+# read everywhere.
 
-def _get_fernet():
-    """Get Fernet instance with derived key - loads key dynamically"""
-    global _fernet_cache
+_LEGACY_SALT = b'veterans_support_salt_v1'
+_KEY_SALT_PREFIX = b'veterans_support_salt_v2:'
+
+
+class DecryptionError(Exception):
+    """A value could not be decrypted with any configured key."""
+
+
+def _derive_fernet(secret: str, salt: bytes) -> Fernet:
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+    )
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(secret.encode())))
+
+
+def key_fingerprint(secret: str) -> str:
+    """Default key id: a short, non-reversible fingerprint of the secret."""
+    return "k" + hashlib.sha256(b"key-id:" + secret.encode()).hexdigest()[:8]
+
+
+class KeyRing:
+    """The current key and any previous keys, with lazily derived Fernets."""
+
+    def __init__(self, current_secret: str, current_id: Optional[str] = None,
+                 previous: Iterable[Tuple[Optional[str], str]] = ()):
+        self.current_id = current_id or key_fingerprint(current_secret)
+        self.secrets: Dict[str, str] = {self.current_id: current_secret}
+        for key_id, secret in previous:
+            self.secrets.setdefault(key_id or key_fingerprint(secret), secret)
+        self._fernets: Dict[Tuple[str, bytes], Fernet] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["KeyRing"]:
+        secret = os.environ.get('ENCRYPTION_KEY')
+        if not secret:
+            return None
+        previous = []
+        for entry in os.environ.get('ENCRYPTION_PREVIOUS_KEYS', '').split(','):
+            entry = entry.strip()
+            if entry:
+                key_id, _, value = entry.partition(':') if ':' in entry else ('', '', entry)
+                previous.append((key_id or None, value))
+        return cls(secret, os.environ.get('ENCRYPTION_KEY_ID') or None, previous)
+
+    def _fernet(self, secret: str, salt: bytes) -> Fernet:
+        cache_key = (secret, salt)
+        fernet = self._fernets.get(cache_key)
+        if fernet is None:
+            with self._lock:
+                fernet = self._fernets.get(cache_key)
+                if fernet is None:
+                    fernet = self._fernets[cache_key] = _derive_fernet(secret, salt)
+        return fernet
+
+    def fernet_for(self, key_id: str) -> Optional[Fernet]:
+        secret = self.secrets.get(key_id)
+        if secret is None:
+            return None
+        return self._fernet(secret, _KEY_SALT_PREFIX + key_id.encode())
+
+    @property
+    def current(self) -> Fernet:
+        return self.fernet_for(self.current_id)
+
+    def legacy_fernets(self):
+        for secret in self.secrets.values():
+            yield self._fernet(secret, _LEGACY_SALT)
+
+    def encrypt(self, plaintext: str, binary: bool = False):
+        token = self.current.encrypt(plaintext.encode()).decode()
+        if binary:
+            return pack_envelope(self.current_id, token)
+        return f"ENC:{self.current_id}:{token}"
+
+    def decrypt(self, value) -> str:
+        key_id, token = parse_ciphertext(value)
+        if key_id is not None:
+            fernet = self.fernet_for(key_id)
+            if fernet is None:
+                raise DecryptionError(f"Unknown encryption key id {key_id}")
+            candidates = [fernet]
+        else:
+            candidates = self.legacy_fernets()
+        for fernet in candidates:
+            try:
+                return fernet.decrypt(token.encode()).decode()
+            except Exception:
+                continue
+        raise DecryptionError("No configured key decrypts this value")
+
+
+def parse_ciphertext(value) -> Tuple[Optional[str], str]:
+    """(key id, token) of an "ENC:" value or envelope; key id is None for legacy values."""
+    if isinstance(value, bytes):
+        return unpack_envelope(value)
+    body = value[4:]
+    # Fernet tokens are urlsafe base64, so a colon can only end a key id
+    key_id, sep, token = body.partition(':')
+    return (key_id, token) if sep else (None, body)
+
+
+def key_id_of(value: Any) -> Optional[str]:
+    """Key id an encrypted value was written with ("legacy" for old values, None if not encrypted)."""
+    if not is_encrypted(value):
+        return None
+    return parse_ciphertext(value)[0] or "legacy"
+
+
+# ============================================================================
+# BINARY ENVELOPE
+# ============================================================================
+# "ENC:<key id>:<token>" base64-encodes a Fernet token that is itself
+# base64, so a string value is about a third larger than the ciphertext.
+# The envelope stores the raw token bytes in a BSON Binary (user-defined
+# subtype 0x80):
+#
+#   [version = 1][key id length][key id][raw Fernet token]
+#
+# Key id length 0 marks a legacy (static salt) value. Converting between
+# the two forms only re-packs the token, no decryption is involved, so the
+# online migration (services/reencryption.py) needs no key for it.
+#
+# Collections listed in ENCRYPTION_BINARY_COLLECTIONS get envelopes for new
+# values; everything else keeps the string form.
+
+ENVELOPE_SUBTYPE = 0x80
+ENVELOPE_VERSION = 1
+
+BINARY_ENVELOPE_COLLECTIONS = frozenset(
+    name.strip() for name in os.getenv(
+        "ENCRYPTION_BINARY_COLLECTIONS", "live_chat_rooms,chat_sessions,safeguarding_alerts"
+    ).split(",") if name.strip()
+)
+
+
+def pack_envelope(key_id: Optional[str], token: str) -> Binary:
+    """Envelope for a Fernet token written with key_id (None for legacy values)."""
+    kid = (key_id or "").encode()
+    if len(kid) > 255:
+        raise ValueError("Key id too long for the envelope")
+    raw = base64.urlsafe_b64decode(token)
+    return Binary(bytes((ENVELOPE_VERSION, len(kid))) + kid + raw, ENVELOPE_SUBTYPE)
+
+
+def unpack_envelope(data: bytes) -> Tuple[Optional[str], str]:
+    """(key id, token) of an envelope."""
+    if len(data) < 2 or data[0] != ENVELOPE_VERSION:
+        raise DecryptionError(f"Unsupported envelope version {data[0] if data else None}")
+    end = 2 + data[1]
+    key_id = data[2:end].decode()
+    return key_id or None, base64.urlsafe_b64encode(data[end:]).decode()
+
+
+def is_envelope(value: Any) -> bool:
+    return isinstance(value, Binary) and value.subtype == ENVELOPE_SUBTYPE
+
+
+def is_encrypted(value: Any) -> bool:
+    """True for an "ENC:" string or a binary envelope."""
+    return (isinstance(value, str) and value.startswith('ENC:')) or is_envelope(value)
+
+
+def to_envelope(value: Any) -> Any:
+    """An "ENC:" string as an envelope (anything else unchanged)."""
+    if isinstance(value, str) and value.startswith('ENC:'):
+        return pack_envelope(*parse_ciphertext(value))
+    return value
+
+
+def to_ciphertext_string(value: Any) -> Any:
+    """An envelope as the equivalent "ENC:" string (anything else unchanged)."""
+    if not is_envelope(value):
+        return value
+    key_id, token = unpack_envelope(value)
+    return f"ENC:{key_id}:{token}" if key_id else f"ENC:{token}"
+
+
+def uses_binary_envelope(collection: str) -> bool:
+    return collection in BINARY_ENVELOPE_COLLECTIONS
+
+
+def envelopes_as_strings(value: Any) -> Any:
+    """
+    `value` with every envelope (in nested dicts and lists) replaced by the
+    "ENC:" string it stands for, so endpoints that return stored documents
+    without decrypting them answer exactly as before
+    """
+    if isinstance(value, dict):
+        return {key: envelopes_as_strings(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [envelopes_as_strings(item) for item in value]
+    return to_ciphertext_string(value)
+
+
+# Cache for the key ring
+_keyring_cache = None
+
+def _get_keyring() -> Optional[KeyRing]:
+    """Get the key ring - loads keys dynamically"""
+    global _keyring_cache
     
     # Return cached instance if available
-    if _fernet_cache is not None:
-        return _fernet_cache
-    
-    # Get encryption key from environment at runtime
-    encryption_key = os.environ.get('ENCRYPTION_KEY')
+    if _keyring_cache is not None:
+        return _keyring_cache
     
-    if not encryption_key:
+    keyring = KeyRing.from_env()
+    if keyring is None:
         logger.warning("ENCRYPTION_KEY not set - encryption disabled")
         return None
     
-    # Derive a proper Fernet key from the secret
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=b'veterans_support_salt_v1',  # Static salt - key should be unique per deployment
-        iterations=100000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(encryption_key.encode()))
-    _fernet_cache = Fernet(key)
-    logger.info("Encryption initialized successfully")
-    return _fernet_cache
+    _keyring_cache = keyring
+    logger.info(f"Encryption initialized successfully (key {keyring.current_id}, "
+                f"{len(keyring.secrets) - 1} previous)")
+    return _keyring_cache
+
+
+def _get_fernet():
+    """Get the Fernet instance for the current key"""
+    keyring = _get_keyring()
+    return keyring.current if keyring else None
 
 
-def encrypt_field(value: str) -> str:
+def current_key_id() -> Optional[str]:
+    keyring = _get_keyring()
+    return keyring.current_id if keyring else None
+
+
+def encrypt_field(value: str, binary: bool = False):
     """
     Encrypt a string value
-    Returns prefixed encrypted string or original if encryption disabled
+    Returns prefixed encrypted string (a binary envelope with binary=True)
+    or original if encryption disabled
     """
     if not value or not isinstance(value, str):
         return value
     
     # Skip if already encrypted
     if value.startswith('ENC:'):
-        return value
+        return to_envelope(value) if binary else value
     
-    fernet = _get_fernet()
-    if not fernet:
+    keyring = _get_keyring()
+    if not keyring:
         return value
     
     try:
-        encrypted = fernet.encrypt(value.encode())
-        return f"ENC:{encrypted.decode()}"
+        return keyring.encrypt(value, binary=binary)
     except Exception as e:
         logger.error(f"Encryption failed: {e}")
         return value
 
 
+def decrypt_field_strict(value: str) -> str:
+    """
+    decrypt_field() for jobs that rewrite data: raises DecryptionError
+    instead of returning a masked placeholder
+    """
+    if not value or not is_encrypted(value):
+        return value
+    keyring = _get_keyring()
+    if not keyring:
+        raise DecryptionError("ENCRYPTION_KEY not set")
+    return keyring.decrypt(value)
+
+
 def decrypt_field(value: str) -> str:
     """
     Decrypt an encrypted string value
     Returns decrypted string or original if not encrypted
     """
-    if not value or not isinstance(value, str):
+    if not value:
         return value
     
     # Only decrypt if it's encrypted
-    if not value.startswith('ENC:'):
+    if not is_encrypted(value):
         return value
     
-    fernet = _get_fernet()
-    if not fernet:
+    keyring = _get_keyring()
+    if not keyring:
         # Can't decrypt without key - return masked value
         return "***encrypted***"
     
     try:
-        encrypted_data = value[4:]  # Remove 'ENC:' prefix
-        decrypted = fernet.decrypt(encrypted_data.encode())
-        return decrypted.decode()
+        return keyring.decrypt(value)
     except Exception as e:
         logger.error(f"Decryption failed: {e}")
         return "***decryption_error***"
 
 
-def encrypt_dict_fields(data: dict, fields: list) -> dict:
+def encrypt_dict_fields(data: dict, fields: list, binary: bool = False) -> dict:
     """
     Encrypt specified fields in a dictionary
     Returns new dict with encrypted fields
     """
     result = data.copy()
     for field in fields:
-        if field in result and result[field]:
-            result[field] = encrypt_field(str(result[field]))
+        if field in result and result[field] and not is_envelope(result[field]):
+            result[field] = encrypt_field(str(result[field]), binary=binary)
     return result
 
 
@@ -116,7 +358,8 @@ def decrypt_dict_fields(data: dict, fields: list) -> dict:
     result = dict(data)  # Convert from MongoDB document if needed
     for field in fields:
         if field in result and result[field]:
-            result[field] = decrypt_field(str(result[field]))
+            value = result[field]
+            result[field] = decrypt_field(value if is_envelope(value) else str(value))
     return result
 
 
@@ -132,15 +375,122 @@ ENCRYPTED_FIELDS = {
     'ai_chat_sessions': ['wellbeing_notes', 'case_notes'],  # Supervision notes
     'supervision_notes': ['wellbeing_notes', 'case_notes', 'action_items'],  # HR sensitive
     'escalations': ['description', 'resolution_notes'],  # Escalation details
+    'email_outbox': ['html', 'text'],  # Queued email bodies (services/email_outbox.py)
+    'concerns': ['your_name', 'your_email', 'your_phone', 'veteran_name', 'concerns'],  # Family & friends
 }
 
 
+# ============================================================================
+# BLIND INDEXES
+# ============================================================================
+# Encrypted values are randomised, so they cannot be matched in a query.
+# Fields that are looked up by exact value also get a companion
+# "<field>_bidx" holding a keyed HMAC of the normalised plaintext, which
+# MongoDB can index and match without anything being decrypted.
+#
+# The HMAC key is derived from ENCRYPTION_KEY (or BLIND_INDEX_KEY if set)
+# with its own salt, so it is independent of the encryption key itself.
+# Set BLIND_INDEX_KEY before rotating ENCRYPTION_KEY to keep the indexes
+# stable; otherwise the re-encryption job rewrites them.
+# Values are normalised per kind so "07700 900123" and "+447700900123", or
+# "Sam@Example.com " and "sam@example.com", give the same index.
+
+BLIND_INDEX_SUFFIX = "_bidx"
+
+# collection (as in ENCRYPTED_FIELDS) -> {field: kind}
+BLIND_INDEX_FIELDS = {
+    'counsellors': {'name': 'name', 'phone': 'phone'},
+    'peer_supporters': {'firstName': 'name', 'phone': 'phone'},
+    'callbacks': {'name': 'name', 'phone': 'phone', 'email': 'email'},
+}
+
+_blind_index_key_cache = None
+
+
+def _get_blind_index_key() -> Optional[bytes]:
+    global _blind_index_key_cache
+    if _blind_index_key_cache is not None:
+        return _blind_index_key_cache
+
+    secret = os.environ.get('BLIND_INDEX_KEY') or os.environ.get('ENCRYPTION_KEY')
+    if not secret:
+        return None
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=b'veterans_support_blind_index_v1',
+        iterations=100000,
+    )
+    _blind_index_key_cache = kdf.derive(secret.encode())
+    return _blind_index_key_cache
+
+
+def warm_up_encryption_keys():
+    """Derive the encryption and blind-index keys (PBKDF2) ahead of the first request."""
+    _get_fernet()
+    _get_blind_index_key()
+
+
+def normalise_for_index(kind: str, value: str) -> str:
+    """Canonical form of a value before it is indexed."""
+    value = str(value).strip()
+    if kind == 'email':
+        return value.lower()
+    if kind == 'phone':
+        digits = re.sub(r'\D', '', value)
+        # UK numbers: +44 7700 900123 and 07700 900123 are the same number
+        if digits.startswith('44') and len(digits) >= 12:
+            digits = '0' + digits[2:]
+        return digits
+    return ' '.join(value.casefold().split())
+
+
+def blind_index(kind: str, value: str) -> Optional[str]:
+    """Keyed HMAC of a normalised value (None if empty or no key is configured)."""
+    if not value or not isinstance(value, str) or value.startswith('ENC:'):
+        return None
+    key = _get_blind_index_key()
+    normalised = normalise_for_index(kind, value)
+    if not key or not normalised:
+        return None
+    digest = hmac.new(key, f"{kind}:{normalised}".encode(), hashlib.sha256).hexdigest()
+    return digest[:32]
+
+
+def blind_index_fields(collection: str, document: dict) -> dict:
+    """Companion "<field>_bidx" values for the plaintext fields present in document."""
+    indexes = {}
+    for field, kind in BLIND_INDEX_FIELDS.get(collection, {}).items():
+        if field in document:
+            indexes[f"{field}{BLIND_INDEX_SUFFIX}"] = blind_index(kind, document[field])
+    return indexes
+
+
+def blind_index_query(collection: str, field: str, value: str) -> dict:
+    """Exact-match filter on an encrypted field, e.g. blind_index_query('callbacks', 'phone', phone)."""
+    kind = BLIND_INDEX_FIELDS.get(collection, {}).get(field)
+    if kind is None:
+        raise ValueError(f"{collection}.{field} has no blind index")
+    digest = blind_index(kind, value)
+    if digest is None:
+        raise ValueError(f"Cannot index an empty value for {collection}.{field}")
+    return {f"{field}{BLIND_INDEX_SUFFIX}": digest}
+
+
 def encrypt_document(collection: str, document: dict) -> dict:
     """Encrypt sensitive fields in a document based on collection"""
     fields = ENCRYPTED_FIELDS.get(collection, [])
     if not fields:
         return document
-    return encrypt_dict_fields(document, fields)
+    # Blind indexes are computed from the plaintext, before it is encrypted
+    encrypted = encrypt_dict_fields(document, fields, binary=uses_binary_envelope(collection))
+    return {**encrypted, **blind_index_fields(collection, document)}
+
+
+def _without_blind_indexes(collection: str, document: dict) -> dict:
+    for field in BLIND_INDEX_FIELDS.get(collection, {}):
+        document.pop(f"{field}{BLIND_INDEX_SUFFIX}", None)
+    return document
 
 
 def decrypt_document(collection: str, document: dict) -> dict:
@@ -148,7 +498,132 @@ def decrypt_document(collection: str, document: dict) -> dict:
     fields = ENCRYPTED_FIELDS.get(collection, [])
     if not fields:
         return document
-    return decrypt_dict_fields(document, fields)
+    result = decrypt_dict_fields(document, fields)
+    return _without_blind_indexes(collection, result) if result else result
+
+
+# ============================================================================
+# BULK DECRYPTION
+# ============================================================================
+# List endpoints decrypt hundreds of fields per request. Doing that inline
+# holds the event loop, so bulk decryption runs in chunks on a small,
+# bounded thread pool (shared by all requests). Small jobs stay inline,
+# where a thread hop would cost more than the work.
+
+DECRYPT_WORKERS = int(os.getenv("DECRYPT_WORKERS", "4"))
+DECRYPT_CHUNK_SIZE = int(os.getenv("DECRYPT_CHUNK_SIZE", "64"))
+DECRYPT_INLINE_MAX = int(os.getenv("DECRYPT_INLINE_MAX", "16"))
+
+_decrypt_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Per-request decrypt timing, started by the request middleware
+_request_timing: contextvars.ContextVar = contextvars.ContextVar("decrypt_timing", default=None)
+
+_metrics_lock = threading.Lock()
+_decrypt_metrics = {
+    "requests": 0,
+    "values_decrypted": 0,
+    "decrypt_seconds": 0.0,
+    "max_request_ms": 0.0,
+}
+
+
+def _get_decrypt_executor() -> ThreadPoolExecutor:
+    global _decrypt_executor
+    if _decrypt_executor is None:
+        with _executor_lock:
+            if _decrypt_executor is None:
+                _decrypt_executor = ThreadPoolExecutor(max_workers=DECRYPT_WORKERS, thread_name_prefix="decrypt")
+    return _decrypt_executor
+
+
+def shutdown_decrypt_executor():
+    global _decrypt_executor
+    if _decrypt_executor is not None:
+        _decrypt_executor.shutdown(wait=False)
+        _decrypt_executor = None
+
+
+def start_decrypt_timing() -> Dict[str, float]:
+    """Start collecting decrypt time for the current request (returns the collector)."""
+    timing = {"values": 0, "ms": 0.0}
+    _request_timing.set(timing)
+    return timing
+
+
+def finish_decrypt_timing(timing: Dict[str, float]):
+    """Fold one request's decrypt time into the process-wide metrics."""
+    if not timing["values"]:
+        return
+    with _metrics_lock:
+        _decrypt_metrics["requests"] += 1
+        _decrypt_metrics["max_request_ms"] = max(_decrypt_metrics["max_request_ms"], timing["ms"])
+
+
+def get_decrypt_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        metrics = dict(_decrypt_metrics)
+    metrics["workers"] = DECRYPT_WORKERS
+    metrics["decrypt_seconds"] = round(metrics["decrypt_seconds"], 3)
+    return metrics
+
+
+def _decrypt_chunk(jobs: List[Tuple[dict, str]]) -> float:
+    """Decrypt values in place; returns the CPU time spent."""
+    start = time.perf_counter()
+    for container, key in jobs:
+        container[key] = decrypt_field(container[key])
+    return time.perf_counter() - start
+
+
+def _record(values: int, seconds: float):
+    with _metrics_lock:
+        _decrypt_metrics["values_decrypted"] += values
+        _decrypt_metrics["decrypt_seconds"] += seconds
+    timing = _request_timing.get()
+    if timing is not None:
+        timing["values"] += values
+        timing["ms"] += seconds * 1000
+
+
+async def _run_jobs(jobs: List[Tuple[dict, str]]):
+    if not jobs:
+        return
+    if len(jobs) <= DECRYPT_INLINE_MAX:
+        _record(len(jobs), _decrypt_chunk(jobs))
+        return
+    loop = asyncio.get_running_loop()
+    executor = _get_decrypt_executor()
+    chunks = [jobs[i:i + DECRYPT_CHUNK_SIZE] for i in range(0, len(jobs), DECRYPT_CHUNK_SIZE)]
+    seconds = await asyncio.gather(*(loop.run_in_executor(executor, _decrypt_chunk, chunk) for chunk in chunks))
+    _record(len(jobs), sum(seconds))
+
+
+async def decrypt_documents(collection: str, documents: Iterable[dict],
+                            fields: Optional[Iterable[str]] = None) -> List[dict]:
+    """
+    decrypt_document() for a list of documents, off the event loop.
+    Only encrypted values are decrypted, and with `fields` (the response
+    projection) only those fields are considered.
+    """
+    encrypted_fields = ENCRYPTED_FIELDS.get(collection, [])
+    if fields is not None:
+        wanted = set(fields)
+        encrypted_fields = [f for f in encrypted_fields if f in wanted]
+
+    results = [_without_blind_indexes(collection, dict(document)) for document in documents]
+    jobs = [(result, field) for result in results for field in encrypted_fields
+            if is_encrypted(result.get(field))]
+    await _run_jobs(jobs)
+    return results
+
+
+async def decrypt_items(items: Iterable[dict], key: str) -> List[dict]:
+    """Decrypt one key in each of a list of dicts (e.g. chat message text)."""
+    results = [dict(item) for item in items]
+    await _run_jobs([(result, key) for result in results if is_encrypted(result.get(key))])
+    return results
 
 
 def generate_encryption_key():
@@ -16,16 +16,9 @@ from datetime import datetime, timezone, timedelta
 from bson import ObjectId
 import logging
 import os
-import asyncio
 
-# Email notifications
-try:
-    import resend
-    RESEND_API_KEY = os.environ.get('RESEND_API_KEY', '')
-    if RESEND_API_KEY:
-        resend.api_key = RESEND_API_KEY
-except ImportError:
-    RESEND_API_KEY = None
+# Email notifications (delivered by the outbox worker)
+from services.email_outbox import email_delivery_enabled, enqueue_email
 
 from governance import (
     Hazard, HazardCreate, HazardStatus, HazardSeverity, HazardLikelihood,
@@ -58,8 +51,8 @@ async def send_incident_notification(incident_dict: dict, recipient_type: str =
     - Level 2 (High): CSO + Admin within shift
     - Level 1 (Moderate): Admin (CSO on monthly review)
     """
-    if not RESEND_API_KEY:
-        logging.warning("Cannot send incident notification - RESEND_API_KEY not configured")
+    if not email_delivery_enabled():
+        logging.warning("Cannot send incident notification - email delivery not configured")
         return False
     
     try:
@@ -158,8 +151,9 @@ async def send_incident_notification(incident_dict: dict, recipient_type: str =
             "html": html_content
         }
         
-        await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Incident notification sent to {recipients} for {incident_number}")
+        await enqueue_email(params, category="incident", dedupe_key=f"incident:{incident_number}",
+                            urgent="critical" in level or "high" in level)
+        logging.info(f"Incident notification queued for {recipients} for {incident_number}")
         return True
         
     except Exception as e:
@@ -168,7 +162,7 @@ async def send_incident_notification(incident_dict: dict, recipient_type: str =
 
 async def send_cso_approval_notification(approval_dict: dict):
     """Send email to CSO when approval is required"""
-    if not RESEND_API_KEY:
+    if not email_delivery_enabled():
         return False
     
     try:
@@ -221,8 +215,8 @@ async def send_cso_approval_notification(approval_dict: dict):
             "html": html_content
         }
         
-        await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"CSO approval notification sent to {cso_email}")
+        await enqueue_email(params, category="cso_approval")
+        logging.info(f"CSO approval notification queued for {cso_email}")
         return True
         
     except Exception as e:
@@ -810,31 +804,31 @@ async def email_summary_report(email: str = Query(...), period: str = Query(defa
         </html>
         """
         
-        # Send email using Resend
-        if not RESEND_API_KEY:
+        # Queue the email (sent by the outbox worker)
+        if not email_delivery_enabled():
             raise HTTPException(status_code=500, detail="Email service not configured")
         
         sender_email = os.environ.get('SENDER_EMAIL', 'noreply@radiocheck.me')
         
-        email_response = resend.Emails.send({
+        email_ids = await enqueue_email({
             "from": sender_email,
             "to": email,
             "subject": f"Radio Check {period_label} Summary Report - {datetime.now().strftime('%d %b %Y')}",
             "html": html_content
-        })
+        }, category="governance_report")
         
-        # Log the email send
+        # Log the email send (email_id is the outbox message; see /admin/email-outbox for delivery)
         await db.report_emails.insert_one({
             "email": email,
             "period": period,
             "sent_at": datetime.now(timezone.utc),
-            "email_id": email_response.get('id') if email_response else None
+            "email_id": email_ids[0] if email_ids else None
         })
         
         return {
             "success": True,
-            "message": f"Report sent to {email}",
-            "email_id": email_response.get('id') if email_response else None
+            "message": f"Report queued for {email}",
+            "email_id": email_ids[0] if email_ids else None
         }
         
     except Exception as e:
@@ -13,6 +13,8 @@ import logging
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
+from services.database import get_database
+
 load_dotenv()
 
 router = APIRouter(tags=["AI Tutor"])
@@ -198,8 +200,7 @@ class TutorFeedback(BaseModel):
 
 def get_db():
     """Get database connection"""
-    from server import db
-    return db
+    return get_database()
 
 
 async def evaluate_response(question: dict, response: str) -> TutorFeedback:
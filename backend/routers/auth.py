@@ -7,12 +7,15 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List
 import uuid
 from datetime import datetime, timedelta
-import bcrypt
 import jwt
 import secrets
 import os
 
+from encryption import envelopes_as_strings
 from services.database import get_database
+from services.passwords import hash_password, verify_and_rehash, verify_password
+from services.principals import get_jwt_secret, invalidate_user, new_token_id, resolve_principal, revoke_token
+from services.rate_limit import RateLimiter, RateLimitRule, rate_limit_dependency
 from models.schemas import (
     UserLogin, UserCreate, User, TokenResponse,
     ChangePassword, ResetPasswordRequest, ResetPassword, AdminResetPassword
@@ -22,48 +25,27 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 security = HTTPBearer()
 
 # JWT Configuration
-def get_jwt_secret():
-    """Get JWT secret - read at runtime to ensure env vars are loaded"""
-    return os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
-
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+# Login attempts per client IP per minute (each one costs a bcrypt check)
+LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "30"))
+login_limiter = RateLimiter("login_ip", [
+    RateLimitRule("minute", LOGIN_RATE_LIMIT, 60, message="Too many login attempts. Please try again shortly."),
+])
 
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": new_token_id()})
     return jwt.encode(to_encode, get_jwt_secret(), algorithm=ALGORITHM)
 
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Validate JWT token and return current user"""
-    db = get_database()
-    secret_key = get_jwt_secret()
-    try:
-        payload = jwt.decode(credentials.credentials, secret_key, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return User(id=user["id"], email=user["email"], role=user.get("role", "user"), name=user.get("name", ""))
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    """Validate JWT token and return current user (cached per token, services/principals.py)"""
+    user = await resolve_principal(credentials.credentials)
+    return User(id=user["id"], email=user["email"], role=user.get("role", "user"), name=user.get("name", ""))
 
 
 def require_role(*required_roles: str):
@@ -129,7 +111,7 @@ async def seed_admin():
     admin_data = {
         "id": user_id,
         "email": "admin@veteran.dbty.co.uk",
-        "hashed_password": hash_password("ChangeThisPassword123!"),
+        "hashed_password": await hash_password("ChangeThisPassword123!"),
         "role": "admin",
         "name": "Admin",
         "created_at": datetime.utcnow()
@@ -152,7 +134,7 @@ async def reset_admin_password():
         admin_data = {
             "id": user_id,
             "email": "admin@veteran.dbty.co.uk",
-            "hashed_password": hash_password("ChangeThisPassword123!"),
+            "hashed_password": await hash_password("ChangeThisPassword123!"),
             "role": "admin",
             "name": "Admin",
             "created_at": datetime.utcnow()
@@ -163,7 +145,7 @@ async def reset_admin_password():
     # Reset password
     await db.users.update_one(
         {"email": "admin@veteran.dbty.co.uk"},
-        {"$set": {"hashed_password": hash_password("ChangeThisPassword123!"), "id": admin.get("id") or str(uuid.uuid4())}}
+        {"$set": {"hashed_password": await hash_password("ChangeThisPassword123!"), "id": admin.get("id") or str(uuid.uuid4())}}
     )
     return {"message": "Admin password reset", "email": "admin@veteran.dbty.co.uk", "password": "ChangeThisPassword123!"}
 
@@ -190,7 +172,7 @@ async def seed_staff():
         user_data = {
             "id": user_id,
             "email": staff["email"].lower(),
-            "hashed_password": hash_password(staff["password"]),
+            "hashed_password": await hash_password(staff["password"]),
             "role": staff["role"],
             "name": staff["name"],
             "created_at": datetime.utcnow()
@@ -225,7 +207,7 @@ async def register_user(user_input: UserCreate, current_user: User = Depends(req
     user_data = {
         "id": user_id,
         "email": user_input.email,
-        "hashed_password": hash_password(user_input.password),
+        "hashed_password": await hash_password(user_input.password),
         "role": user_input.role,
         "name": user_name,
         "created_at": datetime.utcnow()
@@ -272,7 +254,7 @@ async def register_user(user_input: UserCreate, current_user: User = Depends(req
     return User(id=user_id, email=user_input.email, role=user_input.role, name=user_name)
 
 
-@router.post("/login", response_model=TokenResponse)
+@router.post("/login", response_model=TokenResponse, dependencies=[Depends(rate_limit_dependency(login_limiter))])
 async def login(credentials: UserLogin):
     """Login and get JWT token"""
     db = get_database()
@@ -286,8 +268,16 @@ async def login(credentials: UserLogin):
     if not password_hash:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(credentials.password, password_hash):
+    verified, new_hash = await verify_and_rehash(credentials.password, password_hash)
+    if not verified:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # Stored with an old bcrypt cost: upgrade it, unless it changed meanwhile
+        fields = [f for f in ("hashed_password", "password_hash") if user.get(f) == password_hash]
+        await db.users.update_one(
+            {"_id": user["_id"], fields[0]: password_hash},
+            {"$set": {f: new_hash for f in fields}}
+        )
     
     # Ensure user has an ID (generate if missing for legacy users)
     user_id = user.get("id") or str(user.get("_id", ""))
@@ -312,6 +302,13 @@ async def login(credentials: UserLogin):
     )
 
 
+@router.post("/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke the current token"""
+    await revoke_token(credentials.credentials)
+    return {"message": "Logged out"}
+
+
 @router.get("/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_user)):
     """Get current user profile"""
@@ -324,13 +321,14 @@ async def change_password(data: ChangePassword, current_user: User = Depends(get
     db = get_database()
     user = await db.users.find_one({"id": current_user.id})
     
-    if not verify_password(data.old_password, user["hashed_password"]):
+    if not await verify_password(data.old_password, user["hashed_password"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     await db.users.update_one(
         {"id": current_user.id},
-        {"$set": {"hashed_password": hash_password(data.new_password)}}
+        {"$set": {"hashed_password": await hash_password(data.new_password)}}
     )
+    invalidate_user(current_user.id)
     return {"message": "Password changed successfully"}
 
 
@@ -375,8 +373,9 @@ async def reset_password(reset_data: ResetPassword):
     
     await db.users.update_one(
         {"id": reset_record["user_id"]},
-        {"$set": {"hashed_password": hash_password(reset_data.new_password)}}
+        {"$set": {"hashed_password": await hash_password(reset_data.new_password)}}
     )
+    invalidate_user(reset_record["user_id"])
     
     await db.password_resets.update_one(
         {"token": reset_data.token},
@@ -422,7 +421,7 @@ async def admin_reset_password(data: AdminResetPassword, current_user: User = De
     
     for old_hash in password_history[-3:]:
         try:
-            if verify_password(new_password, old_hash):
+            if await verify_password(new_password, old_hash):
                 raise HTTPException(status_code=400, detail="Cannot reuse any of your last 3 passwords")
         except HTTPException:
             raise  # Re-raise HTTP exceptions
@@ -433,7 +432,7 @@ async def admin_reset_password(data: AdminResetPassword, current_user: User = De
     current_hash = user.get("hashed_password") or user.get("password_hash")
     if current_hash:
         try:
-            if verify_password(new_password, current_hash):
+            if await verify_password(new_password, current_hash):
                 raise HTTPException(status_code=400, detail="Cannot reuse any of your last 3 passwords")
         except HTTPException:
             raise  # Re-raise HTTP exceptions
@@ -441,7 +440,7 @@ async def admin_reset_password(data: AdminResetPassword, current_user: User = De
             pass  # If hash comparison fails for other reasons, skip
     
     # Create new hash
-    new_hash = hash_password(new_password)
+    new_hash = await hash_password(new_password)
     
     # Update password history (keep last 3)
     if current_hash:
@@ -463,6 +462,7 @@ async def admin_reset_password(data: AdminResetPassword, current_user: User = De
     if result.modified_count == 0:
         raise HTTPException(status_code=500, detail="Failed to update password")
     
+    invalidate_user(data.user_id)
     return {"message": "Password reset successfully"}
 
 
@@ -484,6 +484,7 @@ async def delete_user(user_id: str, current_user: User = Depends(require_role("a
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user(user_id)
     
     return {"message": "User deleted"}
 
@@ -595,7 +596,7 @@ async def export_my_data(current_user: User = Depends(get_current_user)):
     # Get safeguarding alerts
     alerts = await db.safeguarding_alerts.find({"user_id": current_user.id}, {"_id": 0}).to_list(100)
     if alerts:
-        user_data["data_categories"]["safeguarding_alerts"] = alerts
+        user_data["data_categories"]["safeguarding_alerts"] = envelopes_as_strings(alerts)
     
     # Get counsellor/peer supporter profile if applicable
     if current_user.role == "counsellor":
@@ -675,6 +676,7 @@ async def delete_my_account(current_user: User = Depends(get_current_user)):
     
     # Finally delete user account
     await db.users.delete_one({"id": user_id})
+    invalidate_user(user_id)
     deleted_data["deleted_records"]["user_account"] = 1
     
     deleted_data["message"] = "Account and personal data deleted. Some anonymized records retained for safeguarding compliance."
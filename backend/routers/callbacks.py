@@ -2,12 +2,14 @@
 Callbacks Router - Callback request management
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional
 import uuid
 from datetime import datetime
 
+from encryption import decrypt_document, decrypt_documents
 from services.database import get_database
+from services.pagination import not_modified, page_etag, page_response, paginate, parse_fields
 from models.schemas import CallbackRequestCreate, CallbackRequest, CallbackStatusUpdate
 
 router = APIRouter(prefix="/callbacks", tags=["callbacks"])
@@ -30,7 +32,13 @@ async def create_callback_request(callback: CallbackRequestCreate):
 
 
 @router.get("/")
-async def get_callbacks(status: Optional[str] = None):
+async def get_callbacks(
+    request: Request,
+    status: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get all callback requests, optionally filtered by status"""
     db = get_database()
     
@@ -38,8 +46,16 @@ async def get_callbacks(status: Optional[str] = None):
     if status:
         query["status"] = status
     
-    callbacks = await db.callbacks.find(query).sort("created_at", -1).to_list(200)
-    return [{**c, "id": str(c.get("_id", c.get("id", "")))} for c in callbacks]
+    page = await paginate(db.callbacks, query, sort_field="created_at", id_field="_id",
+                          limit=limit, cursor=cursor, fields=fields,
+                          allowed_fields=[*CallbackRequest.model_fields, "updated_at"], default_limit=200)
+    etag = page_etag(page)
+    cached = not_modified(request, etag, page)
+    if cached:
+        return cached
+    items = await decrypt_documents("callbacks", page.items, parse_fields(fields))
+    callbacks = [{**c, "_id": str(c["_id"]), "id": str(c.get("_id", c.get("id", "")))} for c in items]
+    return page_response(request, callbacks, page, etag=etag)
 
 
 @router.get("/{callback_id}")
@@ -51,6 +67,7 @@ async def get_callback(callback_id: str):
     if not callback:
         raise HTTPException(status_code=404, detail="Callback not found")
     
+    callback = decrypt_document("callbacks", callback)
     callback["id"] = str(callback.get("_id", callback.get("id", "")))
     return callback
 
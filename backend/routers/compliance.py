@@ -8,16 +8,14 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel, Field
 import uuid
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
 
 router = APIRouter(prefix="/compliance", tags=["Compliance"])
 
-# Database connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'veterans_support')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# Database connection (shared pool)
+from encryption import envelopes_as_strings
+from services.database import get_database
+from services.principals import resolve_principal
+db = get_database()
 
 
 # ============ PYDANTIC MODELS ============
@@ -91,22 +89,7 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     token = auth_header.replace("Bearer ", "")
-    user = await db.users.find_one({"id": token}, {"_id": 0, "password_hash": 0})
-    if not user:
-        # Try to decode JWT token
-        import jwt
-        try:
-            payload = jwt.decode(token, options={"verify_signature": False})
-            user_id = payload.get("sub") or payload.get("user_id")
-            if user_id:
-                user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        except:
-            pass
-    
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    return user
+    return await resolve_principal(token, db)
 
 
 def require_admin(user):
@@ -677,7 +660,7 @@ async def export_my_data(request: Request):
     # Chat sessions
     chat_sessions = await db.chat_sessions.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
     if chat_sessions:
-        export_data["chat_sessions"] = chat_sessions
+        export_data["chat_sessions"] = envelopes_as_strings(chat_sessions)
         export_data["data_categories"].append("chat_sessions")
     
     # Consent preferences
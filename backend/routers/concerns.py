@@ -7,6 +7,7 @@ from typing import List, Optional
 import uuid
 from datetime import datetime
 
+from encryption import decrypt_document, decrypt_documents
 from services.database import get_database
 from models.schemas import ConcernCreate, Concern
 
@@ -40,6 +41,7 @@ async def get_concerns(status: Optional[str] = None, severity: Optional[str] = N
         query["severity"] = severity
     
     concerns = await db.concerns.find(query).sort("created_at", -1).to_list(200)
+    concerns = await decrypt_documents("concerns", concerns)
     return [{**c, "id": str(c.get("_id", c.get("id", "")))} for c in concerns]
 
 
@@ -52,6 +54,7 @@ async def get_concern(concern_id: str):
     if not concern:
         raise HTTPException(status_code=404, detail="Concern not found")
     
+    concern = decrypt_document("concerns", concern)
     concern["id"] = str(concern.get("_id", concern.get("id", "")))
     return concern
 
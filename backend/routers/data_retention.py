@@ -8,7 +8,6 @@ Admin only access.
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from datetime import datetime, timezone
 from typing import Optional
-import asyncio
 import sys
 from pathlib import Path
 
@@ -92,7 +91,8 @@ async def run_retention_cleanup(
         }
     else:
         # For actual cleanup, run in background
-        background_tasks.add_task(asyncio.to_thread, asyncio.run, do_cleanup(dry_run=False))
+        # Runs on the server's event loop so it can use the shared DB pool
+        background_tasks.add_task(do_cleanup, dry_run=False)
         return {
             'status': 'started',
             'dry_run': False,
@@ -8,7 +8,6 @@ from pathlib import Path
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import Response, JSONResponse
 import markdown
-from weasyprint import HTML, CSS
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 logger = logging.getLogger(__name__)
@@ -252,7 +251,8 @@ async def download_document(doc_id: str, format: str = "pdf"):
         </html>
         """
         
-        # Convert HTML to PDF
+        # Convert HTML to PDF (weasyprint is heavy - imported on first use / warm-up)
+        from weasyprint import HTML, CSS
         pdf_buffer = BytesIO()
         HTML(string=full_html).write_pdf(
             pdf_buffer,
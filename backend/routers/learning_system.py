@@ -241,6 +241,78 @@ async def review_feedback(feedback_id: str, status: str, admin_id: str, notes: O
     
     return {"message": "Feedback reviewed"}
 
+# ============== CANDIDATE PHRASES (SAFETY LEARNING) ==============
+
+class CandidateClusterReview(BaseModel):
+    approved: bool
+    admin_notes: Optional[str] = None
+
+@router.get("/candidate-clusters")
+async def get_candidate_clusters(limit: int = 50, sample_size: int = 5):
+    """
+    Get unreviewed candidate safety phrases grouped into near-duplicate clusters,
+    largest first, so reviewers handle one cluster instead of every variant
+    """
+    from safety.conversation_monitor import CANDIDATE_COLLECTION, flush_candidate_phrases
+    
+    # Make sure recently flagged phrases are visible
+    await flush_candidate_phrases(db)
+    
+    pipeline = [
+        {"$match": {"reviewed": False}},
+        {"$sort": {"occurrences": -1}},
+        {"$group": {
+            "_id": "$cluster_id",
+            "representative": {"$first": "$phrase"},
+            "variant_count": {"$sum": 1},
+            "total_occurrences": {"$sum": "$occurrences"},
+            "categories": {"$addToSet": "$inferred_category"},
+            "risk_levels": {"$addToSet": "$context_risk_level"},
+            "last_seen_at": {"$max": "$last_seen_at"},
+            "variants": {"$push": {"phrase": "$phrase", "occurrences": "$occurrences"}},
+        }},
+        {"$sort": {"total_occurrences": -1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "cluster_id": "$_id",
+            "representative": 1,
+            "variant_count": 1,
+            "total_occurrences": 1,
+            "categories": 1,
+            "risk_levels": 1,
+            "last_seen_at": 1,
+            "sample_variants": {"$slice": ["$variants", sample_size]},
+        }},
+    ]
+    clusters = await db[CANDIDATE_COLLECTION].aggregate(pipeline).to_list(limit)
+    return {"clusters": clusters, "count": len(clusters)}
+
+@router.put("/candidate-clusters/{cluster_id}/review")
+async def review_candidate_cluster(cluster_id: str, review: CandidateClusterReview, admin_id: str):
+    """Approve or reject every variant in a candidate phrase cluster"""
+    from safety.conversation_monitor import (
+        CANDIDATE_COLLECTION, flush_candidate_phrases, mark_candidate_cluster_reviewed
+    )
+    
+    await flush_candidate_phrases(db)
+    result = await db[CANDIDATE_COLLECTION].update_many(
+        {"cluster_id": cluster_id, "reviewed": False},
+        {"$set": {
+            "reviewed": True,
+            "approved": review.approved,
+            "reviewed_by": admin_id,
+            "reviewed_at": datetime.now(timezone.utc).isoformat(),
+            "admin_notes": review.admin_notes,
+        }}
+    )
+    mark_candidate_cluster_reviewed(cluster_id, review.approved)
+    
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Cluster not found or already reviewed")
+    
+    return {"message": "Cluster reviewed", "variants_updated": result.modified_count}
+
 # ============== STATISTICS ==============
 
 @router.get("/stats")
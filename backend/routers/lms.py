@@ -3,7 +3,7 @@ Radio Check Peer to Peer Training LMS - Backend API
 Handles courses, modules, quizzes, progress tracking, and certificates
 """
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone
@@ -11,21 +11,29 @@ from bson import ObjectId
 import secrets
 import logging
 import os
-import resend
-import bcrypt
 import jwt
 
-# Import the full curriculum
-from routers.lms_curriculum_part2 import get_full_curriculum
+from services.database import get_database
+from services.email_outbox import email_delivery_enabled, enqueue_email
+from services.pagination import page_response, paginate
+from services.passwords import hash_password, verify_and_rehash
 
 router = APIRouter(tags=["LMS"])
 
-# Initialize Resend
-resend.api_key = os.getenv("RESEND_API_KEY")
 LMS_JWT_SECRET = os.getenv("JWT_SECRET", "radiocheck-lms-secret-key-2024")
 
-# Get the full curriculum with all 14 modules
-MHFA_CURRICULUM = get_full_curriculum()
+# The full curriculum (all 14 modules) spans ~10k lines of content modules,
+# so it is built on first use or by the startup warm-up rather than on import
+_curriculum: Optional[Dict[str, Any]] = None
+
+
+def get_curriculum() -> Dict[str, Any]:
+    """Get the full MHFA curriculum, building it on first use."""
+    global _curriculum
+    if _curriculum is None:
+        from routers.lms_curriculum_part2 import get_full_curriculum
+        _curriculum = get_full_curriculum()
+    return _curriculum
 
 # ============================================================================
 # PYDANTIC MODELS
@@ -82,19 +90,9 @@ class LearnerSetPassword(BaseModel):
 
 
 # ============================================================================
-# PASSWORD UTILITY FUNCTIONS
+# TOKEN UTILITY FUNCTIONS
 # ============================================================================
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-
-def verify_password(password: str, password_hash: str) -> bool:
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
-
-
 def create_learner_token(email: str, full_name: str) -> str:
     """Create a JWT token for a learner"""
     payload = {
@@ -111,9 +109,8 @@ def create_learner_token(email: str, full_name: str) -> str:
 # ============================================================================
 
 def get_db():
-    """Get database connection - imported from main server"""
-    from server import db
-    return db
+    """Get database connection - the shared pool from services.database"""
+    return get_database()
 
 @router.post("/api/lms/volunteer/register")
 async def register_volunteer_interest(
@@ -222,12 +219,13 @@ async def send_volunteer_registration_email(registration: VolunteerRegistration,
 @router.get("/api/lms/course")
 async def get_course_info():
     """Get course information for public display"""
+    curriculum = get_curriculum()
     return {
-        "course_id": MHFA_CURRICULUM["course_id"],
-        "title": MHFA_CURRICULUM["title"],
-        "description": MHFA_CURRICULUM["description"],
-        "duration_hours": MHFA_CURRICULUM["duration_hours"],
-        "module_count": len(MHFA_CURRICULUM["modules"]),
+        "course_id": curriculum["course_id"],
+        "title": curriculum["title"],
+        "description": curriculum["description"],
+        "duration_hours": curriculum["duration_hours"],
+        "module_count": len(curriculum["modules"]),
         "modules": [
             {
                 "id": m["id"],
@@ -236,7 +234,7 @@ async def get_course_info():
                 "duration_minutes": m["duration_minutes"],
                 "is_critical": m["is_critical"]
             }
-            for m in MHFA_CURRICULUM["modules"]
+            for m in curriculum["modules"]
         ],
         "requirements": [
             "Internet connection",
@@ -275,7 +273,7 @@ async def set_learner_password(data: LearnerSetPassword):
         raise HTTPException(status_code=400, detail="Password already set. Please use the login form.")
     
     # Hash and save password
-    password_hash = hash_password(data.password)
+    password_hash = await hash_password(data.password)
     await db.lms_learners.update_one(
         {"email": data.email.lower()},
         {"$set": {"password_hash": password_hash, "password_set_at": datetime.now(timezone.utc)}}
@@ -312,14 +310,18 @@ async def learner_login(data: LearnerLogin):
             detail="Password not set. Please set your password first using the link from your approval email."
         )
     
-    # Verify password
-    if not verify_password(data.password, learner["password_hash"]):
+    # Verify password (re-hashing it if it was stored with an old bcrypt cost)
+    verified, new_hash = await verify_and_rehash(data.password, learner["password_hash"])
+    if not verified:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Update last login
+    update = {"last_login": datetime.now(timezone.utc)}
+    if new_hash:
+        update["password_hash"] = new_hash
     await db.lms_learners.update_one(
         {"email": data.email.lower()},
-        {"$set": {"last_login": datetime.now(timezone.utc)}}
+        {"$set": update}
     )
     
     # Generate token
@@ -332,7 +334,7 @@ async def learner_login(data: LearnerLogin):
             "email": learner["email"],
             "full_name": learner["full_name"],
             "progress_percent": round(
-                (len(learner["progress"]["completed_modules"]) / len(MHFA_CURRICULUM["modules"])) * 100
+                (len(learner["progress"]["completed_modules"]) / len(get_curriculum()["modules"])) * 100
             )
         }
     }
@@ -360,6 +362,7 @@ async def check_learner_status(email: str):
 async def enroll_learner(enrollment: LearnerEnrollment):
     """Enroll a learner in the course"""
     db = get_db()
+    curriculum = get_curriculum()
     
     # Check if already enrolled (case-insensitive)
     existing = await db.lms_learners.find_one({"email": enrollment.email.lower()})
@@ -377,10 +380,10 @@ async def enroll_learner(enrollment: LearnerEnrollment):
         "full_name": enrollment.full_name,
         "registration_id": enrollment.registration_id,
         "enrolled_at": datetime.now(timezone.utc),
-        "course_id": MHFA_CURRICULUM["course_id"],
+        "course_id": curriculum["course_id"],
         "progress": {
             "completed_modules": [],
-            "current_module": MHFA_CURRICULUM["modules"][0]["id"],
+            "current_module": curriculum["modules"][0]["id"],
             "quiz_scores": {},
             "total_time_spent_minutes": 0
         },
@@ -394,13 +397,14 @@ async def enroll_learner(enrollment: LearnerEnrollment):
         "success": True,
         "learner_id": str(result.inserted_id),
         "message": "Welcome! You're now enrolled in the course.",
-        "first_module": MHFA_CURRICULUM["modules"][0]["id"]
+        "first_module": curriculum["modules"][0]["id"]
     }
 
 @router.get("/api/lms/module/{module_id}")
 async def get_module(module_id: str, learner_email: str, admin_preview: bool = False):
     """Get module content for a learner"""
     db = get_db()
+    curriculum = get_curriculum()
     
     # Find learner (case-insensitive)
     learner = await db.lms_learners.find_one({"email": learner_email.lower()})
@@ -408,7 +412,7 @@ async def get_module(module_id: str, learner_email: str, admin_preview: bool = F
         raise HTTPException(status_code=404, detail="Learner not found")
     
     # Find module
-    module = next((m for m in MHFA_CURRICULUM["modules"] if m["id"] == module_id), None)
+    module = next((m for m in curriculum["modules"] if m["id"] == module_id), None)
     if not module:
         raise HTTPException(status_code=404, detail="Module not found")
     
@@ -418,7 +422,7 @@ async def get_module(module_id: str, learner_email: str, admin_preview: bool = F
     # Check if previous modules completed (sequential learning) - unless admin preview
     module_order = module["order"]
     if module_order > 1 and not is_admin_preview:
-        prev_module_id = MHFA_CURRICULUM["modules"][module_order - 2]["id"]
+        prev_module_id = curriculum["modules"][module_order - 2]["id"]
         if prev_module_id not in learner["progress"]["completed_modules"]:
             raise HTTPException(
                 status_code=403, 
@@ -444,7 +448,7 @@ async def submit_quiz(submission: QuizSubmission, learner_email: str):
         raise HTTPException(status_code=404, detail="Learner not found")
     
     # Find module and quiz
-    module = next((m for m in MHFA_CURRICULUM["modules"] if m["id"] == submission.module_id), None)
+    module = next((m for m in get_curriculum()["modules"] if m["id"] == submission.module_id), None)
     if not module or "quiz" not in module:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
@@ -514,6 +518,7 @@ async def submit_quiz(submission: QuizSubmission, learner_email: str):
 async def get_learner_progress(learner_email: str):
     """Get learner's course progress"""
     db = get_db()
+    curriculum = get_curriculum()
     
     # Case-insensitive email lookup
     learner = await db.lms_learners.find_one({"email": learner_email.lower()}, {"_id": 0})
@@ -522,7 +527,7 @@ async def get_learner_progress(learner_email: str):
     if not learner:
         raise HTTPException(status_code=404, detail="Learner not found")
     
-    total_modules = len(MHFA_CURRICULUM["modules"])
+    total_modules = len(curriculum["modules"])
     completed_modules = len(learner["progress"]["completed_modules"])
     
     return {
@@ -539,7 +544,7 @@ async def get_learner_progress(learner_email: str):
                 "score": learner["progress"]["quiz_scores"].get(m["id"]),
                 "is_critical": m["is_critical"]
             }
-            for m in MHFA_CURRICULUM["modules"]
+            for m in curriculum["modules"]
         ]
     }
 
@@ -547,6 +552,7 @@ async def get_learner_progress(learner_email: str):
 async def generate_certificate(learner_email: str):
     """Generate certificate for completed course"""
     db = get_db()
+    curriculum = get_curriculum()
     
     # Case-insensitive email lookup
     learner_email_lower = learner_email.lower()
@@ -555,7 +561,7 @@ async def generate_certificate(learner_email: str):
         raise HTTPException(status_code=404, detail="Learner not found")
     
     # Check all modules completed
-    total_modules = len(MHFA_CURRICULUM["modules"])
+    total_modules = len(curriculum["modules"])
     completed = len(learner["progress"]["completed_modules"])
     
     if completed < total_modules:
@@ -565,7 +571,7 @@ async def generate_certificate(learner_email: str):
         )
     
     # Check critical modules passed with 100%
-    for module in MHFA_CURRICULUM["modules"]:
+    for module in curriculum["modules"]:
         if module["is_critical"]:
             score = learner["progress"]["quiz_scores"].get(module["id"], 0)
             if score < 100:
@@ -580,7 +586,7 @@ async def generate_certificate(learner_email: str):
         "certificate_id": certificate_id,
         "learner_email": learner_email_lower,
         "learner_name": learner["full_name"],
-        "course_title": MHFA_CURRICULUM["title"],
+        "course_title": curriculum["title"],
         "issued_at": datetime.now(timezone.utc),
         "valid": True
     }
@@ -597,7 +603,7 @@ async def generate_certificate(learner_email: str):
         "success": True,
         "certificate_id": certificate_id,
         "learner_name": learner["full_name"],
-        "course_title": MHFA_CURRICULUM["title"],
+        "course_title": curriculum["title"],
         "issued_date": certificate_data["issued_at"].isoformat(),
         "verification_url": f"/api/lms/certificate/verify/{certificate_id}"
     }
@@ -638,20 +644,35 @@ async def get_volunteer_registrations(status: str = None):
     
     return {"registrations": registrations}
 
+# What the admin learner list may return; credentials never leave the database
+LEARNER_LIST_FIELDS = ["email", "full_name", "registration_id", "manual_add", "manual_add_notes",
+                       "enrolled_at", "course_id", "progress", "certificate_issued", "certificate_id"]
+
+
 @router.get("/api/lms/admin/learners")
-async def get_all_learners():
+async def get_all_learners(
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get all learners (admin)"""
     db = get_db()
     
-    learners = await db.lms_learners.find().sort("enrolled_at", -1).to_list(100)
+    page = await paginate(db.lms_learners, {}, sort_field="enrolled_at", id_field="_id",
+                          limit=limit, cursor=cursor, fields=fields, allowed_fields=LEARNER_LIST_FIELDS,
+                          exclude_fields=("password_hash", "password_set_at", "password_reset_at"),
+                          default_limit=100)
+    learners = page.items
     
+    total_modules = len(get_curriculum()["modules"])
     for learner in learners:
         learner["_id"] = str(learner["_id"])
-        total_modules = len(MHFA_CURRICULUM["modules"])
-        completed = len(learner["progress"]["completed_modules"])
-        learner["progress_percent"] = round((completed / total_modules) * 100)
+        if "progress" in learner:
+            completed = len(learner["progress"]["completed_modules"])
+            learner["progress_percent"] = round((completed / total_modules) * 100)
     
-    return {"learners": learners}
+    return page_response(request, {"learners": learners, "next_cursor": page.next_cursor}, page)
 
 @router.get("/api/lms/admin/alerts")
 async def get_admin_alerts(unread_only: bool = False):
@@ -672,7 +693,7 @@ async def get_admin_alerts(unread_only: bool = False):
 @router.get("/api/lms/admin/module/{module_id}")
 async def get_admin_module_details(module_id: str):
     """Get full module details including quiz questions for admin view"""
-    module = next((m for m in MHFA_CURRICULUM["modules"] if m["id"] == module_id), None)
+    module = next((m for m in get_curriculum()["modules"] if m["id"] == module_id), None)
     if not module:
         raise HTTPException(status_code=404, detail="Module not found")
     
@@ -707,6 +728,7 @@ async def mark_alert_read(alert_id: str):
 async def approve_registration(registration_id: str, background_tasks: BackgroundTasks):
     """Approve a volunteer registration and auto-enroll them in the course"""
     db = get_db()
+    curriculum = get_curriculum()
     
     try:
         reg = await db.volunteer_registrations.find_one({"_id": ObjectId(registration_id)})
@@ -733,10 +755,10 @@ async def approve_registration(registration_id: str, background_tasks: Backgroun
             "full_name": reg["full_name"],
             "registration_id": registration_id,
             "enrolled_at": datetime.now(timezone.utc),
-            "course_id": MHFA_CURRICULUM["course_id"],
+            "course_id": curriculum["course_id"],
             "progress": {
                 "completed_modules": [],
-                "current_module": MHFA_CURRICULUM["modules"][0]["id"],
+                "current_module": curriculum["modules"][0]["id"],
                 "quiz_scores": {},
                 "total_time_spent_minutes": 0
             },
@@ -755,10 +777,10 @@ async def approve_registration(registration_id: str, background_tasks: Backgroun
     }
 
 async def send_approval_email(email: str, name: str):
-    """Send approval notification email via Resend"""
+    """Queue approval notification email"""
     try:
-        if not resend.api_key:
-            logging.warning("No Resend API key configured - skipping email")
+        if not email_delivery_enabled():
+            logging.warning("Email delivery not configured - skipping email")
             return
             
         email_body = f"""
@@ -783,13 +805,13 @@ Welcome to the team!
 The Radio Check Team
         """
         
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": [email],
             "subject": "Your Radio Check Volunteer Application is Approved!",
             "text": email_body.strip()
-        })
-        logging.info(f"Approval email sent to {email}")
+        }, category="lms_approval")
+        logging.info(f"Approval email queued for {email}")
     except Exception as e:
         logging.error(f"Failed to send approval email: {e}")
 
@@ -797,6 +819,7 @@ The Radio Check Team
 async def admin_add_learner(learner: ManualLearnerAdd, background_tasks: BackgroundTasks):
     """Admin manually add a learner without requiring registration"""
     db = get_db()
+    curriculum = get_curriculum()
     
     # Validate password length
     if len(learner.password) < 8:
@@ -813,7 +836,7 @@ async def admin_add_learner(learner: ManualLearnerAdd, background_tasks: Backgro
         }
     
     # Hash the password
-    password_hash = hash_password(learner.password)
+    password_hash = await hash_password(learner.password)
     
     # Create learner record with password
     learner_data = {
@@ -825,10 +848,10 @@ async def admin_add_learner(learner: ManualLearnerAdd, background_tasks: Backgro
         "manual_add": True,
         "manual_add_notes": learner.notes,
         "enrolled_at": datetime.now(timezone.utc),
-        "course_id": MHFA_CURRICULUM["course_id"],
+        "course_id": curriculum["course_id"],
         "progress": {
             "completed_modules": [],
-            "current_module": MHFA_CURRICULUM["modules"][0]["id"],
+            "current_module": curriculum["modules"][0]["id"],
             "quiz_scores": {},
             "total_time_spent_minutes": 0
         },
@@ -883,10 +906,10 @@ async def reject_registration(registration_id: str, reason: str = None, backgrou
     }
 
 async def send_rejection_email(email: str, name: str, reason: str = None):
-    """Send rejection notification email via Resend"""
+    """Queue rejection notification email"""
     try:
-        if not resend.api_key:
-            logging.warning("No Resend API key configured - skipping email")
+        if not email_delivery_enabled():
+            logging.warning("Email delivery not configured - skipping email")
             return
             
         email_body = f"""
@@ -904,13 +927,13 @@ Best wishes,
 The Radio Check Team
         """
         
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": [email],
             "subject": "Update on Your Radio Check Volunteer Application",
             "text": email_body.strip()
-        })
-        logging.info(f"Rejection email sent to {email}")
+        }, category="lms_rejection")
+        logging.info(f"Rejection email queued for {email}")
     except Exception as e:
         logging.error(f"Failed to send rejection email: {e}")
 
@@ -1028,7 +1051,7 @@ async def admin_reset_password(learner_email: str, data: PasswordReset):
         raise HTTPException(status_code=404, detail="Learner not found")
     
     # Hash and update password
-    password_hash = hash_password(data.new_password)
+    password_hash = await hash_password(data.new_password)
     
     await db.lms_learners.update_one(
         {"email": learner_email.lower()},
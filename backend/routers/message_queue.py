@@ -9,6 +9,7 @@ from datetime import datetime
 import logging
 
 from services.database import get_database
+from services.push import deliver_queue_message
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/message-queue", tags=["message-queue"])
@@ -202,59 +203,23 @@ async def mark_user_offline(user_id: str):
 async def attempt_push_delivery(db, message_data: dict) -> bool:
     """
     Attempt to deliver a message via push notification.
-    Returns True if delivery was successful.
+    Returns True if delivery was successful; transient failures are
+    retried by the push scheduler (services/push.py).
     """
     try:
-        import httpx
-        
-        # Get recipient's push token
-        user = await db.users.find_one({"id": message_data["recipient_id"]})
-        push_token = user.get("push_token") if user else None
-        
-        if not push_token:
-            logger.info(f"No push token for user {message_data['recipient_id']}, message queued")
-            return False
-        
-        # Send via Expo Push Notifications
-        notification = {
-            "to": push_token,
-            "sound": "default",
-            "title": "New Message",
-            "body": message_data["message"][:100],  # Truncate for notification
-            "data": {
-                "type": message_data["message_type"],
-                "message_id": message_data["id"],
-                "sender_id": message_data["sender_id"]
-            }
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://exp.host/--/api/v2/push/send",
-                json=notification,
-                headers={"Content-Type": "application/json"},
-                timeout=10.0
-            )
-            
-            if response.status_code == 200:
-                # Mark as delivered via push
-                await db.message_queue.update_one(
-                    {"id": message_data["id"]},
-                    {"$set": {
-                        "status": "push_sent",
-                        "push_sent_at": datetime.utcnow()
-                    }}
-                )
-                logger.info(f"Push notification sent for message {message_data['id']}")
-                return True
-            else:
-                logger.error(f"Push notification failed: {response.text}")
-                return False
-                
+        result = await deliver_queue_message(db, message_data)
     except Exception as e:
         logger.error(f"Failed to send push notification: {e}")
         return False
 
+    if result.ok:
+        logger.info(f"Push notification sent for message {message_data['id']}")
+    elif result.error == "no_push_token":
+        logger.info(f"No push token for user {message_data['recipient_id']}, message queued")
+    else:
+        logger.error(f"Push notification failed for message {message_data['id']}: {result.error}")
+    return result.ok
+
 
 # ==================================
 # Cleanup & Maintenance
@@ -7,6 +7,7 @@ from typing import List, Optional
 import uuid
 from datetime import datetime
 
+from encryption import decrypt_document, decrypt_documents
 from services.database import get_database
 from models.schemas import NoteCreate, Note, NoteUpdate
 
@@ -47,6 +48,7 @@ async def get_notes(
         query["client_id"] = client_id
     
     notes = await db.notes.find(query).sort("created_at", -1).to_list(200)
+    notes = await decrypt_documents("notes", notes)
     return [{**n, "id": str(n.get("_id", n.get("id", "")))} for n in notes]
 
 
@@ -59,6 +61,7 @@ async def get_note(note_id: str):
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
+    note = decrypt_document("notes", note)
     note["id"] = str(note.get("_id", note.get("id", "")))
     return note
 
@@ -118,4 +121,5 @@ async def get_client_notes(client_id: str):
     db = get_database()
     
     notes = await db.notes.find({"client_id": client_id}).sort("created_at", -1).to_list(100)
+    notes = await decrypt_documents("notes", notes)
     return [{**n, "id": str(n.get("_id", n.get("id", "")))} for n in notes]
@@ -8,6 +8,7 @@ from pydantic import BaseModel
 import uuid
 from datetime import datetime
 
+from encryption import envelopes_as_strings
 from services.database import get_database
 from models.schemas import PanicAlertCreate, PanicAlert, SafeguardingAlert
 
@@ -234,7 +235,7 @@ async def get_safeguarding_alerts(status: Optional[str] = None, risk_level: Opti
         query["risk_level"] = risk_level
     
     alerts = await db.safeguarding_alerts.find(query).sort("created_at", -1).to_list(200)
-    return [{**a, "id": str(a.get("_id", a.get("id", "")))} for a in alerts]
+    return [{**envelopes_as_strings(a), "id": str(a.get("_id", a.get("id", "")))} for a in alerts]
 
 
 @router.get("/safeguarding-alerts/{alert_id}")
@@ -247,7 +248,7 @@ async def get_safeguarding_alert(alert_id: str):
         raise HTTPException(status_code=404, detail="Alert not found")
     
     alert["id"] = str(alert.get("_id", alert.get("id", "")))
-    return alert
+    return envelopes_as_strings(alert)
 
 
 @router.patch("/safeguarding-alerts/{alert_id}/acknowledge")
@@ -7,16 +7,12 @@ from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timezone
 import uuid
-import os
-import resend
 
 from services.database import get_database
+from services.email_outbox import email_delivery_enabled, enqueue_email
 
 router = APIRouter(prefix="/shift-swaps", tags=["shift-swaps"])
 
-# Initialize Resend for email notifications
-resend.api_key = os.getenv("RESEND_API_KEY")
-
 
 class SwapRequest(BaseModel):
     shift_id: str
@@ -282,7 +278,7 @@ async def get_swaps_needing_approval():
 # Notification helpers
 async def notify_staff_of_swap_request(db, swap: dict):
     """Send email to all staff about a new swap request"""
-    if not resend.api_key:
+    if not email_delivery_enabled():
         return
     
     # Get all staff emails (excluding the requester)
@@ -303,7 +299,7 @@ async def notify_staff_of_swap_request(db, swap: dict):
         return
     
     try:
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": emails,
             "subject": "Shift Cover Needed - Radio Check",
@@ -320,14 +316,14 @@ async def notify_staff_of_swap_request(db, swap: dict):
                     <p style="color: #6b7280; font-size: 12px;">First person to accept will get the shift (subject to admin approval).</p>
                 </div>
             """
-        })
+        }, category="shift_swap", dedupe_key=f"swap:{swap.get('id')}:requested", split_recipients=True, db=db)
     except Exception as e:
         print(f"Error sending swap notification: {e}")
 
 
 async def notify_swap_accepted(db, swap: dict, responder_name: str):
     """Notify requester that someone accepted their swap"""
-    if not resend.api_key:
+    if not email_delivery_enabled():
         return
     
     # Get requester email
@@ -339,7 +335,7 @@ async def notify_swap_accepted(db, swap: dict, responder_name: str):
         return
     
     try:
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": [requester.get("email")],
             "subject": "Your Shift Swap Has Been Accepted! - Radio Check",
@@ -350,14 +346,14 @@ async def notify_swap_accepted(db, swap: dict, responder_name: str):
                     <p>Waiting for admin approval. You'll be notified once confirmed.</p>
                 </div>
             """
-        })
+        }, category="shift_swap", dedupe_key=f"swap:{swap.get('id')}:accepted", db=db)
     except Exception as e:
         print(f"Error sending acceptance notification: {e}")
 
 
 async def notify_swap_decision(db, swap: dict, approved: bool, notes: str = None):
     """Notify both staff members of admin decision"""
-    if not resend.api_key:
+    if not email_delivery_enabled():
         return
     
     # Get both staff emails
@@ -376,7 +372,7 @@ async def notify_swap_decision(db, swap: dict, approved: bool, notes: str = None
     status_text = "Approved" if approved else "Rejected"
     
     try:
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": emails,
             "subject": f"Shift Swap {status_text} - Radio Check",
@@ -388,6 +384,6 @@ async def notify_swap_decision(db, swap: dict, approved: bool, notes: str = None
                     {"<p>The shift has been transferred. Check your schedule for updates.</p>" if approved else "<p>The original shift assignment remains unchanged.</p>"}
                 </div>
             """
-        })
+        }, category="shift_swap", dedupe_key=f"swap:{swap.get('id')}:decision", split_recipients=True, db=db)
     except Exception as e:
         print(f"Error sending decision notification: {e}")
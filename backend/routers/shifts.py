@@ -6,24 +6,21 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 import uuid
 from datetime import datetime, date
-import os
-import resend
 import logging
 
 from services.database import get_database
+from services.email_outbox import email_delivery_enabled, enqueue_email
+from services.push import send_push
 from models.schemas import ShiftCreate, Shift, ShiftUpdate
 
 router = APIRouter(prefix="/shifts", tags=["shifts"])
 logger = logging.getLogger(__name__)
 
-# Initialize Resend for email notifications
-resend.api_key = os.getenv("RESEND_API_KEY")
-
 
 async def send_shift_notification(shift_data: dict, staff_email: str, notification_type: str = "created"):
-    """Send email notification for shift changes"""
-    if not resend.api_key:
-        logger.warning("RESEND_API_KEY not set, skipping email notification")
+    """Queue email notification for shift changes"""
+    if not email_delivery_enabled():
+        logger.warning("Email delivery not configured, skipping email notification")
         return False
     
     subject_map = {
@@ -33,7 +30,7 @@ async def send_shift_notification(shift_data: dict, staff_email: str, notificati
     }
     
     try:
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": [staff_email],
             "subject": subject_map.get(notification_type, "Shift Notification"),
@@ -47,8 +44,8 @@ async def send_shift_notification(shift_data: dict, staff_email: str, notificati
                 </ul>
                 <p>Log in to the staff portal for more details.</p>
             """
-        })
-        logger.info(f"Shift notification email sent to {staff_email}")
+        }, category="shift")
+        logger.info(f"Shift notification email queued for {staff_email}")
         return True
     except Exception as e:
         logger.error(f"Failed to send shift notification: {e}")
@@ -60,45 +57,20 @@ async def send_push_notification(user_id: str, title: str, body: str, data: dict
     Send push notification to a user
     This integrates with Expo Push Notifications for React Native
     """
-    db = get_database()
-    
-    # Get user's push token
-    user = await db.users.find_one({"id": user_id})
-    push_token = user.get("push_token") if user else None
-    
-    if not push_token:
-        logger.warning(f"No push token for user {user_id}")
-        return False
-    
     try:
-        import httpx
-        
-        message = {
-            "to": push_token,
-            "sound": "default",
-            "title": title,
-            "body": body,
-            "data": data or {}
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://exp.host/--/api/v2/push/send",
-                json=message,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Push notification sent to user {user_id}")
-                return True
-            else:
-                logger.error(f"Push notification failed: {response.text}")
-                return False
-                
+        result = await send_push(user_id, title, body, data)
     except Exception as e:
         logger.error(f"Failed to send push notification: {e}")
         return False
 
+    if result.ok:
+        logger.info(f"Push notification sent to user {user_id}")
+    elif result.error == "no_push_token":
+        logger.warning(f"No push token for user {user_id}")
+    else:
+        logger.error(f"Push notification failed: {result.error}")
+    return result.ok
+
 
 @router.get("/")
 async def get_shifts(
@@ -3,12 +3,15 @@ Surveys Router - Beta feedback surveys with feature flag control
 """
 from datetime import datetime, timezone
 from typing import Optional, List
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import csv
 import io
 
+from services.database import get_database
+from services.pagination import page_response, paginate
+
 router = APIRouter(prefix="/surveys", tags=["surveys"])
 
 # ============================================
@@ -49,7 +52,7 @@ class SurveyResponse(BaseModel):
 @router.get("/beta-enabled")
 async def check_beta_enabled():
     """Check if beta testing mode is enabled"""
-    from server import db
+    db = get_database()
     
     settings = await db.app_settings.find_one({"key": "beta_testing"})
     enabled = settings.get("enabled", False) if settings else False
@@ -59,7 +62,7 @@ async def check_beta_enabled():
 @router.post("/beta-enabled")
 async def set_beta_enabled(flag: FeatureFlagUpdate):
     """Enable or disable beta testing mode (admin only)"""
-    from server import db
+    db = get_database()
     
     await db.app_settings.update_one(
         {"key": "beta_testing"},
@@ -76,7 +79,7 @@ async def set_beta_enabled(flag: FeatureFlagUpdate):
 @router.post("/pre", response_model=SurveyResponse)
 async def submit_pre_survey(survey: PreSurveySubmission):
     """Submit pre-usage survey"""
-    from server import db
+    db = get_database()
     
     # Check if beta mode is enabled
     settings = await db.app_settings.find_one({"key": "beta_testing"})
@@ -108,7 +111,7 @@ async def submit_pre_survey(survey: PreSurveySubmission):
 @router.post("/post", response_model=SurveyResponse)
 async def submit_post_survey(survey: PostSurveySubmission):
     """Submit post-usage survey"""
-    from server import db
+    db = get_database()
     
     # Check if beta mode is enabled
     settings = await db.app_settings.find_one({"key": "beta_testing"})
@@ -145,7 +148,7 @@ async def submit_post_survey(survey: PostSurveySubmission):
 async def get_survey_status(user_id: str):
     """Check which surveys a user has completed"""
     try:
-        from server import db
+        db = get_database()
         
         pre = await db.survey_responses.find_one({"user_id": user_id, "survey_type": "pre"})
         post = await db.survey_responses.find_one({"user_id": user_id, "survey_type": "post"})
@@ -176,16 +179,28 @@ async def get_survey_status(user_id: str):
 # Admin Endpoints
 # ============================================
 
+RESPONSE_FIELDS = ["survey_type", "submitted_at", *PreSurveySubmission.model_fields,
+                   *PostSurveySubmission.model_fields]
+
+
 @router.get("/responses")
-async def get_all_responses(survey_type: Optional[str] = None, limit: int = 100):
+async def get_all_responses(
+    request: Request,
+    survey_type: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get all survey responses (admin)"""
-    from server import db
+    db = get_database()
     
     query = {}
     if survey_type:
         query["survey_type"] = survey_type
     
-    responses = await db.survey_responses.find(query).sort("submitted_at", -1).limit(limit).to_list(limit)
+    page = await paginate(db.survey_responses, query, sort_field="submitted_at", id_field="_id",
+                          limit=limit, cursor=cursor, fields=fields, allowed_fields=RESPONSE_FIELDS)
+    responses = page.items
     
     # Convert ObjectId to string
     for r in responses:
@@ -193,12 +208,12 @@ async def get_all_responses(survey_type: Optional[str] = None, limit: int = 100)
         if "submitted_at" in r:
             r["submitted_at"] = r["submitted_at"].isoformat()
     
-    return {"responses": responses, "count": len(responses)}
+    return page_response(request, {"responses": responses, "count": len(responses), "next_cursor": page.next_cursor}, page)
 
 @router.get("/stats")
 async def get_survey_stats():
     """Get aggregated survey statistics (admin)"""
-    from server import db
+    db = get_database()
     
     # Count responses
     pre_count = await db.survey_responses.count_documents({"survey_type": "pre"})
@@ -254,7 +269,7 @@ async def get_survey_stats():
 @router.get("/export")
 async def export_responses_csv():
     """Export all survey responses as CSV (admin)"""
-    from server import db
+    db = get_database()
     
     responses = await db.survey_responses.find({}).sort("submitted_at", -1).to_list(1000)
     
@@ -13,12 +13,11 @@ import io
 
 router = APIRouter(prefix="/api/timetracking", tags=["Time Tracking"])
 
-# MongoDB connection
-from pymongo import MongoClient
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-DB_NAME = os.environ.get("DB_NAME", "radiocheck")
-client = MongoClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared async pool). Time tracking has always defaulted
+# to the "radiocheck" database when DB_NAME is unset, unlike the rest of the
+# backend ("veterans_support"); keep reading the data where it was written.
+from services.database import get_database
+db = get_database(os.environ.get("DB_NAME", "radiocheck"))
 time_entries = db.time_entries
 active_sessions = db.time_tracking_sessions
 
@@ -147,7 +146,7 @@ async def create_entry(entry: TimeEntryCreate):
         "updated_at": now,
     }
     
-    result = time_entries.insert_one(doc)
+    result = await time_entries.insert_one(doc)
     doc["_id"] = result.inserted_id
     
     return {"message": "Entry created", "entry": serialize_entry(doc)}
@@ -174,9 +173,9 @@ async def get_entries(
         query["category"] = category
     
     cursor = time_entries.find(query).sort("date", -1).skip(skip).limit(limit)
-    entries = [serialize_entry(e) for e in cursor]
+    entries = [serialize_entry(e) for e in await cursor.to_list(limit)]
     
-    total = time_entries.count_documents(query)
+    total = await time_entries.count_documents(query)
     
     return {
         "entries": entries,
@@ -189,7 +188,7 @@ async def get_entries(
 async def get_entry(entry_id: str):
     """Get a specific time entry"""
     try:
-        entry = time_entries.find_one({"_id": ObjectId(entry_id)})
+        entry = await time_entries.find_one({"_id": ObjectId(entry_id)})
     except:
         raise HTTPException(status_code=400, detail="Invalid entry ID")
     
@@ -202,7 +201,7 @@ async def get_entry(entry_id: str):
 async def update_entry(entry_id: str, update: TimeEntryUpdate):
     """Update a time entry"""
     try:
-        entry = time_entries.find_one({"_id": ObjectId(entry_id)})
+        entry = await time_entries.find_one({"_id": ObjectId(entry_id)})
     except:
         raise HTTPException(status_code=400, detail="Invalid entry ID")
     
@@ -216,16 +215,16 @@ async def update_entry(entry_id: str, update: TimeEntryUpdate):
     
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc)
-        time_entries.update_one({"_id": ObjectId(entry_id)}, {"$set": update_data})
+        await time_entries.update_one({"_id": ObjectId(entry_id)}, {"$set": update_data})
     
-    updated = time_entries.find_one({"_id": ObjectId(entry_id)})
+    updated = await time_entries.find_one({"_id": ObjectId(entry_id)})
     return {"message": "Entry updated", "entry": serialize_entry(updated)}
 
 @router.delete("/entries/{entry_id}")
 async def delete_entry(entry_id: str):
     """Delete a time entry"""
     try:
-        result = time_entries.delete_one({"_id": ObjectId(entry_id)})
+        result = await time_entries.delete_one({"_id": ObjectId(entry_id)})
     except:
         raise HTTPException(status_code=400, detail="Invalid entry ID")
     
@@ -249,7 +248,7 @@ async def start_session(session: SessionStart):
         "active": True,
     }
     
-    result = active_sessions.insert_one(doc)
+    result = await active_sessions.insert_one(doc)
     
     return {
         "session_id": str(result.inserted_id),
@@ -260,7 +259,7 @@ async def start_session(session: SessionStart):
 async def session_heartbeat(session_id: str):
     """Update session activity timestamp"""
     try:
-        result = active_sessions.update_one(
+        result = await active_sessions.update_one(
             {"_id": ObjectId(session_id), "active": True},
             {"$set": {"last_activity": datetime.now(timezone.utc)}}
         )
@@ -276,7 +275,7 @@ async def session_heartbeat(session_id: str):
 async def end_session(data: SessionEnd):
     """End a session and create time entry"""
     try:
-        session = active_sessions.find_one({"_id": ObjectId(data.session_id)})
+        session = await active_sessions.find_one({"_id": ObjectId(data.session_id)})
     except:
         raise HTTPException(status_code=400, detail="Invalid session ID")
     
@@ -285,6 +284,9 @@ async def end_session(data: SessionEnd):
     
     # Calculate duration
     started_at = session["started_at"]
+    if started_at.tzinfo is None:
+        # MongoDB returns naive UTC datetimes
+        started_at = started_at.replace(tzinfo=timezone.utc)
     ended_at = datetime.now(timezone.utc)
     duration = ended_at - started_at
     
@@ -305,10 +307,10 @@ async def end_session(data: SessionEnd):
             "created_at": ended_at,
             "updated_at": ended_at,
         }
-        time_entries.insert_one(entry_doc)
+        await time_entries.insert_one(entry_doc)
     
     # Mark session as inactive
-    active_sessions.update_one(
+    await active_sessions.update_one(
         {"_id": ObjectId(data.session_id)},
         {"$set": {"active": False, "ended_at": ended_at}}
     )
@@ -360,7 +362,7 @@ async def get_summary(
         }}
     ]
     
-    results = list(time_entries.aggregate(pipeline))
+    results = await time_entries.aggregate(pipeline).to_list(None)
     
     # Calculate totals
     by_category = {}
@@ -394,7 +396,7 @@ async def get_summary(
         {"$sort": {"_id": 1}}
     ]
     
-    daily_results = list(time_entries.aggregate(daily_pipeline))
+    daily_results = await time_entries.aggregate(daily_pipeline).to_list(None)
     daily_breakdown = []
     for d in daily_results:
         total_mins = d["total_hours"] * 60 + d["total_minutes"]
@@ -442,9 +444,9 @@ async def export_entries(
         end_date = f"{year_num}-{month_num + 1:02d}-01"
     
     # Get entries
-    entries = list(time_entries.find({
+    entries = await time_entries.find({
         "date": {"$gte": start_date, "$lt": end_date}
-    }).sort("date", 1))
+    }).sort("date", 1).to_list(None)
     
     # Create workbook
     wb = openpyxl.Workbook()
@@ -550,7 +552,7 @@ async def seed_historical_data():
     """Seed historical time entries based on Emergent development sessions"""
     
     # Check if already seeded
-    existing = time_entries.count_documents({})
+    existing = await time_entries.count_documents({})
     if existing > 0:
         return {"message": f"Already have {existing} entries. Delete them first to re-seed.", "seeded": False}
     
@@ -602,7 +604,7 @@ async def seed_historical_data():
         entry["created_at"] = now
         entry["updated_at"] = now
     
-    result = time_entries.insert_many(historical_entries)
+    result = await time_entries.insert_many(historical_entries)
     
     # Calculate totals
     total_minutes = sum(e["hours"] * 60 + e["minutes"] for e in historical_entries)
@@ -619,5 +621,5 @@ async def delete_all_entries(confirm: bool = Query(False)):
     if not confirm:
         raise HTTPException(status_code=400, detail="Must set confirm=true to delete all entries")
     
-    result = time_entries.delete_many({})
+    result = await time_entries.delete_many({})
     return {"message": f"Deleted {result.deleted_count} entries"}
@@ -44,6 +44,10 @@ from .conversation_monitor import (
     clear_conversation_state,
     flag_candidate_phrase,
     get_candidate_phrases_for_review,
+    get_candidate_clusters_for_review,
+    mark_candidate_cluster_reviewed,
+    flush_candidate_phrases,
+    run_candidate_phrase_flusher,
     get_audit_log,
 )
 
@@ -63,6 +67,19 @@ from .unified_safety import (
     initialize_safety_system,
 )
 
+from .output_scanner import (
+    ReplySafetyScanner,
+    ReplyScanResult,
+    scan_reply,
+)
+
+from .metrics import (
+    time_layer,
+    observe_layer,
+    get_safety_metrics,
+    render_prometheus,
+)
+
 from .ai_safety_classifier import (
     classify_message_with_ai,
     should_invoke_ai_classifier,
@@ -102,6 +119,10 @@ __all__ = [
     'clear_conversation_state',
     'flag_candidate_phrase',
     'get_candidate_phrases_for_review',
+    'get_candidate_clusters_for_review',
+    'mark_candidate_cluster_reviewed',
+    'flush_candidate_phrases',
+    'run_candidate_phrase_flusher',
     'get_audit_log',
     
     # Semantic Model
@@ -118,6 +139,17 @@ __all__ = [
     'get_safety_system_status',
     'initialize_safety_system',
     
+    # Reply Scanner
+    'ReplySafetyScanner',
+    'ReplyScanResult',
+    'scan_reply',
+    
+    # Instrumentation
+    'time_layer',
+    'observe_layer',
+    'get_safety_metrics',
+    'render_prometheus',
+    
     # AI Safety Classifier (OpenAI)
     'classify_message_with_ai',
     'should_invoke_ai_classifier',
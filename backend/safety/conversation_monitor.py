@@ -11,10 +11,13 @@ the ENTIRE conversation, not just individual messages.
 """
 
 import asyncio
+import hashlib
 import logging
 import re
+import threading
 import time
-from collections import deque
+import uuid
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
@@ -117,6 +120,13 @@ CRISIS_PATTERNS = {
     },
 }
 
+# Candidate phrase learning
+CANDIDATE_MEMORY_LIMIT = 5000           # Max candidates held in memory (oldest evicted)
+CANDIDATE_CLUSTER_SIMILARITY = 0.85     # Cosine similarity to join an existing cluster
+CANDIDATE_FLUSH_BATCH_SIZE = 50         # Flush to MongoDB once this many writes are pending
+CANDIDATE_FLUSH_INTERVAL_SECONDS = 30   # ...or at least this often
+CANDIDATE_COLLECTION = "safety_candidate_phrases"
+
 
 # ============================================================================
 # DATA STRUCTURES
@@ -202,6 +212,23 @@ class CandidatePhrase:
     embedding_vector: Optional[np.ndarray] = None
     reviewed: bool = False
     approved: bool = False
+    key: str = ""                      # Hash of the normalized phrase (exact-duplicate index)
+    cluster_id: Optional[str] = None   # Near-duplicate group
+    occurrences: int = 1
+    last_seen: Optional[datetime] = None
+
+
+@dataclass
+class CandidateCluster:
+    """Group of near-duplicate candidate phrases, reviewed together."""
+    cluster_id: str
+    representative: str
+    centroid: Optional[np.ndarray] = None   # Unit-length mean embedding
+    member_keys: List[str] = field(default_factory=list)
+    embedded_members: int = 0
+    total_occurrences: int = 0
+    categories: Dict[str, int] = field(default_factory=dict)
+    highest_risk_level: str = "NONE"
 
 
 # ============================================================================
@@ -211,8 +238,16 @@ class CandidatePhrase:
 # Active conversation states (session_id -> ConversationSafetyState)
 conversation_states: Dict[str, ConversationSafetyState] = {}
 
-# Candidate phrases for learning (requires human moderation)
-candidate_phrase_memory: List[CandidatePhrase] = []
+# Candidate phrases for learning (requires human moderation), keyed by
+# normalized-phrase hash and kept in least-recently-seen order
+candidate_phrase_memory: "OrderedDict[str, CandidatePhrase]" = OrderedDict()
+
+# Near-duplicate clusters of candidates (cluster_id -> CandidateCluster)
+candidate_clusters: Dict[str, CandidateCluster] = {}
+
+# Coalesced MongoDB writes waiting for the next batch flush (key -> write)
+_pending_candidate_writes: Dict[str, Dict[str, Any]] = {}
+_candidate_lock = threading.Lock()
 
 # Audit log for all safety assessments
 safety_audit_log: List[Dict] = []
@@ -230,19 +265,39 @@ def _initialize_phrase_lookup():
     """Pre-compute phrase lookup tables for performance."""
     global _phrase_lookup, _phrases_by_weight
     
+    if _phrase_lookup:
+        return
+    
+    # Build into locals and swap in at the end so a concurrent reader never
+    # sees a half-built table
+    lookup: Dict[str, PhraseEntry] = {}
+    by_weight: Dict[int, List[str]] = {}
+    
     for phrase_entry in ALL_PHRASES:
         normalized = phrase_entry.phrase.lower().strip()
-        _phrase_lookup[normalized] = phrase_entry
+        lookup[normalized] = phrase_entry
         
         weight = phrase_entry.severity_weight
-        if weight not in _phrases_by_weight:
-            _phrases_by_weight[weight] = []
-        _phrases_by_weight[weight].append(normalized)
+        if weight not in by_weight:
+            by_weight[weight] = []
+        by_weight[weight].append(normalized)
+    
+    _phrases_by_weight = by_weight
+    _phrase_lookup = lookup
     
     logger.info(f"[ConversationSafetyMonitor] Initialized phrase lookup with {len(_phrase_lookup)} phrases")
 
-# Initialize on module load
-_initialize_phrase_lookup()
+
+def _ensure_phrase_lookup() -> Dict[str, PhraseEntry]:
+    """Build the lookup tables on first use (or during startup warm-up)."""
+    if not _phrase_lookup:
+        _initialize_phrase_lookup()
+    return _phrase_lookup
+
+
+def warm_up_conversation_monitor() -> bool:
+    """Startup warm-up hook - builds the phrase lookup off the request path."""
+    return bool(_ensure_phrase_lookup())
 
 
 # ============================================================================
@@ -403,7 +458,7 @@ def _analyze_single_message(message: str, message_index: int) -> MessageSafetyRe
     total_score = 0
     
     # Check against phrase dataset
-    for phrase, entry in _phrase_lookup.items():
+    for phrase, entry in _ensure_phrase_lookup().items():
         if phrase in normalized:
             matched_phrases.append(phrase)
             categories_triggered.append(entry.category)
@@ -831,6 +886,105 @@ def _log_safety_assessment(
 # CANDIDATE PHRASE LEARNING
 # ============================================================================
 
+def _normalize_candidate(phrase: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = re.sub(r"[^\w\s']", " ", phrase.lower())
+    return " ".join(text.split())
+
+
+def _candidate_key(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+def _unit_vector(vector: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if vector is None:
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+def _assign_cluster(candidate: CandidatePhrase) -> CandidateCluster:
+    """Put a new candidate into the closest cluster, or start a new one."""
+    unit = _unit_vector(candidate.embedding_vector)
+    
+    best_cluster = None
+    if unit is not None:
+        embedded = [c for c in candidate_clusters.values() if c.centroid is not None]
+        if embedded:
+            centroids = np.stack([c.centroid for c in embedded])
+            similarities = centroids @ unit
+            best_idx = int(np.argmax(similarities))
+            if similarities[best_idx] >= CANDIDATE_CLUSTER_SIMILARITY:
+                best_cluster = embedded[best_idx]
+    
+    if best_cluster is None:
+        best_cluster = CandidateCluster(
+            cluster_id=str(uuid.uuid4()),
+            representative=candidate.phrase,
+            centroid=unit,
+            embedded_members=1 if unit is not None else 0,
+        )
+        candidate_clusters[best_cluster.cluster_id] = best_cluster
+    elif unit is not None:
+        # Running mean of member embeddings, re-normalized
+        n = best_cluster.embedded_members
+        merged = best_cluster.centroid * n + unit
+        best_cluster.centroid = _unit_vector(merged)
+        best_cluster.embedded_members = n + 1
+    
+    best_cluster.member_keys.append(candidate.key)
+    candidate.cluster_id = best_cluster.cluster_id
+    return best_cluster
+
+
+def _record_cluster_hit(cluster: CandidateCluster, candidate: CandidatePhrase):
+    cluster.total_occurrences += 1
+    cluster.categories[candidate.inferred_category] = cluster.categories.get(candidate.inferred_category, 0) + 1
+    if _compare_risk_levels(candidate.context_risk_level, cluster.highest_risk_level) > 0:
+        cluster.highest_risk_level = candidate.context_risk_level
+
+
+def _evict_candidates():
+    """Drop the least-recently-seen candidates beyond CANDIDATE_MEMORY_LIMIT.
+
+    Evicted candidates stay in MongoDB (pending writes are kept until flushed).
+    """
+    while len(candidate_phrase_memory) > CANDIDATE_MEMORY_LIMIT:
+        key, evicted = candidate_phrase_memory.popitem(last=False)
+        cluster = candidate_clusters.get(evicted.cluster_id)
+        if cluster:
+            if key in cluster.member_keys:
+                cluster.member_keys.remove(key)
+            if not cluster.member_keys:
+                del candidate_clusters[cluster.cluster_id]
+
+
+def _queue_candidate_write(candidate: CandidatePhrase, is_new: bool):
+    """Coalesce a write for the next batch flush."""
+    pending = _pending_candidate_writes.get(candidate.key)
+    if pending is None:
+        pending = {
+            "key": candidate.key,
+            "phrase": candidate.phrase,
+            "inferred_category": candidate.inferred_category,
+            "context_risk_level": candidate.context_risk_level,
+            "cluster_id": candidate.cluster_id,
+            "session_id": candidate.session_id,
+            "first_detected_at": candidate.detected_at,
+            "embedding": (
+                np.asarray(candidate.embedding_vector, dtype=np.float32).tobytes()
+                if is_new and candidate.embedding_vector is not None else None
+            ),
+            "occurrences": 0,
+        }
+        _pending_candidate_writes[candidate.key] = pending
+    pending["occurrences"] += 1
+    pending["last_seen_at"] = candidate.last_seen or candidate.detected_at
+
+
 def flag_candidate_phrase(
     phrase: str,
     session_id: str,
@@ -842,29 +996,69 @@ def flag_candidate_phrase(
     """
     Flag a phrase as a candidate for addition to the dataset.
     Requires human moderation before inclusion.
+    
+    Exact duplicates (after normalization) are found via a hash index and
+    only bump the occurrence count. New candidates are grouped with
+    near-duplicates by embedding similarity so reviewers see clusters.
+    The embedding is the one the caller already computed; without one the
+    candidate starts its own cluster (no model inference on this path).
     """
+    normalized = _normalize_candidate(phrase)
+    if not normalized:
+        return
+    
     # Don't add if already in dataset
-    if phrase.lower().strip() in _phrase_lookup:
+    if phrase.lower().strip() in _ensure_phrase_lookup() or normalized in _phrase_lookup:
         return
     
-    # Don't add duplicates to candidates
-    for existing in candidate_phrase_memory:
-        if existing.phrase.lower() == phrase.lower():
+    key = _candidate_key(normalized)
+    now = datetime.utcnow()
+    
+    with _candidate_lock:
+        existing = candidate_phrase_memory.get(key)
+        if existing is not None:
+            existing.occurrences += 1
+            existing.last_seen = now
+            candidate_phrase_memory.move_to_end(key)
+            cluster = candidate_clusters.get(existing.cluster_id)
+            if cluster:
+                _record_cluster_hit(cluster, existing)
+            _queue_candidate_write(existing, is_new=False)
             return
     
     candidate = CandidatePhrase(
         phrase=phrase,
-        detected_at=datetime.utcnow(),
+        detected_at=now,
         session_id=session_id,
         user_id=user_id,
         inferred_category=inferred_category,
         context_risk_level=context_risk_level,
         embedding_vector=embedding_vector,
+        key=key,
+        last_seen=now,
     )
     
-    candidate_phrase_memory.append(candidate)
-    
-    logger.info(f"[ConversationSafetyMonitor] Flagged candidate phrase: '{phrase}' -> {inferred_category}")
+    with _candidate_lock:
+        if key in candidate_phrase_memory:
+            # Raced with another flag of the same phrase
+            existing = candidate_phrase_memory[key]
+            existing.occurrences += 1
+            existing.last_seen = now
+            cluster = candidate_clusters.get(existing.cluster_id)
+            if cluster:
+                _record_cluster_hit(cluster, existing)
+            _queue_candidate_write(existing, is_new=False)
+            return
+        cluster = _assign_cluster(candidate)
+        _record_cluster_hit(cluster, candidate)
+        candidate_phrase_memory[key] = candidate
+        _queue_candidate_write(candidate, is_new=True)
+        _evict_candidates()
+    
+    logger.info(
+        f"[ConversationSafetyMonitor] Flagged candidate phrase: '{phrase}' -> {inferred_category} "
+        f"(cluster {candidate.cluster_id[:8]}, {len(cluster.member_keys)} variants)"
+    )
 
 
 def get_candidate_phrases_for_review() -> List[Dict]:
@@ -876,12 +1070,192 @@ def get_candidate_phrases_for_review() -> List[Dict]:
             "inferred_category": c.inferred_category,
             "context_risk_level": c.context_risk_level,
             "reviewed": c.reviewed,
+            "occurrences": c.occurrences,
+            "cluster_id": c.cluster_id,
         }
-        for c in candidate_phrase_memory
+        for c in list(candidate_phrase_memory.values())
         if not c.reviewed
     ]
 
 
+def get_candidate_clusters_for_review(limit: int = 50, sample_size: int = 5) -> List[Dict]:
+    """Get near-duplicate clusters of unreviewed candidates, largest first."""
+    clusters = []
+    for cluster in list(candidate_clusters.values()):
+        members = [
+            candidate_phrase_memory[k] for k in cluster.member_keys
+            if k in candidate_phrase_memory and not candidate_phrase_memory[k].reviewed
+        ]
+        if not members:
+            continue
+        members.sort(key=lambda c: c.occurrences, reverse=True)
+        clusters.append({
+            "cluster_id": cluster.cluster_id,
+            "representative": cluster.representative,
+            "variant_count": len(members),
+            "total_occurrences": cluster.total_occurrences,
+            "categories": dict(cluster.categories),
+            "highest_risk_level": cluster.highest_risk_level,
+            "sample_variants": [
+                {"phrase": c.phrase, "occurrences": c.occurrences}
+                for c in members[:sample_size]
+            ],
+        })
+    clusters.sort(key=lambda c: c["total_occurrences"], reverse=True)
+    return clusters[:limit]
+
+
+def mark_candidate_cluster_reviewed(cluster_id: str, approved: bool) -> int:
+    """Mark every in-memory member of a cluster as reviewed. Returns the count."""
+    cluster = candidate_clusters.get(cluster_id)
+    if not cluster:
+        return 0
+    count = 0
+    with _candidate_lock:
+        for key in cluster.member_keys:
+            candidate = candidate_phrase_memory.get(key)
+            if candidate:
+                candidate.reviewed = True
+                candidate.approved = approved
+                count += 1
+    return count
+
+
+# ============================================================================
+# CANDIDATE PHRASE PERSISTENCE (MongoDB, batched)
+# ============================================================================
+
+async def flush_candidate_phrases(db, batch_size: int = CANDIDATE_FLUSH_BATCH_SIZE) -> int:
+    """
+    Write pending candidate phrases to MongoDB with bulk_write.
+    Returns the number of candidates written.
+    """
+    from pymongo import UpdateOne
+    from bson.binary import Binary
+    
+    with _candidate_lock:
+        if not _pending_candidate_writes:
+            return 0
+        pending = list(_pending_candidate_writes.values())
+        _pending_candidate_writes.clear()
+    
+    written = 0
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        operations = []
+        for write in batch:
+            on_insert = {
+                "key": write["key"],
+                "phrase": write["phrase"],
+                "inferred_category": write["inferred_category"],
+                "context_risk_level": write["context_risk_level"],
+                "cluster_id": write["cluster_id"],
+                "session_id": write["session_id"],
+                "first_detected_at": write["first_detected_at"],
+                "reviewed": False,
+                "approved": False,
+            }
+            if write["embedding"] is not None:
+                on_insert["embedding"] = Binary(write["embedding"])
+            operations.append(UpdateOne(
+                {"key": write["key"]},
+                {
+                    "$setOnInsert": on_insert,
+                    "$set": {"last_seen_at": write["last_seen_at"]},
+                    "$inc": {"occurrences": write["occurrences"]},
+                },
+                upsert=True,
+            ))
+        try:
+            await db[CANDIDATE_COLLECTION].bulk_write(operations, ordered=False)
+            written += len(batch)
+        except Exception as e:
+            logger.error(f"[ConversationSafetyMonitor] Candidate phrase flush failed: {e}")
+            # Re-queue so nothing is lost; merge with writes that arrived meanwhile
+            with _candidate_lock:
+                for write in batch:
+                    queued = _pending_candidate_writes.get(write["key"])
+                    if queued:
+                        queued["occurrences"] += write["occurrences"]
+                    else:
+                        _pending_candidate_writes[write["key"]] = write
+    
+    if written:
+        logger.info(f"[ConversationSafetyMonitor] Persisted {written} candidate phrases")
+    return written
+
+
+async def load_candidate_phrases(db, limit: int = CANDIDATE_MEMORY_LIMIT) -> int:
+    """Seed the in-memory index from unreviewed candidates in MongoDB."""
+    docs = await db[CANDIDATE_COLLECTION].find(
+        {"reviewed": False},
+        {"_id": 0}
+    ).sort("last_seen_at", -1).to_list(limit)
+    
+    with _candidate_lock:
+        # Oldest first, so the most recently seen end up last in the LRU order
+        for doc in reversed(docs):
+            if doc["key"] in candidate_phrase_memory:
+                continue
+            embedding = doc.get("embedding")
+            candidate = CandidatePhrase(
+                phrase=doc["phrase"],
+                detected_at=doc.get("first_detected_at") or datetime.utcnow(),
+                session_id=doc.get("session_id", ""),
+                user_id="",
+                inferred_category=doc.get("inferred_category", "unknown"),
+                context_risk_level=doc.get("context_risk_level", "NONE"),
+                embedding_vector=np.frombuffer(embedding, dtype=np.float32) if embedding else None,
+                key=doc["key"],
+                occurrences=doc.get("occurrences", 1),
+                last_seen=doc.get("last_seen_at"),
+            )
+            cluster = candidate_clusters.get(doc.get("cluster_id"))
+            if cluster is None:
+                cluster = CandidateCluster(
+                    cluster_id=doc.get("cluster_id") or str(uuid.uuid4()),
+                    representative=candidate.phrase,
+                    centroid=_unit_vector(candidate.embedding_vector),
+                    embedded_members=1 if candidate.embedding_vector is not None else 0,
+                )
+                candidate_clusters[cluster.cluster_id] = cluster
+            cluster.member_keys.append(candidate.key)
+            cluster.total_occurrences += candidate.occurrences
+            cluster.categories[candidate.inferred_category] = (
+                cluster.categories.get(candidate.inferred_category, 0) + candidate.occurrences
+            )
+            candidate.cluster_id = cluster.cluster_id
+            candidate_phrase_memory[candidate.key] = candidate
+        _evict_candidates()
+    
+    logger.info(f"[ConversationSafetyMonitor] Loaded {len(docs)} candidate phrases from MongoDB")
+    return len(docs)
+
+
+async def run_candidate_phrase_flusher(db, interval_seconds: int = CANDIDATE_FLUSH_INTERVAL_SECONDS):
+    """
+    Background task: flush candidates when a batch fills up, or every
+    interval_seconds otherwise. Cancel to stop (a final flush runs on cancel).
+    """
+    try:
+        await load_candidate_phrases(db)
+    except Exception as e:
+        logger.error(f"[ConversationSafetyMonitor] Could not load candidate phrases: {e}")
+    
+    since_flush = 0
+    try:
+        while True:
+            await asyncio.sleep(1)
+            since_flush += 1
+            if (len(_pending_candidate_writes) >= CANDIDATE_FLUSH_BATCH_SIZE or
+                    (since_flush >= interval_seconds and _pending_candidate_writes)):
+                await flush_candidate_phrases(db)
+                since_flush = 0
+    except asyncio.CancelledError:
+        await flush_candidate_phrases(db)
+        raise
+
+
 # ============================================================================
 # SESSION MANAGEMENT
 # ============================================================================
@@ -0,0 +1,177 @@
+"""
+RadioCheck Safeguarding - Safety Instrumentation
+================================================
+
+Per-layer latency histograms and counters for the safety pipeline, so we
+can see in production which layer is using the latency budget.
+
+Layers timed:
+    keyword, semantic, conversation, ai, knowledge_lookup, reply_scan, total
+
+Counters:
+    analyses, classifier_invocations, classifier_cache_hits,
+    classifier_errors, failsafe_triggers (by reason), reply_blocks
+
+Everything is in-process and lock-protected (layers run in worker threads
+as well as on the event loop). Exposed as Prometheus text at
+/api/safety/metrics and as live percentiles in get_safety_system_status().
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Histogram bucket upper bounds in milliseconds (Prometheus "le" buckets)
+LATENCY_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Recent samples kept per layer for live percentiles
+PERCENTILE_WINDOW = 1000
+
+SAFETY_LAYERS = [
+    "keyword", "semantic", "conversation", "ai", "knowledge_lookup", "reply_scan", "total",
+]
+
+_COUNTER_HELP = {
+    "analyses": "Messages analysed by the unified safety system",
+    "classifier_invocations": "AI classifier invocations",
+    "classifier_cache_hits": "AI classifier results served from cache",
+    "classifier_errors": "AI classifier calls that failed",
+    "failsafe_triggers": "Hard failsafe triggers by reason",
+    "reply_blocks": "Generated replies blocked by the reply scanner",
+}
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus a window of recent samples."""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+        self.recent: deque = deque(maxlen=PERCENTILE_WINDOW)
+
+    def observe(self, value_ms: float):
+        self.count += 1
+        self.total_ms += value_ms
+        self.recent.append(value_ms)
+        for i, bound in enumerate(self.buckets):
+            if value_ms <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        samples = sorted(self.recent)
+        if not samples:
+            return {"count": 0, "avg_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+
+        def pick(q: float) -> float:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2),
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99),
+            "max_ms": round(samples[-1], 2),
+        }
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, LatencyHistogram] = {layer: LatencyHistogram() for layer in SAFETY_LAYERS}
+_counters: Dict[str, Dict[str, int]] = {name: {} for name in _COUNTER_HELP}
+
+
+# ============================================================================
+# RECORDING
+# ============================================================================
+
+def observe_layer(layer: str, duration_ms: float):
+    """Record how long a safety layer took."""
+    with _lock:
+        histogram = _histograms.get(layer)
+        if histogram is None:
+            histogram = _histograms[layer] = LatencyHistogram()
+        histogram.observe(duration_ms)
+
+
+@contextmanager
+def time_layer(layer: str):
+    """Time a block of work as one observation for a safety layer."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_layer(layer, (time.perf_counter() - start) * 1000)
+
+
+def increment(counter: str, label: str = "", amount: int = 1):
+    """Increment a counter, optionally split by a label value."""
+    with _lock:
+        values = _counters.setdefault(counter, {})
+        values[label] = values.get(label, 0) + amount
+
+
+def reset_safety_metrics():
+    """Clear all metrics (tests)."""
+    with _lock:
+        for layer in list(_histograms):
+            _histograms[layer] = LatencyHistogram()
+        for values in _counters.values():
+            values.clear()
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def get_layer_percentiles() -> Dict[str, Dict[str, Optional[float]]]:
+    """Live latency percentiles per layer over the recent sample window."""
+    with _lock:
+        return {layer: histogram.percentiles() for layer, histogram in _histograms.items()}
+
+
+def get_counters() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        return {name: dict(values) for name, values in _counters.items()}
+
+
+def get_safety_metrics() -> Dict[str, object]:
+    """Percentiles and counters in one snapshot."""
+    return {
+        "layers": get_layer_percentiles(),
+        "counters": get_counters(),
+    }
+
+
+def render_prometheus() -> str:
+    """Metrics in Prometheus text exposition format."""
+    lines = [
+        "# HELP safety_layer_duration_ms Time spent in each safety layer",
+        "# TYPE safety_layer_duration_ms histogram",
+    ]
+    with _lock:
+        for layer, histogram in _histograms.items():
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'safety_layer_duration_ms_bucket{{layer="{layer}",le="{bound}"}} {cumulative}')
+            lines.append(f'safety_layer_duration_ms_bucket{{layer="{layer}",le="+Inf"}} {histogram.count}')
+            lines.append(f'safety_layer_duration_ms_sum{{layer="{layer}"}} {round(histogram.total_ms, 3)}')
+            lines.append(f'safety_layer_duration_ms_count{{layer="{layer}"}} {histogram.count}')
+
+        for name, values in _counters.items():
+            metric = f"safety_{name}_total"
+            lines.append(f"# HELP {metric} {_COUNTER_HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            if not values:
+                lines.append(f"{metric} 0")
+            for label, value in sorted(values.items()):
+                if label:
+                    lines.append(f'{metric}{{reason="{label}"}} {value}')
+                else:
+                    lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
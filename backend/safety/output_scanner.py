@@ -0,0 +1,225 @@
+"""
+RadioCheck Safeguarding - Reply Safety Scanner
+==============================================
+
+Scans the AI persona's own reply before it reaches the user.
+
+The scanner is incremental: text is fed chunk by chunk as it is produced
+(e.g. from a streaming completion) and only the new text, plus a short
+overlap for phrases that straddle a chunk boundary, is scanned each time.
+Incomplete trailing words are held back until the next chunk so a chunk
+ending in "car" is not mistaken for a match before "pet" arrives.
+
+Three rule sets run on every chunk:
+- REPLY_FAILSAFE_PATTERNS (method information, lethality comparison,
+  validation of suicidal intent). Each needs explicit self-harm context
+  inside word boundaries, so everyday phrasing ("what works better for
+  you", "the best way to end a rough day") does not match. A hit BLOCKS
+  the reply.
+- HARD_FAILSAFE_PATTERNS from enhanced_safety_layer. They were written for
+  user messages and are too loose for the persona's own text, so hits are
+  only recorded (flagged_patterns) for review.
+- The compiled keyword lexicon from the safety monitor. Hits are recorded
+  for audit only, since supportive replies legitimately mention crisis
+  language ("if you're thinking about suicide, call Samaritans").
+
+Run the latency benchmark with:
+    python -m safety.output_scanner
+"""
+
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from enhanced_safety_layer import HARD_FAILSAFE_PATTERNS
+
+from . import metrics as safety_metrics
+from .safety_monitor import get_keyword_matcher, normalise_text
+
+logger = logging.getLogger(__name__)
+
+# Characters of already-scanned text re-scanned with each new chunk, so
+# phrases and failsafe patterns spanning a chunk boundary are still found.
+# Must be longer than the longest phrase / failsafe match.
+REPLY_SCAN_OVERLAP_CHARS = 100
+
+_SELF = r"(yourself|myself|themselves|himself|herself)"
+_END_LIFE = rf"(die|dying|kill(ing)? {_SELF}|end(ing)? (your|my|their) (own )?life|end(ing)? it all|commit(ting)? suicide|suicide)"
+
+# Patterns that block a generated reply (matched against normalise_text output)
+REPLY_FAILSAFE_PATTERNS = [
+    # Method information
+    rf"\b(best|quickest|fastest|easiest|surest|painless|least painful) (way|ways|method|methods) (to|of) {_END_LIFE}\b",
+    rf"\bhow (to|you (can|could|would)) (kill|hang|overdose|poison) {_SELF}\b",
+    r"\b(\d+|enough|how many) (pills|tablets|paracetamol|painkillers) (to|would|will) (kill|be (fatal|lethal))\b",
+    rf"\b(use|get|buy) (pills|rope|a weapon|a gun) to (kill|hang|harm|hurt) {_SELF}\b",
+    # Lethality comparison
+    r"\b(most|more|less) (lethal|deadly) (method|methods|way|ways|dose|option)\b",
+    rf"\b(most|more) effective (method|methods|way|ways) (to|of) {_END_LIFE}\b",
+    r"\b(method|methods|pills|tablets|overdose|hanging|poison) (works|kills|would kill you) (faster|quicker|better)\b",
+    # Validation of suicidal intent
+    rf"\b(it['’]?s|it is) (ok|okay|fine|alright|right) (for you )?to {_END_LIFE}\b",
+    rf"\b(support|respect|agree with) your (decision|choice|plan) to {_END_LIFE}\b",
+    rf"\byou (should|deserve to) {_END_LIFE}\b",
+]
+
+_COMPILED_FAILSAFE = [re.compile(p) for p in REPLY_FAILSAFE_PATTERNS]
+# One combined scan for the common path (no failsafe hit at all)
+_FAILSAFE_ANY = re.compile("|".join(f"(?:{p})" for p in REPLY_FAILSAFE_PATTERNS))
+# The user-input rules: recorded, never blocking
+_COMPILED_INPUT_FAILSAFE = [re.compile(p) for p in HARD_FAILSAFE_PATTERNS]
+_INPUT_FAILSAFE_ANY = re.compile("|".join(f"(?:{p})" for p in HARD_FAILSAFE_PATTERNS))
+
+_WHITESPACE_RE = re.compile(r'\s')
+
+
+@dataclass
+class ReplyScanResult:
+    """Outcome of scanning a generated reply"""
+    blocked: bool = False
+    failsafe_patterns: List[str] = field(default_factory=list)
+    flagged_patterns: List[str] = field(default_factory=list)
+    lexicon_hits: List[str] = field(default_factory=list)
+    chunks_scanned: int = 0
+    scan_time_ms: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "blocked": self.blocked,
+            "failsafe_patterns": self.failsafe_patterns,
+            "flagged_patterns": self.flagged_patterns,
+            "lexicon_hits": self.lexicon_hits,
+            "chunks_scanned": self.chunks_scanned,
+            "scan_time_ms": round(self.scan_time_ms, 3),
+        }
+
+
+class ReplySafetyScanner:
+    """
+    Incremental safety scanner for a single generated reply.
+
+    Usage:
+        scanner = ReplySafetyScanner()
+        for chunk in stream:
+            if scanner.feed(chunk).blocked:
+                break
+        result = scanner.finish()
+    """
+
+    def __init__(self, overlap_chars: int = REPLY_SCAN_OVERLAP_CHARS):
+        self.overlap_chars = overlap_chars
+        self.result = ReplyScanResult()
+        self._matcher = get_keyword_matcher()
+        self._pending = ""   # Raw text not yet scanned (incomplete last word)
+        self._context = ""   # Tail of scanned text, re-scanned with the next chunk
+        self._seen_hits = set()
+
+    def feed(self, chunk: str) -> ReplyScanResult:
+        """Add a chunk of the reply and scan every complete word in it."""
+        if not chunk or self.result.blocked:
+            return self.result
+
+        self._pending += chunk
+        # Hold back the trailing partial word until more text arrives
+        cut = max(self._pending.rfind(" "), self._pending.rfind("\n"))
+        if cut <= 0:
+            return self.result
+
+        ready, self._pending = self._pending[:cut], self._pending[cut:]
+        self._scan(ready)
+        return self.result
+
+    def finish(self) -> ReplyScanResult:
+        """Scan any held-back text. Call once the reply is complete."""
+        if self._pending and not self.result.blocked:
+            pending, self._pending = self._pending, ""
+            self._scan(pending)
+        safety_metrics.observe_layer("reply_scan", self.result.scan_time_ms)
+        if self.result.blocked:
+            safety_metrics.increment("reply_blocks")
+        return self.result
+
+    def _scan(self, new_text: str):
+        start = time.perf_counter()
+        window = self._context + new_text
+        text = normalise_text(window)
+
+        # Hard failsafe patterns — block the reply
+        if _FAILSAFE_ANY.search(text):
+            for pattern in _COMPILED_FAILSAFE:
+                if pattern.search(text) and pattern.pattern not in self.result.failsafe_patterns:
+                    self.result.failsafe_patterns.append(pattern.pattern)
+            self.result.blocked = True
+            logger.warning("REPLY FAILSAFE TRIGGERED: generated reply matched a hard failsafe pattern")
+
+        # User-input failsafe patterns — record for review
+        if _INPUT_FAILSAFE_ANY.search(text):
+            for pattern in _COMPILED_INPUT_FAILSAFE:
+                if pattern.search(text) and pattern.pattern not in self.result.flagged_patterns:
+                    self.result.flagged_patterns.append(pattern.pattern)
+
+        # Lexicon — record for audit
+        for tier, tier_hits in self._matcher.scan(text).items():
+            for hit in tier_hits:
+                key = f"{tier}: '{hit.phrase}'"
+                if key not in self._seen_hits:
+                    self._seen_hits.add(key)
+                    self.result.lexicon_hits.append(key)
+
+        # Keep an overlap that starts on a word boundary
+        tail = window[-self.overlap_chars:]
+        if len(window) > self.overlap_chars:
+            boundary = _WHITESPACE_RE.search(tail)
+            tail = tail[boundary.start():] if boundary else ""
+        self._context = tail
+
+        self.result.chunks_scanned += 1
+        self.result.scan_time_ms += (time.perf_counter() - start) * 1000
+
+
+def scan_reply(reply: str, chunk_size: Optional[int] = None) -> ReplyScanResult:
+    """
+    Scan a complete reply. With chunk_size the reply is fed in pieces of that
+    many characters, matching what a streaming completion would deliver.
+    """
+    scanner = ReplySafetyScanner()
+    if chunk_size:
+        for i in range(0, len(reply), chunk_size):
+            if scanner.feed(reply[i:i + chunk_size]).blocked:
+                break
+    else:
+        scanner.feed(reply)
+    return scanner.finish()
+
+
+def benchmark_reply_scanner(replies: List[str], chunk_size: int = 16, rounds: int = 200) -> dict:
+    """Average and worst-case scan time per reply, in milliseconds."""
+    timings = []
+    for _ in range(rounds):
+        for reply in replies:
+            start = time.perf_counter()
+            scan_reply(reply, chunk_size=chunk_size)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "replies": len(timings),
+        "chunk_size": chunk_size,
+        "avg_ms": round(sum(timings) / len(timings), 3),
+        "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+
+if __name__ == "__main__":
+    sample_replies = [
+        "That sounds like a really tough day, mate. I'm glad you told me. "
+        "Do you want to talk through what happened at the appointment? "
+        "Sometimes just getting it off your chest helps a bit, and I'm here "
+        "for as long as you need.",
+        "I hear you, and I'm worried about you. If you're having thoughts of "
+        "suicide, please call Samaritans on 116 123, free, any time. A real "
+        "person is available right now too - just use the button below.",
+    ] * 2
+    print(benchmark_reply_scanner(sample_replies))
@@ -20,7 +20,7 @@ KNOWN LIMITATIONS:
 import re
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, NamedTuple, Optional, Set, Tuple
 from collections import deque
 from enum import Enum
 
@@ -115,6 +115,117 @@ def is_negated(text: str, match_start: int) -> bool:
     return False
 
 
+# =============================================================================
+# TIERED KEYWORD MATCHER
+# =============================================================================
+
+_WORD_RE = re.compile(r'\w+')
+_WORD_CHAR_RE = re.compile(r'\w')
+_SIMPLE_WORD_PATTERN_RE = re.compile(r'\\b(\w+)\\b')
+
+
+class KeywordHit(NamedTuple):
+    tier: str
+    order: int      # Position of the phrase in its tier's keyword list
+    phrase: str
+    start: int
+
+
+class TieredKeywordMatcher:
+    """
+    Matches every keyword tier against normalised text in a single pass.
+    
+    Phrases are indexed by their first word. The scan walks the words of the
+    text once and only compares phrases that start with the current word, so
+    a benign message costs one dictionary lookup per word instead of one
+    regex search per keyword. All hits are returned, including overlapping
+    ones (e.g. "take all my pills" is a critical phrase and "pills" is a
+    means multiplier), each tagged with its tier.
+    
+    Because normalise_text collapses whitespace to single spaces, a literal
+    comparison with word boundaries is equivalent to build_pattern().
+    Phrases that cannot be indexed that way fall back to a regex.
+    """
+    
+    def __init__(
+        self,
+        tiers: Dict[str, List[str]],
+        regex_tiers: Optional[Set[str]] = None
+    ):
+        self._by_first_word: Dict[str, List[Tuple[str, str, int]]] = {}
+        self._fallback: List[Tuple[str, int, re.Pattern]] = []
+        regex_tiers = regex_tiers or set()
+        
+        for tier, phrases in tiers.items():
+            for order, phrase in enumerate(phrases):
+                if tier in regex_tiers:
+                    simple = _SIMPLE_WORD_PATTERN_RE.fullmatch(phrase)
+                    if not simple:
+                        self._fallback.append(
+                            (tier, order, re.compile(phrase, re.IGNORECASE))
+                        )
+                        continue
+                    phrase = simple.group(1)
+                phrase = normalise_text(phrase)
+                first_word = _WORD_RE.match(phrase)
+                if not first_word or not _WORD_CHAR_RE.match(phrase[-1]):
+                    self._fallback.append((tier, order, build_pattern(phrase)))
+                    continue
+                self._by_first_word.setdefault(first_word.group(), []).append(
+                    (phrase, tier, order)
+                )
+    
+    def scan(self, text: str) -> Dict[str, List[KeywordHit]]:
+        """
+        Return all hits in normalised text, grouped by tier and sorted by
+        keyword order (then position) within each tier.
+        """
+        found: List[KeywordHit] = []
+        index = self._by_first_word
+        text_len = len(text)
+        
+        for word in _WORD_RE.finditer(text):
+            candidates = index.get(word.group())
+            if not candidates:
+                continue
+            start = word.start()
+            for phrase, tier, order in candidates:
+                end = start + len(phrase)
+                if not text.startswith(phrase, start):
+                    continue
+                if end < text_len and _WORD_CHAR_RE.match(text, end):
+                    continue
+                found.append(KeywordHit(tier, order, phrase, start))
+        
+        for tier, order, pattern in self._fallback:
+            for match in pattern.finditer(text):
+                found.append(KeywordHit(tier, order, match.group(), match.start()))
+        
+        hits: Dict[str, List[KeywordHit]] = {}
+        for hit in sorted(found, key=lambda h: (h.order, h.start)):
+            hits.setdefault(hit.tier, []).append(hit)
+        return hits
+
+
+_matcher_cache: Dict[Tuple, TieredKeywordMatcher] = {}
+
+
+def get_tiered_matcher(
+    tiers: Dict[str, List[str]],
+    regex_tiers: Optional[Set[str]] = None
+) -> TieredKeywordMatcher:
+    """Return a shared matcher for this keyword set, building it on first use."""
+    key = (
+        tuple((tier, tuple(phrases)) for tier, phrases in tiers.items()),
+        frozenset(regex_tiers or ()),
+    )
+    matcher = _matcher_cache.get(key)
+    if matcher is None:
+        matcher = TieredKeywordMatcher(tiers, regex_tiers)
+        _matcher_cache[key] = matcher
+    return matcher
+
+
 # =============================================================================
 # SAFETY MONITOR
 # =============================================================================
@@ -132,7 +243,8 @@ class EnhancedSafetyMonitor:
     
     Matching approach:
         - Text is normalised before matching (whitespace, case, punctuation)
-        - Word-boundary regex prevents substring false positives
+        - One tiered scan finds every keyword hit; word boundaries
+          prevent substring false positives
         - Negation window check reduces false positives from context
         - Context multipliers escalate risk when co-occurring signals present
     
@@ -237,37 +349,39 @@ class EnhancedSafetyMonitor:
             ],
         }
         
-        # Pre-compile all patterns at init for performance
-        self._compiled_critical = [build_pattern(k) for k in self.critical_keywords]
-        self._compiled_high = [build_pattern(k) for k in self.high_risk_keywords]
-        self._compiled_medium = [build_pattern(k) for k in self.medium_risk_keywords]
-        self._compiled_ideation = [build_pattern(k) for k in self.ideation_keywords]
-        self._compiled_informal = [re.compile(p, re.IGNORECASE) for p in self.informal_critical]
-        self._compiled_multipliers = {
-            cat: [build_pattern(k) for k in keywords]
-            for cat, keywords in self.risk_multipliers.items()
+        # One matcher over every tier, compiled once per keyword set and
+        # shared by all monitor instances
+        tiers = {
+            "critical": self.critical_keywords,
+            "informal": self.informal_critical,
+            "high": self.high_risk_keywords,
+            "medium": self.medium_risk_keywords,
+            "ideation": self.ideation_keywords,
         }
+        for category, keywords in self.risk_multipliers.items():
+            tiers[f"multiplier:{category}"] = keywords
+        self._matcher = get_tiered_matcher(tiers, regex_tiers={"informal"})
     
     def _match(
         self,
         text: str,
-        patterns: List[re.Pattern],
+        hits: Dict[str, List[KeywordHit]],
+        tier: str,
         check_negation: bool = True
     ) -> Optional[str]:
         """
-        Attempt to match any pattern against normalised text.
+        Pick the first keyword (in list order) hit for a tier.
+        Negation is only checked for phrases that actually matched.
         Returns matched keyword string or None.
         """
-        for pattern in patterns:
-            match = pattern.search(text)
-            if match:
-                if check_negation and is_negated(text, match.start()):
-                    logger.info(
-                        f"Negated match skipped: '{match.group()}' "
-                        f"user={self.user_id}"
-                    )
-                    continue
-                return match.group()
+        for hit in hits.get(tier, ()):
+            if check_negation and is_negated(text, hit.start):
+                logger.info(
+                    f"Negated match skipped: '{hit.phrase}' "
+                    f"user={self.user_id}"
+                )
+                continue
+            return hit.phrase
         return None
     
     def assess_safety(
@@ -308,12 +422,15 @@ class EnhancedSafetyMonitor:
             # PHASE 1: Direct keyword matching
             # =================================================================
             
+            # Single scan over every tier; the common benign path ends here
+            hits = self._matcher.scan(text)
+            
             # CRITICAL
-            matched = self._match(text, self._compiled_critical)
+            matched = self._match(text, hits, "critical")
             if not matched:
                 # Also check informal patterns (no negation check)
                 matched = self._match(
-                    text, self._compiled_informal, check_negation=False
+                    text, hits, "informal", check_negation=False
                 )
             
             if matched:
@@ -328,7 +445,7 @@ class EnhancedSafetyMonitor:
             
             # HIGH
             if risk_level != RiskLevel.CRITICAL:
-                matched = self._match(text, self._compiled_high)
+                matched = self._match(text, hits, "high")
                 if matched:
                     risk_level = RiskLevel.HIGH
                     safety_concerns.append("high_suicide_risk")
@@ -341,7 +458,7 @@ class EnhancedSafetyMonitor:
             
             # MEDIUM
             if risk_level not in [RiskLevel.CRITICAL, RiskLevel.HIGH]:
-                matched = self._match(text, self._compiled_medium)
+                matched = self._match(text, hits, "medium")
                 if matched:
                     risk_level = RiskLevel.MEDIUM
                     safety_concerns.append("self_harm_risk")
@@ -354,7 +471,7 @@ class EnhancedSafetyMonitor:
             
             # LOW
             if risk_level == RiskLevel.NONE:
-                matched = self._match(text, self._compiled_ideation)
+                matched = self._match(text, hits, "ideation")
                 if matched:
                     risk_level = RiskLevel.LOW
                     safety_concerns.append("suicidal_ideation")
@@ -368,9 +485,9 @@ class EnhancedSafetyMonitor:
             # PHASE 2: Context multipliers
             # =================================================================
             multiplier_found = False
-            for category, patterns in self._compiled_multipliers.items():
+            for category in self.risk_multipliers:
                 matched_multiplier = self._match(
-                    text, patterns, check_negation=False
+                    text, hits, f"multiplier:{category}", check_negation=False
                 )
                 if matched_multiplier:
                     multiplier_found = True
@@ -541,3 +658,11 @@ def assess_message_safety(
     """
     monitor = EnhancedSafetyMonitor(user_id)
     return monitor.assess_safety(message, emotional_context)
+
+
+def get_keyword_matcher() -> TieredKeywordMatcher:
+    """
+    The shared matcher over the monitor's default keyword tiers
+    (critical, informal, high, medium, ideation, multiplier:<category>).
+    """
+    return EnhancedSafetyMonitor()._matcher
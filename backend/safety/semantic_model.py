@@ -11,6 +11,7 @@ cosine similarity for phrase matching.
 """
 
 import logging
+import threading
 import time
 from typing import Dict, List, Optional, Tuple, Any
 import numpy as np
@@ -126,6 +127,10 @@ _model = None
 _reference_embeddings: Dict[str, List[np.ndarray]] = {}
 _model_loaded = False
 
+# Held while the model loads so a background warm-up and a request never
+# load it twice; request paths don't wait on it (see initialize_semantic_model)
+_model_lock = threading.Lock()
+
 
 def _load_model():
     """Load the sentence transformer model."""
@@ -166,13 +171,32 @@ def _precompute_reference_embeddings():
     logger.info(f"[SemanticSafetyModel] Pre-computed {total_phrases} reference embeddings in {elapsed:.1f}ms")
 
 
-def initialize_semantic_model() -> bool:
-    """Initialize the semantic model and pre-compute embeddings."""
-    if not _load_model():
-        return False
+def initialize_semantic_model(blocking: bool = True) -> bool:
+    """
+    Initialize the semantic model and pre-compute embeddings.
     
-    _precompute_reference_embeddings()
-    return True
+    With blocking=False, returns False immediately if another thread
+    (normally the startup warm-up) is already loading the model, so
+    request handlers degrade to the other safety layers instead of stalling.
+    """
+    if _model_loaded and _reference_embeddings:
+        return True
+    
+    if not _model_lock.acquire(blocking=blocking):
+        return False
+    try:
+        if not _load_model():
+            return False
+        if not _reference_embeddings:
+            _precompute_reference_embeddings()
+        return True
+    finally:
+        _model_lock.release()
+
+
+def is_semantic_model_warm() -> bool:
+    """True once the model and reference embeddings are ready to use."""
+    return _model_loaded and bool(_reference_embeddings)
 
 
 # ============================================================================
@@ -182,7 +206,7 @@ def initialize_semantic_model() -> bool:
 def compute_embedding(text: str) -> Optional[np.ndarray]:
     """Compute embedding for a text string."""
     if not _model:
-        if not _load_model():
+        if not initialize_semantic_model(blocking=False):
             return None
     
     try:
@@ -220,10 +244,11 @@ def analyze_semantic_risk(
         - highest_similarity: highest cosine similarity found
         - matched_category: category with highest match
         - semantic_matches: list of matches above threshold
+        - embedding: the message's embedding (with return_details)
     """
     if not _model or not _reference_embeddings:
-        # Try to initialize
-        if not initialize_semantic_model():
+        # Try to initialize (skipped while the background warm-up holds the lock)
+        if not initialize_semantic_model(blocking=False):
             return {
                 "semantic_risk_score": 0,
                 "highest_similarity": 0.0,
@@ -293,6 +318,8 @@ def analyze_semantic_risk(
         "model_available": True,
         "processing_time_ms": round(processing_time, 2),
     }
+    if return_details:
+        result["embedding"] = message_embedding
     
     # Log high-similarity detections
     if highest_similarity >= SIMILARITY_THRESHOLD_MEDIUM:
@@ -310,7 +337,7 @@ def batch_analyze_semantic_risk(messages: List[str]) -> List[Dict[str, Any]]:
     More efficient than calling analyze_semantic_risk individually.
     """
     if not _model or not _reference_embeddings:
-        if not initialize_semantic_model():
+        if not initialize_semantic_model(blocking=False):
             return [{"semantic_risk_score": 0, "model_available": False} for _ in messages]
     
     # Batch encode all messages
@@ -452,6 +479,7 @@ def full_semantic_analysis(message: str) -> Dict[str, Any]:
         "requires_intervention": requires_intervention,
         "model_available": embedding_analysis.get("model_available", False),
         "processing_time_ms": embedding_analysis.get("processing_time_ms", 0),
+        "embedding": embedding_analysis.get("embedding"),  # reused for candidate phrases
     }
 
 
@@ -459,10 +487,8 @@ def full_semantic_analysis(message: str) -> Dict[str, Any]:
 # INITIALIZATION
 # ============================================================================
 
-# Attempt to initialize on module load (will gracefully fail if dependencies missing)
-try:
-    initialize_semantic_model()
-except Exception as e:
-    logger.warning(f"[SemanticSafetyModel] Initialization skipped: {e}")
+# The model is NOT loaded on import: loading sentence-transformers/torch takes
+# several seconds. server.py warms it up in the background after startup
+# (services.warmup); other callers load it lazily on first use.
 
-print("[SemanticSafetyModel] Module loaded - semantic similarity analysis ready")
+print("[SemanticSafetyModel] Module loaded - semantic model loads on warm-up or first use")
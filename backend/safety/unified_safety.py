@@ -40,6 +40,8 @@ from .semantic_model import (
 )
 from .phrase_dataset import get_phrase_count, CATEGORY_SEVERITY_ORDER
 
+from . import metrics as safety_metrics
+
 # Import AI classifier (new)
 from .ai_safety_classifier import (
     classify_message_with_ai,
@@ -116,7 +118,8 @@ def analyze_message_unified(
     # LAYER 1: Keyword-based Safety Monitor (Existing)
     # Fast, deterministic keyword matching
     # =========================================================================
-    keyword_result = assess_message_safety(message)
+    with safety_metrics.time_layer("keyword"):
+        keyword_result = assess_message_safety(message)
     keyword_score = _risk_level_to_score(keyword_result.get("risk_level", "none"))
     keyword_triggers = keyword_result.get("matched_keywords", [])
     
@@ -124,20 +127,22 @@ def analyze_message_unified(
     # LAYER 2: Semantic Similarity Analysis (New)
     # Embedding-based detection of indirect expressions
     # =========================================================================
-    semantic_result = full_semantic_analysis(message)
+    with safety_metrics.time_layer("semantic"):
+        semantic_result = full_semantic_analysis(message)
     semantic_score = semantic_result.get("combined_semantic_score", 0)
     
     # =========================================================================
     # LAYER 3: Conversation Trajectory Analysis (New)
     # Full context evaluation with pattern detection
     # =========================================================================
-    conversation_result = analyze_message_with_context(
-        message=message,
-        session_id=session_id,
-        user_id=user_id,
-        character=character,
-        semantic_score=semantic_result.get("highest_similarity", 0.0)
-    )
+    with safety_metrics.time_layer("conversation"):
+        conversation_result = analyze_message_with_context(
+            message=message,
+            session_id=session_id,
+            user_id=user_id,
+            character=character,
+            semantic_score=semantic_result.get("highest_similarity", 0.0)
+        )
     conversation_score = conversation_result.get("conversation_risk_score", 0)
     
     # =========================================================================
@@ -189,10 +194,14 @@ def analyze_message_unified(
                     loop.close()
             
             # Run in a thread pool to avoid event loop conflicts
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(run_ai_classification)
-                ai_result = future.result(timeout=10)  # 10 second timeout
+            safety_metrics.increment("classifier_invocations")
+            with safety_metrics.time_layer("ai"):
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    future = executor.submit(run_ai_classification)
+                    ai_result = future.result(timeout=10)  # 10 second timeout
             
+            if ai_result.get("cached"):
+                safety_metrics.increment("classifier_cache_hits")
             ai_invoked = ai_result.get("ai_used", False)
             ai_score = ai_result.get("risk_score", 0)
             
@@ -210,6 +219,7 @@ def analyze_message_unified(
             
         except Exception as e:
             logger.error(f"[UnifiedSafety] AI classification failed: {e}")
+            safety_metrics.increment("classifier_errors")
             ai_result = {"error": str(e), "ai_used": False}
     
     # =========================================================================
@@ -335,10 +345,15 @@ def analyze_message_unified(
             user_id=user_id,
             inferred_category=semantic_result.get("matched_category", "unknown"),
             context_risk_level=final_risk_level,
+            embedding_vector=semantic_result.get("embedding"),
         )
     
     # Calculate total processing time
     processing_time_ms = (time.time() - start_time) * 1000
+    safety_metrics.observe_layer("total", processing_time_ms)
+    safety_metrics.increment("analyses")
+    if failsafe_triggered:
+        safety_metrics.increment("failsafe_triggers", failsafe_reason)
     
     # =========================================================================
     # BUILD RESPONSE
@@ -539,6 +554,8 @@ def get_safety_system_status() -> Dict[str, Any]:
             "high": UNIFIED_THRESHOLD_HIGH,
             "imminent": UNIFIED_THRESHOLD_IMMINENT,
         },
+        "latency_percentiles": safety_metrics.get_layer_percentiles(),
+        "counters": safety_metrics.get_counters(),
         "status": "operational",
     }
 
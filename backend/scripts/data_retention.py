@@ -20,7 +20,6 @@ Usage:
 """
 
 import asyncio
-import os
 import sys
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -30,13 +29,14 @@ import argparse
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent.parent
 load_dotenv(ROOT_DIR / '.env')
 
+from services.database import get_database, close_client
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -48,10 +48,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB Configuration
-MONGO_URL = os.environ.get('MONGO_URL')
-DB_NAME = os.environ.get('DB_NAME', 'veterans_support')
-
 # Retention periods in days
 RETENTION_PERIODS = {
     'chat_messages': 90,           # AI/Live chat messages
@@ -220,8 +216,7 @@ async def run_retention_cleanup(dry_run: bool = False):
     """
     logger.info(f"Starting data retention cleanup (dry_run={dry_run})")
     
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
+    db = get_database()
     
     stats = {
         'started_at': datetime.now(timezone.utc).isoformat(),
@@ -290,9 +285,6 @@ async def run_retention_cleanup(dry_run: bool = False):
         stats['error'] = str(e)
         logger.error(f"Retention cleanup failed: {e}")
     
-    finally:
-        client.close()
-    
     logger.info(f"Data retention cleanup completed: {stats}")
     return stats
 
@@ -309,6 +301,7 @@ if __name__ == "__main__":
     
     # Run the cleanup
     result = asyncio.run(run_retention_cleanup(dry_run=args.dry_run))
+    close_client()
     
     # Exit with appropriate code
     sys.exit(0 if result.get('status') == 'success' else 1)
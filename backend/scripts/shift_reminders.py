@@ -8,12 +8,15 @@ Sends email reminders to staff before their shifts:
 Run this script as a cron job every 15 minutes:
     */15 * * * * cd /app/backend && python scripts/shift_reminders.py
 
+Reminders are queued in the email outbox (services/email_outbox.py). The
+script then delivers everything due in the outbox before it exits, so
+reminders go out even when no server (and so no outbox worker) is running.
+
 Or use the API endpoint to trigger manually:
     POST /api/shifts/send-reminders
 """
 
 import asyncio
-import os
 import sys
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -22,14 +25,15 @@ import logging
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
-import resend
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent.parent
 load_dotenv(ROOT_DIR / '.env')
 
+from services.database import get_database, close_client
+from services.email_outbox import EmailOutboxWorker, email_delivery_enabled, enqueue_email
+
 # Configure logging
 log_dir = ROOT_DIR / 'logs'
 log_dir.mkdir(exist_ok=True)
@@ -44,11 +48,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configuration
-MONGO_URL = os.environ.get('MONGO_URL')
-DB_NAME = os.environ.get('DB_NAME', 'veterans_support')
-resend.api_key = os.environ.get('RESEND_API_KEY')
-
 # Reminder windows (in minutes before shift)
 REMINDER_WINDOWS = [
     {'name': '24_hour', 'minutes': 24 * 60, 'tolerance': 30},  # 24 hours ± 30 min
@@ -96,9 +95,9 @@ async def get_staff_email(db, user_id: str) -> str:
 
 
 async def send_reminder_email(staff_email: str, shift: dict, reminder_type: str) -> bool:
-    """Send reminder email to staff member"""
-    if not resend.api_key:
-        logger.warning("RESEND_API_KEY not set, skipping email")
+    """Queue reminder email to staff member (delivered by the server's email outbox worker)"""
+    if not email_delivery_enabled():
+        logger.warning("Email delivery not configured, skipping email")
         return False
     
     if not staff_email:
@@ -118,7 +117,7 @@ async def send_reminder_email(staff_email: str, shift: dict, reminder_type: str)
         shift_date = shift_date.strftime('%A, %d %B %Y')
     
     try:
-        resend.Emails.send({
+        await enqueue_email({
             "from": "Radio Check <noreply@radiocheck.me>",
             "to": [staff_email],
             "subject": f"{urgency}Shift Reminder - Your shift starts {time_text}",
@@ -154,8 +153,8 @@ async def send_reminder_email(staff_email: str, shift: dict, reminder_type: str)
                     </div>
                 </div>
             """
-        })
-        logger.info(f"Sent {reminder_type} reminder to {staff_email} for shift {shift.get('id')}")
+        }, category="shift_reminder", dedupe_key=f"shift_reminder:{reminder_type}:{shift.get('id')}")
+        logger.info(f"Queued {reminder_type} reminder to {staff_email} for shift {shift.get('id')}")
         return True
     except Exception as e:
         logger.error(f"Failed to send reminder email: {e}")
@@ -166,8 +165,7 @@ async def check_and_send_reminders():
     """Main function to check for upcoming shifts and send reminders"""
     logger.info("Starting shift reminder check...")
     
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
+    db = get_database()
     
     stats = {
         'started_at': datetime.now(timezone.utc).isoformat(),
@@ -246,13 +244,24 @@ async def check_and_send_reminders():
         stats['error'] = str(e)
         logger.error(f"Reminder check failed: {e}")
     
-    finally:
-        client.close()
-    
     logger.info(f"Shift reminder check completed: {stats}")
     return stats
 
 
+async def send_reminders_and_deliver():
+    """Cron entry point: queue due reminders, then drain the outbox"""
+    stats = await check_and_send_reminders()
+    if email_delivery_enabled():
+        try:
+            stats['emails_delivered'] = await EmailOutboxWorker(get_database()).drain()
+            logger.info(f"Delivered {stats['emails_delivered']} queued emails")
+        except Exception as e:
+            # Still queued; the server's outbox worker or the next run delivers them
+            logger.error(f"Outbox delivery failed: {e}")
+    return stats
+
+
 if __name__ == "__main__":
-    result = asyncio.run(check_and_send_reminders())
+    result = asyncio.run(send_reminders_and_deliver())
+    close_client()
     sys.exit(0 if result.get('status') == 'success' else 1)
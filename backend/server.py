@@ -1,70 +1,129 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 import hashlib
 from pathlib import Path
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
 from datetime import datetime, timedelta
-import bcrypt
 import jwt
 import secrets
-import resend
 import asyncio
 from openai import OpenAI
-import httpx  # For IP geolocation lookup
-from collections import defaultdict
 import time
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Startup profiling + background warm-up of heavy components
+from services.warmup import (
+    startup_phase,
+    register_warmup,
+    register_import_warmup,
+    start_background_warmup,
+    get_startup_report,
+    format_startup_report,
+)
+from services.database import get_client, get_database, close_client, ping_database
+from services.indexes import APPLY_INDEXES_ON_STARTUP, apply_index_manifest, get_index_drift
+from services.analytics_rollups import (
+    BACKFILL_ROLLUPS_ON_STARTUP, USAGE_PERIODS, backfill_rollups, get_rollups,
+    summarise_usage, window_start,
+)
+from services.analytics_sketches import (
+    backfill_sketches, get_sketch_docs, group_by_key, run_sketch_flusher,
+    union_count, unique_by_date,
+)
+from services.analytics_ingest import get_ingest_metrics, ingest_buffer, run_analytics_flusher
+from services.daily_counts import cached_daily_counts, daily_counts, date_range, day_start
+from services.system_stats import SystemStatsSampler
+from services.geolocation import GEOIP_HTTP_FALLBACK, get_geolocation_status, load_geo_database, lookup_ip_location
+from services.pagination import not_modified, page_etag, page_response, paginate, parse_fields
+from services.passwords import get_password_hash_metrics, hash_password, shutdown_password_executor
+from services.principals import get_jwt_secret, get_principal_cache_metrics, new_token_id, resolve_principal
+from services.rate_limit import (
+    RateLimiter, RateLimitRule, get_rate_limit_metrics, rate_limit_middleware,
+    client_ip as get_client_ip,
+)
+
 # Import encryption utilities AFTER loading .env
-from encryption import encrypt_field, decrypt_field, encrypt_document, decrypt_document, ENCRYPTED_FIELDS
+with startup_phase("encryption"):
+    from encryption import (
+        encrypt_field, decrypt_field, encrypt_document, decrypt_document, ENCRYPTED_FIELDS,
+        decrypt_documents, decrypt_items, finish_decrypt_timing, get_decrypt_metrics,
+        shutdown_decrypt_executor, start_decrypt_timing, warm_up_encryption_keys,
+        envelopes_as_strings, is_encrypted, uses_binary_envelope,
+    )
+    from services.blind_index import find_by_blind_index
+    from services.email_outbox import (
+        email_delivery_enabled, enqueue_email, get_email_outbox_metrics, get_outbox_status,
+        run_email_outbox_worker,
+    )
+    from services.notifications import (
+        StaffNotification, get_notification_metrics, notify_staff_in_background,
+    )
+    from services.push import close_push_client, get_push_metrics, run_push_scheduler
 
 # Import enhanced safety monitor from Zentrafuge Veteran AI Safety Layer
-from safety import (
-    EnhancedSafetyMonitor,
-    assess_message_safety,
-    format_crisis_message,
-    get_veteran_helplines,
-    get_emergency_number,
-)
+# (the semantic model itself is loaded by the background warm-up, not here)
+with startup_phase("safety"):
+    from safety import (
+        EnhancedSafetyMonitor,
+        assess_message_safety,
+        format_crisis_message,
+        get_veteran_helplines,
+        get_emergency_number,
+    )
 
-# Import enhanced safety layer (wraps around personas, doesn't replace them)
-from enhanced_safety_layer import (
-    analyze_message_safety as legacy_analyze_message_safety,
-    get_session_safety_summary,
-    get_user_safety_summary,
-    get_safety_audit_log,
-    export_safety_audit_log,
-    check_age_for_features,
-    RiskLevel,
-)
+    # Import enhanced safety layer (wraps around personas, doesn't replace them)
+    from enhanced_safety_layer import (
+        analyze_message_safety as legacy_analyze_message_safety,
+        get_session_safety_summary,
+        get_user_safety_summary,
+        get_safety_audit_log,
+        export_safety_audit_log,
+        check_age_for_features,
+        RiskLevel,
+    )
 
-# Import the new UNIFIED safety system with conversation trajectory analysis
-from safety.unified_safety import (
-    analyze_message_unified,
-    end_safety_session,
-    get_session_safety_status,
-    get_safety_audit_report,
-    get_safety_system_status,
-    initialize_safety_system,
-)
+    # Import the new UNIFIED safety system with conversation trajectory analysis
+    from safety.unified_safety import (
+        analyze_message_unified,
+        end_safety_session,
+        get_session_safety_status,
+        get_safety_audit_report,
+        get_safety_system_status,
+        initialize_safety_system,
+    )
+    from safety.semantic_model import initialize_semantic_model
+    from safety.conversation_monitor import warm_up_conversation_monitor, run_candidate_phrase_flusher
+    from safety.output_scanner import scan_reply
+    from safety import metrics as safety_metrics
 
 # Import governance router for clinical safety & compliance
-from governance_router import governance_router, set_db as set_governance_db
-from case_router import case_router, set_dependencies as set_case_dependencies
-from routers.ai_characters import router as ai_characters_router, set_dependencies as set_ai_char_dependencies
-from routers.learning_system import router as learning_router, set_db as set_learning_db
-from routers.lms import router as lms_router
+with startup_phase("governance, case, ai_characters, learning, lms routers"):
+    from governance_router import governance_router, set_db as set_governance_db
+    from case_router import case_router, set_dependencies as set_case_dependencies
+    from routers.ai_characters import router as ai_characters_router, set_dependencies as set_ai_char_dependencies
+    from routers.learning_system import router as learning_router, set_db as set_learning_db
+    from routers.lms import router as lms_router, get_curriculum as get_lms_curriculum
+
+# Heavy components loaded in the background once the server is accepting
+# connections. The semantic model gates /api/health/ready.
+register_warmup("semantic_model", initialize_semantic_model, gates_readiness=True)
+register_warmup("conversation_monitor", warm_up_conversation_monitor, gates_readiness=True)
+register_warmup("lms_curriculum", get_lms_curriculum)
+register_import_warmup("weasyprint", "weasyprint")
+register_import_warmup("openpyxl", "openpyxl")
+register_import_warmup("psutil", "psutil")
+register_warmup("geolocation", load_geo_database)
+register_warmup("encryption_keys", warm_up_encryption_keys)
 
 # ============ RATE LIMITING & BOT PROTECTION ============
 
@@ -74,95 +133,23 @@ RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # Window in secon
 RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))  # Max burst requests
 SESSION_RATE_LIMIT = int(os.getenv("SESSION_RATE_LIMIT", "50"))  # Max messages per session
 
-# In-memory rate limiting stores
-ip_request_counts: Dict[str, List[float]] = defaultdict(list)
-session_message_counts: Dict[str, int] = defaultdict(int)
-blocked_ips: Dict[str, float] = {}  # IP -> block expiry time
-
-def get_client_ip(request: Request) -> str:
-    """Extract client IP from request, handling proxies"""
-    forwarded = request.headers.get("x-forwarded-for")
-    if forwarded:
-        return forwarded.split(",")[0].strip()
-    return request.client.host if request.client else "unknown"
-
-def is_ip_blocked(ip: str) -> bool:
-    """Check if IP is temporarily blocked"""
-    if ip in blocked_ips:
-        if time.time() < blocked_ips[ip]:
-            return True
-        else:
-            del blocked_ips[ip]
-    return False
-
-def block_ip(ip: str, duration_seconds: int = 300):
-    """Block an IP for specified duration (default 5 minutes)"""
-    blocked_ips[ip] = time.time() + duration_seconds
-    logging.warning(f"RATE LIMIT: Blocked IP {ip} for {duration_seconds}s")
-
-def check_rate_limit(ip: str) -> tuple[bool, str]:
-    """
-    Check if request should be rate limited
-    Returns: (is_allowed, reason)
-    """
-    now = time.time()
-    
-    # Check if IP is blocked
-    if is_ip_blocked(ip):
-        return False, "Too many requests. Please wait a few minutes."
-    
-    # Clean old requests outside window
-    ip_request_counts[ip] = [t for t in ip_request_counts[ip] if now - t < RATE_LIMIT_WINDOW]
-    
-    # Check burst limit (requests in last 5 seconds)
-    recent_requests = [t for t in ip_request_counts[ip] if now - t < 5]
-    if len(recent_requests) >= RATE_LIMIT_BURST:
-        block_ip(ip, 60)  # Block for 1 minute on burst
-        return False, "Slow down. Too many requests too quickly."
-    
-    # Check window limit
-    if len(ip_request_counts[ip]) >= RATE_LIMIT_REQUESTS:
-        block_ip(ip, 300)  # Block for 5 minutes
-        return False, "Rate limit exceeded. Please try again later."
-    
-    # Record this request
-    ip_request_counts[ip].append(now)
-    return True, "OK"
-
-def check_session_limit(session_id: str) -> tuple[bool, str]:
-    """
-    Check if session has exceeded message limit
-    Prevents single session from burning through API credits
-    """
-    session_message_counts[session_id] += 1
-    
-    if session_message_counts[session_id] > SESSION_RATE_LIMIT:
-        return False, "Session limit reached. Please start a new conversation."
-    
-    return True, "OK"
-
-def cleanup_rate_limits():
-    """Periodic cleanup of old rate limit data"""
-    now = time.time()
-    
-    # Clean IP counts older than 2x window
-    for ip in list(ip_request_counts.keys()):
-        ip_request_counts[ip] = [t for t in ip_request_counts[ip] if now - t < RATE_LIMIT_WINDOW * 2]
-        if not ip_request_counts[ip]:
-            del ip_request_counts[ip]
-    
-    # Clean expired blocks
-    for ip in list(blocked_ips.keys()):
-        if now >= blocked_ips[ip]:
-            del blocked_ips[ip]
+# Sliding-window limiters (services/rate_limit.py), shared across workers.
+# The per-IP limiter runs as middleware on the chat endpoint, so abusive
+# clients are turned away before their request body is even read.
+chat_ip_limiter = RateLimiter("ai_chat_ip", [
+    RateLimitRule("burst", RATE_LIMIT_BURST, 5, block_seconds=60,
+                  message="Slow down. Too many requests too quickly."),
+    RateLimitRule("window", RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, block_seconds=300,
+                  message="Rate limit exceeded. Please try again later."),
+])
+chat_session_limiter = RateLimiter("ai_chat_session", [
+    RateLimitRule("session", SESSION_RATE_LIMIT, 24 * 3600,
+                  message="Session limit reached. Please start a new conversation."),
+])
 
 # ============ JWT CONFIGURATION ============
 
-# JWT Configuration - Use function to read at runtime
-def get_jwt_secret():
-    """Get JWT secret at runtime to ensure env vars are loaded"""
-    return os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
-
+# JWT Configuration - the secret is read at runtime by get_jwt_secret() (services/principals.py)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
@@ -1398,6 +1385,13 @@ AI_CHARACTERS = {
     }
 }
 
+# Sent instead of the persona's reply when a hard fail-safe is triggered
+BUDDY_CRISIS_RESPONSE = (
+    "I care about you, and I'm really worried about what you're sharing. "
+    "Please call Samaritans on 116 123 (free, 24/7) or in an emergency, call 999. "
+    "A real person is available to talk right now - just use the button below."
+)
+
 # ============================================================================
 # UNIVERSAL SAFEGUARDING ADDENDUM - ADDED TO ALL AI CHARACTER PROMPTS
 # This has HIGHEST PRIORITY and overrides all other AI behavior
@@ -1492,26 +1486,12 @@ Always include these when user is in distress:
 === END OF SAFEGUARDING PROTOCOL ===
 """
 
-# MongoDB connection with SSL fix for Atlas
-import ssl
-import certifi
-
-mongo_url = os.environ['MONGO_URL']
-
-# Only apply SSL settings for MongoDB Atlas (remote) connections
-if 'mongodb+srv' in mongo_url or 'mongodb.net' in mongo_url:
-    client = AsyncIOMotorClient(
-        mongo_url,
-        serverSelectionTimeoutMS=10000,
-        tlsCAFile=certifi.where()
-    )
-else:
-    # Local MongoDB without SSL
-    client = AsyncIOMotorClient(
-        mongo_url,
-        serverSelectionTimeoutMS=10000
-    )
-db = client[os.environ.get('DB_NAME', 'veterans_support')]
+# MongoDB connection - one shared pool (services/database.py), also used by
+# the routers and scripts. Atlas TLS, pool sizes and timeouts are set there.
+if not os.environ.get('MONGO_URL'):
+    raise RuntimeError("MONGO_URL must be set")
+client = get_client()
+db = get_database()
 
 # Create the main app
 app = FastAPI(redirect_slashes=True)
@@ -1862,7 +1842,7 @@ class SafeguardingAlert(BaseModel):
     callback_requested: bool = False
     callback_id: Optional[str] = None
     contact_captured: bool = False
-    # Geolocation fields (from ip-api.com)
+    # Geolocation fields (services/geolocation.py)
     geo_city: Optional[str] = None
     geo_region: Optional[str] = None
     geo_country: Optional[str] = None
@@ -2622,55 +2602,50 @@ def check_safeguarding(message: str, session_id: str = "default", user_id: str =
     
     return should_escalate, risk_data
 
-# IP Geolocation lookup using ip-api.com (free, no API key required)
-async def lookup_ip_geolocation(ip_address: str) -> Dict[str, Any]:
+# IP Geolocation: local IP-range dataset, ip-api.com only as an opt-in fallback
+async def lookup_ip_geolocation(ip_address: str, allow_remote: bool = True) -> Dict[str, Any]:
     """
-    Lookup geolocation data for an IP address using ip-api.com
-    Returns city, region, country, ISP, timezone, and coordinates
+    Lookup geolocation data for an IP address.
+    Returns city, region, country and coordinates (plus ISP and timezone
+    when the HTTP fallback answered), or {} when unknown.
     """
-    if not ip_address or ip_address in ["unknown", "127.0.0.1", "localhost"]:
-        return {}
-    
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"http://ip-api.com/json/{ip_address}?fields=status,city,regionName,country,isp,timezone,lat,lon")
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "success":
-                    return {
-                        "geo_city": data.get("city"),
-                        "geo_region": data.get("regionName"),
-                        "geo_country": data.get("country"),
-                        "geo_isp": data.get("isp"),
-                        "geo_timezone": data.get("timezone"),
-                        "geo_lat": data.get("lat"),
-                        "geo_lon": data.get("lon")
-                    }
-    except Exception as e:
-        logging.warning(f"IP geolocation lookup failed for {ip_address}: {e}")
-    
-    return {}
+    return await lookup_ip_location(ip_address, allow_remote=allow_remote)
+
+async def enrich_alert_location(alert_id: str, ip_address: str):
+    """Fill in an alert's location from the HTTP fallback after it was created"""
+    geo_data = await lookup_ip_geolocation(ip_address)
+    if geo_data:
+        await db.safeguarding_alerts.update_one({"id": alert_id}, {"$set": geo_data})
+
+_enrichment_tasks: Set[asyncio.Task] = set()
+
+def enrich_alert_location_in_background(alert_id: str, ip_address: str) -> asyncio.Task:
+    """Start enrich_alert_location() without waiting for it (the task is kept until it finishes)"""
+    task = asyncio.create_task(enrich_alert_location(alert_id, ip_address))
+    _enrichment_tasks.add(task)
+    task.add_done_callback(_enrichment_done)
+    return task
+
+def _enrichment_done(task: asyncio.Task):
+    _enrichment_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Alert location enrichment failed: {task.exception()!r}")
 
 # In-memory rate limiting and conversation history for AI Buddies
 buddy_sessions: Dict[str, Dict[str, Any]] = {}
 BUDDY_MAX_MESSAGES = 30
 BUDDY_SESSION_TIMEOUT_MINUTES = 60
 
-# Resend Configuration
-RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
+# Email Configuration (delivered through services/email_outbox.py)
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", "noreply@radiocheck.me")
 # URL Configuration for email links
 APP_URL = os.getenv("APP_URL", "https://app.radiocheck.me")  # Main user app
 STAFF_PORTAL_URL = os.getenv("STAFF_PORTAL_URL", "https://staff.radiocheck.me")  # Staff portal
 
-# Initialize Resend
-if RESEND_API_KEY:
-    resend.api_key = RESEND_API_KEY
-
 async def send_reset_email(email: str, reset_token: str):
-    """Send password reset email via Resend"""
-    if not RESEND_API_KEY:
-        logging.warning("Resend API key not configured, skipping email")
+    """Queue password reset email"""
+    if not email_delivery_enabled():
+        logging.warning("Email delivery not configured, skipping email")
         return False
     
     try:
@@ -2701,9 +2676,8 @@ async def send_reset_email(email: str, reset_token: str):
             "html": html_content
         }
         
-        # Run sync SDK in thread to keep FastAPI non-blocking
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Password reset email sent to {email}, ID: {result.get('id')}")
+        ids = await enqueue_email(params, category="password_reset", urgent=True)
+        logging.info(f"Password reset email queued for {email}, outbox: {ids}")
         return True
     except Exception as e:
         logging.error(f"Failed to send email via Resend: {str(e)}")
@@ -2711,8 +2685,8 @@ async def send_reset_email(email: str, reset_token: str):
 
 async def send_safeguarding_email_notification(alert: SafeguardingAlert, risk_data: Dict = None):
     """Send urgent safeguarding alert email to admins/counsellors"""
-    if not RESEND_API_KEY:
-        logging.warning("Resend API key not configured, skipping safeguarding email")
+    if not email_delivery_enabled():
+        logging.warning("Email delivery not configured, skipping safeguarding email")
         return False
     
     try:
@@ -2776,8 +2750,8 @@ async def send_safeguarding_email_notification(alert: SafeguardingAlert, risk_da
             "html": html_content
         }
         
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Safeguarding alert email sent, ID: {result.get('id')}")
+        ids = await enqueue_email(params, category="safeguarding", dedupe_key=f"safeguarding:{alert.id}", urgent=True)
+        logging.info(f"Safeguarding alert email queued, outbox: {ids}")
         return True
     except Exception as e:
         logging.error(f"Failed to send safeguarding email: {str(e)}")
@@ -2785,18 +2759,12 @@ async def send_safeguarding_email_notification(alert: SafeguardingAlert, risk_da
 
 # ============ AUTH FUNCTIONS ============
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+# hash_password / verify_password: services/passwords.py (bcrypt off the event loop)
 
 async def send_shift_notification_email(shift_data: dict, staff_email: str, notification_type: str = "created"):
     """Send email notification when shift is created/updated/deleted"""
-    if not RESEND_API_KEY or not staff_email:
-        logging.info(f"Skipping shift email notification (API key: {bool(RESEND_API_KEY)}, email: {bool(staff_email)})")
+    if not email_delivery_enabled() or not staff_email:
+        logging.info(f"Skipping shift email notification (delivery: {email_delivery_enabled()}, email: {bool(staff_email)})")
         return False
     
     try:
@@ -2863,8 +2831,8 @@ async def send_shift_notification_email(shift_data: dict, staff_email: str, noti
             "html": html_content,
         }
         
-        resend.Emails.send(params)
-        logging.info(f"Shift notification email sent to {staff_email}")
+        await enqueue_email(params, category="shift")
+        logging.info(f"Shift notification email queued for {staff_email}")
         return True
     except Exception as e:
         logging.error(f"Failed to send shift notification email: {str(e)}")
@@ -2874,28 +2842,16 @@ def create_access_token(data: dict) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": new_token_id()})
     return jwt.encode(to_encode, get_jwt_secret(), algorithm=ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current authenticated user from JWT token"""
+    """Get current authenticated user from JWT token (cached per token, services/principals.py)"""
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, get_jwt_secret(), algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        
-        # Look up by user ID (not email - the token contains user_id)
-        user_data = await db.users.find_one({"id": user_id})
-        if user_data is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return User(**user_data)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
+        return User(**await resolve_principal(credentials.credentials, db))
+    except HTTPException:
+        raise
     except Exception as e:
-        # Catch all JWT-related errors
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
 def require_role(*required_roles: str):
@@ -2924,8 +2880,8 @@ async def get_unified_staff(current_user: User = Depends(require_role("admin")))
     peers = await db.peer_supporters.find().to_list(1000)
     
     # Decrypt profiles
-    counsellors = [decrypt_document("counsellors", c) for c in counsellors]
-    peers = [decrypt_document("peer_supporters", p) for p in peers]
+    counsellors = await decrypt_documents("counsellors", counsellors)
+    peers = await decrypt_documents("peer_supporters", peers)
     
     # Build lookup maps
     counsellor_by_user = {c.get("user_id"): c for c in counsellors if c.get("user_id")}
@@ -3181,7 +3137,7 @@ async def create_users_for_unlinked_staff(
                 "email": email,
                 "role": "counsellor",
                 "name": name,
-                "password_hash": hash_password(request.default_password),
+                "password_hash": await hash_password(request.default_password),
                 "created_at": datetime.utcnow()
             }
             await db.users.insert_one(user_data)
@@ -3232,7 +3188,7 @@ async def create_users_for_unlinked_staff(
                 "email": email,
                 "role": "peer",
                 "name": name,
-                "password_hash": hash_password(request.default_password),
+                "password_hash": await hash_password(request.default_password),
                 "created_at": datetime.utcnow()
             }
             await db.users.insert_one(user_data)
@@ -3390,13 +3346,28 @@ async def create_counsellor(
     return counsellor_obj
 
 @api_router.get("/counsellors", response_model=List[Counsellor])
-async def get_counsellors(current_user: User = Depends(get_current_user)):
+async def get_counsellors(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get all counsellors - Requires authentication (admin, counsellor, or peer)"""
     if current_user.role not in ["admin", "supervisor", "counsellor", "peer"]:
         raise HTTPException(status_code=403, detail="Access denied. Staff only.")
-    counsellors = await db.counsellors.find().to_list(1000)
-    # Decrypt sensitive fields when retrieving
-    return [Counsellor(**decrypt_document('counsellors', c)) for c in counsellors]
+    page = await paginate(db.counsellors, {}, sort_field="id", direction=1, limit=limit,
+                          cursor=cursor, fields=fields, allowed_fields=Counsellor.model_fields,
+                          default_limit=1000)
+    etag = page_etag(page)
+    cached = not_modified(request, etag, page)
+    if cached:
+        return cached
+    # Decrypt sensitive fields when retrieving (only the projected ones)
+    counsellors = await decrypt_documents('counsellors', page.items, parse_fields(fields))
+    if not fields:
+        counsellors = [Counsellor(**c) for c in counsellors]
+    return page_response(request, counsellors, page, etag=etag)
 
 @api_router.get("/counsellors/available")
 async def get_available_counsellors():
@@ -3411,7 +3382,7 @@ async def get_available_counsellors():
     for c in counsellors:
         counsellor_data = dict(c)
         # Decrypt name if it's encrypted
-        if counsellor_data.get("name") and str(counsellor_data["name"]).startswith("ENC:"):
+        if is_encrypted(counsellor_data.get("name")):
             try:
                 counsellor_data["name"] = decrypt_field(counsellor_data["name"])
             except Exception as e:
@@ -3500,13 +3471,28 @@ async def create_peer_supporter(
     return peer_obj
 
 @api_router.get("/peer-supporters", response_model=List[PeerSupporter])
-async def get_peer_supporters(current_user: User = Depends(get_current_user)):
+async def get_peer_supporters(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get all peer supporters - Requires authentication (admin, counsellor, or peer)"""
     if current_user.role not in ["admin", "supervisor", "counsellor", "peer"]:
         raise HTTPException(status_code=403, detail="Access denied. Staff only.")
-    peers = await db.peer_supporters.find().to_list(1000)
-    # Decrypt sensitive fields when retrieving
-    return [PeerSupporter(**decrypt_document('peer_supporters', p)) for p in peers]
+    page = await paginate(db.peer_supporters, {}, sort_field="id", direction=1, limit=limit,
+                          cursor=cursor, fields=fields, allowed_fields=PeerSupporter.model_fields,
+                          default_limit=1000)
+    etag = page_etag(page)
+    cached = not_modified(request, etag, page)
+    if cached:
+        return cached
+    # Decrypt sensitive fields when retrieving (only the projected ones)
+    peers = await decrypt_documents('peer_supporters', page.items, parse_fields(fields))
+    if not fields:
+        peers = [PeerSupporter(**p) for p in peers]
+    return page_response(request, peers, page, etag=etag)
 
 @api_router.get("/peer-supporters/available")
 async def get_available_peer_supporters():
@@ -3519,7 +3505,7 @@ async def get_available_peer_supporters():
     result = []
     for peer in peers:
         peer_data = dict(peer)
-        if peer_data.get('firstName') and str(peer_data['firstName']).startswith('ENC:'):
+        if is_encrypted(peer_data.get('firstName')):
             try:
                 peer_data['firstName'] = decrypt_field(peer_data['firstName'])
             except Exception as e:
@@ -4057,8 +4043,8 @@ async def update_settings(
 
 async def send_callback_confirmation_email(email: str, name: str, request_type: str):
     """Send confirmation email to user who requested callback"""
-    if not RESEND_API_KEY:
-        logging.warning("Resend API key not configured, skipping email")
+    if not email_delivery_enabled():
+        logging.warning("Email delivery not configured, skipping email")
         return False
     
     try:
@@ -4090,31 +4076,16 @@ async def send_callback_confirmation_email(email: str, name: str, request_type:
             "html": html_content
         }
         
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Callback confirmation email sent to {email}, ID: {result.get('id')}")
+        ids = await enqueue_email(params, category="callback_confirmation")
+        logging.info(f"Callback confirmation email queued for {email}, outbox: {ids}")
         return True
     except Exception as e:
         logging.error(f"Failed to send callback confirmation email: {str(e)}")
         return False
 
 async def send_callback_notification_to_staff(callback: dict, staff_type: str):
-    """Send notification to relevant staff about new callback request"""
-    if not RESEND_API_KEY:
-        logging.warning("Resend API key not configured, skipping staff notification")
-        return False
-    
+    """Notify relevant staff about a new callback request on every channel (services/notifications.py)"""
     try:
-        # Get all staff of the relevant type
-        if staff_type == "counsellor":
-            staff_users = await db.users.find({"role": "counsellor"}).to_list(100)
-        else:
-            staff_users = await db.users.find({"role": "peer"}).to_list(100)
-        
-        if not staff_users:
-            logging.warning(f"No {staff_type} users found to notify")
-            return False
-        
-        staff_emails = [u["email"] for u in staff_users]
         type_label = "Counsellor" if staff_type == "counsellor" else "Peer Supporter"
         
         html_content = f"""
@@ -4136,15 +4107,20 @@ async def send_callback_notification_to_staff(callback: dict, staff_type: str):
         </html>
         """
         
-        params = {
-            "from": SENDER_EMAIL,
-            "to": staff_emails,
-            "subject": f"[ACTION REQUIRED] New Callback Request - Veterans Support",
-            "html": html_content
-        }
-        
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Callback notification sent to {len(staff_emails)} {staff_type}(s), ID: {result.get('id')}")
+        notification = StaffNotification(
+            kind="callback_request",
+            ref_id=callback["id"],
+            title="New Callback Request",
+            body=f"A veteran has requested a callback from a {type_label}.",
+            email={
+                "from": SENDER_EMAIL,
+                "subject": f"[ACTION REQUIRED] New Callback Request - Veterans Support",
+                "html": html_content
+            },
+            data={"request_type": staff_type},
+        )
+        # Fanned out in the background; the caller gets their answer straight away
+        notify_staff_in_background(notification, ["counsellor"] if staff_type == "counsellor" else ["peer"], db=db)
         return True
     except Exception as e:
         logging.error(f"Failed to send staff notification: {str(e)}")
@@ -4178,9 +4154,13 @@ async def create_callback_request(callback_input: CallbackRequestCreate):
 
 @api_router.get("/callbacks")
 async def get_callback_requests(
+    request: Request,
     current_user: User = Depends(get_current_user),
     status: Optional[str] = None,
-    request_type: Optional[str] = None
+    request_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
 ):
     """Get callback requests (staff only, filtered by their role)"""
     try:
@@ -4198,13 +4178,43 @@ async def get_callback_requests(
         if request_type and current_user.role == "admin":
             query["request_type"] = request_type
         
-        callbacks = await db.callback_requests.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
+        page = await paginate(db.callback_requests, query, sort_field="created_at", limit=limit,
+                              cursor=cursor, fields=fields, allowed_fields=CallbackRequest.model_fields,
+                              default_limit=500)
+        etag = page_etag(page)
+        cached = not_modified(request, etag, page)
+        if cached:
+            return cached
         # Decrypt sensitive fields when retrieving
-        return [decrypt_document('callbacks', c) for c in callbacks]
+        callbacks = await decrypt_documents('callbacks', page.items, parse_fields(fields))
+        return page_response(request, callbacks, page, etag=etag)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching callback requests: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch callback requests")
 
+@api_router.get("/callbacks/by-caller")
+async def get_callbacks_by_caller(
+    phone: Optional[str] = None,
+    email: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Previous callback requests from the same caller, matched on phone or email (staff only)"""
+    if current_user.role not in ["admin", "supervisor", "counsellor", "peer"]:
+        raise HTTPException(status_code=403, detail="Only staff can search callback requests")
+    if not phone and not email:
+        raise HTTPException(status_code=400, detail="Provide a phone number or email")
+    
+    try:
+        # Matched on blind indexes, so nothing is decrypted except the results
+        field, value = ("phone", phone) if phone else ("email", email)
+        matches = await find_by_blind_index(db, "callback_requests", field, value, limit=50)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field}")
+    matches.sort(key=lambda c: str(c.get("created_at", "")), reverse=True)
+    return await decrypt_documents('callbacks', matches)
+
 @api_router.patch("/callbacks/{callback_id}/take")
 async def take_callback_control(
     callback_id: str,
@@ -4308,22 +4318,13 @@ async def complete_callback(
 
 # ============ PANIC ALERT ENDPOINTS ============
 
-async def send_panic_alert_to_counsellors(alert: dict):
-    """Send urgent notification to all counsellors about panic alert"""
-    if not RESEND_API_KEY:
-        logging.warning("Resend API key not configured, skipping panic alert email")
-        return False
-    
+async def send_panic_alert_to_counsellors(alert: dict, started: Optional[float] = None):
+    """
+    Notify all counsellors, supervisors and admins about a panic alert on
+    every channel at once (services/notifications.py). `started` is when
+    the alert came in, for the notification latency record.
+    """
     try:
-        # Get all counsellors AND admins for urgent alerts
-        staff_users = await db.users.find({"role": {"$in": ["counsellor", "supervisor", "admin"]}}).to_list(100)
-        
-        if not staff_users:
-            logging.error("No counsellors or admins found to notify about panic alert!")
-            return False
-        
-        staff_emails = [u["email"] for u in staff_users]
-        
         html_content = f"""
         <html>
         <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #fff5f5;">
@@ -4344,15 +4345,19 @@ async def send_panic_alert_to_counsellors(alert: dict):
         </html>
         """
         
-        params = {
-            "from": SENDER_EMAIL,
-            "to": staff_emails,
-            "subject": f"🚨 URGENT: Panic Alert - Immediate Assistance Required",
-            "html": html_content
-        }
-        
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Panic alert sent to {len(staff_emails)} counsellors/admins, ID: {result.get('id')}")
+        notification = StaffNotification(
+            kind="panic_alert",
+            ref_id=alert["id"],
+            title="🚨 URGENT: Panic Alert",
+            body="A veteran has pressed the panic button and needs immediate assistance.",
+            email={
+                "from": SENDER_EMAIL,
+                "subject": f"🚨 URGENT: Panic Alert - Immediate Assistance Required",
+                "html": html_content
+            },
+        )
+        # The alert response never waits on staff lookups, sockets, push or email
+        notify_staff_in_background(notification, ["counsellor", "supervisor", "admin"], db=db, started=started)
         return True
     except Exception as e:
         logging.error(f"Failed to send panic alert email: {str(e)}")
@@ -4361,12 +4366,13 @@ async def send_panic_alert_to_counsellors(alert: dict):
 @api_router.post("/panic-alert")
 async def create_panic_alert(alert_input: PanicAlertCreate):
     """Create a panic alert (public - for users in crisis)"""
+    started = time.perf_counter()
     try:
         alert = PanicAlert(**alert_input.dict())
         await db.panic_alerts.insert_one(alert.dict())
         
         # Send urgent notification to counsellors
-        await send_panic_alert_to_counsellors(alert.dict())
+        await send_panic_alert_to_counsellors(alert.dict(), started=started)
         
         logging.warning(f"PANIC ALERT CREATED: {alert.id}")
         
@@ -4461,7 +4467,11 @@ async def resolve_panic_alert(
 
 @api_router.get("/safeguarding-alerts")
 async def get_safeguarding_alerts(
+    request: Request,
     status: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get safeguarding alerts - all staff can view"""
@@ -4473,8 +4483,18 @@ async def get_safeguarding_alerts(
         if status:
             query["status"] = status
         
-        alerts = await db.safeguarding_alerts.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
-        return alerts
+        page = await paginate(db.safeguarding_alerts, query, sort_field="created_at", limit=limit,
+                              cursor=cursor, fields=fields, allowed_fields=SafeguardingAlert.model_fields,
+                              default_limit=500)
+        etag = page_etag(page)
+        cached = not_modified(request, etag, page)
+        if cached:
+            return cached
+        # Older alerts have encrypted conversation_history / ip_address
+        alerts = await decrypt_documents('safeguarding_alerts', page.items, parse_fields(fields))
+        return page_response(request, alerts, page, etag=etag)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching safeguarding alerts: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch safeguarding alerts")
@@ -4492,7 +4512,7 @@ async def get_safeguarding_alert(
         alert = await db.safeguarding_alerts.find_one({"id": alert_id}, {"_id": 0})
         if not alert:
             raise HTTPException(status_code=404, detail="Alert not found")
-        return alert
+        return envelopes_as_strings(alert)
     except HTTPException:
         raise
     except Exception as e:
@@ -4785,9 +4805,13 @@ async def create_note(
 
 @api_router.get("/notes")
 async def get_notes(
+    request: Request,
     current_user: User = Depends(get_current_user),
     callback_id: Optional[str] = None,
-    include_shared: bool = True
+    include_shared: bool = True,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
 ):
     """Get notes - own notes + notes shared with me (admins see all)"""
     if current_user.role not in ["admin", "supervisor", "counsellor", "peer"]:
@@ -4814,8 +4838,17 @@ async def get_notes(
         if callback_id:
             query["callback_id"] = callback_id
         
-        notes = await db.notes.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
-        return notes
+        page = await paginate(db.notes, query, sort_field="created_at", limit=limit,
+                              cursor=cursor, fields=fields, allowed_fields=Note.model_fields,
+                              default_limit=500)
+        etag = page_etag(page)
+        cached = not_modified(request, etag, page)
+        if cached:
+            return cached
+        notes = await decrypt_documents('notes', page.items, parse_fields(fields))
+        return page_response(request, notes, page, etag=etag)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching notes: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch notes")
@@ -5267,15 +5300,13 @@ async def track_app_visit(visit: AppVisit, request: Request):
         else:
             ua_info["device"] = "desktop"
     
-    # Lookup geolocation for IP address (async, with caching)
-    geo_data = await lookup_ip_geolocation(client_ip)
-    
+    now = datetime.utcnow()
     visit_data = {
         "id": str(uuid.uuid4()),
         "session_id": visit.session_id,
-        "timestamp": datetime.utcnow(),
-        "date": datetime.utcnow().strftime("%Y-%m-%d"),
-        "hour": datetime.utcnow().hour,
+        "timestamp": now,
+        "date": now.strftime("%Y-%m-%d"),
+        "hour": now.hour,
         "user_agent": visit.user_agent,
         "region": visit.region,
         "referrer": visit.referrer,
@@ -5284,175 +5315,72 @@ async def track_app_visit(visit: AppVisit, request: Request):
         "browser": ua_info["browser"],
         "os": ua_info["os"],
         "ip_hash": hashlib.sha256(client_ip.encode()).hexdigest()[:16],  # Anonymized IP for unique counting
-        # Geolocation data
-        "geo_city": geo_data.get("geo_city"),
-        "geo_region": geo_data.get("geo_region"),
-        "geo_country": geo_data.get("geo_country"),
-        "geo_lat": geo_data.get("geo_lat"),
-        "geo_lon": geo_data.get("geo_lon"),
     }
     
-    # Upsert - only count unique sessions per day
-    await db.app_visits.update_one(
-        {"session_id": visit.session_id, "date": visit_data["date"]},
-        {"$set": visit_data, "$inc": {"page_views": 1}},
-        upsert=True
-    )
-    
-    # Track active sessions (expires after 30 min of inactivity)
-    await db.active_sessions.update_one(
-        {"session_id": visit.session_id},
-        {
-            "$set": {
-                "session_id": visit.session_id,
-                "last_seen": datetime.utcnow(),
-                "region": visit.region,
-                "device": ua_info["device"],
-                "browser": ua_info["browser"],
-                "os": ua_info["os"],
-                # Geolocation data for map
-                "geo_city": geo_data.get("geo_city"),
-                "geo_region": geo_data.get("geo_region"),
-                "geo_country": geo_data.get("geo_country"),
-                "geo_lat": geo_data.get("geo_lat"),
-                "geo_lon": geo_data.get("geo_lon"),
-            },
-            "$setOnInsert": {"first_seen": datetime.utcnow()}
-        },
-        upsert=True
-    )
-    
-    # Track page/feature usage
-    if visit.page:
-        await db.feature_usage.update_one(
-            {"date": visit_data["date"], "page": visit.page},
-            {"$inc": {"visits": 1}, "$addToSet": {"unique_sessions": visit.session_id}},
-            upsert=True
-        )
+    # Queued for the background flusher, which geolocates the IP and writes
+    # app_visits, active_sessions, feature_usage and the rollups in bulk
+    if not ingest_buffer.add_visit(visit_data, client_ip=client_ip, page=visit.page):
+        return {"status": "dropped"}
     
     return {"status": "tracked"}
 
 @api_router.post("/analytics/heartbeat")
 async def analytics_heartbeat(session_id: str):
     """Keep session alive - call every 5 minutes"""
-    await db.active_sessions.update_one(
-        {"session_id": session_id},
-        {"$set": {"last_seen": datetime.utcnow()}},
-        upsert=True
-    )
+    ingest_buffer.add_heartbeat(session_id)
     return {"status": "ok"}
 
+@api_router.get("/analytics/ingest")
+async def get_analytics_ingest_status(current_user: User = Depends(require_role("admin"))):
+    """Analytics ingestion buffer: pending events, drops and flush lag"""
+    return {**get_ingest_metrics(), "geolocation": get_geolocation_status()}
+
 @api_router.get("/analytics/usage")
 async def get_app_usage_stats(current_user: User = Depends(require_role("admin"))):
     """Get app usage statistics for admin dashboard"""
     now = datetime.utcnow()
     
-    # Time periods
-    periods = {
-        "7_days": now - timedelta(days=7),
-        "30_days": now - timedelta(days=30),
-        "6_months": now - timedelta(days=180),
-        "12_months": now - timedelta(days=365),
-    }
+    # Totals, breakdowns and daily trend come from the daily rollups
+    # (at most one small document per day) instead of raw app_visits
+    rollups = await get_rollups(db, window_start(USAGE_PERIODS["12_months"], now))
+    usage = summarise_usage(rollups, now)
     
     stats = {}
     
-    # Get visit counts for each period
-    for period_name, cutoff in periods.items():
-        # Unique visitors (by session)
-        unique_visitors = await db.app_visits.distinct(
-            "session_id",
-            {"timestamp": {"$gte": cutoff}}
-        )
-        
-        # Total visits
-        total_visits = await db.app_visits.count_documents(
-            {"timestamp": {"$gte": cutoff}}
-        )
-        
+    # Unique visitors (by session) are merged from daily sketches
+    visitor_sketches = await get_sketch_docs(db, "visitors", window_start(USAGE_PERIODS["12_months"], now))
+    for period_name, days in USAGE_PERIODS.items():
         stats[period_name] = {
-            "unique_visitors": len(unique_visitors),
-            "total_visits": total_visits
+            "unique_visitors": unique_by_date(visitor_sketches, window_start(days, now)),
+            "total_visits": usage[period_name]["total_visits"]
         }
     
     # Currently connected (active in last 10 minutes)
     active_cutoff = now - timedelta(minutes=10)
-    active_sessions = await db.active_sessions.find(
-        {"last_seen": {"$gte": active_cutoff}},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    stats["currently_connected"] = len(active_sessions)
+    stats["currently_connected"] = await db.active_sessions.count_documents(
+        {"last_seen": {"$gte": active_cutoff}}
+    )
     
-    # Region breakdown (last 30 days)
-    region_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}, "region": {"$ne": None}}},
-        {"$group": {"_id": "$region", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    region_stats = await db.app_visits.aggregate(region_pipeline).to_list(10)
-    stats["regions"] = {r["_id"]: r["count"] for r in region_stats if r["_id"]}
-    
-    # Device breakdown (last 30 days)
-    device_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}, "device": {"$ne": None}}},
-        {"$group": {"_id": "$device", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    device_stats = await db.app_visits.aggregate(device_pipeline).to_list(10)
-    stats["devices"] = {d["_id"]: d["count"] for d in device_stats if d["_id"]}
-    
-    # Browser breakdown (last 30 days)
-    browser_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}, "browser": {"$ne": None}}},
-        {"$group": {"_id": "$browser", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
+    # Breakdowns (last 30 days)
+    stats["regions"] = usage["regions"]
+    stats["devices"] = usage["devices"]
+    stats["browsers"] = usage["browsers"]
+    stats["operating_systems"] = usage["operating_systems"]
+    stats["peak_hours"] = usage["peak_hours"]
+    
+    # Feature/page usage (last 30 days): visits from rollups, unique visitors
+    # from page sketches
+    page_sketches = group_by_key(await get_sketch_docs(db, "page", window_start(30, now)))
+    page_unique = {p["key"]: p["unique"] for p in page_sketches}
+    stats["feature_usage"] = [
+        {"page": page, "visits": visits, "unique": page_unique.get(page, 0)}
+        for page, visits in list(usage["page_visits"].items())[:15]
     ]
-    browser_stats = await db.app_visits.aggregate(browser_pipeline).to_list(10)
-    stats["browsers"] = {b["_id"]: b["count"] for b in browser_stats if b["_id"]}
-    
-    # OS breakdown (last 30 days)
-    os_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}, "os": {"$ne": None}}},
-        {"$group": {"_id": "$os", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    os_stats = await db.app_visits.aggregate(os_pipeline).to_list(10)
-    stats["operating_systems"] = {o["_id"]: o["count"] for o in os_stats if o["_id"]}
-    
-    # Peak hours (last 30 days) - aggregate by hour
-    peak_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}}},
-        {"$group": {"_id": "$hour", "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    peak_stats = await db.app_visits.aggregate(peak_pipeline).to_list(24)
-    stats["peak_hours"] = {str(p["_id"]): p["count"] for p in peak_stats if p["_id"] is not None}
     
-    # Feature/page usage (last 30 days)
-    feature_pipeline = [
-        {"$match": {"date": {"$gte": (now - timedelta(days=30)).strftime("%Y-%m-%d")}}},
-        {"$group": {
-            "_id": "$page",
-            "total_visits": {"$sum": "$visits"},
-            "unique_visitors": {"$sum": {"$size": {"$ifNull": ["$unique_sessions", []]}}}
-        }},
-        {"$sort": {"total_visits": -1}},
-        {"$limit": 15}
-    ]
-    feature_stats = await db.feature_usage.aggregate(feature_pipeline).to_list(15)
-    stats["feature_usage"] = [{"page": f["_id"], "visits": f["total_visits"], "unique": f["unique_visitors"]} for f in feature_stats if f["_id"]]
-    
-    # Return visitors (users who visited more than once in last 30 days)
-    return_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}}},
-        {"$group": {"_id": "$session_id", "visit_count": {"$sum": 1}}},
-        {"$match": {"visit_count": {"$gt": 1}}},
-        {"$count": "returning_visitors"}
-    ]
-    return_result = await db.app_visits.aggregate(return_pipeline).to_list(1)
-    total_unique = len(await db.app_visits.distinct("session_id", {"timestamp": {"$gte": periods["30_days"]}}))
-    returning = return_result[0]["returning_visitors"] if return_result else 0
+    # Return visitors (sessions seen on more than one day, last 30 days)
+    returning = union_count(await get_sketch_docs(db, "returning", window_start(30, now)))
+    total_unique = stats["30_days"]["unique_visitors"]
+    returning = min(returning, total_unique)
     stats["return_rate"] = {
         "returning_visitors": returning,
         "total_visitors": total_unique,
@@ -5460,22 +5388,7 @@ async def get_app_usage_stats(current_user: User = Depends(require_role("admin")
     }
     
     # Daily trend (last 30 days)
-    daily_pipeline = [
-        {"$match": {"timestamp": {"$gte": periods["30_days"]}}},
-        {"$group": {
-            "_id": "$date",
-            "visits": {"$sum": 1},
-            "unique": {"$addToSet": "$session_id"}
-        }},
-        {"$project": {
-            "_id": 1,
-            "visits": 1,
-            "unique_visitors": {"$size": "$unique"}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    daily_trend = await db.app_visits.aggregate(daily_pipeline).to_list(31)
-    stats["daily_trend"] = daily_trend
+    stats["daily_trend"] = usage["daily_trend"]
     
     return stats
 
@@ -5496,66 +5409,12 @@ async def get_location_analytics(current_user: User = Depends(require_role("admi
          "geo_lat": 1, "geo_lon": 1, "device": 1, "last_seen": 1}
     ).to_list(1000)
     
-    # Get location breakdown for last 30 days
-    thirty_days_ago = now - timedelta(days=30)
-    
-    # Country breakdown
-    country_pipeline = [
-        {"$match": {"timestamp": {"$gte": thirty_days_ago}, "geo_country": {"$ne": None}}},
-        {"$group": {
-            "_id": "$geo_country",
-            "visits": {"$sum": 1},
-            "unique_visitors": {"$addToSet": "$session_id"}
-        }},
-        {"$project": {
-            "_id": 1,
-            "visits": 1,
-            "unique_visitors": {"$size": "$unique_visitors"}
-        }},
-        {"$sort": {"visits": -1}},
-        {"$limit": 20}
-    ]
-    country_stats = await db.app_visits.aggregate(country_pipeline).to_list(20)
-    
-    # City breakdown (top 30)
-    city_pipeline = [
-        {"$match": {"timestamp": {"$gte": thirty_days_ago}, "geo_city": {"$ne": None}}},
-        {"$group": {
-            "_id": {"city": "$geo_city", "country": "$geo_country"},
-            "visits": {"$sum": 1},
-            "unique_visitors": {"$addToSet": "$session_id"},
-            "lat": {"$first": "$geo_lat"},
-            "lon": {"$first": "$geo_lon"}
-        }},
-        {"$project": {
-            "_id": 1,
-            "visits": 1,
-            "unique_visitors": {"$size": "$unique_visitors"},
-            "lat": 1,
-            "lon": 1
-        }},
-        {"$sort": {"visits": -1}},
-        {"$limit": 30}
-    ]
-    city_stats = await db.app_visits.aggregate(city_pipeline).to_list(30)
-    
-    # Region breakdown (UK focused)
-    region_pipeline = [
-        {"$match": {"timestamp": {"$gte": thirty_days_ago}, "geo_region": {"$ne": None}, "geo_country": "United Kingdom"}},
-        {"$group": {
-            "_id": "$geo_region",
-            "visits": {"$sum": 1},
-            "unique_visitors": {"$addToSet": "$session_id"}
-        }},
-        {"$project": {
-            "_id": 1,
-            "visits": 1,
-            "unique_visitors": {"$size": "$unique_visitors"}
-        }},
-        {"$sort": {"visits": -1}},
-        {"$limit": 20}
-    ]
-    region_stats = await db.app_visits.aggregate(region_pipeline).to_list(20)
+    # Location breakdowns for the last 30 days, merged from daily sketches
+    # (visits are session-days, unique visitors are distinct sessions)
+    thirty_days_start = window_start(30, now)
+    country_stats = group_by_key(await get_sketch_docs(db, "country", thirty_days_start))[:20]
+    city_stats = group_by_key(await get_sketch_docs(db, "city", thirty_days_start))[:30]
+    region_stats = group_by_key(await get_sketch_docs(db, "uk_region", thirty_days_start))[:20]
     
     # Recent visitor locations (last 24 hours with coordinates for map markers)
     day_ago = now - timedelta(hours=24)
@@ -5577,10 +5436,10 @@ async def get_location_analytics(current_user: User = Depends(require_role("admi
     return {
         "active_users_with_location": active_with_location,
         "active_count": len(active_with_location),
-        "countries": [{"country": c["_id"], "visits": c["visits"], "unique": c["unique_visitors"]} for c in country_stats],
-        "cities": [{"city": c["_id"]["city"], "country": c["_id"]["country"], "visits": c["visits"], 
-                   "unique": c["unique_visitors"], "lat": c.get("lat"), "lon": c.get("lon")} for c in city_stats],
-        "uk_regions": [{"region": r["_id"], "visits": r["visits"], "unique": r["unique_visitors"]} for r in region_stats],
+        "countries": [{"country": c["key"], "visits": c["visits"], "unique": c["unique"]} for c in country_stats],
+        "cities": [{"city": c.get("city"), "country": c.get("country"), "visits": c["visits"], 
+                   "unique": c["unique"], "lat": c.get("lat"), "lon": c.get("lon")} for c in city_stats],
+        "uk_regions": [{"region": r["key"], "visits": r["visits"], "unique": r["unique"]} for r in region_stats],
         "recent_locations": [{"lat": l["_id"]["lat"], "lon": l["_id"]["lon"], "city": l["_id"]["city"],
                             "country": l["_id"]["country"], "visits": l["visit_count"]} for l in recent_locations]
     }
@@ -5670,25 +5529,17 @@ async def get_ai_chat_stats(days: int = 7):
     
     by_character = await db.ai_chat_sessions.aggregate(pipeline).to_list(20)
     
-    # Get total counts
-    total_sessions = await db.ai_chat_sessions.count_documents({"started_at": {"$gte": cutoff}})
-    total_messages_result = await db.ai_chat_sessions.aggregate([
-        {"$match": {"started_at": {"$gte": cutoff}}},
-        {"$group": {"_id": None, "total": {"$sum": "$message_count"}}}
-    ]).to_list(1)
-    total_messages = total_messages_result[0]["total"] if total_messages_result else 0
-    
-    # Get daily trend
-    daily_pipeline = [
-        {"$match": {"started_at": {"$gte": cutoff}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$started_at"}},
-            "sessions": {"$sum": 1},
-            "messages": {"$sum": "$message_count"}
-        }},
-        {"$sort": {"_id": 1}}
+    # Daily trend; totals are the sum of the days
+    daily = await daily_counts(
+        db.ai_chat_sessions, "started_at", cutoff, datetime.utcnow() + timedelta(seconds=1),
+        sums={"messages": "$message_count"}, fill=False
+    )
+    daily_trend = [
+        {"_id": date, "sessions": day["count"], "messages": day["messages"]}
+        for date, day in daily.items()
     ]
-    daily_trend = await db.ai_chat_sessions.aggregate(daily_pipeline).to_list(30)
+    total_sessions = sum(day["count"] for day in daily.values())
+    total_messages = sum(day["messages"] for day in daily.values())
     
     return {
         "period_days": days,
@@ -5916,15 +5767,9 @@ async def buddy_chat(request: BuddyChatRequest, req: Request):
     user_agent = req.headers.get("user-agent", "unknown")
     
     # === BOT PROTECTION: Rate Limiting ===
-    # Check IP-based rate limit
-    is_allowed, reason = check_rate_limit(client_ip)
-    if not is_allowed:
-        logging.warning(f"RATE LIMITED: IP {client_ip} - {reason}")
-        raise HTTPException(status_code=429, detail=reason)
-    
+    # Per-IP limits run in chat_rate_limit_middleware, before the body is parsed
     # Check session message limit
-    is_allowed, reason = check_session_limit(request.sessionId)
-    if not is_allowed:
+    if not (await chat_session_limiter.check(request.sessionId)).allowed:
         char = AI_CHARACTERS.get(request.character, AI_CHARACTERS["tommy"])
         return BuddyChatResponse(
             reply=f"We've been chatting for a while. If you'd like to continue talking, a real person is available. Use the 'Talk to a real person' button to connect with someone.",
@@ -6023,11 +5868,7 @@ async def buddy_chat(request: BuddyChatRequest, req: Request):
             
             # Get safety wrapper for crisis response message
             safety_wrapper = unified_safety.get("safety_wrapper", {})
-            crisis_response = (
-                "I care about you, and I'm really worried about what you're sharing. "
-                "Please call Samaritans on 116 123 (free, 24/7) or in an emergency, call 999. "
-                "A real person is available to talk right now - just use the button below."
-            )
+            crisis_response = BUDDY_CRISIS_RESPONSE
             if safety_wrapper and safety_wrapper.get("prepend_message"):
                 crisis_response = safety_wrapper.get("prepend_message") + safety_wrapper.get("append_message", "")
             
@@ -6080,7 +5921,8 @@ async def buddy_chat(request: BuddyChatRequest, req: Request):
         
         # === Knowledge Base Integration ===
         # Fetch relevant verified information to enhance the response
-        knowledge_context = await get_knowledge_context(request.message)
+        with safety_metrics.time_layer("knowledge_lookup"):
+            knowledge_context = await get_knowledge_context(request.message)
         
         # Build messages with character-specific system prompt
         # IMPORTANT: Safeguarding addendum is added to ALL character prompts
@@ -6112,6 +5954,21 @@ async def buddy_chat(request: BuddyChatRequest, req: Request):
         
         reply = completion.choices[0].message.content or ""
         
+        # === Response-side safety scan ===
+        # The persona's own reply must never contain method information or
+        # validate suicidal intent (reply fail-safe rules; the looser
+        # user-input rules are only flagged for review)
+        reply_scan = scan_reply(reply)
+        if reply_scan.lexicon_hits or reply_scan.flagged_patterns:
+            logging.info(f"Reply safety hits - Session: {request.sessionId[:12]} - "
+                         f"lexicon: {reply_scan.lexicon_hits} - flagged: {reply_scan.flagged_patterns}")
+        if reply_scan.blocked:
+            logging.warning(
+                f"REPLY FAILSAFE TRIGGERED - Session: {request.sessionId[:12]} - "
+                f"Patterns: {reply_scan.failsafe_patterns} - Scan: {reply_scan.scan_time_ms:.2f}ms"
+            )
+            reply = BUDDY_CRISIS_RESPONSE
+        
         # Store in history
         session["history"].append({"role": "user", "content": request.message})
         session["history"].append({"role": "assistant", "content": reply})
@@ -6135,8 +5992,9 @@ async def buddy_chat(request: BuddyChatRequest, req: Request):
                 conversation_history=conversation_history
             )
             
-            # Lookup geolocation for IP address
-            geo_data = await lookup_ip_geolocation(client_ip)
+            # Lookup geolocation for IP address (local dataset only; the
+            # optional HTTP fallback runs after the alert is stored)
+            geo_data = await lookup_ip_geolocation(client_ip, allow_remote=False)
             if geo_data:
                 alert.geo_city = geo_data.get("geo_city")
                 alert.geo_region = geo_data.get("geo_region")
@@ -6148,6 +6006,8 @@ async def buddy_chat(request: BuddyChatRequest, req: Request):
             
             alert_id = alert.id
             await db.safeguarding_alerts.insert_one(alert.dict())
+            if not geo_data and GEOIP_HTTP_FALLBACK and client_ip:
+                enrich_alert_location_in_background(alert_id, client_ip)
             logging.warning(f"SAFEGUARDING ALERT [{risk_level}] Score: {risk_data['score']} - Alert: {alert_id} - Session: {request.sessionId} - IP: {client_ip} - Location: {geo_data.get('geo_city', 'Unknown')}, {geo_data.get('geo_country', 'Unknown')}")
             
             # NOTE: We no longer emit the alert immediately here.
@@ -6407,8 +6267,8 @@ async def send_peer_registration_notification(email: str, registration_time: dat
             logging.warning("No notification email configured for peer registration")
             return False
         
-        if not RESEND_API_KEY:
-            logging.warning("Resend API key not configured, skipping peer registration notification")
+        if not email_delivery_enabled():
+            logging.warning("Email delivery not configured, skipping peer registration notification")
             return False
         
         html_content = f"""
@@ -6434,8 +6294,8 @@ async def send_peer_registration_notification(email: str, registration_time: dat
             "html": html_content
         }
         
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Peer registration notification sent to {notification_email}, ID: {result.get('id')}")
+        ids = await enqueue_email(params, category="peer_registration")
+        logging.info(f"Peer registration notification queued for {notification_email}, outbox: {ids}")
         return True
     except Exception as e:
         logging.error(f"Failed to send peer registration notification: {str(e)}")
@@ -6465,11 +6325,22 @@ async def register_peer_support(input: PeerSupportRegistrationCreate):
         raise HTTPException(status_code=500, detail="Failed to register. Please try again.")
 
 @api_router.get("/peer-support/registrations", response_model=List[PeerSupportRegistration])
-async def get_peer_support_registrations(current_user: User = Depends(require_role("admin"))):
+async def get_peer_support_registrations(
+    request: Request,
+    current_user: User = Depends(require_role("admin")),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get all peer support registrations (admin only)"""
     try:
-        registrations = await db.peer_support_registrations.find().sort("timestamp", -1).to_list(1000)
-        return [PeerSupportRegistration(**reg) for reg in registrations]
+        page = await paginate(db.peer_support_registrations, {}, sort_field="timestamp", limit=limit,
+                              cursor=cursor, fields=fields, allowed_fields=PeerSupportRegistration.model_fields,
+                              default_limit=1000)
+        registrations = page.items if fields else [PeerSupportRegistration(**reg) for reg in page.items]
+        return page_response(request, registrations, page)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error retrieving registrations: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve registrations.")
@@ -6497,7 +6368,11 @@ async def raise_concern(input: ConcernCreate):
 
 @api_router.get("/concerns")
 async def get_concerns(
+    request: Request,
     status: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get all concerns (staff only)"""
@@ -6509,8 +6384,18 @@ async def get_concerns(
         if status:
             query["status"] = status
         
-        concerns = await db.concerns.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
-        return concerns
+        page = await paginate(db.concerns, query, sort_field="created_at", limit=limit,
+                              cursor=cursor, fields=fields, allowed_fields=Concern.model_fields,
+                              default_limit=500)
+        etag = page_etag(page)
+        cached = not_modified(request, etag, page)
+        if cached:
+            return cached
+        # Concerns encrypted by the re-encryption job
+        concerns = await decrypt_documents('concerns', page.items, parse_fields(fields))
+        return page_response(request, concerns, page, etag=etag)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error retrieving concerns: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve concerns.")
@@ -6547,8 +6432,8 @@ async def update_concern_status(
 
 async def send_concern_notification(concern: Concern):
     """Send notification to admin when a concern is raised"""
-    if not RESEND_API_KEY:
-        logging.warning("Resend API key not configured, skipping concern notification")
+    if not email_delivery_enabled():
+        logging.warning("Email delivery not configured, skipping concern notification")
         return False
     
     try:
@@ -6602,8 +6487,8 @@ async def send_concern_notification(concern: Concern):
             "html": html_content
         }
         
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Concern notification sent, ID: {result.get('id')}")
+        ids = await enqueue_email(params, category="concern", dedupe_key=f"concern:{concern.id}", urgent=True)
+        logging.info(f"Concern notification queued, outbox: {ids}")
         return True
     except Exception as e:
         logging.error(f"Failed to send concern notification: {str(e)}")
@@ -6625,11 +6510,19 @@ async def log_call_intent(call_input: CallIntentCreate):
 
 @api_router.get("/call-logs")
 async def get_call_logs(
+    request: Request,
     current_user: User = Depends(require_role("admin")),
     days: int = 30,
-    contact_type: Optional[str] = None
+    contact_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
 ):
-    """Get call logs with metrics (admin only)"""
+    """
+    Get call logs with metrics (admin only). The metrics cover every
+    matching log, so they are only computed for the first page; pages
+    fetched with a cursor carry recent_logs and next_cursor only.
+    """
     try:
         from_date = datetime.utcnow() - timedelta(days=days)
         
@@ -6637,35 +6530,42 @@ async def get_call_logs(
         if contact_type:
             query["contact_type"] = contact_type
         
-        logs = await db.call_logs.find(query, {"_id": 0}).sort("timestamp", -1).to_list(1000)
-        
-        # Calculate metrics
-        total_calls = len(logs)
-        calls_by_type = {}
-        calls_by_method = {}
-        calls_by_day = {}
-        
-        for log in logs:
-            # By type
-            ct = log.get("contact_type", "unknown")
-            calls_by_type[ct] = calls_by_type.get(ct, 0) + 1
-            
-            # By method
-            cm = log.get("call_method", "phone")
-            calls_by_method[cm] = calls_by_method.get(cm, 0) + 1
-            
-            # By day
-            day = log.get("timestamp", datetime.utcnow()).strftime("%Y-%m-%d")
-            calls_by_day[day] = calls_by_day.get(day, 0) + 1
-        
-        return {
-            "total_calls": total_calls,
+        page = await paginate(db.call_logs, query, sort_field="timestamp", limit=limit,
+                              cursor=cursor, fields=fields, allowed_fields=CallIntent.model_fields,
+                              default_limit=50)
+        body = {
             "period_days": days,
+            "recent_logs": page.items,  # Last 50 logs by default
+            "next_cursor": page.next_cursor
+        }
+        if cursor:
+            return page_response(request, body, page)
+        
+        breakdowns = await db.call_logs.aggregate([
+            {"$match": query},
+            {"$facet": {
+                "by_type": [{"$group": {"_id": {"$ifNull": ["$contact_type", "unknown"]}, "count": {"$sum": 1}}}],
+                "by_method": [{"$group": {"_id": {"$ifNull": ["$call_method", "phone"]}, "count": {"$sum": 1}}}],
+            }}
+        ]).to_list(1)
+        breakdowns = breakdowns[0] if breakdowns else {"by_type": [], "by_method": []}
+        calls_by_type = {row["_id"]: row["count"] for row in breakdowns["by_type"]}
+        calls_by_method = {row["_id"]: row["count"] for row in breakdowns["by_method"]}
+        
+        calls_by_day = await daily_counts(
+            db.call_logs, "timestamp", from_date, datetime.utcnow() + timedelta(seconds=1),
+            match={"contact_type": contact_type} if contact_type else None, fill=False
+        )
+        
+        return page_response(request, {
+            "total_calls": sum(calls_by_type.values()),
             "calls_by_type": calls_by_type,
             "calls_by_method": calls_by_method,
-            "calls_by_day": dict(sorted(calls_by_day.items())),
-            "recent_logs": logs[:50]  # Last 50 logs
-        }
+            "calls_by_day": {date: day["count"] for date, day in calls_by_day.items()},
+            **body
+        }, page)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error retrieving call logs: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve call logs")
@@ -6687,7 +6587,7 @@ async def initialize_system():
         name="System Administrator"
     )
     admin_data = admin_user.dict()
-    admin_data["password_hash"] = hash_password("ChangeThisPassword123!")
+    admin_data["password_hash"] = await hash_password("ChangeThisPassword123!")
     await db.users.insert_one(admin_data)
     
     return {
@@ -6704,139 +6604,109 @@ async def root():
     return {"message": "UK Veterans Support API - Admin System Active"}
 
 
+# ============ HEALTH / READINESS ENDPOINTS ============
+
+@api_router.get("/health/live")
+async def health_live():
+    """Liveness probe - the process is up and serving"""
+    return {"status": "alive"}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """Readiness probe - 503 until the semantic safety model is warm"""
+    report = get_startup_report()
+    body = {
+        "ready": report["ready"],
+        "semantic_model_warm": report["warmup"].get("semantic_model", {}).get("status") == "ready",
+        "warmup": {name: state["status"] for name, state in report["warmup"].items()},
+        "degraded": report["degraded"],
+    }
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@api_router.get("/health/db")
+async def health_db():
+    """Database probe - ping round-trip and pool configuration (503 if unreachable)"""
+    probe = await ping_database()
+    if not probe["ok"]:
+        return JSONResponse(status_code=503, content=probe)
+    return probe
+
+@api_router.get("/health/startup")
+async def health_startup_profile(current_user: User = Depends(require_role("admin"))):
+    """Startup profile report - import phase timings and warm-up progress"""
+    return get_startup_report()
+
+
 # ============ SYSTEM MONITORING ENDPOINTS ============
 
-@api_router.get("/admin/system-stats")
-async def get_system_stats(current_user: User = Depends(require_role("admin"))):
-    """Get real-time system statistics for monitoring dashboard"""
-    import psutil
-    from datetime import datetime, timedelta
-    
-    # Get database stats
-    try:
-        # Count active users (logged in within last 24 hours)
-        yesterday = datetime.utcnow() - timedelta(hours=24)
-        
-        # User counts
-        total_users = await db.users.count_documents({})
-        staff_count = await db.users.count_documents({"role": {"$in": ["counsellor", "peer", "admin"]}})
-        
-        # Active sessions (approximation based on recent activity)
-        active_ai_sessions = await db.ai_sessions.count_documents({
-            "created_at": {"$gte": yesterday.isoformat()}
-        })
-        
-        # Count active live chats
-        active_live_chats = len([r for r in live_chat_rooms.values() if r.get("status") == "active"])
-        
-        # Count pending callbacks
-        pending_callbacks = await db.callbacks.count_documents({"status": "pending"})
-        
-        # Count today's shifts
-        today = datetime.utcnow().strftime("%Y-%m-%d")
-        today_shifts = await db.shifts.count_documents({"date": today})
-        
-        # Safeguarding alerts (last 7 days)
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_alerts = await db.safeguarding_alerts.count_documents({
-            "created_at": {"$gte": week_ago.isoformat()}
-        })
-        
-        # Active calls - count from live chat rooms with active calls
-        active_calls = len([r for r in live_chat_rooms.values() if r.get("has_active_call")])
-        
-        # Connected staff - count staff who logged in within last 15 minutes
-        # This requires tracking last_active timestamp on login
-        fifteen_mins_ago = datetime.utcnow() - timedelta(minutes=15)
-        connected_staff = await db.users.count_documents({
-            "role": {"$in": ["counsellor", "peer", "admin"]},
-            "last_active": {"$gte": fifteen_mins_ago.isoformat()}
-        })
-        
-    except Exception as e:
-        print(f"Error getting DB stats: {e}")
-        total_users = 0
-        staff_count = 0
-        active_ai_sessions = 0
-        active_live_chats = 0
-        pending_callbacks = 0
-        today_shifts = 0
-        recent_alerts = 0
-        active_calls = 0
-        connected_staff = 0
-    
-    # Get server resource usage
-    try:
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        memory = psutil.virtual_memory()
-        memory_percent = memory.percent
-        memory_used_mb = memory.used / (1024 * 1024)
-        memory_total_mb = memory.total / (1024 * 1024)
-    except:
-        cpu_percent = 0
-        memory_percent = 0
-        memory_used_mb = 0
-        memory_total_mb = 0
-    
+@api_router.get("/admin/email-outbox")
+async def get_email_outbox_status(current_user: User = Depends(require_role("admin"))):
+    """Queued email by delivery status, queue age and recent failures"""
+    return await get_outbox_status(db)
+
+@api_router.get("/admin/indexes")
+async def get_index_status(current_user: User = Depends(require_role("admin"))):
+    """Drift between the declared index manifest and the indexes in MongoDB"""
+    return await get_index_drift(db)
+
+def get_live_counts() -> Dict[str, int]:
+    """In-memory activity figures for the system stats sampler"""
+    from webrtc_signaling import connected_users
     return {
-        "timestamp": datetime.utcnow().isoformat(),
-        "users": {
-            "total_registered": total_users,
-            "staff_count": staff_count,
-            "connected_staff": connected_staff
-        },
-        "activity": {
-            "active_ai_sessions_24h": active_ai_sessions,
-            "active_live_chats": active_live_chats,
-            "active_calls": active_calls,
-            "pending_callbacks": pending_callbacks,
-            "today_shifts": today_shifts,
-            "safeguarding_alerts_7d": recent_alerts
-        },
-        "server": {
-            "cpu_percent": round(cpu_percent, 1),
-            "memory_percent": round(memory_percent, 1),
-            "memory_used_mb": round(memory_used_mb, 1),
-            "memory_total_mb": round(memory_total_mb, 1)
-        },
-        "capacity": {
-            "estimated_max_concurrent_users": 75,
-            "estimated_max_calls": 25,
-            "current_load_percent": round((active_calls / 25) * 100 if active_calls else 0, 1)
-        }
+        "active_live_chats": len([r for r in live_chat_rooms.values() if r.get("status") == "active"]),
+        "active_calls": len([r for r in live_chat_rooms.values() if r.get("has_active_call")]),
+        "socket_connections": len(connected_users),
     }
 
+system_stats_sampler = SystemStatsSampler(db, get_live_counts)
+
+@api_router.get("/admin/system-stats")
+async def get_system_stats(
+    history: int = 0,
+    current_user: User = Depends(require_role("admin"))
+):
+    """
+    Latest system statistics snapshot, kept current by the background
+    sampler. Pass history=N for the last N samples (sparklines).
+    """
+    snapshot = system_stats_sampler.snapshot
+    if snapshot is None:
+        # Polled before the sampler's first run
+        await system_stats_sampler.refresh_db_counts()
+        snapshot = system_stats_sampler.take_sample()
+    
+    snapshot = {**snapshot, "decryption": get_decrypt_metrics(), "password_hashing": get_password_hash_metrics(),
+                "principal_cache": get_principal_cache_metrics(), "rate_limits": get_rate_limit_metrics(),
+                "email_outbox": get_email_outbox_metrics(), "notifications": get_notification_metrics(),
+                "push": get_push_metrics()}
+    if history > 0:
+        return {**snapshot, "history": system_stats_sampler.get_history(history)}
+    return snapshot
+
 
 @api_router.get("/admin/usage-history")
 async def get_usage_history(
     days: int = 7,
     current_user: User = Depends(require_role("admin"))
 ):
-    """Get usage history for charts"""
-    from datetime import datetime, timedelta
+    """Get usage history for charts (the `days` full days before today)"""
+    end = day_start(datetime.utcnow())
+    start = end - timedelta(days=days)
     
-    history = []
-    for i in range(days, 0, -1):
-        date = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
-        
-        # Count AI sessions for that day
-        day_start = f"{date}T00:00:00"
-        day_end = f"{date}T23:59:59"
-        
-        ai_sessions = await db.ai_sessions.count_documents({
-            "created_at": {"$gte": day_start, "$lte": day_end}
-        })
-        
-        # Count callbacks
-        callbacks = await db.callbacks.count_documents({
-            "created_at": {"$gte": day_start, "$lte": day_end}
-        })
-        
-        history.append({
+    # One aggregation per collection for the whole range
+    ai_sessions = await cached_daily_counts(db, "ai_sessions", "created_at", start, end)
+    callbacks = await cached_daily_counts(db, "callbacks", "created_at", start, end)
+    
+    history = [
+        {
             "date": date,
-            "ai_sessions": ai_sessions,
-            "callbacks": callbacks
-        })
+            "ai_sessions": ai_sessions[date]["count"],
+            "callbacks": callbacks[date]["count"]
+        }
+        for date in date_range(start, end)
+    ]
     
     return {"history": history}
 
@@ -6951,7 +6821,7 @@ async def get_live_chat_room(room_id: str):
     if not room:
         raise HTTPException(status_code=404, detail="Chat room not found")
     
-    return room
+    return envelopes_as_strings(room)
 
 @api_router.get("/live-chat/rooms/{room_id}/messages")
 async def get_live_chat_messages(room_id: str):
@@ -6966,13 +6836,7 @@ async def get_live_chat_messages(room_id: str):
         raise HTTPException(status_code=404, detail="Chat room not found")
     
     # Decrypt messages from database
-    messages = room.get("messages", [])
-    decrypted_messages = []
-    for msg in messages:
-        decrypted_msg = msg.copy()
-        if msg.get("text"):
-            decrypted_msg["text"] = decrypt_field(msg["text"])
-        decrypted_messages.append(decrypted_msg)
+    decrypted_messages = await decrypt_items(room.get("messages", []), "text")
     
     return {"messages": decrypted_messages}
 
@@ -6981,7 +6845,7 @@ async def send_live_chat_message(room_id: str, message: LiveChatMessage):
     """Send a message in a live chat room (encrypted)"""
     msg = {
         "id": str(uuid.uuid4()),
-        "text": encrypt_field(message.text),  # Encrypt message content
+        "text": encrypt_field(message.text, binary=uses_binary_envelope("live_chat_rooms")),  # Encrypt message content
         "sender": message.sender,
         "timestamp": datetime.utcnow().isoformat(),
     }
@@ -7031,10 +6895,22 @@ async def get_active_chat_rooms(current_user: User = Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
     
-    return rooms
+    return envelopes_as_strings(rooms)
 
 # Note: include_router moved to end of file after all routes are defined
 
+app.middleware("http")(rate_limit_middleware(chat_ip_limiter, {"/api/ai-buddies/chat"}))
+
+@app.middleware("http")
+async def decrypt_timing_middleware(request: Request, call_next):
+    """Report time spent decrypting fields for this request (Server-Timing header)."""
+    timing = start_decrypt_timing()
+    response = await call_next(request)
+    if timing["values"]:
+        response.headers["Server-Timing"] = f"decrypt;dur={timing['ms']:.1f};desc=\"{timing['values']} fields\""
+        finish_decrypt_timing(timing)
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -7055,6 +6931,8 @@ app.add_middleware(
     allow_origin_regex=r"https://.*\.emergentagent\.com|https://.*\.vercel\.app|https://.*\.onrender\.com|https://.*\.radiocheck\.me",
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination headers read by browser clients (services/pagination.py)
+    expose_headers=["ETag", "X-Next-Cursor", "Link"],
 )
 
 # Configure logging
@@ -7064,9 +6942,103 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_warmup():
+    """Load heavy components in the background so the server can accept connections immediately"""
+    start_background_warmup()
+    logger.info("\n" + format_startup_report())
+
+candidate_phrase_flusher_task: Optional[asyncio.Task] = None
+index_manifest_task: Optional[asyncio.Task] = None
+rollup_backfill_task: Optional[asyncio.Task] = None
+sketch_flusher_task: Optional[asyncio.Task] = None
+analytics_flusher_task: Optional[asyncio.Task] = None
+system_stats_task: Optional[asyncio.Task] = None
+email_outbox_task: Optional[asyncio.Task] = None
+push_scheduler_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_candidate_phrase_flusher():
+    """Persist flagged safety candidate phrases to MongoDB in batches"""
+    global candidate_phrase_flusher_task
+    candidate_phrase_flusher_task = asyncio.create_task(run_candidate_phrase_flusher(db))
+
+@app.on_event("startup")
+async def start_index_manifest():
+    """Create any missing declared MongoDB indexes in the background"""
+    global index_manifest_task
+    if not APPLY_INDEXES_ON_STARTUP:
+        return
+    
+    async def apply():
+        try:
+            await apply_index_manifest(db)
+        except Exception as e:
+            logging.error(f"Index manifest could not be applied: {e}")
+    
+    index_manifest_task = asyncio.create_task(apply())
+
+@app.on_event("startup")
+async def start_rollup_backfill():
+    """Build daily analytics rollups for days that have visits but no rollup"""
+    global rollup_backfill_task
+    if not BACKFILL_ROLLUPS_ON_STARTUP:
+        return
+    
+    async def backfill():
+        try:
+            await backfill_rollups(db)
+            await backfill_sketches(db)
+        except Exception as e:
+            logging.error(f"Analytics rollup backfill failed: {e}")
+    
+    rollup_backfill_task = asyncio.create_task(backfill())
+
+@app.on_event("startup")
+async def start_sketch_flusher():
+    """Merge buffered unique-visitor sketches into MongoDB every few seconds"""
+    global sketch_flusher_task
+    sketch_flusher_task = asyncio.create_task(run_sketch_flusher(db))
+
+@app.on_event("startup")
+async def start_analytics_flusher():
+    """Write buffered analytics visits and heartbeats in batches"""
+    global analytics_flusher_task
+    analytics_flusher_task = asyncio.create_task(run_analytics_flusher(db, geo_lookup=lookup_ip_geolocation))
+
+@app.on_event("startup")
+async def start_system_stats_sampler():
+    """Keep the monitoring dashboard snapshot current in the background"""
+    global system_stats_task
+    system_stats_task = asyncio.create_task(system_stats_sampler.run())
+
+@app.on_event("startup")
+async def start_email_outbox_worker():
+    """Deliver queued email in batches, retrying failures with backoff"""
+    global email_outbox_task
+    email_outbox_task = asyncio.create_task(run_email_outbox_worker(db))
+
+@app.on_event("startup")
+async def start_push_scheduler():
+    """Resend push notifications due a retry and check delivery receipts"""
+    global push_scheduler_task
+    push_scheduler_task = asyncio.create_task(run_push_scheduler(db))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    # The analytics flusher drains into the sketch buffer, so it stops first
+    for task in (index_manifest_task, rollup_backfill_task, system_stats_task, email_outbox_task,
+                 push_scheduler_task, candidate_phrase_flusher_task, analytics_flusher_task, sketch_flusher_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    shutdown_decrypt_executor()
+    shutdown_password_executor()
+    await close_push_client()
+    close_client()
 
 # ============ IMAGE UPLOAD ENDPOINTS ============
 import base64
@@ -7115,8 +7087,9 @@ async def get_uploaded_image(filename: str):
 
 # ============ WebRTC Signaling Integration ============
 # Import Socket.IO signaling server
-from webrtc_signaling import sio, get_online_staff_list, get_active_calls_list, get_active_chat_rooms
-import socketio
+with startup_phase("webrtc signaling"):
+    from webrtc_signaling import sio, get_online_staff_list, get_active_calls_list, get_active_chat_rooms
+    import socketio
 
 # WebRTC REST API Endpoints (must be defined BEFORE socket_app wrapping)
 @api_router.get("/webrtc/online-staff")
@@ -7162,6 +7135,14 @@ async def api_debug_safety():
         "description": "Unified safety system combining keyword, semantic, and conversation trajectory analysis"
     }
 
+@api_router.get("/safety/metrics", response_class=PlainTextResponse)
+async def api_safety_metrics():
+    """Per-layer safety latency histograms and counters (Prometheus text format)"""
+    return PlainTextResponse(
+        safety_metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
 @api_router.get("/safety/audit")
 async def api_safety_audit(
     hours_back: int = 24,
@@ -7659,14 +7640,15 @@ async def cleanup_test_data(
 app.include_router(api_router)
 
 # Include modular routers from /routers directory
-from routers import (
-    auth, cms, shifts, buddy_finder,
-    staff, organizations, resources, safeguarding, 
-    callbacks, live_chat, notes, concerns,
-    message_queue, ai_feedback, knowledge_base, compliance,
-    podcasts, data_retention, shift_swaps, documents, surveys,
-    twilio_calling, events, ai_tutor
-)
+with startup_phase("modular routers"):
+    from routers import (
+        auth, cms, shifts, buddy_finder,
+        staff, organizations, resources, safeguarding, 
+        callbacks, live_chat, notes, concerns,
+        message_queue, ai_feedback, knowledge_base, compliance,
+        podcasts, data_retention, shift_swaps, documents, surveys,
+        twilio_calling, events, ai_tutor
+    )
 
 # Core functionality routers
 app.include_router(auth.router, prefix="/api")
@@ -7721,7 +7703,8 @@ app.include_router(lms_router)
 app.include_router(ai_tutor.router)
 
 # Time Tracking - Admin work hours logging
-from routers.timetracking import router as timetracking_router
+with startup_phase("timetracking router"):
+    from routers.timetracking import router as timetracking_router
 app.include_router(timetracking_router)
 
 # Serve static files for Staff Portal and Admin Site
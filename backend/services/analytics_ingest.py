@@ -0,0 +1,351 @@
+"""
+Buffered analytics ingestion.
+
+/analytics/visit and /analytics/heartbeat only record the event in an
+in-process buffer and return. A background flusher drains the buffer when
+it holds ANALYTICS_FLUSH_BATCH_SIZE sessions or its oldest event is
+ANALYTICS_FLUSH_INTERVAL_SECONDS old, and writes everything with a handful
+of unordered bulk_write calls:
+
+    app_visits          one upsert per session-day (page views coalesced)
+    active_sessions     one upsert per session (visits and heartbeats)
+    feature_usage       one $inc per day and page
+    analytics_daily_rollups   one $inc per day
+
+Geolocation is looked up at flush time, once per distinct IP in the batch,
+so no request waits on it. Events from the same session are coalesced, and
+the flusher issues one write at a time, so analytics never holds more than
+one pooled connection however busy the app is.
+
+The buffer is bounded (ANALYTICS_BUFFER_MAX_SESSIONS); events for new
+sessions are dropped and counted when it is full. A batch whose write
+fails goes back into the buffer (within the same bound) and is retried
+with the next flush; a batch that failed part-way may then count some
+page views twice, which beats losing them. Pending events are written
+on shutdown. Drop, lag and flush metrics are reported by
+get_ingest_metrics().
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from services.analytics_rollups import ROLLUP_COLLECTION, build_rollup_update, rollup_key
+from services.analytics_sketches import record_visit_sketches, returning_sessions
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_FLUSH_BATCH_SIZE = int(os.getenv("ANALYTICS_FLUSH_BATCH_SIZE", "500"))
+ANALYTICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_SECONDS", "5"))
+ANALYTICS_BUFFER_MAX_SESSIONS = int(os.getenv("ANALYTICS_BUFFER_MAX_SESSIONS", "20000"))
+GEO_LOOKUP_CONCURRENCY = 10
+
+GeoLookup = Callable[[str], Awaitable[Dict[str, Any]]]
+
+_GEO_FIELDS = ("geo_city", "geo_region", "geo_country", "geo_lat", "geo_lon")
+
+
+class AnalyticsIngestBuffer:
+    """Pending visit and heartbeat events, coalesced per session."""
+
+    def __init__(self, max_sessions: int = ANALYTICS_BUFFER_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        # (session_id, date) -> coalesced visits
+        self.visits: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # session_id -> last heartbeat time
+        self.heartbeats: Dict[str, datetime] = {}
+        self.oldest_event: Optional[float] = None
+        self.metrics = {
+            "events_enqueued": 0,
+            "events_coalesced": 0,
+            "events_dropped": 0,
+            "events_lost_on_error": 0,
+            "sessions_requeued": 0,
+            "batches_flushed": 0,
+            "flush_errors": 0,
+            "last_flush_at": None,
+            "last_flush_sessions": 0,
+            "last_flush_duration_ms": None,
+            "last_flush_lag_seconds": None,
+            "max_flush_lag_seconds": 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.visits) + len(self.heartbeats)
+
+    def _accept(self, is_new: bool) -> bool:
+        if is_new and len(self) >= self.max_sessions:
+            self.metrics["events_dropped"] += 1
+            return False
+        self.metrics["events_enqueued"] += 1
+        if not is_new:
+            self.metrics["events_coalesced"] += 1
+        if self.oldest_event is None:
+            self.oldest_event = time.monotonic()
+        return True
+
+    def add_visit(self, visit_data: Dict[str, Any], client_ip: Optional[str] = None,
+                  page: Optional[str] = None) -> bool:
+        """Queue a visit. Returns False if it was dropped (buffer full)."""
+        key = (visit_data["session_id"], visit_data["date"])
+        entry = self.visits.get(key)
+        if not self._accept(entry is None):
+            return False
+
+        if entry is None:
+            entry = self.visits[key] = {
+                "first": visit_data,
+                "page_views": 0,
+                "pages": Counter(),
+            }
+        entry["latest"] = visit_data
+        entry["client_ip"] = client_ip
+        entry["page_views"] += 1
+        if page:
+            entry["pages"][page] += 1
+        return True
+
+    def add_heartbeat(self, session_id: str, seen_at: Optional[datetime] = None) -> bool:
+        """Queue a heartbeat. Returns False if it was dropped (buffer full)."""
+        if not self._accept(session_id not in self.heartbeats):
+            return False
+        self.heartbeats[session_id] = seen_at or datetime.utcnow()
+        return True
+
+    def oldest_age(self) -> float:
+        """Seconds since the oldest pending event was queued."""
+        return time.monotonic() - self.oldest_event if self.oldest_event is not None else 0.0
+
+    def drain(self):
+        visits, heartbeats, lag = self.visits, self.heartbeats, self.oldest_age()
+        self.visits, self.heartbeats, self.oldest_event = {}, {}, None
+        return visits, heartbeats, lag
+
+    def requeue(self, visits: Dict[Tuple[str, str], Dict[str, Any]], heartbeats: Dict[str, datetime]):
+        """Put back a drained batch that could not be written, merged with what arrived since."""
+        for key, entry in visits.items():
+            newer = self.visits.get(key)
+            if newer is not None:
+                newer["first"] = entry["first"]
+                newer["page_views"] += entry["page_views"]
+                newer["pages"].update(entry["pages"])
+            elif len(self) < self.max_sessions:
+                self.visits[key] = entry
+            else:
+                self.metrics["events_lost_on_error"] += 1
+                continue
+            self.metrics["sessions_requeued"] += 1
+        for session_id, seen_at in heartbeats.items():
+            if session_id in self.heartbeats:
+                self.heartbeats[session_id] = max(self.heartbeats[session_id], seen_at)
+            elif len(self) < self.max_sessions:
+                self.heartbeats[session_id] = seen_at
+            else:
+                self.metrics["events_lost_on_error"] += 1
+                continue
+            self.metrics["sessions_requeued"] += 1
+        # Retried after the flush interval rather than straight away
+        if len(self) and self.oldest_event is None:
+            self.oldest_event = time.monotonic()
+
+
+ingest_buffer = AnalyticsIngestBuffer()
+
+
+def get_ingest_metrics(buffer: AnalyticsIngestBuffer = ingest_buffer) -> Dict[str, Any]:
+    return {
+        **buffer.metrics,
+        "pending_sessions": len(buffer.visits),
+        "pending_heartbeats": len(buffer.heartbeats),
+        "oldest_pending_age_seconds": round(buffer.oldest_age(), 2),
+        "max_sessions": buffer.max_sessions,
+        "flush_batch_size": ANALYTICS_FLUSH_BATCH_SIZE,
+        "flush_interval_seconds": ANALYTICS_FLUSH_INTERVAL_SECONDS,
+    }
+
+
+# ============================================================================
+# FLUSH
+# ============================================================================
+
+async def _lookup_locations(entries: List[Dict[str, Any]], geo_lookup: Optional[GeoLookup]) -> Dict[str, Dict[str, Any]]:
+    """Geolocate each distinct client IP in the batch once."""
+    ips = {e["client_ip"] for e in entries if e.get("client_ip")}
+    if not geo_lookup or not ips:
+        return {}
+
+    semaphore = asyncio.Semaphore(GEO_LOOKUP_CONCURRENCY)
+
+    async def lookup(ip):
+        async with semaphore:
+            try:
+                return ip, await geo_lookup(ip)
+            except Exception as e:
+                logger.warning(f"[AnalyticsIngest] Geolocation failed: {e}")
+                return ip, {}
+
+    return dict(await asyncio.gather(*(lookup(ip) for ip in ips)))
+
+
+def _sum_inc(target: Dict[str, int], inc: Dict[str, int]):
+    for field, amount in inc.items():
+        target[field] = target.get(field, 0) + amount
+
+
+async def write_batch(db, visits: Dict[Tuple[str, str], Dict[str, Any]],
+                      heartbeats: Dict[str, datetime], geo_lookup: Optional[GeoLookup] = None) -> int:
+    """Write one drained batch. Returns the number of documents written."""
+    entries = list(visits.values())
+    locations = await _lookup_locations(entries, geo_lookup)
+    for entry in entries:
+        geo = locations.get(entry.get("client_ip")) or {}
+        for visit_data in (entry["first"], entry["latest"]):
+            for field in _GEO_FIELDS:
+                visit_data[field] = geo.get(field)
+
+    written = 0
+
+    # Session-days: the latest visit wins, page views are summed
+    if entries:
+        result = await db.app_visits.bulk_write([
+            UpdateOne(
+                {"session_id": e["latest"]["session_id"], "date": e["latest"]["date"]},
+                {"$set": e["latest"], "$inc": {"page_views": e["page_views"]}},
+                upsert=True,
+            )
+            for e in entries
+        ], ordered=False)
+        written += result.upserted_count + result.modified_count
+        new_session_days = set(result.upserted_ids)
+    else:
+        new_session_days = set()
+
+    # Returning-visitor check, one query per day in the batch
+    new_by_date: Dict[str, List[str]] = {}
+    for index, entry in enumerate(entries):
+        if index in new_session_days:
+            new_by_date.setdefault(entry["first"]["date"], []).append(entry["first"]["session_id"])
+    returning = set()
+    for date, session_ids in new_by_date.items():
+        returning |= {(sid, date) for sid in await returning_sessions(db, session_ids, date)}
+
+    # Rollups, sketches and page counters
+    rollup_incs: Dict[str, Dict[str, int]] = {}
+    page_visits: Counter = Counter()
+    for index, entry in enumerate(entries):
+        first = entry["first"]
+        date = first["date"]
+        is_new = index in new_session_days
+
+        inc = build_rollup_update(first, new_session_day=is_new)["$inc"]
+        inc["page_views"] = entry["page_views"]
+        for page, count in entry["pages"].items():
+            page_key = rollup_key(page)
+            if page_key:
+                _sum_inc(inc, {f"pages.{page_key}": count})
+            page_visits[(date, page)] += count
+        _sum_inc(rollup_incs.setdefault(date, {}), inc)
+
+        record_visit_sketches(first, new_session_day=is_new,
+                              returning=(first["session_id"], date) in returning)
+        for page in entry["pages"]:
+            record_visit_sketches(first, new_session_day=False, page=page)
+
+    if rollup_incs:
+        now = datetime.utcnow()
+        result = await db[ROLLUP_COLLECTION].bulk_write([
+            UpdateOne({"date": date}, {"$inc": inc, "$set": {"updated_at": now},
+                                       "$setOnInsert": {"date": date}}, upsert=True)
+            for date, inc in rollup_incs.items()
+        ], ordered=False)
+        written += result.upserted_count + result.modified_count
+
+    if page_visits:
+        result = await db.feature_usage.bulk_write([
+            UpdateOne({"date": date, "page": page}, {"$inc": {"visits": count}}, upsert=True)
+            for (date, page), count in page_visits.items()
+        ], ordered=False)
+        written += result.upserted_count + result.modified_count
+
+    # Active sessions: visits carry device and location, heartbeats only time
+    session_ops: Dict[str, UpdateOne] = {}
+    for session_id, seen_at in heartbeats.items():
+        session_ops[session_id] = UpdateOne(
+            {"session_id": session_id}, {"$set": {"last_seen": seen_at}}, upsert=True
+        )
+    for entry in sorted(entries, key=lambda e: e["latest"]["timestamp"]):
+        latest = entry["latest"]
+        last_seen = max(latest["timestamp"], heartbeats.get(latest["session_id"], latest["timestamp"]))
+        session_ops[latest["session_id"]] = UpdateOne(
+            {"session_id": latest["session_id"]},
+            {
+                "$set": {
+                    "session_id": latest["session_id"],
+                    "last_seen": last_seen,
+                    "region": latest.get("region"),
+                    "device": latest.get("device"),
+                    "browser": latest.get("browser"),
+                    "os": latest.get("os"),
+                    **{field: latest.get(field) for field in _GEO_FIELDS},
+                },
+                "$setOnInsert": {"first_seen": entry["first"]["timestamp"]},
+            },
+            upsert=True,
+        )
+    if session_ops:
+        result = await db.active_sessions.bulk_write(list(session_ops.values()), ordered=False)
+        written += result.upserted_count + result.modified_count
+
+    return written
+
+
+async def flush_analytics(db, geo_lookup: Optional[GeoLookup] = None,
+                          buffer: AnalyticsIngestBuffer = ingest_buffer) -> int:
+    """Drain the buffer and write it. Returns the number of sessions flushed."""
+    if not len(buffer):
+        return 0
+
+    visits, heartbeats, lag = buffer.drain()
+    sessions = len(visits) + len(heartbeats)
+    start = time.perf_counter()
+    try:
+        await write_batch(db, visits, heartbeats, geo_lookup)
+    except Exception as e:
+        buffer.metrics["flush_errors"] += 1
+        buffer.requeue(visits, heartbeats)
+        logger.error(f"[AnalyticsIngest] Flush of {sessions} sessions failed, requeued: {e}")
+        return 0
+
+    metrics = buffer.metrics
+    metrics["batches_flushed"] += 1
+    metrics["last_flush_at"] = datetime.utcnow().isoformat()
+    metrics["last_flush_sessions"] = sessions
+    metrics["last_flush_duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    metrics["last_flush_lag_seconds"] = round(lag, 2)
+    metrics["max_flush_lag_seconds"] = max(metrics["max_flush_lag_seconds"], round(lag, 2))
+    return sessions
+
+
+async def run_analytics_flusher(db, geo_lookup: Optional[GeoLookup] = None,
+                                buffer: AnalyticsIngestBuffer = ingest_buffer,
+                                poll_seconds: float = 0.5):
+    """
+    Background task: flush when the batch is full or the oldest event is
+    ANALYTICS_FLUSH_INTERVAL_SECONDS old. Cancel to stop (pending events are
+    written first).
+    """
+    try:
+        while True:
+            await asyncio.sleep(poll_seconds)
+            if (len(buffer) >= ANALYTICS_FLUSH_BATCH_SIZE
+                    or (len(buffer) and buffer.oldest_age() >= ANALYTICS_FLUSH_INTERVAL_SECONDS)):
+                await flush_analytics(db, geo_lookup, buffer)
+    except asyncio.CancelledError:
+        await flush_analytics(db, geo_lookup, buffer)
+        raise
@@ -0,0 +1,265 @@
+"""
+Daily analytics rollups.
+
+The admin usage dashboard used to scan up to 12 months of raw app_visits on
+every load. Instead, one small document per day in analytics_daily_rollups
+holds the counters the dashboard needs:
+
+    {
+        "date": "2026-03-02",
+        "visits": 412,              # session-days (one app_visits doc each)
+        "page_views": 1380,
+        "regions":  {"england": 300, ...},
+        "devices":  {"mobile": 250, ...},
+        "browsers": {"chrome": 200, ...},
+        "os":       {"android": 120, ...},
+        "hours":    {"9": 31, ...},
+        "pages":    {"home": 90, ...},
+    }
+
+Rollups are maintained incrementally at ingest: the analytics flusher
+(services/analytics_ingest.py) applies one $inc upsert per day per batch. Days that have raw visits but no rollup (history from
+before rollups existed, or a repair) are rebuilt from app_visits and
+feature_usage in the background at startup, or from the command line.
+Today is never rebuilt: the flusher is still incrementing its rollup, and
+replacing it would lose those increments.
+
+    python -m services.analytics_rollups                 # fill missing days (365)
+    python -m services.analytics_rollups --rebuild 30    # recompute last 30 days
+
+The command line also builds the unique-visitor sketches for the same days
+(services/analytics_sketches.py).
+
+Window totals are by calendar day: "7 days" is today plus the previous six.
+Breakdowns count session-days, attributed to the first visit of the day.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "analytics_daily_rollups"
+
+BACKFILL_ROLLUPS_ON_STARTUP = os.getenv("BACKFILL_ROLLUPS_ON_STARTUP", "true").lower() == "true"
+ROLLUP_BACKFILL_DAYS = int(os.getenv("ROLLUP_BACKFILL_DAYS", "365"))
+
+# Dashboard windows (name -> calendar days)
+USAGE_PERIODS = {
+    "7_days": 7,
+    "30_days": 30,
+    "6_months": 180,
+    "12_months": 365,
+}
+
+# Breakdown field in the rollup document -> field in app_visits
+DIMENSIONS = {
+    "regions": "region",
+    "devices": "device",
+    "browsers": "browser",
+    "os": "os",
+    "hours": "hour",
+}
+
+_MAX_KEY_LENGTH = 64
+
+
+def rollup_key(value: Any) -> Optional[str]:
+    """Dimension value as a safe MongoDB field name (None if unusable)."""
+    if value is None:
+        return None
+    key = str(value).strip()[:_MAX_KEY_LENGTH].replace(".", "_")
+    if key.startswith("$"):
+        key = "_" + key[1:]
+    return key or None
+
+
+def window_start(days: int, now: Optional[datetime] = None) -> str:
+    """First date (YYYY-MM-DD) of a window of `days` calendar days ending today."""
+    now = now or datetime.utcnow()
+    return (now - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+
+# ============================================================================
+# INGEST
+# ============================================================================
+
+def build_rollup_update(visit_data: Dict[str, Any], new_session_day: bool,
+                        page: Optional[str] = None) -> Dict[str, Any]:
+    """
+    $inc update for one tracked visit.
+
+    Every visit adds a page view (and a page count when the client sent a
+    page). Only the first visit of a session on a given day counts as a
+    visit in the breakdowns, matching one app_visits document per session-day.
+    """
+    inc: Dict[str, int] = {"page_views": 1}
+    page_key = rollup_key(page)
+    if page_key:
+        inc[f"pages.{page_key}"] = 1
+
+    if new_session_day:
+        inc["visits"] = 1
+        for rollup_field, visit_field in DIMENSIONS.items():
+            key = rollup_key(visit_data.get(visit_field))
+            if key:
+                inc[f"{rollup_field}.{key}"] = 1
+
+    return {
+        "$inc": inc,
+        "$set": {"updated_at": datetime.utcnow()},
+        "$setOnInsert": {"date": visit_data["date"]},
+    }
+
+
+# ============================================================================
+# READ
+# ============================================================================
+
+async def get_rollups(db, start_date: str, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rollup documents for start_date..end_date inclusive, oldest first."""
+    query: Dict[str, Any] = {"date": {"$gte": start_date}}
+    if end_date:
+        query["date"]["$lte"] = end_date
+    return await db[ROLLUP_COLLECTION].find(query, {"_id": 0}).sort("date", 1).to_list(None)
+
+
+def merge_counts(rollups: Iterable[Dict[str, Any]], field: str) -> Dict[str, int]:
+    """Sum one breakdown field across rollups, largest first."""
+    totals: Dict[str, int] = {}
+    for rollup in rollups:
+        for key, count in (rollup.get(field) or {}).items():
+            totals[key] = totals.get(key, 0) + count
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def summarise_usage(rollups: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Usage dashboard figures computed from rollups alone. Keys match the
+    /analytics/usage response: per-period total_visits, the 30-day
+    breakdowns, page visit counts and the daily trend.
+    """
+    now = now or datetime.utcnow()
+    summary: Dict[str, Any] = {}
+
+    for period, days in USAGE_PERIODS.items():
+        start = window_start(days, now)
+        summary[period] = {
+            "total_visits": sum(r.get("visits", 0) for r in rollups if r["date"] >= start)
+        }
+
+    last_30 = [r for r in rollups if r["date"] >= window_start(30, now)]
+    summary["regions"] = merge_counts(last_30, "regions")
+    summary["devices"] = merge_counts(last_30, "devices")
+    summary["browsers"] = merge_counts(last_30, "browsers")
+    summary["operating_systems"] = merge_counts(last_30, "os")
+    summary["peak_hours"] = dict(sorted(merge_counts(last_30, "hours").items(), key=lambda item: int(item[0])))
+    summary["page_visits"] = merge_counts(last_30, "pages")
+
+    # One app_visits document per session per day, so a day's visits are
+    # also its unique visitors
+    summary["daily_trend"] = [
+        {"_id": r["date"], "visits": r.get("visits", 0), "unique_visitors": r.get("visits", 0)}
+        for r in last_30 if r.get("visits")
+    ]
+    return summary
+
+
+# ============================================================================
+# REBUILD / BACKFILL
+# ============================================================================
+
+async def rebuild_rollup(db, date: str) -> Dict[str, Any]:
+    """Recompute one day's rollup from app_visits and feature_usage."""
+    facets = {
+        "totals": [{"$group": {"_id": None, "visits": {"$sum": 1},
+                               "page_views": {"$sum": {"$ifNull": ["$page_views", 1]}}}}],
+    }
+    for rollup_field, visit_field in DIMENSIONS.items():
+        facets[rollup_field] = [
+            {"$match": {visit_field: {"$ne": None}}},
+            {"$group": {"_id": f"${visit_field}", "count": {"$sum": 1}}},
+        ]
+
+    result = await db.app_visits.aggregate([
+        {"$match": {"date": date}},
+        {"$facet": facets},
+    ]).to_list(1)
+    result = result[0] if result else {}
+
+    totals = (result.get("totals") or [{}])[0]
+    rollup: Dict[str, Any] = {
+        "date": date,
+        "visits": totals.get("visits", 0),
+        "page_views": totals.get("page_views", 0),
+        "updated_at": datetime.utcnow(),
+        "rebuilt_at": datetime.utcnow(),
+    }
+    for rollup_field in DIMENSIONS:
+        counts: Dict[str, int] = {}
+        for row in result.get(rollup_field, []):
+            key = rollup_key(row["_id"])
+            if key:
+                counts[key] = counts.get(key, 0) + row["count"]
+        rollup[rollup_field] = counts
+
+    pages: Dict[str, int] = {}
+    async for row in db.feature_usage.find({"date": date}, {"_id": 0, "page": 1, "visits": 1}):
+        key = rollup_key(row.get("page"))
+        if key:
+            pages[key] = pages.get(key, 0) + row.get("visits", 0)
+    rollup["pages"] = pages
+
+    await db[ROLLUP_COLLECTION].replace_one({"date": date}, rollup, upsert=True)
+    return rollup
+
+
+async def backfill_rollups(db, days: int = ROLLUP_BACKFILL_DAYS, rebuild: bool = False,
+                           now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Build rollups for days before today with raw visits but no rollup yet.
+    With rebuild=True every such day in the window is recomputed.
+    """
+    window = {"$gte": window_start(days, now), "$lt": window_start(1, now)}
+    raw_dates = set(await db.app_visits.distinct("date", {"date": window}))
+    if rebuild:
+        dates = sorted(raw_dates)
+    else:
+        existing = set(await db[ROLLUP_COLLECTION].distinct("date", {"date": window}))
+        dates = sorted(raw_dates - existing)
+
+    for date in dates:
+        await rebuild_rollup(db, date)
+        await asyncio.sleep(0)
+
+    if dates:
+        logger.info(f"[Rollups] Built {len(dates)} daily rollups ({dates[0]} .. {dates[-1]})")
+    return {"built": dates}
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    logging.basicConfig(level=logging.INFO)
+
+    from services.database import close_client, get_database
+    from services.analytics_sketches import backfill_sketches
+
+    async def main():
+        rebuild = "--rebuild" in sys.argv
+        days = ROLLUP_BACKFILL_DAYS
+        if rebuild:
+            index = sys.argv.index("--rebuild")
+            if len(sys.argv) > index + 1:
+                days = int(sys.argv[index + 1])
+        report = await backfill_rollups(get_database(), days=days, rebuild=rebuild)
+        print(f"Built {len(report['built'])} daily rollups")
+        report = await backfill_sketches(get_database(), days=days, rebuild=rebuild)
+        print(f"Built unique-visitor sketches for {len(report['built'])} days")
+        close_client()
+
+    asyncio.run(main())
@@ -0,0 +1,332 @@
+"""
+Unique-visitor sketches for analytics.
+
+Distinct session counts used to come from app_visits.distinct("session_id")
+over windows of up to a year and from $addToSet groups, and feature_usage
+kept an ever-growing unique_sessions array per page per day. Instead, one
+HyperLogLog sketch (services/hyperloglog.py) per day and key is stored in
+analytics_sketches and merged on read for any window:
+
+    kind        key                      counts
+    visitors    ""                       sessions seen that day
+    returning   ""                       sessions that had also visited in the
+                                         previous RETURNING_LOOKBACK_DAYS
+    page        page name                sessions that opened the page
+    country     country                  sessions from the country
+    city        "city|country"           sessions from the city
+    uk_region   region                   sessions from a UK region
+
+Location sketches also carry a visits counter (session-days), so the
+location dashboard is served entirely from this collection.
+
+Ingest only updates an in-memory buffer; run_sketch_flusher() merges the
+buffer into MongoDB every few seconds (and on shutdown). Merges use a
+version field, so several workers can flush the same sketch safely.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from services.hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+SKETCH_COLLECTION = "analytics_sketches"
+
+SKETCH_FLUSH_INTERVAL_SECONDS = int(os.getenv("SKETCH_FLUSH_INTERVAL_SECONDS", "5"))
+SKETCH_FLUSH_MAX_KEYS = int(os.getenv("SKETCH_FLUSH_MAX_KEYS", "500"))
+RETURNING_LOOKBACK_DAYS = 30
+
+_MAX_KEY_LENGTH = 128
+_MERGE_ATTEMPTS = 5
+
+SketchKey = Tuple[str, str, str]  # (date, kind, key)
+
+
+def _clean_key(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    key = str(value).strip()[:_MAX_KEY_LENGTH]
+    return key or None
+
+
+# ============================================================================
+# INGEST BUFFER
+# ============================================================================
+
+class SketchBuffer:
+    """Pending sketch updates, merged into MongoDB by the flusher."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[SketchKey, Dict[str, Any]] = {}
+
+    def add(self, date: str, kind: str, key: Any, session_id: str,
+            visits: int = 0, fields: Optional[Dict[str, Any]] = None):
+        key = "" if kind in ("visitors", "returning") else _clean_key(key)
+        if key is None or not session_id:
+            return
+        with self._lock:
+            entry = self._pending.get((date, kind, key))
+            if entry is None:
+                entry = self._pending[(date, kind, key)] = {
+                    "sketch": HyperLogLog(), "visits": 0, "fields": {},
+                }
+            entry["sketch"].add(session_id)
+            entry["visits"] += visits
+            if fields:
+                entry["fields"].update(fields)
+
+    def drain(self) -> Dict[SketchKey, Dict[str, Any]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: Dict[SketchKey, Dict[str, Any]]):
+        """Put back updates that could not be written."""
+        with self._lock:
+            for sketch_key, entry in pending.items():
+                current = self._pending.get(sketch_key)
+                if current is None:
+                    self._pending[sketch_key] = entry
+                else:
+                    current["sketch"].merge(entry["sketch"])
+                    current["visits"] += entry["visits"]
+                    current["fields"] = {**entry["fields"], **current["fields"]}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+sketch_buffer = SketchBuffer()
+
+
+def record_visit_sketches(visit_data: Dict[str, Any], new_session_day: bool,
+                          returning: bool = False, page: Optional[str] = None,
+                          buffer: SketchBuffer = sketch_buffer):
+    """Buffer the sketch updates for one tracked visit."""
+    date = visit_data["date"]
+    session_id = visit_data["session_id"]
+
+    if page:
+        buffer.add(date, "page", page, session_id)
+
+    if not new_session_day:
+        return
+
+    buffer.add(date, "visitors", "", session_id)
+    if returning:
+        buffer.add(date, "returning", "", session_id)
+
+    country = visit_data.get("geo_country")
+    city = visit_data.get("geo_city")
+    region = visit_data.get("geo_region")
+    if country:
+        buffer.add(date, "country", country, session_id, visits=1)
+    if city:
+        buffer.add(date, "city", f"{city}|{country or ''}", session_id, visits=1, fields={
+            "city": city, "country": country,
+            "lat": visit_data.get("geo_lat"), "lon": visit_data.get("geo_lon"),
+        })
+    if region and country == "United Kingdom":
+        buffer.add(date, "uk_region", region, session_id, visits=1)
+
+
+async def returning_sessions(db, session_ids: Iterable[str], date: str) -> set:
+    """Subset of session_ids that visited on an earlier day in the lookback window."""
+    session_ids = list(session_ids)
+    if not session_ids:
+        return set()
+    start = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=RETURNING_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+    previous = await db.app_visits.distinct(
+        "session_id",
+        {"session_id": {"$in": session_ids}, "date": {"$gte": start, "$lt": date}}
+    )
+    return set(previous)
+
+
+# ============================================================================
+# PERSISTENCE
+# ============================================================================
+
+async def merge_sketch(db, date: str, kind: str, key: str, sketch: HyperLogLog,
+                       visits: int = 0, fields: Optional[Dict[str, Any]] = None) -> bool:
+    """Merge a sketch into the stored one (optimistic, retried on conflict)."""
+    collection = db[SKETCH_COLLECTION]
+    selector = {"date": date, "kind": kind, "key": key}
+    fields = fields or {}
+
+    for _ in range(_MERGE_ATTEMPTS):
+        doc = await collection.find_one(selector, {"_id": 1, "sketch": 1, "version": 1})
+        if doc is None:
+            try:
+                await collection.insert_one({
+                    **selector, **fields,
+                    "sketch": Binary(sketch.to_bytes()),
+                    "visits": visits,
+                    "version": 1,
+                    "updated_at": datetime.utcnow(),
+                })
+                return True
+            except DuplicateKeyError:
+                continue
+
+        merged = HyperLogLog.from_bytes(doc["sketch"]).merge(sketch)
+        result = await collection.update_one(
+            {"_id": doc["_id"], "version": doc.get("version")},
+            {
+                "$set": {**fields, "sketch": Binary(merged.to_bytes()), "updated_at": datetime.utcnow()},
+                "$inc": {"version": 1, "visits": visits},
+            }
+        )
+        if result.modified_count:
+            return True
+    return False
+
+
+async def flush_sketches(db, buffer: SketchBuffer = sketch_buffer) -> int:
+    """Write all buffered sketch updates. Failed merges are re-buffered."""
+    pending = buffer.drain()
+    if not pending:
+        return 0
+
+    failed = {}
+    for (date, kind, key), entry in pending.items():
+        try:
+            ok = await merge_sketch(db, date, kind, key, entry["sketch"], entry["visits"], entry["fields"])
+        except Exception as e:
+            logger.error(f"[Sketches] Merge failed for {kind}:{key} on {date}: {e}")
+            ok = False
+        if not ok:
+            failed[(date, kind, key)] = entry
+
+    if failed:
+        buffer.restore(failed)
+    return len(pending) - len(failed)
+
+
+async def run_sketch_flusher(db, interval_seconds: int = SKETCH_FLUSH_INTERVAL_SECONDS,
+                             buffer: SketchBuffer = sketch_buffer):
+    """
+    Background task: flush when many keys are pending, or every
+    interval_seconds otherwise. Cancel to stop (a final flush runs on cancel).
+    """
+    since_flush = 0
+    try:
+        while True:
+            await asyncio.sleep(1)
+            since_flush += 1
+            if len(buffer) >= SKETCH_FLUSH_MAX_KEYS or (since_flush >= interval_seconds and len(buffer)):
+                await flush_sketches(db, buffer)
+                since_flush = 0
+    except asyncio.CancelledError:
+        await flush_sketches(db, buffer)
+        raise
+
+
+# ============================================================================
+# READ
+# ============================================================================
+
+async def get_sketch_docs(db, kind: str, start_date: str, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+    query: Dict[str, Any] = {"kind": kind, "date": {"$gte": start_date}}
+    if end_date:
+        query["date"]["$lte"] = end_date
+    return await db[SKETCH_COLLECTION].find(query, {"_id": 0, "version": 0}).to_list(None)
+
+
+def union_count(docs: Iterable[Dict[str, Any]]) -> int:
+    """Distinct sessions across the given sketch documents."""
+    return HyperLogLog.union(HyperLogLog.from_bytes(d["sketch"]) for d in docs).count()
+
+
+def unique_by_date(docs: Iterable[Dict[str, Any]], start_date: str) -> int:
+    return union_count(d for d in docs if d["date"] >= start_date)
+
+
+def group_by_key(docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge a window of per-day sketch documents by key:
+    [{"key", "visits", "unique", **latest fields}] sorted by visits.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for doc in sorted(docs, key=lambda d: d["date"]):
+        group = groups.get(doc["key"])
+        if group is None:
+            group = groups[doc["key"]] = {"key": doc["key"], "visits": 0, "sketch": HyperLogLog()}
+        group["visits"] += doc.get("visits", 0)
+        group["sketch"].merge(HyperLogLog.from_bytes(doc["sketch"]))
+        for field, value in doc.items():
+            if field not in ("date", "kind", "key", "sketch", "visits", "updated_at") and value is not None:
+                group[field] = value
+
+    results = []
+    for group in groups.values():
+        group["unique"] = group.pop("sketch").count()
+        results.append(group)
+    return sorted(results, key=lambda g: -g["visits"])
+
+
+# ============================================================================
+# REBUILD
+# ============================================================================
+
+async def rebuild_sketches(db, date: str) -> int:
+    """
+    Recompute one day's sketches from app_visits (and any legacy
+    feature_usage.unique_sessions arrays, which are then removed).
+    """
+    buffer = SketchBuffer()
+    cursor = db.app_visits.find(
+        {"date": date},
+        {"_id": 0, "session_id": 1, "date": 1, "geo_country": 1, "geo_city": 1,
+         "geo_region": 1, "geo_lat": 1, "geo_lon": 1}
+    )
+    visits = await cursor.to_list(None)
+    returning = await returning_sessions(db, {visit["session_id"] for visit in visits}, date)
+    for visit in visits:
+        record_visit_sketches(visit, new_session_day=True, returning=visit["session_id"] in returning,
+                              buffer=buffer)
+
+    async for usage in db.feature_usage.find({"date": date, "unique_sessions": {"$exists": True}},
+                                             {"_id": 0, "page": 1, "unique_sessions": 1}):
+        for session_id in usage.get("unique_sessions") or []:
+            buffer.add(date, "page", usage.get("page"), session_id)
+
+    await db[SKETCH_COLLECTION].delete_many({"date": date, "kind": {"$ne": "page"}})
+    written = await flush_sketches(db, buffer)
+    await db.feature_usage.update_many({"date": date}, {"$unset": {"unique_sessions": ""}})
+    return written
+
+
+async def backfill_sketches(db, days: int = 365, rebuild: bool = False,
+                            now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Build sketches for days before today with raw visits but no visitors
+    sketch yet. With rebuild=True every such day in the window is recomputed.
+    Today is left to the flusher, whose merges would race the rebuild's
+    delete_many.
+    """
+    now = now or datetime.utcnow()
+    window = {"$gte": (now - timedelta(days=days - 1)).strftime("%Y-%m-%d"), "$lt": now.strftime("%Y-%m-%d")}
+    raw_dates = set(await db.app_visits.distinct("date", {"date": window}))
+    if rebuild:
+        dates = sorted(raw_dates)
+    else:
+        existing = set(await db[SKETCH_COLLECTION].distinct("date", {"kind": "visitors", "date": window}))
+        dates = sorted(raw_dates - existing)
+
+    for date in dates:
+        await rebuild_sketches(db, date)
+        await asyncio.sleep(0)
+
+    if dates:
+        logger.info(f"[Sketches] Built sketches for {len(dates)} days ({dates[0]} .. {dates[-1]})")
+    return {"built": dates}
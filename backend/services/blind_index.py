@@ -0,0 +1,114 @@
+"""
+Blind-index lookups over encrypted PII.
+
+encryption.encrypt_document() writes a "<field>_bidx" HMAC next to each
+encrypted field listed in BLIND_INDEX_FIELDS, so exact-match lookups
+("has this phone number asked for a callback before?") are an indexed
+query instead of decrypting the whole collection.
+
+Documents written before blind indexes existed are filled in by the
+backfill, which is safe to re-run and resumes where it stopped:
+
+    python -m services.blind_index                 # all collections
+    python -m services.blind_index callback_requests
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from encryption import (
+    BLIND_INDEX_FIELDS, BLIND_INDEX_SUFFIX, DecryptionError, blind_index, blind_index_query, decrypt_field_strict,
+)
+
+logger = logging.getLogger(__name__)
+
+# MongoDB collection -> its ENCRYPTED_FIELDS / BLIND_INDEX_FIELDS schema name
+BLIND_INDEXED_COLLECTIONS = {
+    "counsellors": "counsellors",
+    "peer_supporters": "peer_supporters",
+    "callback_requests": "callbacks",
+}
+
+BACKFILL_BATCH_SIZE = 500
+
+
+async def find_by_blind_index(db, collection_name: str, field: str, value: str,
+                              projection: Optional[Dict[str, Any]] = None,
+                              limit: int = 100) -> List[Dict[str, Any]]:
+    """Documents whose encrypted `field` equals `value` (still encrypted)."""
+    schema = BLIND_INDEXED_COLLECTIONS[collection_name]
+    query = blind_index_query(schema, field, value)
+    return await db[collection_name].find(query, projection or {"_id": 0}).limit(limit).to_list(limit)
+
+
+def _missing_filter(fields: List[str]) -> Dict[str, Any]:
+    """Documents with a value in any field whose blind index has not been written."""
+    return {"$or": [
+        {field: {"$nin": [None, ""]}, f"{field}{BLIND_INDEX_SUFFIX}": {"$exists": False}}
+        for field in fields
+    ]}
+
+
+def _index_updates(schema: str, document: Dict[str, Any]) -> Dict[str, Any]:
+    updates = {}
+    for field, kind in BLIND_INDEX_FIELDS[schema].items():
+        value = document.get(field)
+        if value and isinstance(value, str) and f"{field}{BLIND_INDEX_SUFFIX}" not in document:
+            try:
+                updates[f"{field}{BLIND_INDEX_SUFFIX}"] = blind_index(kind, decrypt_field_strict(value))
+            except DecryptionError:
+                continue
+    return updates
+
+
+async def backfill_blind_indexes(db, collection_name: str, batch_size: int = BACKFILL_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Write missing blind indexes for one collection, a batch at a time in
+    _id order. Decryption runs in a worker thread.
+    """
+    schema = BLIND_INDEXED_COLLECTIONS[collection_name]
+    fields = list(BLIND_INDEX_FIELDS[schema])
+    projection = {field: 1 for field in fields}
+    projection.update({f"{field}{BLIND_INDEX_SUFFIX}": 1 for field in fields})
+
+    stats = {"scanned": 0, "updated": 0, "undecryptable": 0}
+    last_id = None
+    while True:
+        query = _missing_filter(fields)
+        if last_id is not None:
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+        batch = await db[collection_name].find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        stats["scanned"] += len(batch)
+
+        updates = await asyncio.to_thread(lambda: [(doc["_id"], _index_updates(schema, doc)) for doc in batch])
+        operations = [UpdateOne({"_id": doc_id}, {"$set": update}) for doc_id, update in updates if update]
+        stats["undecryptable"] += sum(1 for _, update in updates if not update)
+        if operations:
+            await db[collection_name].bulk_write(operations, ordered=False)
+            stats["updated"] += len(operations)
+
+    logger.info(f"[BlindIndex] {collection_name}: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    logging.basicConfig(level=logging.INFO)
+
+    from services.database import close_client, get_database
+
+    async def main():
+        names = sys.argv[1:] or list(BLIND_INDEXED_COLLECTIONS)
+        for name in names:
+            print(name, await backfill_blind_indexes(get_database(), name))
+        close_client()
+
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+"""
+Date-bucketed counts for admin charts.
+
+daily_counts() answers "how many documents per day between start and end"
+(optionally with per-day sums) with a single $dateTrunc/$group aggregation,
+instead of one count_documents call per day.
+
+Timestamp fields are stored either as BSON dates or, in older collections,
+as ISO strings. Both are matched (MongoDB compares each type separately, so
+the range is expressed once per type) and both are bucketed.
+
+cached_daily_counts() adds an optional materialised cache: counts for
+finished days are kept in daily_counts_cache (expired a day after they
+were computed by a TTL index, see services/indexes.py) so a chart over many
+days only aggregates the days it has not seen recently. Today is always counted live.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+CACHE_COLLECTION = "daily_counts_cache"
+
+DAILY_COUNTS_CACHE_ENABLED = os.getenv("DAILY_COUNTS_CACHE_ENABLED", "true").lower() == "true"
+
+
+def day_start(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def date_range(start: datetime, end: datetime) -> List[str]:
+    """YYYY-MM-DD for every day from start up to (not including) end."""
+    days, current = [], day_start(start)
+    while current < end:
+        days.append(current.strftime("%Y-%m-%d"))
+        current += timedelta(days=1)
+    return days
+
+
+def _date_expression(field: str) -> Dict[str, Any]:
+    """The field as a BSON date, whether stored as a date or an ISO string."""
+    return {"$cond": [
+        {"$eq": [{"$type": f"${field}"}, "string"]},
+        {"$dateFromString": {"dateString": {"$substrBytes": [f"${field}", 0, 19]}, "onError": None}},
+        f"${field}",
+    ]}
+
+
+def build_daily_pipeline(field: str, start: datetime, end: datetime,
+                         match: Optional[Dict[str, Any]] = None,
+                         sums: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """Aggregation pipeline: one group per day in [start, end)."""
+    range_match = {"$or": [
+        {field: {"$gte": start, "$lt": end}},
+        {field: {"$gte": start.isoformat(), "$lt": end.isoformat()}},
+    ]}
+    group: Dict[str, Any] = {
+        "_id": {"$dateTrunc": {"date": _date_expression(field), "unit": "day"}},
+        "count": {"$sum": 1},
+    }
+    for name, expression in (sums or {}).items():
+        group[name] = {"$sum": {"$ifNull": [expression, 0]}}
+
+    return [
+        {"$match": {"$and": [match, range_match]} if match else range_match},
+        {"$group": group},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+async def daily_counts(collection, field: str, start: datetime, end: datetime,
+                       match: Optional[Dict[str, Any]] = None,
+                       sums: Optional[Dict[str, str]] = None,
+                       fill: bool = True) -> Dict[str, Dict[str, int]]:
+    """
+    {"YYYY-MM-DD": {"count": n, <sum name>: total, ...}} for [start, end).
+    With fill=True days without documents are included as zeros.
+    """
+    rows = await collection.aggregate(build_daily_pipeline(field, start, end, match, sums)).to_list(None)
+    counts = {
+        row["_id"].strftime("%Y-%m-%d"): {k: v for k, v in row.items() if k != "_id"}
+        for row in rows
+    }
+    if fill:
+        empty = {"count": 0, **{name: 0 for name in (sums or {})}}
+        counts = {day: counts.get(day, dict(empty)) for day in date_range(start, end)}
+    return counts
+
+
+def _cache_key(collection_name: str, field: str, match: Optional[Dict[str, Any]],
+               sums: Optional[Dict[str, str]]) -> str:
+    spec = json.dumps([collection_name, field, match, sums], sort_keys=True, default=str)
+    return hashlib.sha256(spec.encode()).hexdigest()[:24]
+
+
+async def cached_daily_counts(db, collection_name: str, field: str, start: datetime, end: datetime,
+                              match: Optional[Dict[str, Any]] = None,
+                              sums: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, int]]:
+    """daily_counts() for [start, end), serving finished days from the cache."""
+    collection = db[collection_name]
+    today = day_start(datetime.utcnow())
+    if not DAILY_COUNTS_CACHE_ENABLED or start >= today:
+        return await daily_counts(collection, field, start, end, match, sums)
+
+    key = _cache_key(collection_name, field, match, sums)
+    closed_end = min(end, today)
+    wanted = date_range(start, closed_end)
+
+    cached = {
+        doc["date"]: doc["counts"]
+        for doc in await db[CACHE_COLLECTION].find(
+            {"key": key, "date": {"$in": wanted}}, {"_id": 0, "date": 1, "counts": 1}
+        ).to_list(None)
+    }
+    missing = [day for day in wanted if day not in cached]
+    if missing:
+        # One aggregation over the span of missing days
+        fresh = await daily_counts(
+            collection, field,
+            datetime.strptime(missing[0], "%Y-%m-%d"),
+            datetime.strptime(missing[-1], "%Y-%m-%d") + timedelta(days=1),
+            match, sums,
+        )
+        now = datetime.utcnow()
+        for day in missing:
+            cached[day] = fresh[day]
+        await db[CACHE_COLLECTION].bulk_write([
+            UpdateOne(
+                {"key": key, "date": day},
+                {"$set": {"counts": fresh[day], "collection": collection_name, "computed_at": now}},
+                upsert=True,
+            )
+            for day in missing
+        ], ordered=False)
+
+    result = {day: cached[day] for day in wanted}
+    if end > today:
+        result.update(await daily_counts(collection, field, today, end, match, sums))
+    return result
@@ -1,10 +1,28 @@
 """
 Database configuration and connection utilities.
-Provides shared database access for all routers.
+Provides the single shared MongoDB connection pool for the server, routers
+and scripts.
+
+Pool sizing and timeouts are configured from the environment:
+    MONGO_MAX_POOL_SIZE                 (default 50)
+    MONGO_MIN_POOL_SIZE                 (default 0)
+    MONGO_MAX_IDLE_TIME_MS              (default 300000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   (default 10000)
+    MONGO_CONNECT_TIMEOUT_MS            (default 10000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         (default 10000)
+
+Per-collection read preferences and write concerns are declared in
+COLLECTION_SETTINGS and applied whenever the collection is accessed through
+get_database().
 """
 
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import time
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo import ReadPreference
+from pymongo.write_concern import WriteConcern
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,27 +33,140 @@ load_dotenv(ROOT_DIR / '.env')
 MONGO_URL = os.environ.get('MONGO_URL')
 DB_NAME = os.environ.get('DB_NAME', 'veterans_support')
 
-# Global database client
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+
+# Per-collection settings.
+# - Safeguarding and audit data must survive a primary failover: majority writes.
+# - High-volume analytics writes are fire-and-forget (w=1) and dashboard reads
+#   may be served by a secondary.
+COLLECTION_SETTINGS: Dict[str, Dict[str, Any]] = {
+    "safeguarding_alerts": {"write_concern": WriteConcern(w="majority")},
+    "panic_alerts": {"write_concern": WriteConcern(w="majority")},
+    "cases": {"write_concern": WriteConcern(w="majority")},
+    "audit_logs": {"write_concern": WriteConcern(w="majority")},
+    "app_visits": {
+        "write_concern": WriteConcern(w=1),
+        "read_preference": ReadPreference.SECONDARY_PREFERRED,
+    },
+    "active_sessions": {"write_concern": WriteConcern(w=1)},
+    "feature_usage": {
+        "write_concern": WriteConcern(w=1),
+        "read_preference": ReadPreference.SECONDARY_PREFERRED,
+    },
+}
+
+# Global database client, and the databases opened on it by name
 _client = None
-_db = None
+_databases: Dict[str, "ConfiguredDatabase"] = {}
+
+
+def is_atlas_url(url: Optional[str]) -> bool:
+    """Atlas (remote) connections need the certifi CA bundle."""
+    return bool(url) and ('mongodb+srv' in url or 'mongodb.net' in url)
+
+
+def get_client_options() -> Dict[str, Any]:
+    """Connection pool and timeout options shared by every client."""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "appname": os.environ.get('MONGO_APP_NAME', 'radiocheck-backend'),
+    }
+    if is_atlas_url(MONGO_URL):
+        import certifi
+        options["tlsCAFile"] = certifi.where()
+    return options
 
 
-def get_database():
-    """Get the database instance. Creates connection if not exists."""
-    global _client, _db
-    if _db is None:
-        _client = AsyncIOMotorClient(MONGO_URL)
-        _db = _client[DB_NAME]
-    return _db
+class ConfiguredDatabase:
+    """
+    Thin wrapper around the Motor database that applies COLLECTION_SETTINGS
+    to collections accessed as db.name or db["name"]. Everything else
+    (command, list_collection_names, ...) is passed through.
+    """
+
+    def __init__(self, database):
+        self._database = database
+        self._collections: Dict[str, Any] = {}
+
+    def _collection(self, name: str):
+        collection = self._collections.get(name)
+        if collection is None:
+            settings = COLLECTION_SETTINGS.get(name)
+            if settings:
+                collection = self._database.get_collection(name, **settings)
+            else:
+                collection = self._database[name]
+            self._collections[name] = collection
+        return collection
+
+    def __getitem__(self, name: str):
+        return self._collection(name)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._collections:
+            return self._collections[name]
+        attribute = getattr(self._database, name)
+        # Motor returns a collection for unknown attribute names
+        if name in COLLECTION_SETTINGS or isinstance(attribute, AsyncIOMotorCollection):
+            return self._collection(name)
+        return attribute
 
 
 def get_client():
     """Get the MongoDB client instance."""
     global _client
     if _client is None:
-        _client = AsyncIOMotorClient(MONGO_URL)
+        _client = AsyncIOMotorClient(MONGO_URL, **get_client_options())
     return _client
 
 
-# Convenience function for getting the db
-db = property(lambda self: get_database())
+def get_database(name: Optional[str] = None):
+    """
+    Get a database on the shared client: DB_NAME, or `name` for the few
+    callers that keep their data elsewhere. Creates connection if not exists.
+    """
+    name = name or DB_NAME
+    database = _databases.get(name)
+    if database is None:
+        database = _databases[name] = ConfiguredDatabase(get_client()[name])
+    return database
+
+
+def close_client():
+    """Close the shared client (server shutdown, end of a script)."""
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = None
+    _databases.clear()
+
+
+async def ping_database() -> Dict[str, Any]:
+    """Health probe: round-trip a ping and report pool configuration."""
+    start = time.perf_counter()
+    try:
+        await get_client().admin.command("ping")
+        ok, error = True, None
+    except Exception as e:
+        ok, error = False, str(e)
+    return {
+        "ok": ok,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        "error": error,
+        "database": DB_NAME,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "server_selection_timeout_ms": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
@@ -0,0 +1,442 @@
+"""
+Transactional email through an outbox.
+
+Request handlers used to call resend.Emails.send (a blocking HTTP call)
+inline, so a panic alert waited on the email provider before answering the
+veteran. Now a handler only writes the message to the email_outbox
+collection (one insert) and returns; a background worker delivers it:
+
+- enqueue_email() stores the message with status "pending". A dedupe_key
+  makes repeats of the same notification (retried requests, double clicks)
+  a no-op while the first copy is kept. split_recipients=True stores one
+  message per address, so staff do not see each other's addresses and each
+  delivery has its own status
+- the worker claims due messages (urgent first) with a lease, sends them in
+  batches of up to EMAIL_BATCH_SIZE through the transport, and records
+  "sent" (with the provider id) or schedules a retry with exponential
+  backoff and jitter; after EMAIL_MAX_ATTEMPTS, or on a permanent error, the
+  message is "failed". Messages left "sending" by a crashed worker are
+  claimed again once their lease expires
+- sent and failed messages expire after EMAIL_OUTBOX_RETENTION_DAYS
+
+Transports (EMAIL_TRANSPORT):
+- resend (default): Resend batch API (one request per batch); messages with
+  attachments go through the single-email endpoint
+- fake: records messages in memory, with configurable latency and
+  failures, for tests and local development
+
+Bodies are encrypted at rest like other sensitive fields (ENCRYPTED_FIELDS
+in encryption.py). Scripts can enqueue too; the server's worker delivers.
+
+    python -m services.email_outbox            # outbox status counts
+    python -m services.email_outbox --drain    # deliver everything due now
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from encryption import decrypt_document, encrypt_document
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "email_outbox"
+
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "resend").lower()
+# Resend accepts at most 100 emails per batch request
+EMAIL_BATCH_SIZE = min(int(os.getenv("EMAIL_BATCH_SIZE", "100")), 100)
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+# A claimed batch not recorded within this long is claimed again
+EMAIL_SEND_LEASE_SECONDS = float(os.getenv("EMAIL_SEND_LEASE_SECONDS", "120"))
+# Messages enqueued by other processes are picked up within this long
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", "5"))
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "14"))
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+
+# Resend send parameters kept on the outbox document
+_MESSAGE_FIELDS = ("from", "to", "cc", "bcc", "reply_to", "subject", "html", "text", "headers", "tags", "attachments")
+
+_metrics = {
+    "enqueued": 0, "duplicates": 0, "sent": 0, "retried": 0, "failed": 0,
+    "batches": 0, "transport_errors": 0, "last_batch_ms": 0.0,
+}
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def email_delivery_enabled() -> bool:
+    """Whether enqueued email will go anywhere (a Resend key, or the fake transport)."""
+    return EMAIL_TRANSPORT == "fake" or bool(os.getenv("RESEND_API_KEY"))
+
+
+# ============================================================================
+# ENQUEUE
+# ============================================================================
+
+def _get_collection(db):
+    if db is None:
+        from services.database import get_database
+        db = get_database()
+    return db[OUTBOX_COLLECTION]
+
+
+def _recipients(value) -> List[str]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else [v for v in value if v]
+
+
+async def enqueue_email(params: Dict[str, Any], *, category: str = "general", dedupe_key: Optional[str] = None,
+                        urgent: bool = False, split_recipients: bool = False, db=None) -> List[str]:
+    """
+    Queue an email for delivery. params are Resend send parameters (from,
+    to, subject, html or text, ...). Returns the ids of the outbox messages
+    created; duplicates of an existing dedupe_key are skipped.
+    """
+    recipients = _recipients(params.get("to"))
+    if split_recipients and len(recipients) > 1:
+        messages = [({**params, "to": [address]}, f"{dedupe_key}:{address.lower()}" if dedupe_key else None)
+                    for address in dict.fromkeys(recipients)]
+    else:
+        messages = [(params, dedupe_key)]
+
+    now = datetime.utcnow()
+    documents = []
+    for message, key in messages:
+        document = {
+            "_id": uuid.uuid4().hex,
+            "category": category,
+            "priority": PRIORITY_URGENT if urgent else PRIORITY_NORMAL,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+            **{field: message[field] for field in _MESSAGE_FIELDS if message.get(field) is not None},
+        }
+        if key:
+            document["dedupe_key"] = key
+        documents.append(encrypt_document(OUTBOX_COLLECTION, document))
+
+    collection = _get_collection(db)
+    duplicates: Set[int] = set()
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        duplicates = {error["index"] for error in errors}
+
+    ids = [d["_id"] for i, d in enumerate(documents) if i not in duplicates]
+    _metrics["enqueued"] += len(ids)
+    _metrics["duplicates"] += len(duplicates)
+    if duplicates:
+        logger.info(f"[EmailOutbox] skipped {len(duplicates)} duplicate {category} email(s)")
+    if ids:
+        _get_wakeup().set()
+    return ids
+
+
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
+
+@dataclass
+class SendResult:
+    ok: bool
+    provider_id: Optional[str] = None
+    error: Optional[str] = None
+    retryable: bool = True
+
+
+def _send_params(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: message[field] for field in _MESSAGE_FIELDS if message.get(field) is not None}
+
+
+class ResendTransport:
+    """Delivers through Resend, one batch request per call (attachments go one by one)."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        import resend
+        self._resend = resend
+        resend.api_key = api_key or os.getenv("RESEND_API_KEY") or resend.api_key
+
+    def _is_retryable(self, error: Exception) -> bool:
+        # Bad requests will fail the same way again; rate limits and outages will not
+        exceptions = self._resend.exceptions
+        return not isinstance(error, (exceptions.ValidationError, exceptions.MissingRequiredFieldsError,
+                                      exceptions.InvalidApiKeyError, exceptions.MissingApiKeyError))
+
+    def _send_one(self, message: Dict[str, Any]) -> SendResult:
+        try:
+            response = self._resend.Emails.send(_send_params(message), {"idempotency_key": f"outbox/{message['_id']}"})
+            return SendResult(True, provider_id=(response or {}).get("id"))
+        except Exception as e:
+            return SendResult(False, error=str(e), retryable=self._is_retryable(e))
+
+    def _send_batch(self, messages: List[Dict[str, Any]]) -> List[SendResult]:
+        # Same batch, same key: a batch retried after a lost response is not sent twice
+        key = "outbox-batch/" + uuid.uuid5(uuid.NAMESPACE_URL, ",".join(m["_id"] for m in messages)).hex
+        try:
+            response = self._resend.Batch.send([_send_params(m) for m in messages],
+                                               {"batch_validation": "permissive", "idempotency_key": key})
+        except Exception as e:
+            retryable = self._is_retryable(e)
+            return [SendResult(False, error=str(e), retryable=retryable) for _ in messages]
+
+        # Permissive mode: data holds the accepted emails in order, errors the rejected indexes
+        rejected = {error.get("index"): error.get("message", "rejected") for error in response.get("errors") or []}
+        accepted = iter(response.get("data") or [])
+        results = []
+        for index in range(len(messages)):
+            if index in rejected:
+                results.append(SendResult(False, error=rejected[index], retryable=False))
+            else:
+                results.append(SendResult(True, provider_id=(next(accepted, None) or {}).get("id")))
+        return results
+
+    def _send(self, messages: List[Dict[str, Any]]) -> List[SendResult]:
+        results: Dict[int, SendResult] = {}
+        batch = [i for i, m in enumerate(messages) if not m.get("attachments")]
+        if batch:
+            results.update(zip(batch, self._send_batch([messages[i] for i in batch])))
+        for i, message in enumerate(messages):
+            if message.get("attachments"):
+                results[i] = self._send_one(message)
+        return [results[i] for i in range(len(messages))]
+
+    async def send(self, messages: List[Dict[str, Any]]) -> List[SendResult]:
+        """One result per message, in order."""
+        return await asyncio.to_thread(self._send, messages)
+
+
+class FakeTransport:
+    """
+    In-memory transport for tests and local development.
+    fail_times: address -> number of transient failures before it succeeds
+    rejected: addresses that always fail permanently
+    """
+
+    def __init__(self, latency: float = 0.0, fail_times: Optional[Dict[str, int]] = None,
+                 rejected: Iterable[str] = ()):
+        self.latency = latency
+        self.fail_times = dict(fail_times or {})
+        self.rejected = set(rejected)
+        self.sent: List[Dict[str, Any]] = []
+        self.batches: List[int] = []
+
+    async def send(self, messages: List[Dict[str, Any]]) -> List[SendResult]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.batches.append(len(messages))
+        results = []
+        for message in messages:
+            address = ",".join(_recipients(message.get("to")))
+            if address in self.rejected:
+                results.append(SendResult(False, error="rejected by fake transport", retryable=False))
+            elif self.fail_times.get(address, 0) > 0:
+                self.fail_times[address] -= 1
+                results.append(SendResult(False, error="fake transient failure"))
+            else:
+                self.sent.append(_send_params(message))
+                results.append(SendResult(True, provider_id=f"fake-{len(self.sent)}"))
+        return results
+
+
+_default_transport = None
+
+
+def get_email_transport():
+    """The configured transport (EMAIL_TRANSPORT=resend|fake)."""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = FakeTransport() if EMAIL_TRANSPORT == "fake" else ResendTransport()
+    return _default_transport
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before the next try after `attempts` failures: exponential, capped, with jitter."""
+    delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _due_query(now: datetime) -> Dict[str, Any]:
+    return {"$or": [
+        {"status": "pending", "next_attempt_at": {"$lte": now}},
+        {"status": "sending", "lease_until": {"$lte": now}},
+    ]}
+
+
+class EmailOutboxWorker:
+    """Claims due outbox messages in batches and delivers them through a transport."""
+
+    def __init__(self, db=None, transport=None, batch_size: int = EMAIL_BATCH_SIZE,
+                 max_attempts: int = EMAIL_MAX_ATTEMPTS):
+        self._db = db
+        self._transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+    @property
+    def collection(self):
+        return _get_collection(self._db)
+
+    @property
+    def transport(self):
+        return self._transport or get_email_transport()
+
+    async def claim(self) -> List[Dict[str, Any]]:
+        """Lease up to batch_size due messages to this worker, urgent and oldest first."""
+        now = datetime.utcnow()
+        candidates = await self.collection.find(_due_query(now), {"_id": 1}).sort(
+            [("priority", 1), ("next_attempt_at", 1)]).limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return []
+        claim = uuid.uuid4().hex
+        # Re-checked in the update, so a message claimed meanwhile by another worker is skipped
+        await self.collection.update_many(
+            {"_id": {"$in": [c["_id"] for c in candidates]}, **_due_query(now)},
+            {"$set": {"status": "sending", "claim": claim,
+                      "lease_until": now + timedelta(seconds=EMAIL_SEND_LEASE_SECONDS)}},
+        )
+        claimed = await self.collection.find({"claim": claim}).to_list(self.batch_size)
+        return [decrypt_document(OUTBOX_COLLECTION, doc) for doc in claimed]
+
+    def _outcome(self, message: Dict[str, Any], result: SendResult, now: datetime) -> Dict[str, Any]:
+        attempts = message.get("attempts", 0) + 1
+        if result.ok:
+            _metrics["sent"] += 1
+            return {"$set": {"status": "sent", "attempts": attempts, "sent_at": now, "provider_id": result.provider_id,
+                             "expires_at": now + timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS)},
+                    "$unset": {"claim": "", "lease_until": "", "last_error": ""}}
+        if not result.retryable or attempts >= self.max_attempts:
+            _metrics["failed"] += 1
+            logger.error(f"[EmailOutbox] {message.get('category')} email {message['_id']} failed "
+                         f"after {attempts} attempt(s): {result.error}")
+            return {"$set": {"status": "failed", "attempts": attempts, "failed_at": now, "last_error": result.error,
+                             "expires_at": now + timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS)},
+                    "$unset": {"claim": "", "lease_until": ""}}
+        _metrics["retried"] += 1
+        return {"$set": {"status": "pending", "attempts": attempts, "last_error": result.error,
+                         "next_attempt_at": now + timedelta(seconds=retry_delay(attempts))},
+                "$unset": {"claim": "", "lease_until": ""}}
+
+    async def run_once(self) -> int:
+        """Deliver one batch. Returns how many messages were processed."""
+        messages = await self.claim()
+        if not messages:
+            return 0
+        started = time.perf_counter()
+        try:
+            results = await self.transport.send(messages)
+        except Exception as e:
+            _metrics["transport_errors"] += 1
+            logger.warning(f"[EmailOutbox] transport error: {e}")
+            results = [SendResult(False, error=str(e)) for _ in messages]
+        _metrics["batches"] += 1
+        _metrics["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        now = datetime.utcnow()
+        await self.collection.bulk_write([
+            UpdateOne({"_id": message["_id"], "claim": message["claim"]}, self._outcome(message, result, now))
+            for message, result in zip(messages, results)
+        ], ordered=False)
+        return len(messages)
+
+    async def drain(self) -> int:
+        """Deliver everything due now (scripts and tests)."""
+        total = 0
+        while True:
+            processed = await self.run_once()
+            if not processed:
+                return total
+            total += processed
+
+    async def run(self, poll_seconds: float = EMAIL_OUTBOX_POLL_SECONDS):
+        """Background task: deliver as messages arrive, polling for other processes' messages. Cancel to stop."""
+        wakeup = _get_wakeup()
+        while True:
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[EmailOutbox] delivery pass failed: {e}")
+                processed = 0
+            if processed:
+                continue
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def run_email_outbox_worker(db=None, transport=None):
+    await EmailOutboxWorker(db, transport).run()
+
+
+# ============================================================================
+# STATUS
+# ============================================================================
+
+def get_email_outbox_metrics() -> Dict[str, Any]:
+    return {**_metrics, "transport": EMAIL_TRANSPORT}
+
+
+async def get_outbox_status(db=None) -> Dict[str, Any]:
+    """Message counts by status, the oldest pending message and recent failures."""
+    collection = _get_collection(db)
+    counts = {row["_id"]: row["count"] async for row in collection.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ])}
+    oldest = await collection.find_one({"status": "pending"}, {"created_at": 1}, sort=[("created_at", 1)])
+    failures = await collection.find(
+        {"status": "failed"},
+        {"_id": 1, "category": 1, "attempts": 1, "last_error": 1, "failed_at": 1},
+    ).sort("failed_at", -1).limit(20).to_list(20)
+    return {
+        "counts": counts,
+        "oldest_pending_seconds": (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0,
+        "recent_failures": failures,
+        "metrics": get_email_outbox_metrics(),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Email outbox status and delivery")
+    parser.add_argument("--drain", action="store_true", help="deliver everything due now, then exit")
+    args = parser.parse_args()
+
+    async def main():
+        if args.drain:
+            print(f"Delivered {await EmailOutboxWorker().drain()} message(s)")
+        print(json.dumps(await get_outbox_status(), indent=2, default=str))
+
+    asyncio.run(main())
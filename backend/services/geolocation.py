@@ -0,0 +1,319 @@
+"""
+Local IP geolocation.
+
+Visitor and safeguarding-alert locations are resolved from a local IP-range
+dataset instead of calling ip-api.com for every request, so lookups take
+microseconds and user IPs are not sent to a third party.
+
+Dataset: CSV (optionally gzipped) at GEOIP_DATABASE_PATH, one range per row:
+
+    start_ip,end_ip,country,region,city,latitude,longitude
+
+start/end are IPv4 or IPv6 addresses (or their integer form); extra columns
+are ignored and a header row is skipped. Country should be the country name
+("United Kingdom"), as used by the location dashboard.
+
+The ranges are loaded into sorted integer arrays and searched with bisect;
+recent results are kept in an LRU cache. The file is re-read when it
+changes on disk (checked at most every GEOIP_RELOAD_CHECK_SECONDS).
+
+Refresh the dataset from GEOIP_DATASET_URL (or a URL given on the command
+line) with:
+
+    python -m services.geolocation --refresh [url]
+    python -m services.geolocation 81.2.69.160      # test a lookup
+
+The ip-api.com HTTP provider is kept as an opt-in fallback for addresses
+the dataset does not cover (GEOIP_HTTP_FALLBACK=true).
+"""
+
+import bisect
+import csv
+import gzip
+import io
+import ipaddress
+import logging
+import os
+import threading
+import time
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent
+
+GEOIP_DATABASE_PATH = os.getenv("GEOIP_DATABASE_PATH", str(ROOT_DIR / "data" / "geoip" / "ip_ranges.csv.gz"))
+GEOIP_DATASET_URL = os.getenv("GEOIP_DATASET_URL", "")
+GEOIP_HTTP_FALLBACK = os.getenv("GEOIP_HTTP_FALLBACK", "false").lower() == "true"
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "10000"))
+GEOIP_RELOAD_CHECK_SECONDS = 60
+
+_IGNORED_IPS = {"", "unknown", "localhost"}
+
+
+class IPRangeDatabase:
+    """Sorted, non-overlapping IP ranges mapped to locations."""
+
+    def __init__(self, ranges: List[Tuple[int, int, int, Dict[str, Any]]]):
+        # IPv4 ranges fit in unsigned 32-bit arrays; IPv6 needs Python ints
+        v4 = sorted((r for r in ranges if r[0] == 4), key=lambda r: r[1])
+        v6 = sorted((r for r in ranges if r[0] == 6), key=lambda r: r[1])
+
+        self.locations: List[Dict[str, Any]] = []
+        location_ids: Dict[Tuple, int] = {}
+
+        def location_id(location):
+            key = tuple(location.values())
+            if key not in location_ids:
+                location_ids[key] = len(self.locations)
+                self.locations.append(location)
+            return location_ids[key]
+
+        self.v4_starts = array("I", (r[1] for r in v4))
+        self.v4_ends = array("I", (r[2] for r in v4))
+        self.v4_locations = array("I", (location_id(r[3]) for r in v4))
+        self.v6_starts = [r[1] for r in v6]
+        self.v6_ends = [r[2] for r in v6]
+        self.v6_locations = array("I", (location_id(r[3]) for r in v6))
+
+    def __len__(self) -> int:
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    def lookup(self, ip: str) -> Optional[Dict[str, Any]]:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        value = int(address)
+
+        if address.version == 4:
+            starts, ends, locations = self.v4_starts, self.v4_ends, self.v4_locations
+        else:
+            starts, ends, locations = self.v6_starts, self.v6_ends, self.v6_locations
+
+        i = bisect.bisect_right(starts, value) - 1
+        if i >= 0 and value <= ends[i]:
+            return self.locations[locations[i]]
+        return None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _address(value: str) -> Tuple[int, int]:
+        value = value.strip()
+        if value.isdigit():
+            number = int(value)
+            return (4 if number < 2 ** 32 else 6), number
+        address = ipaddress.ip_address(value)
+        return address.version, int(address)
+
+    @staticmethod
+    def _float(value: str) -> Optional[float]:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def from_rows(cls, rows) -> "IPRangeDatabase":
+        ranges = []
+        skipped = 0
+        for row in rows:
+            if len(row) < 7:
+                skipped += 1
+                continue
+            try:
+                version, start = cls._address(row[0])
+                end_version, end = cls._address(row[1])
+            except ValueError:
+                skipped += 1  # header or malformed row
+                continue
+            if version != end_version or end < start:
+                skipped += 1
+                continue
+            ranges.append((version, start, end, {
+                "geo_country": row[2] or None,
+                "geo_region": row[3] or None,
+                "geo_city": row[4] or None,
+                "geo_lat": cls._float(row[5]),
+                "geo_lon": cls._float(row[6]),
+            }))
+        if skipped > 1:
+            logger.warning(f"[GeoIP] Skipped {skipped} unusable rows")
+        return cls(ranges)
+
+    @classmethod
+    def load(cls, path: str) -> "IPRangeDatabase":
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8", newline="") as f:
+            return cls.from_rows(csv.reader(f))
+
+
+# ============================================================================
+# SHARED INSTANCE
+# ============================================================================
+
+_lock = threading.Lock()
+_database: Optional[IPRangeDatabase] = None
+_loaded_mtime: Optional[float] = None
+_last_check = 0.0
+
+
+def load_geo_database(path: str = GEOIP_DATABASE_PATH) -> bool:
+    """(Re)load the dataset. Returns False if there is no dataset file."""
+    global _database, _loaded_mtime
+    if not os.path.exists(path):
+        logger.warning(f"[GeoIP] No dataset at {path}; local lookups disabled")
+        return False
+
+    start = time.perf_counter()
+    mtime = os.path.getmtime(path)
+    database = IPRangeDatabase.load(path)
+    with _lock:
+        _database, _loaded_mtime = database, mtime
+        lookup_local.cache_clear()
+    logger.info(f"[GeoIP] Loaded {len(database)} ranges in {(time.perf_counter() - start) * 1000:.0f}ms")
+    return True
+
+
+def _reload_if_changed():
+    """Pick up a refreshed dataset file without restarting."""
+    global _last_check
+    now = time.monotonic()
+    if now - _last_check < GEOIP_RELOAD_CHECK_SECONDS:
+        return
+    _last_check = now
+    try:
+        mtime = os.path.getmtime(GEOIP_DATABASE_PATH)
+    except OSError:
+        return
+    # Also covers a dataset that appeared after startup (nothing loaded yet)
+    if mtime != _loaded_mtime:
+        threading.Thread(target=load_geo_database, args=(GEOIP_DATABASE_PATH,), daemon=True).start()
+
+
+def is_public_ip(ip: str) -> bool:
+    if not ip or ip in _IGNORED_IPS:
+        return False
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
+
+
+@lru_cache(maxsize=GEOIP_CACHE_SIZE)
+def lookup_local(ip: str) -> Optional[Dict[str, Any]]:
+    """Location for an IP from the local dataset (None if unknown or not loaded)."""
+    database = _database
+    if database is None:
+        return None
+    return database.lookup(ip)
+
+
+def get_geolocation_status() -> Dict[str, Any]:
+    cache = lookup_local.cache_info()
+    return {
+        "dataset_path": GEOIP_DATABASE_PATH,
+        "loaded": _database is not None,
+        "ranges": len(_database) if _database else 0,
+        "http_fallback": GEOIP_HTTP_FALLBACK,
+        "cache_hits": cache.hits,
+        "cache_misses": cache.misses,
+        "cache_size": cache.currsize,
+    }
+
+
+# ============================================================================
+# PROVIDERS
+# ============================================================================
+
+async def lookup_http(ip: str) -> Dict[str, Any]:
+    """ip-api.com lookup (opt-in fallback; sends the IP to a third party)."""
+    import httpx
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(f"http://ip-api.com/json/{ip}?fields=status,city,regionName,country,isp,timezone,lat,lon")
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("status") == "success":
+                    return {
+                        "geo_city": data.get("city"),
+                        "geo_region": data.get("regionName"),
+                        "geo_country": data.get("country"),
+                        "geo_isp": data.get("isp"),
+                        "geo_timezone": data.get("timezone"),
+                        "geo_lat": data.get("lat"),
+                        "geo_lon": data.get("lon")
+                    }
+    except Exception as e:
+        logger.warning(f"[GeoIP] HTTP lookup failed for {ip}: {e}")
+    return {}
+
+
+async def lookup_ip_location(ip: str, allow_remote: bool = True) -> Dict[str, Any]:
+    """
+    Location for an IP: local dataset first, then (if enabled and allowed)
+    the HTTP provider. Returns {} when unknown.
+    """
+    if not is_public_ip(ip):
+        return {}
+    _reload_if_changed()
+    location = lookup_local(ip)
+    if location:
+        return dict(location)
+    if allow_remote and GEOIP_HTTP_FALLBACK:
+        return await lookup_http(ip)
+    return {}
+
+
+# ============================================================================
+# REFRESH
+# ============================================================================
+
+def refresh_dataset(url: str = GEOIP_DATASET_URL, path: str = GEOIP_DATABASE_PATH) -> int:
+    """
+    Download a new dataset, check that it parses, and atomically replace
+    the current file. Running servers pick it up on their next reload check.
+    """
+    import httpx
+    if not url:
+        raise ValueError("No dataset URL (set GEOIP_DATASET_URL or pass one)")
+
+    response = httpx.get(url, timeout=120.0, follow_redirects=True)
+    response.raise_for_status()
+    data = response.content
+    if not data.startswith(b"\x1f\x8b"):
+        data = gzip.compress(data)
+
+    with gzip.open(io.BytesIO(data), "rt", encoding="utf-8", newline="") as f:
+        database = IPRangeDatabase.from_rows(csv.reader(f))
+    if not len(database):
+        raise ValueError("Downloaded dataset contains no usable ranges")
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(database)
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+
+    if "--refresh" in sys.argv:
+        index = sys.argv.index("--refresh")
+        url = sys.argv[index + 1] if len(sys.argv) > index + 1 else GEOIP_DATASET_URL
+        print(f"Installed {refresh_dataset(url)} ranges at {GEOIP_DATABASE_PATH}")
+    else:
+        load_geo_database()
+        for ip in sys.argv[1:]:
+            print(ip, lookup_local(ip))
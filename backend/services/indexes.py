@@ -0,0 +1,311 @@
+"""
+MongoDB index manifest.
+
+Every index the backend relies on is declared here, per collection, next to
+the query it serves. The manifest is applied idempotently in the background
+at startup and can be checked or applied from the command line:
+
+    python -m services.indexes            # report drift only
+    python -m services.indexes --apply    # create missing indexes
+
+Drift reporting compares declared indexes with what the server actually has:
+- missing:    declared but not present (created by apply)
+- mismatched: same name but different keys/options (reported, never dropped)
+- extra:      present but not declared (reported, never dropped)
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+APPLY_INDEXES_ON_STARTUP = os.getenv("APPLY_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+# Options compared when checking drift (everything else is server metadata)
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+# ============================================================================
+# MANIFEST
+# ============================================================================
+# collection -> list of {"name", "keys", **options}
+# Keys are (field, direction) pairs, exactly as passed to create_index.
+
+INDEX_MANIFEST: Dict[str, List[Dict[str, Any]]] = {
+    "safeguarding_alerts": [
+        # Alert lists filtered by status / risk, newest first
+        {"name": "status_created_at", "keys": [("status", 1), ("created_at", -1)]},
+        {"name": "risk_level_created_at", "keys": [("risk_level", 1), ("created_at", -1)]},
+        {"name": "created_at", "keys": [("created_at", -1)]},
+        {"name": "id", "keys": [("id", 1)]},
+        # Keyset pages (services/pagination.py): sort key then id tie-break
+        {"name": "created_at_id", "keys": [("created_at", -1), ("id", -1)]},
+        {"name": "status_created_at_id", "keys": [("status", 1), ("created_at", -1), ("id", -1)]},
+    ],
+    "notes": [
+        {"name": "created_at_id", "keys": [("created_at", -1), ("id", -1)]},
+        {"name": "author_id_created_at_id", "keys": [("author_id", 1), ("created_at", -1), ("id", -1)]},
+        {"name": "callback_id_created_at_id", "keys": [("callback_id", 1), ("created_at", -1), ("id", -1)]},
+    ],
+    "concerns": [
+        {"name": "created_at_id", "keys": [("created_at", -1), ("id", -1)]},
+        {"name": "status_created_at_id", "keys": [("status", 1), ("created_at", -1), ("id", -1)]},
+    ],
+    "callback_requests": [
+        {"name": "created_at_id", "keys": [("created_at", -1), ("id", -1)]},
+        {"name": "request_type_created_at_id", "keys": [("request_type", 1), ("created_at", -1), ("id", -1)]},
+        # Blind indexes over encrypted caller details (services/blind_index.py)
+        {"name": "phone_bidx", "keys": [("phone_bidx", 1)]},
+        {"name": "email_bidx", "keys": [("email_bidx", 1)]},
+        {"name": "name_bidx", "keys": [("name_bidx", 1)]},
+    ],
+    "callbacks": [
+        {"name": "created_at_id", "keys": [("created_at", -1), ("_id", -1)]},
+    ],
+    "call_logs": [
+        {"name": "timestamp_id", "keys": [("timestamp", -1), ("id", -1)]},
+    ],
+    "counsellors": [
+        {"name": "id", "keys": [("id", 1)]},
+        {"name": "phone_bidx", "keys": [("phone_bidx", 1)]},
+        {"name": "name_bidx", "keys": [("name_bidx", 1)]},
+    ],
+    "peer_supporters": [
+        {"name": "id", "keys": [("id", 1)]},
+        {"name": "phone_bidx", "keys": [("phone_bidx", 1)]},
+        {"name": "firstName_bidx", "keys": [("firstName_bidx", 1)]},
+    ],
+    "peer_support_registrations": [
+        {"name": "timestamp_id", "keys": [("timestamp", -1), ("id", -1)]},
+    ],
+    "survey_responses": [
+        {"name": "submitted_at_id", "keys": [("submitted_at", -1), ("_id", -1)]},
+    ],
+    "app_visits": [
+        # Per-session daily upsert in /analytics/visit
+        {"name": "session_id_date", "keys": [("session_id", 1), ("date", 1)]},
+        # Usage / location analytics windows
+        {"name": "timestamp", "keys": [("timestamp", -1)]},
+        {"name": "date", "keys": [("date", 1)]},
+    ],
+    "analytics_daily_rollups": [
+        # One rollup per day, read by date range for the usage dashboard
+        {"name": "date", "keys": [("date", 1)], "unique": True},
+    ],
+    "analytics_sketches": [
+        # One sketch per day and key; windows are read by kind and date range
+        {"name": "date_kind_key", "keys": [("date", 1), ("kind", 1), ("key", 1)], "unique": True},
+        {"name": "kind_date", "keys": [("kind", 1), ("date", 1)]},
+    ],
+    "daily_counts_cache": [
+        # Materialised per-day chart counts, recomputed after a day
+        {"name": "key_date", "keys": [("key", 1), ("date", 1)], "unique": True},
+        {"name": "computed_at_ttl", "keys": [("computed_at", 1)], "expireAfterSeconds": 86400},
+    ],
+    "message_queue": [
+        # Pending messages for a recipient, by priority then age
+        {
+            "name": "recipient_status_priority",
+            "keys": [("recipient_id", 1), ("status", 1), ("priority", -1), ("created_at", 1)],
+        },
+        {"name": "status", "keys": [("status", 1)]},
+        {"name": "id", "keys": [("id", 1)]},
+        # Push retries that are due (services/push.py)
+        {"name": "status_next_retry_at", "keys": [("status", 1), ("next_retry_at", 1)]},
+        {"name": "retry_claim", "keys": [("retry_claim", 1)], "sparse": True},
+    ],
+    "lms_learners": [
+        {"name": "email", "keys": [("email", 1)]},
+        {"name": "enrolled_at", "keys": [("enrolled_at", -1)]},
+        {"name": "enrolled_at_id", "keys": [("enrolled_at", -1), ("_id", -1)]},
+    ],
+    "users": [
+        {"name": "id", "keys": [("id", 1)]},
+        {"name": "email", "keys": [("email", 1)]},
+        {"name": "role", "keys": [("role", 1)]},
+        # Stale tokens removed after a DeviceNotRegistered receipt
+        {"name": "push_token", "keys": [("push_token", 1)], "sparse": True},
+    ],
+    "rate_limits": [
+        # Sliding-window counters (services/rate_limit.py), gone once idle past their windows
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "revoked_tokens": [
+        # Logged-out token ids (services/principals.py), kept until the token would have expired
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "email_outbox": [
+        # Worker claims: due pending messages (and expired leases), urgent first
+        {"name": "status_priority_next_attempt_at", "keys": [("status", 1), ("priority", 1), ("next_attempt_at", 1)]},
+        {"name": "claim", "keys": [("claim", 1)], "sparse": True},
+        {
+            "name": "dedupe_key",
+            "keys": [("dedupe_key", 1)],
+            "unique": True,
+            "partialFilterExpression": {"dedupe_key": {"$exists": True}},
+        },
+        # Sent and failed messages, after EMAIL_OUTBOX_RETENTION_DAYS
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "push_tickets": [
+        # Expo tickets awaiting their receipt (services/push.py); unanswered ones lapse after a day
+        {"name": "check_after", "keys": [("check_after", 1)]},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "notification_fanouts": [
+        # Staff notification records (services/notifications.py), looked up per alert / request
+        {"name": "kind_ref_id", "keys": [("kind", 1), ("ref_id", 1)]},
+        {"name": "expires_at_ttl", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "cases": [
+        # Staff case lists (own cases, optional status filter, recently updated)
+        {"name": "assigned_to_status_updated_at", "keys": [("assigned_to", 1), ("status", 1), ("updated_at", -1)]},
+        {"name": "shared_with", "keys": [("shared_with", 1)]},
+        {"name": "status_next_check_in", "keys": [("status", 1), ("next_check_in", 1)]},
+        {"name": "id", "keys": [("id", 1)]},
+        {"name": "safeguarding_alert_id", "keys": [("safeguarding_alert_id", 1)]},
+    ],
+    "shifts": [
+        {"name": "date", "keys": [("date", 1)]},
+        {"name": "user_id_date", "keys": [("user_id", 1), ("date", 1)]},
+        {"name": "id", "keys": [("id", 1)]},
+    ],
+    "knowledge_base": [
+        # search_text is matched with case-insensitive regexes, which can scan
+        # the (much smaller) index keys instead of every document
+        {"name": "search_text", "keys": [("search_text", 1)]},
+        {"name": "category", "keys": [("category", 1)]},
+        {"name": "is_verified", "keys": [("is_verified", -1)]},
+        {"name": "id", "keys": [("id", 1)]},
+    ],
+}
+
+
+# ============================================================================
+# DRIFT DETECTION
+# ============================================================================
+
+def _normalise_keys(keys) -> List[List[Any]]:
+    """Key spec as a comparable list of [field, direction] pairs."""
+    items = keys.items() if hasattr(keys, "items") else keys
+    return [[field, int(direction) if isinstance(direction, (int, float)) else direction]
+            for field, direction in items]
+
+
+def _options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: spec[k] for k in _COMPARED_OPTIONS if spec.get(k) not in (None, False)}
+
+
+async def get_index_drift(db, manifest: Dict[str, List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, List]]:
+    """
+    Compare declared indexes with the ones that exist.
+    Returns {collection: {"missing": [...], "mismatched": [...], "extra": [...]}}.
+    """
+    manifest = manifest or INDEX_MANIFEST
+    drift = {}
+
+    for collection, declared in manifest.items():
+        existing = {}
+        async for index in db[collection].list_indexes():
+            if index["name"] != "_id_":
+                existing[index["name"]] = index
+
+        missing, mismatched = [], []
+        for spec in declared:
+            actual = existing.get(spec["name"])
+            if actual is None:
+                missing.append(spec["name"])
+                continue
+            if (_normalise_keys(actual["key"]) != _normalise_keys(spec["keys"])
+                    or _options(actual) != _options(spec)):
+                mismatched.append({
+                    "name": spec["name"],
+                    "declared": {"keys": _normalise_keys(spec["keys"]), **_options(spec)},
+                    "actual": {"keys": _normalise_keys(actual["key"]), **_options(actual)},
+                })
+
+        declared_names = {spec["name"] for spec in declared}
+        extra = sorted(name for name in existing if name not in declared_names)
+
+        drift[collection] = {"missing": missing, "mismatched": mismatched, "extra": extra}
+
+    return drift
+
+
+# ============================================================================
+# APPLY
+# ============================================================================
+
+async def apply_index_manifest(db, manifest: Dict[str, List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Create every declared index that does not exist yet.
+
+    Safe to run repeatedly. Mismatched and extra indexes are only reported.
+    A failure on one index (e.g. duplicate data for a unique index) is
+    recorded and does not stop the others.
+    """
+    manifest = manifest or INDEX_MANIFEST
+    drift = await get_index_drift(db, manifest)
+    created, errors = [], []
+
+    for collection, declared in manifest.items():
+        missing = set(drift[collection]["missing"])
+        for spec in declared:
+            if spec["name"] not in missing:
+                continue
+            try:
+                await db[collection].create_index(
+                    spec["keys"], name=spec["name"], background=True, **_options(spec)
+                )
+                created.append(f"{collection}.{spec['name']}")
+            except Exception as e:
+                errors.append({"index": f"{collection}.{spec['name']}", "error": str(e)})
+                logger.error(f"[Indexes] Failed to create {collection}.{spec['name']}: {e}")
+
+    report = {
+        "created": created,
+        "errors": errors,
+        "mismatched": {c: d["mismatched"] for c, d in drift.items() if d["mismatched"]},
+        "extra": {c: d["extra"] for c, d in drift.items() if d["extra"]},
+    }
+    if created:
+        logger.info(f"[Indexes] Created {len(created)} indexes: {', '.join(created)}")
+    if report["mismatched"]:
+        logger.warning(f"[Indexes] Mismatched indexes (not changed): {report['mismatched']}")
+    return report
+
+
+def format_drift_report(drift: Dict[str, Dict[str, List]]) -> str:
+    """Human-readable version of get_index_drift()."""
+    lines = ["Index drift", "=" * 60]
+    for collection, state in drift.items():
+        status = "ok" if not any(state.values()) else "drift"
+        lines.append(f"  {collection:<24} {status}")
+        for name in state["missing"]:
+            lines.append(f"      missing     {name}")
+        for item in state["mismatched"]:
+            lines.append(f"      mismatched  {item['name']}: declared {item['declared']} actual {item['actual']}")
+        for name in state["extra"]:
+            lines.append(f"      extra       {name}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    logging.basicConfig(level=logging.INFO)
+
+    from services.database import get_database
+
+    async def main():
+        db = get_database()
+        if "--apply" in sys.argv:
+            report = await apply_index_manifest(db)
+            print(f"Created: {report['created'] or 'none'}")
+            for error in report["errors"]:
+                print(f"Error:   {error['index']}: {error['error']}")
+        print(format_drift_report(await get_index_drift(db)))
+
+    asyncio.run(main())
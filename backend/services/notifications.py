@@ -0,0 +1,284 @@
+"""
+Staff notification fan-out.
+
+Panic alerts and callback requests notify every relevant staff member on
+every channel they can be reached on. Previously, staff were looked up
+with full documents and notified by one email, after the handler had
+waited on the provider. notify_staff() instead:
+
+- resolves the recipients with one projected users query (id, name,
+  email, push token; nothing else leaves MongoDB)
+- dispatches to all channels concurrently, each channel reaching all of
+  its recipients at once:
+    email   one insert into the email outbox (services/email_outbox.py),
+            one message per recipient
+    socket  an event to each recipient's Socket.IO connection
+    push    Expo push through the services/push.py batcher, up to 100
+            devices per request, with tickets kept for receipt checks
+- stops waiting after NOTIFY_DEADLINE_SECONDS; a channel still running
+  then is cancelled and its unreached recipients are marked "timeout"
+- records, per recipient and channel, the status and the milliseconds
+  from the triggering event, plus all_notified_ms: the time by which every
+  recipient had been reached on at least one channel (the panic-alert
+  SLA). Records are kept in notification_fanouts for
+  NOTIFY_RECORD_RETENTION_DAYS; recent latencies appear in system-stats
+
+Push and socket payloads carry only a title and ids, never caller
+details: they show on lock screens and staff open the portal for the rest.
+notify_staff_in_background() runs the fan-out without holding up the
+request that triggered it.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from services.email_outbox import email_delivery_enabled, enqueue_email
+from services.push import push_batcher
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_DEADLINE_SECONDS = float(os.getenv("NOTIFY_DEADLINE_SECONDS", "5"))
+NOTIFY_MAX_RECIPIENTS = int(os.getenv("NOTIFY_MAX_RECIPIENTS", "500"))
+NOTIFY_RECORD_RETENTION_DAYS = int(os.getenv("NOTIFY_RECORD_RETENTION_DAYS", "30"))
+FANOUT_COLLECTION = "notification_fanouts"
+
+# Everything a channel needs to reach a staff member, and no more
+STAFF_PROJECTION = {"_id": 1, "id": 1, "name": 1, "role": 1, "email": 1, "push_token": 1}
+
+
+@dataclass
+class StaffNotification:
+    kind: str                                   # "panic_alert", "callback_request", ... (also the socket event)
+    ref_id: str                                 # id of the alert / request it is about
+    title: str                                  # push and socket title, no personal details
+    body: str
+    email: Optional[Dict[str, Any]] = None      # Resend params except "to"; no email when None
+    data: Dict[str, Any] = field(default_factory=dict)
+    urgent: bool = True
+
+
+Report = Callable[..., None]
+Channel = Callable[[StaffNotification, List[Dict[str, Any]], Report], Awaitable[None]]
+
+
+# ============================================================================
+# CHANNELS
+# ============================================================================
+# A channel reaches all recipients it can and calls report(user_id, status)
+# as each is handed over ("sent", "queued") or not ("skipped", "failed").
+
+async def email_channel(notification: StaffNotification, recipients: List[Dict[str, Any]], report: Report):
+    reachable = [r for r in recipients if r.get("email")]
+    if notification.email is None or not email_delivery_enabled() or not reachable:
+        for r in recipients:
+            report(r["id"], "skipped")
+        return
+    await enqueue_email({**notification.email, "to": [r["email"] for r in reachable]},
+                        category=notification.kind, dedupe_key=f"{notification.kind}:{notification.ref_id}",
+                        urgent=notification.urgent, split_recipients=True)
+    for r in recipients:
+        report(r["id"], "queued" if r.get("email") else "skipped")
+
+
+async def socket_channel(notification: StaffNotification, recipients: List[Dict[str, Any]], report: Report):
+    from webrtc_signaling import sio, user_to_socket
+
+    payload = {"id": notification.ref_id, "title": notification.title, "body": notification.body,
+               **notification.data}
+
+    async def emit(recipient):
+        sid = user_to_socket.get(recipient["id"])
+        if not sid:
+            report(recipient["id"], "skipped")
+            return
+        try:
+            await sio.emit(notification.kind, payload, to=sid)
+            report(recipient["id"], "sent")
+        except Exception as e:
+            report(recipient["id"], "failed", str(e))
+
+    await asyncio.gather(*(emit(r) for r in recipients))
+
+
+async def push_channel(notification: StaffNotification, recipients: List[Dict[str, Any]], report: Report):
+    # The tokens came with the recipients, so the batcher does not look them up again
+    reachable = [r for r in recipients if r.get("push_token")]
+    for r in recipients:
+        if not r.get("push_token"):
+            report(r["id"], "skipped")
+    message = {"sound": "default", "priority": "high", "title": notification.title,
+               "body": notification.body, "data": {"type": notification.kind, "id": notification.ref_id}}
+    results = await asyncio.gather(*(push_batcher.send(r["id"], message, token=r["push_token"]) for r in reachable))
+    for r, result in zip(reachable, results):
+        if result.ok:
+            report(r["id"], "sent")
+        else:
+            report(r["id"], "failed", result.error)
+
+
+DEFAULT_CHANNELS: Dict[str, Channel] = {"email": email_channel, "socket": socket_channel, "push": push_channel}
+
+
+# ============================================================================
+# FAN-OUT
+# ============================================================================
+
+_REACHED = ("sent", "queued")
+_LATENCY_SAMPLES = 1000
+
+_metrics = {"fanouts": 0, "recipients": 0, "timeouts": 0, "unreached": 0, "errors": 0}
+_latencies: Dict[str, deque] = {}
+
+
+def _get_db(db):
+    if db is None:
+        from services.database import get_database
+        db = get_database()
+    return db
+
+
+async def resolve_recipients(db, roles: Iterable[str]) -> List[Dict[str, Any]]:
+    """Staff with any of the roles, projected to what the channels need."""
+    users = await db.users.find({"role": {"$in": list(roles)}}, STAFF_PROJECTION).to_list(NOTIFY_MAX_RECIPIENTS)
+    # Older user documents have no "id"; they are reported under their _id
+    for user in users:
+        _id = user.pop("_id", None)
+        user["id"] = user.get("id") or str(_id)
+    return users
+
+
+def _summarise(results: Dict[str, Dict[str, Dict[str, Any]]]) -> Optional[float]:
+    """When the last recipient was first reached, or None if someone was not reached at all."""
+    firsts = []
+    for channels in results.values():
+        reached = [r["ms"] for r in channels.values() if r["status"] in _REACHED]
+        if not reached:
+            return None
+        firsts.append(min(reached))
+    return max(firsts, default=0.0)
+
+
+async def notify_staff(notification: StaffNotification, roles: Iterable[str], *, db=None,
+                       channels: Optional[Dict[str, Channel]] = None,
+                       deadline: float = NOTIFY_DEADLINE_SECONDS, started: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Notify all staff with the given roles on every channel, concurrently,
+    giving up on channels still running after `deadline` seconds. `started`
+    is the time.perf_counter() of the triggering event (default: now).
+    Returns the fan-out record.
+    """
+    started = time.perf_counter() if started is None else started
+    channels = channels or DEFAULT_CHANNELS
+    db = _get_db(db)
+    recipients = await resolve_recipients(db, roles)
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {r["id"]: {} for r in recipients}
+
+    def reporter(channel: str) -> Report:
+        def report(user_id: str, status: str, error: Optional[str] = None):
+            entry = {"status": status, "ms": round((time.perf_counter() - started) * 1000, 1)}
+            if error:
+                entry["error"] = error[:200]
+            results.setdefault(user_id, {})[channel] = entry
+            if status in _REACHED:
+                _latencies.setdefault(channel, deque(maxlen=_LATENCY_SAMPLES)).append(entry["ms"])
+        return report
+
+    tasks = {name: asyncio.ensure_future(channel(notification, recipients, reporter(name)))
+             for name, channel in channels.items()} if recipients else {}
+    remaining = max(0.0, deadline - (time.perf_counter() - started))
+    done, pending = await asyncio.wait(tasks.values(), timeout=remaining) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+
+    timed_out = []
+    for name, task in tasks.items():
+        if task in pending:
+            timed_out.append(name)
+            status, error = "timeout", None
+        elif task.exception() is not None:
+            _metrics["errors"] += 1
+            logger.error(f"[Notify] {notification.kind} {name} channel failed: {task.exception()}")
+            status, error = "failed", str(task.exception())
+        else:
+            continue
+        for user_id, by_channel in results.items():
+            if name not in by_channel:
+                by_channel[name] = {"status": status, "ms": round((time.perf_counter() - started) * 1000, 1),
+                                    **({"error": error[:200]} if error else {})}
+
+    all_notified_ms = _summarise(results)
+    unreached = [user_id for user_id, by_channel in results.items()
+                 if not any(r["status"] in _REACHED for r in by_channel.values())]
+    _metrics["fanouts"] += 1
+    _metrics["recipients"] += len(recipients)
+    _metrics["timeouts"] += len(timed_out)
+    _metrics["unreached"] += len(unreached)
+
+    now = datetime.utcnow()
+    record = {
+        "_id": uuid.uuid4().hex,
+        "kind": notification.kind,
+        "ref_id": notification.ref_id,
+        "created_at": now,
+        "expires_at": now + timedelta(days=NOTIFY_RECORD_RETENTION_DAYS),
+        "recipient_count": len(recipients),
+        "all_notified_ms": all_notified_ms,
+        "timed_out_channels": timed_out,
+        "unreached": unreached,
+        "recipients": [{"user_id": user_id, "channels": by_channel} for user_id, by_channel in results.items()],
+    }
+    if not recipients:
+        logger.error(f"[Notify] No staff found to notify about {notification.kind} {notification.ref_id}")
+    elif unreached:
+        logger.warning(f"[Notify] {notification.kind} {notification.ref_id}: "
+                       f"{len(unreached)}/{len(recipients)} staff not reached")
+    else:
+        logger.info(f"[Notify] {notification.kind} {notification.ref_id}: "
+                    f"{len(recipients)} staff reached in {all_notified_ms}ms")
+    try:
+        await db[FANOUT_COLLECTION].insert_one(record)
+    except Exception as e:
+        logger.error(f"[Notify] Could not store fan-out record: {e}")
+    return record
+
+
+_background: Set[asyncio.Task] = set()
+
+
+def notify_staff_in_background(notification: StaffNotification, roles: Iterable[str], **kwargs) -> asyncio.Task:
+    """Start notify_staff() without waiting for it (the task is kept until it finishes)."""
+    kwargs.setdefault("started", time.perf_counter())
+    task = asyncio.create_task(notify_staff(notification, roles, **kwargs))
+    _background.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        _metrics["errors"] += 1
+        logger.error(f"[Notify] Background fan-out failed: {task.exception()!r}")
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def get_notification_metrics() -> Dict[str, Any]:
+    latency = {}
+    for channel, samples in _latencies.items():
+        values = list(samples)
+        latency[channel] = {"count": len(values), "p50_ms": _percentile(values, 0.5),
+                            "p95_ms": _percentile(values, 0.95), "max_ms": max(values, default=None)}
+    return {**_metrics, "in_flight": len(_background), "latency": latency}
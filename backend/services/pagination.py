@@ -0,0 +1,287 @@
+"""
+Keyset pagination for staff-facing list endpoints.
+
+List endpoints used to return to_list(200..1000) of full documents, so
+payload size and decrypt cost grew with history (and some lists silently
+stopped at 1000). paginate() instead returns one page ordered by
+(sort field, id) and an opaque cursor for the next page:
+
+    page = await paginate(db.concerns, query, sort_field="created_at",
+                          limit=limit, cursor=cursor, fields=fields,
+                          allowed_fields=Concern.model_fields)
+    return page_response(request, [transform(d) for d in page.items], page)
+
+- cursor:  base64 of the last item's (sort value, id). The next page is
+           fetched with a range query on the same index, so page N costs
+           the same as page 1 (no skip()).
+- fields:  comma-separated projection ("id,status,created_at"), limited to
+           the endpoint's allowed_fields (normally its document model's
+           fields); without allowed_fields ?fields= is rejected. The sort
+           field and id are always included so the cursor can be built.
+- ETag:    a hash of the response body; a request whose If-None-Match
+           matches gets 304 with no body. Endpoints that decrypt or
+           transform the page derive it from the stored page instead
+           (page_etag), so a 304 is answered before that work:
+
+    etag = page_etag(page)
+    cached = not_modified(request, etag, page)
+    if cached:
+        return cached
+    notes = await decrypt_documents("notes", page.items, parse_fields(fields))
+    return page_response(request, notes, page, etag=etag)
+
+Response bodies keep their existing shape. The next cursor is sent in the
+X-Next-Cursor header (and a Link rel="next" header); endpoints that
+already return an object also include it as "next_cursor".
+
+Sort values may be stored with mixed BSON types (dates in newer documents,
+ISO strings in older ones). The range query follows MongoDB's cross-type
+sort order so no document is skipped or repeated at a type boundary.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId, json_util
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# MongoDB's sort order across the types used as sort keys here
+# (null and missing sort together, before everything else)
+_TYPE_ORDER = ["null", "number", "string", "objectId", "bool", "date"]
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$")
+_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+
+@dataclass
+class Page:
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    limit: int = DEFAULT_PAGE_SIZE
+
+
+# ============================================================================
+# CURSORS
+# ============================================================================
+
+def encode_cursor(sort_value: Any, item_id: Any) -> str:
+    data = json_util.dumps([sort_value, item_id], json_options=_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """(sort value, id) from a cursor; 400 if it was not produced by encode_cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode(), json_options=_JSON_OPTIONS)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(value, list) or len(value) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+
+def _bson_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    if isinstance(value, datetime):
+        return "date"
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _type_match(field_name: str, types: List[str]) -> List[Dict[str, Any]]:
+    clauses = []
+    if "null" in types:
+        clauses.append({field_name: None})  # null or missing
+    others = [t for t in types if t != "null"]
+    if others:
+        clauses.append({field_name: {"$type": others}})
+    return clauses
+
+
+def keyset_filter(sort_field: str, direction: int, sort_value: Any, item_id: Any,
+                  id_field: str = "id") -> Dict[str, Any]:
+    """Documents strictly after (sort_value, item_id) in (sort_field, id_field) order."""
+    op = "$lt" if direction < 0 else "$gt"
+    if sort_field == id_field:
+        return {id_field: {op: item_id}}
+
+    value_type = _bson_type(sort_value)
+    clauses = [{sort_field: sort_value, id_field: {op: item_id}}]
+    if value_type != "null":
+        clauses.append({sort_field: {op: sort_value}})
+
+    # Values of other types that sort after this one in the requested order
+    position = _TYPE_ORDER.index(value_type)
+    later_types = _TYPE_ORDER[:position] if direction < 0 else _TYPE_ORDER[position + 1:]
+    clauses.extend(_type_match(sort_field, later_types))
+    return {"$or": clauses}
+
+
+# ============================================================================
+# PROJECTIONS
+# ============================================================================
+
+def parse_fields(fields: Optional[str], allowed: Optional[Iterable[str]] = None) -> Optional[List[str]]:
+    """Field names from a "a,b,c" query parameter (None means all fields)."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    allowed = set(allowed) if allowed is not None else None
+    for name in names:
+        if not _FIELD_NAME.match(name) or (allowed is not None and name.split(".")[0] not in allowed):
+            raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+    return names or None
+
+
+def build_projection(fields: Optional[List[str]], sort_field: str, id_field: str = "id",
+                     exclude: Iterable[str] = ()) -> Optional[Dict[str, int]]:
+    if fields is None:
+        projection = {name: 0 for name in exclude}
+        if id_field != "_id":
+            projection["_id"] = 0
+        return projection or None
+
+    projection = {name: 1 for name in fields if name not in exclude}
+    projection[sort_field] = 1
+    projection[id_field] = 1
+    if id_field != "_id" and "_id" not in fields:
+        projection["_id"] = 0
+    return projection
+
+
+# ============================================================================
+# QUERY
+# ============================================================================
+
+def clamp_limit(limit: Optional[int], default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    if not limit or limit < 1:
+        return default
+    return min(limit, maximum)
+
+
+async def paginate(collection, query: Dict[str, Any], *, sort_field: str, direction: int = -1,
+                   limit: Optional[int] = None, cursor: Optional[str] = None,
+                   fields: Optional[str] = None, id_field: str = "id",
+                   allowed_fields: Optional[Iterable[str]] = None,
+                   exclude_fields: Iterable[str] = (),
+                   default_limit: int = DEFAULT_PAGE_SIZE,
+                   max_limit: int = MAX_PAGE_SIZE) -> Page:
+    """
+    One page of `query` ordered by (sort_field, id_field) in `direction`.
+    `fields` may only name allowed_fields (none without it), and
+    exclude_fields are never returned, even if asked for in `fields`.
+    """
+    if fields and allowed_fields is None:
+        raise HTTPException(status_code=400, detail="Field selection is not supported for this list")
+    limit = clamp_limit(limit, default_limit, max_limit)
+    if cursor:
+        sort_value, item_id = decode_cursor(cursor)
+        after = keyset_filter(sort_field, direction, sort_value, item_id, id_field)
+        query = {"$and": [query, after]} if query else after
+
+    projection = build_projection(parse_fields(fields, allowed_fields), sort_field, id_field, exclude_fields)
+    sort = [(sort_field, direction)] if sort_field == id_field else [(sort_field, direction), (id_field, direction)]
+
+    # One extra document tells us whether there is a next page
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(_get_path(last, sort_field), last.get(id_field))
+    return Page(items=docs, next_cursor=next_cursor, limit=limit)
+
+
+def _get_path(document: Dict[str, Any], path: str) -> Any:
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+# ============================================================================
+# RESPONSES
+# ============================================================================
+
+def compute_etag(content: Any) -> str:
+    body = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return f'W/"{hashlib.sha256(body.encode()).hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _next_link(request: Request, next_cursor: str) -> str:
+    return f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+
+
+def page_etag(page: Page, *extra: Any) -> str:
+    """
+    ETag of a page as stored (before decryption or any transform). `extra`
+    covers whatever else goes into the body, e.g. aggregate figures.
+    """
+    return compute_etag([page.items, page.next_cursor, *extra])
+
+
+def _page_headers(request: Request, etag: str, page: Optional[Page]) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if page is not None and page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+        headers["Link"] = _next_link(request, page.next_cursor)
+    return headers
+
+
+def not_modified(request: Request, etag: str, page: Optional[Page] = None) -> Optional[Response]:
+    """304 response if the client already has `etag`, else None."""
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=_page_headers(request, etag, page))
+    return None
+
+
+def page_response(request: Request, body: Any, page: Optional[Page] = None,
+                  status_code: int = 200, etag: Optional[str] = None) -> Response:
+    """
+    JSON response for a page with ETag and next-page headers, or 304 when
+    the client already has this exact body. Without `etag` it is computed
+    from the body.
+    """
+    content = jsonable_encoder(body, custom_encoder={ObjectId: str})
+    etag = etag or compute_etag(content)
+    cached = not_modified(request, etag, page)
+    if cached:
+        return cached
+    return JSONResponse(content=content, status_code=status_code, headers=_page_headers(request, etag, page))
@@ -0,0 +1,224 @@
+"""
+Password hashing off the event loop.
+
+A bcrypt hash or check costs on the order of 100ms of CPU. Run inline in an
+async handler that blocks every other request, socket and chat message for
+as long, so a burst of logins stalls the whole server. All hashing goes
+through here instead:
+
+- bcrypt runs on a small dedicated thread pool (PASSWORD_HASH_WORKERS);
+  bcrypt releases the GIL, so the event loop keeps running meanwhile
+- at most PASSWORD_HASH_MAX_PENDING jobs may be queued or running; beyond
+  that callers get a 503 with Retry-After instead of an ever-growing queue
+- queue wait and hash time are measured (get_password_hash_metrics(),
+  shown in /api/admin/system-stats)
+- verify_and_rehash() reports when a stored hash was made with a different
+  cost than BCRYPT_ROUNDS, so login can upgrade it transparently
+
+Simulate a login burst and watch event-loop lag:
+    python -m services.passwords --logins 50
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import bcrypt
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_pending = 0
+
+_metrics = {
+    "hashed": 0,
+    "verified": 0,
+    "rehashed": 0,
+    "rejected": 0,
+    "peak_pending": 0,
+    "queue_wait_seconds": 0.0,
+    "max_queue_wait_ms": 0.0,
+    "hash_seconds": 0.0,
+}
+
+
+# ============================================================================
+# EXECUTOR
+# ============================================================================
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def shutdown_password_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+async def _run(kind: str, fn: Callable[..., Any], *args) -> Any:
+    """Run one bcrypt call on the pool, refusing work once the queue is full."""
+    global _pending
+    with _lock:
+        if _pending >= PASSWORD_HASH_MAX_PENDING:
+            _metrics["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Too many sign-ins in progress, please try again",
+                                headers={"Retry-After": "1"})
+        _pending += 1
+        _metrics["peak_pending"] = max(_metrics["peak_pending"], _pending)
+    queued_at = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            wait = started - queued_at
+            with _lock:
+                _metrics[kind] += 1
+                _metrics["queue_wait_seconds"] += wait
+                _metrics["max_queue_wait_ms"] = max(_metrics["max_queue_wait_ms"], wait * 1000)
+                _metrics["hash_seconds"] += time.perf_counter() - started
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), job)
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+def get_password_hash_metrics() -> Dict[str, Any]:
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["pending"] = _pending
+    jobs = metrics["hashed"] + metrics["verified"]
+    metrics["avg_queue_wait_ms"] = round(metrics.pop("queue_wait_seconds") / jobs * 1000, 1) if jobs else 0.0
+    metrics["avg_hash_ms"] = round(metrics.pop("hash_seconds") / jobs * 1000, 1) if jobs else 0.0
+    metrics["max_queue_wait_ms"] = round(metrics["max_queue_wait_ms"], 1)
+    metrics.update({"workers": PASSWORD_HASH_WORKERS, "max_pending": PASSWORD_HASH_MAX_PENDING,
+                    "rounds": BCRYPT_ROUNDS})
+    return metrics
+
+
+# ============================================================================
+# HASHING
+# ============================================================================
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _check(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """Cost factor of a bcrypt hash ("$2b$12$..." -> 12), None if not bcrypt."""
+    parts = hashed.split("$") if isinstance(hashed, str) else []
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed: str) -> bool:
+    return hash_rounds(hashed) not in (None, BCRYPT_ROUNDS)
+
+
+async def hash_password(password: str) -> str:
+    """bcrypt hash of a password at BCRYPT_ROUNDS."""
+    return await _run("hashed", _hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Check a password against a stored hash (False for anything that is not bcrypt)."""
+    if not password or not hashed:
+        return False
+    return await _run("verified", _check, password, hashed)
+
+
+async def verify_and_rehash(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    verify_password() for logins: (ok, new hash). The new hash is set when
+    the password is correct but the stored hash has a different cost, and
+    the caller should store it in place of the old one.
+    """
+    if not await verify_password(password, hashed):
+        return False, None
+    if not needs_rehash(hashed):
+        return True, None
+    new_hash = await hash_password(password)
+    with _lock:
+        _metrics["rehashed"] += 1
+    return True, new_hash
+
+
+# ============================================================================
+# LOAD TEST
+# ============================================================================
+
+async def measure_login_burst(logins: int, rounds: int = BCRYPT_ROUNDS,
+                              tick_ms: float = 5.0) -> Dict[str, Any]:
+    """
+    Run `logins` concurrent password checks while a ticker measures how late
+    the event loop wakes it up. Returns the worst and p99 lag and the wall time.
+    """
+    hashed = await asyncio.to_thread(_hash, "correct horse battery staple", rounds)
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(tick_ms / 1000)
+            lags.append((time.perf_counter() - start) * 1000 - tick_ms)
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(verify_password("correct horse battery staple", hashed)
+                                     for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticking
+
+    lags.sort()
+    return {
+        "logins": logins,
+        "all_verified": all(results),
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "max_loop_lag_ms": round(lags[-1], 1) if lags else 0.0,
+        "p99_loop_lag_ms": round(lags[int(len(lags) * 0.99)], 1) if lags else 0.0,
+        "ticks": len(lags),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrent login load test for the password hasher")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS)
+    args = parser.parse_args()
+
+    PASSWORD_HASH_MAX_PENDING = max(PASSWORD_HASH_MAX_PENDING, args.logins)
+    print(asyncio.run(measure_login_burst(args.logins, args.rounds)))
+    print(get_password_hash_metrics())
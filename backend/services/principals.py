@@ -0,0 +1,194 @@
+"""
+Authenticated principal resolution with a short-TTL cache.
+
+Every authenticated request used to decode its JWT and then read the user
+from db.users. Staff portals poll several endpoints every few seconds, so
+the same user was read many times a second. All auth dependencies
+(server.get_current_user, routers/auth.get_current_user, case management
+and compliance) now resolve tokens here:
+
+- the JWT signature and expiry are still checked on every request
+- the user (id, email, role, name) is cached per token id (the "jti"
+  claim; a hash of the token for tokens issued before jti was added) for
+  PRINCIPAL_CACHE_TTL_SECONDS, never past the token's own expiry
+- invalidate_user() drops a user's cached principals (role or status
+  change, deletion, password change); revoke_token() logs a token out, in
+  this process at once and, through revoked_tokens, in every process on its
+  next cache miss
+
+Other processes keep a cached principal for at most the TTL.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+import jwt
+from fastapi import HTTPException
+
+from services.database import get_database
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+REVOKED_TOKENS_COLLECTION = "revoked_tokens"
+
+# Only what the auth dependencies hand to endpoints; never password hashes
+PRINCIPAL_PROJECTION = {"_id": 0, "id": 1, "email": 1, "role": 1, "name": 1, "created_at": 1}
+
+
+def get_jwt_secret() -> str:
+    """JWT secret - read at runtime to ensure env vars are loaded"""
+    return os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+
+
+def new_token_id() -> str:
+    """Value for the "jti" claim of a new access token."""
+    return uuid.uuid4().hex
+
+
+def token_id(payload: Dict[str, Any], token: str) -> str:
+    return payload.get("jti") or "sha256:" + hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class PrincipalCache:
+    """LRU of token id -> (expires at, principal), with a per-user index for invalidation."""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return dict(entry[1])
+
+    def put(self, key: str, principal: Dict[str, Any], token_expires_in: Optional[float] = None):
+        ttl = self.ttl if token_expires_in is None else min(self.ttl, token_expires_in)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, dict(principal))
+            self._by_user.setdefault(principal.get("id"), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[1].get("id"))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[1].get("id")]
+
+    def invalidate_token(self, key: str):
+        with self._lock:
+            self._drop(key)
+            self.stats["invalidations"] += 1
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "ttl_seconds": self.ttl}
+
+
+principal_cache = PrincipalCache()
+
+
+# ============================================================================
+# RESOLUTION
+# ============================================================================
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verified JWT payload; 401 if expired or invalid."""
+    try:
+        payload = jwt.decode(token, get_jwt_secret(), algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return payload
+
+
+async def resolve_principal(token: str, db=None) -> Dict[str, Any]:
+    """
+    The user a bearer token belongs to, as a dict with id, email, role and
+    name. Raises 401 for invalid, expired, revoked or orphaned tokens.
+    """
+    payload = decode_token(token)
+    key = token_id(payload, token)
+    principal = principal_cache.get(key)
+    if principal is not None:
+        return principal
+
+    db = db if db is not None else get_database()
+    if await db[REVOKED_TOKENS_COLLECTION].find_one({"_id": key}, {"_id": 1}):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    user = await db.users.find_one({"id": payload["sub"]}, PRINCIPAL_PROJECTION)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    expires_in = payload["exp"] - time.time() if payload.get("exp") else None
+    principal_cache.put(key, user, expires_in)
+    return user
+
+
+def invalidate_user(user_id: str):
+    """Forget cached principals for a user after their role, status or credentials change."""
+    principal_cache.invalidate_user(user_id)
+
+
+async def revoke_token(token: str, db=None):
+    """Log a token out: it stops working here now and in other processes on their next cache miss."""
+    payload = decode_token(token)
+    key = token_id(payload, token)
+    principal_cache.invalidate_token(key)
+    db = db if db is not None else get_database()
+    expires_at = datetime.utcfromtimestamp(payload["exp"]) if payload.get("exp") else None
+    await db[REVOKED_TOKENS_COLLECTION].update_one(
+        {"_id": key},
+        {"$set": {"user_id": payload["sub"], "expires_at": expires_at, "revoked_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def get_principal_cache_metrics() -> Dict[str, Any]:
+    return principal_cache.metrics()
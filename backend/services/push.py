@@ -0,0 +1,442 @@
+"""
+Expo push delivery.
+
+Push senders (the message queue, shift notifications, staff alerts) used
+to open a new HTTP client per notification, read the recipient's push
+token with its own users query and post one notification per request.
+They now share this service:
+
+- one keep-alive httpx client for every Expo request
+- PushBatcher collects the notifications sent within PUSH_BATCH_WINDOW_MS
+  (or until EXPO_BATCH_SIZE are waiting), reads all their tokens with one
+  projected users query and posts them to Expo in batches of up to 100,
+  so a burst of alerts is a handful of requests
+- every accepted ticket is stored in push_tickets; the scheduler fetches
+  the receipts (up to 1000 per request) after PUSH_RECEIPT_DELAY_SECONDS.
+  DeviceNotRegistered removes the stale token; rate-limited deliveries of
+  queued messages go back for a retry, which counts towards max_retries
+- message_queue messages in status "retry" are resent by the scheduler
+  with exponential backoff (PUSH_RETRY_BASE_SECONDS doubling, capped at
+  PUSH_RETRY_MAX_SECONDS) until their max_retries; after that they stay
+  queued for the app to fetch when it next comes online
+
+    python -m services.push --receipts    # check due receipts now
+"""
+
+import asyncio
+import logging
+import os
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+EXPO_PUSH_URL = os.getenv("EXPO_PUSH_URL", "https://exp.host/--/api/v2/push/send")
+EXPO_RECEIPTS_URL = os.getenv("EXPO_RECEIPTS_URL", "https://exp.host/--/api/v2/push/getReceipts")
+EXPO_ACCESS_TOKEN = os.getenv("EXPO_ACCESS_TOKEN", "")
+# Expo limits: 100 notifications per send request, 1000 ids per receipts request
+EXPO_BATCH_SIZE = 100
+EXPO_RECEIPT_BATCH_SIZE = 1000
+
+PUSH_BATCH_WINDOW_MS = float(os.getenv("PUSH_BATCH_WINDOW_MS", "20"))
+PUSH_HTTP_TIMEOUT_SECONDS = float(os.getenv("PUSH_HTTP_TIMEOUT_SECONDS", "10"))
+PUSH_RECEIPT_DELAY_SECONDS = float(os.getenv("PUSH_RECEIPT_DELAY_SECONDS", "900"))
+PUSH_RETRY_BASE_SECONDS = float(os.getenv("PUSH_RETRY_BASE_SECONDS", "30"))
+PUSH_RETRY_MAX_SECONDS = float(os.getenv("PUSH_RETRY_MAX_SECONDS", "1800"))
+PUSH_SCHEDULER_INTERVAL_SECONDS = float(os.getenv("PUSH_SCHEDULER_INTERVAL_SECONDS", "15"))
+# A retry claimed by a scheduler that died is picked up again after this long
+PUSH_RETRY_LEASE_SECONDS = float(os.getenv("PUSH_RETRY_LEASE_SECONDS", "120"))
+
+PUSH_TICKETS_COLLECTION = "push_tickets"
+
+# Ticket / receipt errors that will not go away by sending again
+_PERMANENT_ERRORS = {"DeviceNotRegistered", "MessageTooBig", "InvalidCredentials", "InvalidProviderToken"}
+
+_metrics = {
+    "requests": 0, "messages": 0, "accepted": 0, "errors": 0, "token_lookups": 0, "no_token": 0,
+    "retries_scheduled": 0, "retries_sent": 0, "retries_exhausted": 0,
+    "receipts_checked": 0, "receipt_errors": 0, "tokens_removed": 0,
+}
+
+
+@dataclass
+class PushResult:
+    ok: bool
+    ticket_id: Optional[str] = None
+    error: Optional[str] = None
+    retryable: bool = False
+
+
+# ============================================================================
+# EXPO CLIENT
+# ============================================================================
+
+class PushService:
+    """Posts notifications to Expo over one shared keep-alive connection pool."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            headers = {"Accept-Encoding": "gzip, deflate"}
+            if EXPO_ACCESS_TOKEN:
+                headers["Authorization"] = f"Bearer {EXPO_ACCESS_TOKEN}"
+            self._client = httpx.AsyncClient(
+                timeout=PUSH_HTTP_TIMEOUT_SECONDS, headers=headers,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None and hasattr(self._client, "aclose"):
+            await self._client.aclose()
+        self._client = None
+
+    async def _send_chunk(self, messages: List[Dict[str, Any]]) -> List[PushResult]:
+        _metrics["requests"] += 1
+        _metrics["messages"] += len(messages)
+        try:
+            response = await self.client.post(EXPO_PUSH_URL, json=messages)
+        except Exception as e:
+            _metrics["errors"] += len(messages)
+            return [PushResult(False, error=str(e), retryable=True) for _ in messages]
+
+        tickets = (response.json().get("data") or []) if response.status_code == 200 else []
+        if len(tickets) != len(messages):
+            # Rate limited or unavailable is worth another go; a rejected request is not
+            retryable = response.status_code == 429 or response.status_code >= 500
+            _metrics["errors"] += len(messages)
+            return [PushResult(False, error=f"HTTP {response.status_code}", retryable=retryable) for _ in messages]
+
+        results = []
+        for ticket in tickets:
+            if ticket.get("status") == "ok":
+                _metrics["accepted"] += 1
+                results.append(PushResult(True, ticket_id=ticket.get("id")))
+            else:
+                _metrics["errors"] += 1
+                error = (ticket.get("details") or {}).get("error") or ticket.get("message") or "error"
+                results.append(PushResult(False, error=error, retryable=error not in _PERMANENT_ERRORS))
+        return results
+
+    async def send(self, messages: List[Dict[str, Any]]) -> List[PushResult]:
+        """One result per message, in order; batches of EXPO_BATCH_SIZE are posted concurrently."""
+        chunks = [messages[i:i + EXPO_BATCH_SIZE] for i in range(0, len(messages), EXPO_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._send_chunk(chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+    async def get_receipts(self, ticket_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Receipts by ticket id; tickets Expo has no receipt for yet are absent."""
+        receipts: Dict[str, Dict[str, Any]] = {}
+        for i in range(0, len(ticket_ids), EXPO_RECEIPT_BATCH_SIZE):
+            _metrics["requests"] += 1
+            response = await self.client.post(EXPO_RECEIPTS_URL, json={"ids": ticket_ids[i:i + EXPO_RECEIPT_BATCH_SIZE]})
+            response.raise_for_status()
+            receipts.update(response.json().get("data") or {})
+        return receipts
+
+
+push_service = PushService()
+
+
+async def close_push_client():
+    await push_batcher.drain()
+    await push_service.close()
+
+
+def _get_db(db):
+    if db is None:
+        from services.database import get_database
+        db = get_database()
+    return db
+
+
+async def get_push_tokens(db, user_ids: Iterable[str]) -> Dict[str, str]:
+    """Push tokens for many users with one projected query."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    _metrics["token_lookups"] += 1
+    users = await db.users.find(
+        {"id": {"$in": user_ids}, "push_token": {"$exists": True}}, {"_id": 0, "id": 1, "push_token": 1},
+    ).to_list(len(user_ids))
+    return {u["id"]: u["push_token"] for u in users if u.get("push_token")}
+
+
+async def record_tickets(db, sent: List[Tuple[Dict[str, Any], PushResult]], message_ids: List[Optional[str]]):
+    """Remember accepted tickets so the scheduler can check their receipts."""
+    now = datetime.utcnow()
+    check_after = now + timedelta(seconds=PUSH_RECEIPT_DELAY_SECONDS)
+    tickets = [{
+        "_id": result.ticket_id, "token": message["to"], "message_id": message_id,
+        "created_at": now, "check_after": check_after, "expires_at": now + timedelta(days=1),
+    } for (message, result), message_id in zip(sent, message_ids) if result.ok and result.ticket_id]
+    if tickets:
+        try:
+            await db[PUSH_TICKETS_COLLECTION].insert_many(tickets, ordered=False)
+        except Exception as e:
+            logger.warning(f"[Push] Could not store {len(tickets)} ticket(s): {e}")
+
+
+# ============================================================================
+# BATCHING
+# ============================================================================
+
+class PushBatcher:
+    """
+    Coalesces push notifications to users: send() waits at most
+    PUSH_BATCH_WINDOW_MS for others to join, then the whole batch shares one
+    token lookup and as few Expo requests as possible. Callers that already
+    have the token pass it and skip the lookup.
+    """
+
+    def __init__(self, db=None, service: Optional[PushService] = None, window_ms: float = PUSH_BATCH_WINDOW_MS):
+        self._db = db
+        self._service = service
+        self.window = window_ms / 1000
+        self._pending: List[Tuple[str, Dict[str, Any], Optional[str], Optional[str], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    @property
+    def service(self) -> PushService:
+        return self._service or push_service
+
+    async def send(self, user_id: str, message: Dict[str, Any], message_id: Optional[str] = None,
+                   token: Optional[str] = None) -> PushResult:
+        """Push `message` (Expo fields except "to") to a user's device."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_id, message, message_id, token, future))
+        if len(self._pending) >= EXPO_BATCH_SIZE:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task):
+        self._flushing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"[Push] Flush failed: {task.exception()!r}")
+
+    async def drain(self):
+        """Send what is waiting and wait for the flushes in flight (on shutdown)."""
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    async def _flush(self, batch):
+        try:
+            db = _get_db(self._db)
+            tokens = await get_push_tokens(db, (user_id for user_id, _, _, token, _ in batch if token is None))
+            sendable = [(entry, {**entry[1], "to": entry[3] or tokens[entry[0]]})
+                        for entry in batch if entry[3] or entry[0] in tokens]
+            results = await self.service.send([message for _, message in sendable]) if sendable else []
+            await record_tickets(db, [(message, result) for (_, message), result in zip(sendable, results)],
+                                 [entry[2] for entry, _ in sendable])
+            by_future = {id(entry[4]): result for (entry, _), result in zip(sendable, results)}
+            for *_, future in batch:
+                if future.done():
+                    continue
+                result = by_future.get(id(future))
+                if result is None:
+                    _metrics["no_token"] += 1
+                    result = PushResult(False, error="no_push_token")
+                future.set_result(result)
+        except Exception as e:
+            logger.error(f"[Push] Batch of {len(batch)} failed: {e}")
+            for *_, future in batch:
+                if not future.done():
+                    future.set_result(PushResult(False, error=str(e), retryable=True))
+
+
+push_batcher = PushBatcher()
+
+
+async def send_push(user_id: str, title: str, body: str, data: Optional[Dict[str, Any]] = None,
+                    message_id: Optional[str] = None, **fields) -> PushResult:
+    """Push a notification to one user, batched with any others sent at the same moment."""
+    message = {"sound": "default", "title": title, "body": body, "data": data or {}, **fields}
+    return await push_batcher.send(user_id, message, message_id)
+
+
+# ============================================================================
+# RETRIES AND RECEIPTS
+# ============================================================================
+
+def retry_delay(retry_count: int) -> float:
+    """Seconds before retry number retry_count + 1: exponential, capped, with jitter."""
+    delay = min(PUSH_RETRY_MAX_SECONDS, PUSH_RETRY_BASE_SECONDS * 2 ** retry_count)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def queue_message_push(message_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The Expo notification for a message_queue message."""
+    return {
+        "sound": "default",
+        "title": "New Message",
+        "body": message_data["message"][:100],  # Truncate for notification
+        "priority": "high" if message_data.get("priority", 0) >= 2 else "default",
+        "data": {
+            "type": message_data["message_type"],
+            "message_id": message_data["id"],
+            "sender_id": message_data["sender_id"],
+        },
+    }
+
+
+def queue_outcome(message_data: Dict[str, Any], result: PushResult, now: datetime) -> Optional[Dict[str, Any]]:
+    """The message_queue update after a push attempt (None: leave it queued as it is)."""
+    if result.ok:
+        return {"$set": {"status": "push_sent", "push_sent_at": now, "push_ticket_id": result.ticket_id},
+                "$unset": {"next_retry_at": "", "push_error": ""}}
+    if not result.retryable:
+        # No device to push to: the app fetches it from /pending when it next opens
+        return {"$set": {"status": "queued", "push_error": result.error}, "$unset": {"next_retry_at": ""}}
+    retry_count = message_data.get("retry_count", 0) + (1 if message_data.get("status") == "retry" else 0)
+    if retry_count >= message_data.get("max_retries", 3):
+        _metrics["retries_exhausted"] += 1
+        return {"$set": {"status": "queued", "retry_count": retry_count, "push_error": result.error},
+                "$unset": {"next_retry_at": ""}}
+    _metrics["retries_scheduled"] += 1
+    return {"$set": {"status": "retry", "retry_count": retry_count, "push_error": result.error,
+                     "next_retry_at": now + timedelta(seconds=retry_delay(retry_count))}}
+
+
+async def deliver_queue_message(db, message_data: Dict[str, Any], batcher: Optional[PushBatcher] = None) -> PushResult:
+    """Push a message_queue message and record the outcome on it."""
+    batcher = batcher or push_batcher
+    result = await batcher.send(message_data["recipient_id"], queue_message_push(message_data), message_data["id"])
+    if result.error == "no_push_token":
+        return result
+    update = queue_outcome(message_data, result, datetime.utcnow())
+    # Only while still undelivered: the app may have fetched it meanwhile
+    await db.message_queue.update_one(
+        {"id": message_data["id"], "status": {"$in": ["queued", "retry"]}}, update,
+    )
+    return result
+
+
+async def retry_due_messages(db=None, batcher: Optional[PushBatcher] = None, limit: int = 500) -> int:
+    """Resend message_queue messages whose retry is due. Returns how many were sent again."""
+    db = _get_db(db)
+    now = datetime.utcnow()
+    due = {"status": "retry", "next_retry_at": {"$lte": now}}
+    candidates = await db.message_queue.find(due, {"_id": 0, "id": 1}).limit(limit).to_list(limit)
+    if not candidates:
+        return 0
+    # Claimed by pushing next_retry_at out, so other workers skip them while they are in flight
+    claim = uuid.uuid4().hex
+    await db.message_queue.update_many(
+        {"id": {"$in": [c["id"] for c in candidates]}, **due},
+        {"$set": {"next_retry_at": now + timedelta(seconds=PUSH_RETRY_LEASE_SECONDS), "retry_claim": claim}},
+    )
+    messages = await db.message_queue.find({"retry_claim": claim, "status": "retry"}).to_list(limit)
+    await asyncio.gather(*(deliver_queue_message(db, m, batcher) for m in messages))
+    _metrics["retries_sent"] += len(messages)
+    return len(messages)
+
+
+async def poll_receipts(db=None, service: Optional[PushService] = None, limit: int = EXPO_RECEIPT_BATCH_SIZE) -> int:
+    """Check receipts of tickets that are due. Returns how many receipts were processed."""
+    db = _get_db(db)
+    service = service or push_service
+    tickets = await db[PUSH_TICKETS_COLLECTION].find(
+        {"check_after": {"$lte": datetime.utcnow()}}).limit(limit).to_list(limit)
+    if not tickets:
+        return 0
+    receipts = await service.get_receipts([t["_id"] for t in tickets])
+
+    done, stale_tokens, retry_errors = [], set(), {}
+    for ticket in tickets:
+        receipt = receipts.get(ticket["_id"])
+        if receipt is None:
+            continue  # not ready yet; the ticket expires after a day
+        done.append(ticket["_id"])
+        if receipt.get("status") == "ok":
+            continue
+        _metrics["receipt_errors"] += 1
+        error = (receipt.get("details") or {}).get("error") or receipt.get("message")
+        logger.warning(f"[Push] Receipt error for ticket {ticket['_id']}: {error}")
+        if error == "DeviceNotRegistered":
+            stale_tokens.add(ticket["token"])
+        elif error not in _PERMANENT_ERRORS and ticket.get("message_id"):
+            retry_errors[ticket["message_id"]] = error
+
+    if stale_tokens:
+        result = await db.users.update_many({"push_token": {"$in": list(stale_tokens)}},
+                                            {"$unset": {"push_token": "", "device_type": ""}})
+        _metrics["tokens_removed"] += getattr(result, "modified_count", 0) or 0
+    if retry_errors:
+        # A delivery that failed at the receipt is a spent retry, so a device that
+        # keeps failing ends up queued like any other message out of retries
+        now = datetime.utcnow()
+        messages = await db.message_queue.find(
+            {"id": {"$in": list(retry_errors)}, "status": "push_sent"},
+            {"_id": 0, "id": 1, "retry_count": 1, "max_retries": 1},
+        ).to_list(len(retry_errors))
+        updates = [UpdateOne({"id": m["id"], "status": "push_sent"},
+                             queue_outcome({**m, "status": "retry"},
+                                           PushResult(False, error=retry_errors[m["id"]], retryable=True), now))
+                   for m in messages]
+        if updates:
+            await db.message_queue.bulk_write(updates, ordered=False)
+    if done:
+        await db[PUSH_TICKETS_COLLECTION].delete_many({"_id": {"$in": done}})
+    _metrics["receipts_checked"] += len(done)
+    return len(done)
+
+
+async def run_push_scheduler(db=None, interval_seconds: float = PUSH_SCHEDULER_INTERVAL_SECONDS):
+    """Background task: resend due retries and check receipts. Cancel to stop."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        for step in (retry_due_messages, poll_receipts):
+            try:
+                await step(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Push] {step.__name__} failed: {e}")
+
+
+def get_push_metrics() -> Dict[str, Any]:
+    return dict(_metrics)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Expo push receipts and retries")
+    parser.add_argument("--receipts", action="store_true", help="check due receipts")
+    parser.add_argument("--retries", action="store_true", help="resend due retries")
+    args = parser.parse_args()
+
+    async def main():
+        if args.retries:
+            print(f"Resent {await retry_due_messages()} message(s)")
+        if args.receipts:
+            print(f"Processed {await poll_receipts()} receipt(s)")
+        await close_push_client()
+        print(json.dumps(get_push_metrics(), indent=2))
+
+    asyncio.run(main())
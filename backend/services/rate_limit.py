@@ -0,0 +1,280 @@
+"""
+Rate limiting with fixed-memory sliding-window counters.
+
+Each limited key (an IP, a chat session) has one small record per limiter:
+for every rule, the request count in the current fixed window and in the
+previous one. The sliding-window estimate
+
+    current + previous * (1 - elapsed fraction of the current window)
+
+is checked in O(1) time and memory per request, however many requests a
+key sends. A rule can also block the key for a while once it trips.
+
+Counters live in a pluggable backend:
+- MongoBackend (default): one document per key in rate_limits, advanced
+  with a single find_one_and_update, so limits hold across workers
+- LocalBackend: an in-process LRU, for tests, development, and as the
+  fallback for RATE_LIMIT_BACKEND_RETRY_SECONDS after a MongoDB error
+  (or the only backend with RATE_LIMIT_BACKEND=local)
+
+Blocked keys are also remembered in-process, so a client that keeps going
+after being blocked is turned away without touching the backend at all.
+
+Use a limiter directly (await limiter.check(key)), as a FastAPI dependency
+(rate_limit_dependency) or as HTTP middleware for given paths
+(rate_limit_middleware), which rejects before the request body is read.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "mongo").lower()
+RATE_LIMIT_COLLECTION = "rate_limits"
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", "100000"))
+# After a backend error, count locally for this long before trying it again
+RATE_LIMIT_BACKEND_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_BACKEND_RETRY_SECONDS", "30"))
+
+
+@dataclass
+class RateLimitRule:
+    """At most `limit` requests per `window` seconds; optionally block for block_seconds once exceeded."""
+    name: str
+    limit: int
+    window: float
+    block_seconds: float = 0
+    message: str = "Rate limit exceeded. Please try again later."
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    message: str = "OK"
+    rule: Optional[str] = None
+    retry_after: float = 0.0
+
+
+def client_ip(request: Request) -> str:
+    """Extract client IP from request, handling proxies"""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+# hit() advances every rule's window for one key and returns the record:
+#   {"blocked_until": float or None, "<rule>": {"i": window index, "c": count, "p": previous count}}
+
+def advance_window(state: Optional[Dict[str, int]], index: int) -> Dict[str, int]:
+    """A rule's counters after one more request in window `index`."""
+    if state and state.get("i") == index:
+        return {"i": index, "c": state["c"] + 1, "p": state.get("p", 0)}
+    previous = state["c"] if state and state.get("i") == index - 1 else 0
+    return {"i": index, "c": 1, "p": previous}
+
+
+class LocalBackend:
+    """Per-process counters in a bounded LRU."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    async def hit(self, key: str, indexes: Dict[str, int], ttl: float) -> Dict[str, Any]:
+        record = self._records.pop(key, None) or {"blocked_until": None}
+        for rule, index in indexes.items():
+            record[rule] = advance_window(record.get(rule), index)
+        self._records[key] = record
+        while len(self._records) > self.max_keys:
+            self._records.popitem(last=False)
+        return dict(record)
+
+    async def block(self, key: str, until: float, ttl: float):
+        record = self._records.setdefault(key, {"blocked_until": None})
+        record["blocked_until"] = max(record.get("blocked_until") or 0, until)
+
+
+class MongoBackend:
+    """Counters shared by all workers: one rate_limits document per key, expired by a TTL index."""
+
+    def __init__(self, db=None, collection: str = RATE_LIMIT_COLLECTION):
+        self._db = db
+        self.collection_name = collection
+
+    @property
+    def collection(self):
+        if self._db is None:
+            from services.database import get_database
+            self._db = get_database()
+        return self._db[self.collection_name]
+
+    @staticmethod
+    def update_pipeline(indexes: Dict[str, int], expires_at: datetime) -> List[Dict[str, Any]]:
+        """advance_window() for every rule as one server-side update."""
+        stage = {"expires_at": {"$max": [{"$ifNull": ["$expires_at", expires_at]}, expires_at]}}
+        for rule, index in indexes.items():
+            field = f"${rule}"
+            stage[rule] = {"$cond": [
+                {"$eq": [f"{field}.i", index]},
+                {"i": index, "c": {"$add": [f"{field}.c", 1]}, "p": {"$ifNull": [f"{field}.p", 0]}},
+                {"i": index, "c": 1, "p": {"$cond": [{"$eq": [f"{field}.i", index - 1]}, f"{field}.c", 0]}},
+            ]}
+        return [{"$set": stage}]
+
+    async def hit(self, key: str, indexes: Dict[str, int], ttl: float) -> Dict[str, Any]:
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        record = await self.collection.find_one_and_update(
+            {"_id": key}, self.update_pipeline(indexes, expires_at),
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        return record or {}
+
+    async def block(self, key: str, until: float, ttl: float):
+        await self.collection.update_one({"_id": key}, {
+            "$max": {"blocked_until": until,
+                     "expires_at": datetime.utcnow() + timedelta(seconds=max(ttl, until - time.time()))},
+        }, upsert=True)
+
+
+_default_backend = None
+
+
+def get_rate_limit_backend():
+    """The configured shared backend (RATE_LIMIT_BACKEND=mongo|local)."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = LocalBackend() if RATE_LIMIT_BACKEND == "local" else MongoBackend()
+    return _default_backend
+
+
+# ============================================================================
+# LIMITER
+# ============================================================================
+
+_metrics = {"checks": 0, "rejected": 0, "rejected_locally": 0, "blocks": 0, "backend_errors": 0}
+
+
+class RateLimiter:
+    """A named set of rules applied to keys (e.g. client IPs)."""
+
+    def __init__(self, name: str, rules: Iterable[RateLimitRule], backend=None,
+                 block_message: str = "Too many requests. Please wait a few minutes."):
+        self.name = name
+        self.rules = list(rules)
+        self.block_message = block_message
+        self._backend = backend
+        self._fallback = LocalBackend()
+        self._backend_down_until = 0.0
+        # key -> (blocked until, message), checked before the backend
+        self._blocked: "OrderedDict[str, tuple]" = OrderedDict()
+        self._ttl = max(max(r.window * 2, r.block_seconds) for r in self.rules)
+
+    @property
+    def backend(self):
+        return self._backend or get_rate_limit_backend()
+
+    def _remember_block(self, key: str, until: float, message: str):
+        self._blocked[key] = (until, message)
+        self._blocked.move_to_end(key)
+        while len(self._blocked) > RATE_LIMIT_LOCAL_MAX_KEYS:
+            self._blocked.popitem(last=False)
+
+    async def check(self, key: str) -> RateLimitResult:
+        """Count one request for key and say whether it may proceed."""
+        now = time.time()
+        _metrics["checks"] += 1
+        blocked = self._blocked.get(key)
+        if blocked:
+            if blocked[0] > now:
+                _metrics["rejected"] += 1
+                _metrics["rejected_locally"] += 1
+                return RateLimitResult(False, self.block_message, "blocked", blocked[0] - now)
+            del self._blocked[key]
+
+        record_key = f"{self.name}:{key}"
+        indexes = {rule.name: int(now // rule.window) for rule in self.rules}
+        backend = self.backend if now >= self._backend_down_until else self._fallback
+        try:
+            record = await backend.hit(record_key, indexes, self._ttl)
+        except Exception as e:
+            # Keep limiting per process rather than failing open
+            _metrics["backend_errors"] += 1
+            logger.warning(f"[RateLimit] {self.name}: backend unavailable ({e}), using local counters")
+            self._backend_down_until = now + RATE_LIMIT_BACKEND_RETRY_SECONDS
+            backend = self._fallback
+            record = await backend.hit(record_key, indexes, self._ttl)
+
+        blocked_until = record.get("blocked_until") or 0
+        if blocked_until > now:
+            self._remember_block(key, blocked_until, self.block_message)
+            _metrics["rejected"] += 1
+            return RateLimitResult(False, self.block_message, "blocked", blocked_until - now)
+
+        for rule in self.rules:
+            state = record.get(rule.name) or {}
+            elapsed = (now % rule.window) / rule.window
+            estimate = state.get("c", 0) + state.get("p", 0) * (1 - elapsed)
+            if estimate <= rule.limit:
+                continue
+            _metrics["rejected"] += 1
+            retry_after = rule.window * (1 - elapsed)
+            if rule.block_seconds:
+                until = now + rule.block_seconds
+                retry_after = rule.block_seconds
+                _metrics["blocks"] += 1
+                logger.warning(f"RATE LIMIT: {self.name} blocked {key} for {rule.block_seconds:.0f}s ({rule.name})")
+                self._remember_block(key, until, self.block_message)
+                try:
+                    await backend.block(record_key, until, self._ttl)
+                except Exception as e:
+                    _metrics["backend_errors"] += 1
+                    logger.warning(f"[RateLimit] {self.name}: could not store block ({e})")
+            return RateLimitResult(False, rule.message, rule.name, retry_after)
+
+        return RateLimitResult(True)
+
+
+def get_rate_limit_metrics() -> Dict[str, Any]:
+    return {**_metrics, "backend": type(get_rate_limit_backend()).__name__}
+
+
+def _too_many(result: RateLimitResult) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, int(result.retry_after + 0.999)))}
+
+
+def rate_limit_dependency(limiter: RateLimiter, key_func: Callable[[Request], str] = client_ip):
+    """FastAPI dependency: 429 with Retry-After once `limiter` trips for the request's key."""
+    async def dependency(request: Request):
+        result = await limiter.check(key_func(request))
+        if not result.allowed:
+            raise HTTPException(status_code=429, detail=result.message, headers=_too_many(result))
+    return dependency
+
+
+def rate_limit_middleware(limiter: RateLimiter, paths: Iterable[str], methods: Iterable[str] = ("POST",),
+                          key_func: Callable[[Request], str] = client_ip):
+    """HTTP middleware limiting the given paths, for app.middleware("http")(...)."""
+    paths, methods = frozenset(paths), frozenset(methods)
+
+    async def middleware(request: Request, call_next):
+        if request.method in methods and request.url.path in paths:
+            key = key_func(request)
+            result = await limiter.check(key)
+            if not result.allowed:
+                logger.warning(f"RATE LIMITED: {limiter.name} {key} - {result.message}")
+                return JSONResponse({"detail": result.message}, status_code=429, headers=_too_many(result))
+        return await call_next(request)
+    return middleware
@@ -0,0 +1,371 @@
+"""
+Resumable re-encryption of stored fields.
+
+Brings every encrypted field up to the current key (encryption.py key ring)
+and encrypts any plaintext left in fields that should be encrypted (only in
+PLAINTEXT_TARGETS, whose read paths all decrypt). Used
+after rotating ENCRYPTION_KEY, and for the first encryption of existing
+data (it replaces scripts/migrate_encrypt_pii.py).
+
+It is also the online migration to the binary ciphertext envelope: in
+collections listed in ENCRYPTION_BINARY_COLLECTIONS, values already on the
+current key that are still "ENC:" strings are re-packed as envelopes
+(no decryption needed), and anything re-encrypted is written as one.
+
+Safe to run against the live database:
+- documents are streamed in _id order, a batch at a time, and written with
+  one unordered bulk_write per batch
+- every update is conditional on the field still holding the value that
+  was read, so a concurrent write by the app is never overwritten (the
+  document is retried at the end of the collection)
+- values that no configured key can decrypt are left untouched and counted
+- progress is checkpointed per collection and target key in
+  reencryption_checkpoints, so an interrupted run resumes where it stopped
+- collections run in parallel, throttled to a shared writes-per-second budget
+
+    python -m services.reencryption --dry-run         # report what would change
+    python -m services.reencryption                   # all collections
+    python -m services.reencryption notes --rate 100  # one collection, slower
+    python -m services.reencryption --verify          # count values not on the current key
+    python -m services.reencryption --restart         # ignore checkpoints
+
+Take a backup before the first run. Once --verify reports nothing left,
+previous keys can be removed from ENCRYPTION_PREVIOUS_KEYS.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from encryption import (
+    BLIND_INDEX_FIELDS, BLIND_INDEX_SUFFIX, ENCRYPTED_FIELDS, DecryptionError, blind_index,
+    current_key_id, decrypt_field_strict, encrypt_field, is_envelope, key_id_of,
+    to_ciphertext_string, to_envelope, uses_binary_envelope,
+)
+from services.blind_index import BLIND_INDEXED_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = "reencryption_checkpoints"
+
+REENCRYPT_BATCH_SIZE = int(os.getenv("REENCRYPT_BATCH_SIZE", "200"))
+REENCRYPT_OPS_PER_SECOND = float(os.getenv("REENCRYPT_OPS_PER_SECOND", "200"))
+REENCRYPT_CONCURRENCY = int(os.getenv("REENCRYPT_CONCURRENCY", "3"))
+REENCRYPT_CONFLICT_RETRIES = 3
+
+# MongoDB collection -> encrypted field paths. "messages.text" is the text
+# of each message in the messages array; arrays are only re-encrypted, never
+# encrypted for the first time.
+REENCRYPT_TARGETS: Dict[str, List[str]] = {
+    "counsellors": ENCRYPTED_FIELDS["counsellors"],
+    "peer_supporters": ENCRYPTED_FIELDS["peer_supporters"],
+    "callback_requests": ENCRYPTED_FIELDS["callbacks"],
+    "callbacks": ENCRYPTED_FIELDS["callbacks"],
+    "notes": ENCRYPTED_FIELDS["notes"],
+    "safeguarding_alerts": ENCRYPTED_FIELDS["safeguarding_alerts"],
+    "concerns": ENCRYPTED_FIELDS["concerns"],
+    "live_chat_rooms": ["messages.text", "user_name"],
+    "chat_sessions": ENCRYPTED_FIELDS["chat_sessions"],
+    "ai_chat_sessions": ENCRYPTED_FIELDS["ai_chat_sessions"],
+    "supervision_notes": ENCRYPTED_FIELDS["supervision_notes"],
+    "escalations": ENCRYPTED_FIELDS["escalations"],
+    "email_outbox": ENCRYPTED_FIELDS["email_outbox"],
+}
+
+# Collections where plaintext is encrypted for the first time: every endpoint
+# reading them decrypts. The other targets are only rotated, because their
+# endpoints return stored values as they are and would show staff ciphertext.
+PLAINTEXT_TARGETS = {"counsellors", "peer_supporters", "callbacks", "notes", "safeguarding_alerts", "concerns"}
+
+_MAX_ERROR_IDS = 20
+
+
+class Throttle:
+    """Spaces out work so the total rate stays under ops_per_second (0 = unlimited)."""
+
+    def __init__(self, ops_per_second: float):
+        self.ops_per_second = ops_per_second
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self, ops: int):
+        if self.ops_per_second <= 0 or ops <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + ops / self.ops_per_second
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+# ============================================================================
+# PER-DOCUMENT PLAN
+# ============================================================================
+
+def _rewrite(value: Any, key_id: str, encrypt_plaintext: bool, binary: bool,
+             stats: Dict[str, int]) -> Tuple[Any, Optional[str]]:
+    """
+    (new value, plaintext) for one value; the value itself if unchanged.
+    plaintext is None when the value was only re-packed.
+    """
+    if not value or not (isinstance(value, str) or is_envelope(value)):
+        return value, None
+    value_key = key_id_of(value)
+    if value_key == key_id:
+        if binary != is_envelope(value):
+            stats["fields_repacked"] += 1
+            return (to_envelope(value) if binary else to_ciphertext_string(value)), None
+        stats["already_current"] += 1
+        return value, None
+    if value_key is None:
+        if not encrypt_plaintext:
+            return value, None
+        stats["fields_encrypted"] += 1
+        return encrypt_field(value, binary=binary), value
+    plaintext = decrypt_field_strict(value)
+    stats["fields_reencrypted"] += 1
+    return encrypt_field(plaintext, binary=binary), plaintext
+
+
+def plan_document(document: Dict[str, Any], fields: List[str], key_id: str, schema: Optional[str],
+                  encrypt_plaintext: bool, stats: Dict[str, int],
+                  binary: bool = False) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    ($set, conditions) bringing one document's fields to the current key
+    (and storage format).
+    conditions pin each rewritten field to the value that was read.
+    """
+    updates: Dict[str, Any] = {}
+    conditions: Dict[str, Any] = {}
+    blind_fields = BLIND_INDEX_FIELDS.get(schema, {}) if schema else {}
+
+    for path in fields:
+        field, _, subfield = path.partition(".")
+        value = document.get(field)
+        try:
+            if subfield:
+                if not isinstance(value, list):
+                    continue
+                items, changed = [], False
+                for item in value:
+                    if isinstance(item, dict) and subfield in item:
+                        new_value, _ = _rewrite(item[subfield], key_id, False, binary, stats)
+                        if new_value is not item[subfield]:
+                            item, changed = {**item, subfield: new_value}, True
+                    items.append(item)
+                if changed:
+                    updates[field], conditions[field] = items, value
+                continue
+
+            new_value, plaintext = _rewrite(value, key_id, encrypt_plaintext, binary, stats)
+        except DecryptionError:
+            stats["errors"] += 1
+            continue
+        if new_value is value:
+            continue
+        updates[field], conditions[field] = new_value, value
+        if field in blind_fields and plaintext is not None:
+            updates[f"{field}{BLIND_INDEX_SUFFIX}"] = blind_index(blind_fields[field], plaintext)
+
+    return updates, conditions
+
+
+def _new_stats() -> Dict[str, int]:
+    return {"scanned": 0, "updated": 0, "fields_reencrypted": 0, "fields_encrypted": 0,
+            "fields_repacked": 0, "already_current": 0, "errors": 0, "conflicts": 0}
+
+
+# ============================================================================
+# JOB
+# ============================================================================
+
+async def _apply(collection, planned: List[Tuple[Any, Dict, Dict]], throttle: Throttle, dry_run: bool) -> List[Any]:
+    """Write one batch; returns the _ids whose update lost a race with the app."""
+    if not planned or dry_run:
+        return []
+    await throttle.wait(len(planned))
+    result = await collection.bulk_write([
+        UpdateOne({"_id": doc_id, **conditions}, {"$set": updates})
+        for doc_id, updates, conditions in planned
+    ], ordered=False)
+    if result.matched_count == len(planned):
+        return []
+    # Find out which ones did not match
+    ids = [doc_id for doc_id, _, _ in planned]
+    conflicting = []
+    projection = {field: 1 for _, updates, _ in planned for field in updates}
+    current = {doc["_id"]: doc for doc in await collection.find({"_id": {"$in": ids}}, projection).to_list(len(ids))}
+    for doc_id, updates, _ in planned:
+        doc = current.get(doc_id)
+        if doc is not None and any(doc.get(field) != value for field, value in updates.items()
+                                   if not field.endswith(BLIND_INDEX_SUFFIX)):
+            conflicting.append(doc_id)
+    return conflicting
+
+
+async def reencrypt_collection(db, collection_name: str, fields: Optional[List[str]] = None, *,
+                               key_id: Optional[str] = None, batch_size: int = REENCRYPT_BATCH_SIZE,
+                               throttle: Optional[Throttle] = None, encrypt_plaintext: bool = True,
+                               binary: Optional[bool] = None, dry_run: bool = False,
+                               restart: bool = False) -> Dict[str, Any]:
+    """
+    Re-encrypt one collection, resuming from its checkpoint. binary picks
+    the storage format (default: the collection's configured format).
+    Plaintext is only encrypted in PLAINTEXT_TARGETS.
+    """
+    fields = fields or REENCRYPT_TARGETS[collection_name]
+    encrypt_plaintext = encrypt_plaintext and collection_name in PLAINTEXT_TARGETS
+    key_id = key_id or current_key_id()
+    if not key_id:
+        raise RuntimeError("ENCRYPTION_KEY not set")
+    throttle = throttle or Throttle(REENCRYPT_OPS_PER_SECOND)
+    schema = BLIND_INDEXED_COLLECTIONS.get(collection_name)
+    collection = db[collection_name]
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    binary = uses_binary_envelope(collection_name) if binary is None else binary
+    # A format change on the same key is a new pass over the collection
+    checkpoint_id = f"{collection_name}:{key_id}" + (":binary" if binary else "")
+
+    stats = _new_stats()
+    last_id = None
+    error_ids: List[Any] = []
+    conflicts: List[Any] = []
+    checkpoint = None if (restart or dry_run) else await checkpoints.find_one({"_id": checkpoint_id})
+    if checkpoint:
+        if checkpoint.get("status") == "done":
+            return {"collection": collection_name, "status": "done", **checkpoint.get("stats", {})}
+        last_id = checkpoint.get("last_id")
+        stats.update(checkpoint.get("stats", {}))
+        error_ids = checkpoint.get("error_ids", [])
+        conflicts = checkpoint.get("conflict_ids", [])
+
+    async def save(status: str):
+        if dry_run:
+            return
+        await checkpoints.update_one({"_id": checkpoint_id}, {"$set": {
+            "collection": collection_name, "key_id": key_id, "binary": binary, "status": status,
+            "last_id": last_id,
+            "stats": stats, "error_ids": error_ids[:_MAX_ERROR_IDS], "conflict_ids": conflicts,
+            "updated_at": datetime.utcnow(),
+        }, "$setOnInsert": {"started_at": datetime.utcnow()}}, upsert=True)
+
+    projection = {path.split(".")[0]: 1 for path in fields}
+
+    def plan(batch):
+        planned = []
+        for doc in batch:
+            errors_before = stats["errors"]
+            updates, conditions = plan_document(doc, fields, key_id, schema, encrypt_plaintext, stats, binary)
+            if stats["errors"] > errors_before:
+                error_ids.append(doc["_id"])
+            if updates:
+                planned.append((doc["_id"], updates, conditions))
+        return planned
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = await collection.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        stats["scanned"] += len(batch)
+        planned = await asyncio.to_thread(plan, batch)
+        conflicting = await _apply(collection, planned, throttle, dry_run)
+        conflicts.extend(conflicting)
+        stats["updated"] += len(planned) - len(conflicting)
+        last_id = batch[-1]["_id"]
+        await save("running")
+
+    # Documents the app changed while we were rewriting them: read and retry
+    for _ in range(REENCRYPT_CONFLICT_RETRIES):
+        if not conflicts:
+            break
+        batch = await collection.find({"_id": {"$in": conflicts}}, projection).to_list(len(conflicts))
+        planned = await asyncio.to_thread(plan, batch)
+        retried = await _apply(collection, planned, throttle, dry_run)
+        stats["updated"] += len(planned) - len(retried)
+        conflicts = retried
+    stats["conflicts"] = len(conflicts)
+
+    await save("done" if not conflicts else "incomplete")
+    if stats["errors"]:
+        logger.warning(f"[Reencrypt] {collection_name}: {stats['errors']} values could not be decrypted "
+                       f"(e.g. _id {error_ids[:3]})")
+    logger.info(f"[Reencrypt] {collection_name}: {stats}")
+    return {"collection": collection_name, "status": "dry_run" if dry_run else "done", **stats}
+
+
+async def run_reencryption(db, collections: Optional[List[str]] = None, *,
+                           ops_per_second: float = REENCRYPT_OPS_PER_SECOND,
+                           concurrency: int = REENCRYPT_CONCURRENCY, **options) -> List[Dict[str, Any]]:
+    """Re-encrypt several collections in parallel under one shared throttle."""
+    throttle = Throttle(ops_per_second)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(name):
+        async with semaphore:
+            return await reencrypt_collection(db, name, throttle=throttle, **options)
+
+    return await asyncio.gather(*(run(name) for name in collections or REENCRYPT_TARGETS))
+
+
+async def count_remaining(db, collection_name: str, key_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Per field, documents still holding a value encrypted with another key
+    (or, in binary collections, any "ENC:" string). Envelopes cannot be
+    matched by key id in a query; --dry-run gives an exact count for them.
+    """
+    key_id = key_id or current_key_id()
+    if uses_binary_envelope(collection_name):
+        stale = {"$regex": "^ENC:"}
+    else:
+        stale = {"$regex": "^ENC:", "$not": re.compile(f"^ENC:{re.escape(key_id)}:")}
+    return {
+        path: await db[collection_name].count_documents({path: stale})
+        for path in REENCRYPT_TARGETS[collection_name]
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    logging.basicConfig(level=logging.INFO)
+
+    from services.database import close_client, get_database
+
+    parser = argparse.ArgumentParser(description="Re-encrypt stored fields with the current key")
+    parser.add_argument("collections", nargs="*", help="collections (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    parser.add_argument("--verify", action="store_true", help="count values not on the current key")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    parser.add_argument("--rate", type=float, default=REENCRYPT_OPS_PER_SECOND, help="max document writes per second")
+    parser.add_argument("--batch", type=int, default=REENCRYPT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=REENCRYPT_CONCURRENCY)
+    parser.add_argument("--no-plaintext", action="store_true", help="only re-encrypt, never encrypt plaintext")
+    args = parser.parse_args()
+
+    async def main():
+        db = get_database()
+        names = args.collections or list(REENCRYPT_TARGETS)
+        print(f"Target key: {current_key_id()}")
+        if args.verify:
+            for name in names:
+                print(name, await count_remaining(db, name))
+        else:
+            for report in await run_reencryption(
+                db, names, ops_per_second=args.rate, concurrency=args.concurrency,
+                batch_size=args.batch, dry_run=args.dry_run, restart=args.restart,
+                encrypt_plaintext=not args.no_plaintext,
+            ):
+                print(report)
+        close_client()
+
+    asyncio.run(main())
@@ -0,0 +1,232 @@
+"""
+System statistics sampler for the admin monitoring dashboard.
+
+/admin/system-stats used to measure CPU with psutil.cpu_percent(interval=0.1)
+(which sleeps for 100ms) and run seven count_documents queries on every
+poll. Instead a background task keeps a snapshot current and the endpoint
+just returns it, so polling adds no load:
+
+    every SYSTEM_STATS_INTERVAL_SECONDS      CPU, memory, live counts
+    every SYSTEM_STATS_DB_INTERVAL_SECONDS   database counts
+    continuously                             event-loop lag
+
+Recent samples are kept in a ring buffer (SYSTEM_STATS_HISTORY entries) for
+sparklines, and capacity figures are derived from what was measured rather
+than hard-coded.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_STATS_INTERVAL_SECONDS = int(os.getenv("SYSTEM_STATS_INTERVAL_SECONDS", "10"))
+SYSTEM_STATS_DB_INTERVAL_SECONDS = int(os.getenv("SYSTEM_STATS_DB_INTERVAL_SECONDS", "60"))
+SYSTEM_STATS_HISTORY = int(os.getenv("SYSTEM_STATS_HISTORY", "360"))  # 1 hour at 10s
+
+# Configured call limit (the call relay, not this process, is the bottleneck)
+MAX_CONCURRENT_CALLS = int(os.getenv("MAX_CONCURRENT_CALLS", "25"))
+# CPU level treated as "full" when extrapolating user capacity
+CAPACITY_TARGET_CPU_PERCENT = 80.0
+# Event-loop lag treated as "full" (requests visibly slow down beyond this)
+LOOP_LAG_BUDGET_MS = 100.0
+
+_LAG_PROBE_SECONDS = 0.5
+_STAFF_ROLES = ["counsellor", "peer", "admin"]
+
+
+def _since(field: str, since: datetime) -> Dict[str, Any]:
+    """Match a timestamp stored either as a date or an ISO string."""
+    return {"$or": [{field: {"$gte": since}}, {field: {"$gte": since.isoformat()}}]}
+
+
+async def collect_db_counts(db) -> Dict[str, int]:
+    """The database figures shown on the dashboard (run by the sampler only)."""
+    now = datetime.utcnow()
+    return {
+        "total_users": await db.users.count_documents({}),
+        "staff_count": await db.users.count_documents({"role": {"$in": _STAFF_ROLES}}),
+        "connected_staff": await db.users.count_documents({
+            "role": {"$in": _STAFF_ROLES},
+            **_since("last_active", now - timedelta(minutes=15)),
+        }),
+        "active_ai_sessions": await db.ai_sessions.count_documents(_since("created_at", now - timedelta(hours=24))),
+        "pending_callbacks": await db.callbacks.count_documents({"status": "pending"}),
+        "today_shifts": await db.shifts.count_documents({"date": now.strftime("%Y-%m-%d")}),
+        "recent_alerts": await db.safeguarding_alerts.count_documents(_since("created_at", now - timedelta(days=7))),
+        "active_visitors": await db.active_sessions.count_documents({"last_seen": {"$gte": now - timedelta(minutes=10)}}),
+    }
+
+
+class SystemStatsSampler:
+    """Background sampler holding the latest snapshot and a short history."""
+
+    def __init__(self, db, live_counts: Callable[[], Dict[str, int]],
+                 interval: int = SYSTEM_STATS_INTERVAL_SECONDS,
+                 db_interval: int = SYSTEM_STATS_DB_INTERVAL_SECONDS,
+                 history_size: int = SYSTEM_STATS_HISTORY):
+        self.db = db
+        self.live_counts = live_counts
+        self.interval = interval
+        self.db_interval = db_interval
+        self.history: deque = deque(maxlen=history_size)
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.db_counts: Dict[str, int] = {}
+        self.db_counts_at: Optional[datetime] = None
+        self.db_error: Optional[str] = None
+        self._max_lag_ms = 0.0
+        self._last_db_sample = 0.0
+        self._process = None
+
+    # ------------------------------------------------------------------
+    # Measurements
+    # ------------------------------------------------------------------
+
+    def _resources(self) -> Dict[str, float]:
+        try:
+            import psutil
+            if self._process is None:
+                self._process = psutil.Process()
+                self._process.cpu_percent(None)
+            memory = psutil.virtual_memory()
+            return {
+                # Non-blocking: CPU use since the previous call
+                "cpu_percent": psutil.cpu_percent(None),
+                "process_cpu_percent": self._process.cpu_percent(None) / (psutil.cpu_count() or 1),
+                "memory_percent": memory.percent,
+                "memory_used_mb": memory.used / (1024 * 1024),
+                "memory_total_mb": memory.total / (1024 * 1024),
+            }
+        except Exception as e:
+            logger.warning(f"[SystemStats] Resource sampling failed: {e}")
+            return {"cpu_percent": 0, "process_cpu_percent": 0, "memory_percent": 0,
+                    "memory_used_mb": 0, "memory_total_mb": 0}
+
+    async def refresh_db_counts(self):
+        try:
+            self.db_counts = await collect_db_counts(self.db)
+            self.db_counts_at = datetime.utcnow()
+            self.db_error = None
+        except Exception as e:
+            self.db_error = str(e)
+            logger.error(f"[SystemStats] Database counts failed: {e}")
+        self._last_db_sample = time.monotonic()
+
+    def record_lag(self, lag_ms: float):
+        self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+
+    def _capacity(self, sample: Dict[str, Any]) -> Dict[str, Any]:
+        history = list(self.history)
+        users = [h["concurrent_users"] for h in history]
+        lags = sorted(h["loop_lag_ms"] for h in history)
+        busy = [h for h in history if h["process_cpu_percent"] >= 5 and h["concurrent_users"] > 0]
+
+        # Users per CPU percent measured while the process was doing real
+        # work, extrapolated to the target CPU level
+        estimated_users = None
+        if busy:
+            per_percent = sum(h["concurrent_users"] for h in busy) / sum(h["process_cpu_percent"] for h in busy)
+            estimated_users = int(per_percent * CAPACITY_TARGET_CPU_PERCENT)
+
+        load = max(
+            sample["cpu_percent"],
+            sample["loop_lag_ms"] / LOOP_LAG_BUDGET_MS * 100,
+            sample["active_calls"] / MAX_CONCURRENT_CALLS * 100 if MAX_CONCURRENT_CALLS else 0,
+        )
+        return {
+            "current_concurrent_users": sample["concurrent_users"],
+            "peak_concurrent_users": max(users) if users else sample["concurrent_users"],
+            "estimated_max_concurrent_users": estimated_users,
+            "estimated_max_calls": MAX_CONCURRENT_CALLS,
+            "event_loop_lag_ms": round(sample["loop_lag_ms"], 1),
+            "event_loop_lag_p95_ms": round(lags[min(len(lags) - 1, int(0.95 * len(lags)))], 1) if lags else None,
+            "current_load_percent": round(min(load, 100.0), 1),
+        }
+
+    def take_sample(self) -> Dict[str, Any]:
+        """Measure resources and live counts, append to history, rebuild the snapshot."""
+        resources = self._resources()
+        live = self.live_counts()
+        counts = self.db_counts
+        lag_ms, self._max_lag_ms = self._max_lag_ms, 0.0
+
+        sample = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "cpu_percent": resources["cpu_percent"],
+            "process_cpu_percent": resources["process_cpu_percent"],
+            "memory_percent": resources["memory_percent"],
+            "loop_lag_ms": lag_ms,
+            "active_calls": live.get("active_calls", 0),
+            "active_live_chats": live.get("active_live_chats", 0),
+            "concurrent_users": counts.get("active_visitors", 0) + live.get("socket_connections", 0),
+        }
+        self.history.append(sample)
+
+        self.snapshot = {
+            "timestamp": sample["timestamp"],
+            "users": {
+                "total_registered": counts.get("total_users", 0),
+                "staff_count": counts.get("staff_count", 0),
+                "connected_staff": counts.get("connected_staff", 0),
+            },
+            "activity": {
+                "active_ai_sessions_24h": counts.get("active_ai_sessions", 0),
+                "active_live_chats": sample["active_live_chats"],
+                "active_calls": sample["active_calls"],
+                "pending_callbacks": counts.get("pending_callbacks", 0),
+                "today_shifts": counts.get("today_shifts", 0),
+                "safeguarding_alerts_7d": counts.get("recent_alerts", 0),
+                "active_visitors": counts.get("active_visitors", 0),
+                "socket_connections": live.get("socket_connections", 0),
+            },
+            "server": {
+                "cpu_percent": round(resources["cpu_percent"], 1),
+                "process_cpu_percent": round(resources["process_cpu_percent"], 1),
+                "memory_percent": round(resources["memory_percent"], 1),
+                "memory_used_mb": round(resources["memory_used_mb"], 1),
+                "memory_total_mb": round(resources["memory_total_mb"], 1),
+            },
+            "capacity": self._capacity(sample),
+            "sampling": {
+                "interval_seconds": self.interval,
+                "db_interval_seconds": self.db_interval,
+                "db_counts_at": self.db_counts_at.isoformat() if self.db_counts_at else None,
+                "db_error": self.db_error,
+            },
+        }
+        return self.snapshot
+
+    def get_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        history = list(self.history)
+        return history[-limit:] if limit else history
+
+    # ------------------------------------------------------------------
+    # Background loop
+    # ------------------------------------------------------------------
+
+    async def run(self):
+        """Sample forever; cancel to stop."""
+        loop = asyncio.get_running_loop()
+        await self.refresh_db_counts()
+        self.take_sample()
+        next_sample = loop.time() + self.interval
+
+        while True:
+            expected = loop.time() + _LAG_PROBE_SECONDS
+            await asyncio.sleep(_LAG_PROBE_SECONDS)
+            self.record_lag(max(0.0, (loop.time() - expected) * 1000))
+
+            if loop.time() >= next_sample:
+                next_sample = loop.time() + self.interval
+                if time.monotonic() - self._last_db_sample >= self.db_interval:
+                    await self.refresh_db_counts()
+                self.take_sample()
@@ -0,0 +1,218 @@
+"""
+Startup profiling and background warm-up.
+
+Heavy components (the sentence-transformer model, PDF/Excel libraries, the
+LMS curriculum) are registered here and loaded in a background task once the
+server has started accepting connections, instead of at import time.
+
+Readiness is reported via /api/health/ready so Kubernetes only routes traffic
+once the semantic safety model is warm.
+
+Run a standalone profile with:
+    python -m services.warmup
+"""
+
+import asyncio
+import importlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# When true the readiness probe fails until the semantic model is loaded,
+# even if the model cannot be loaded at all (e.g. missing dependency).
+READINESS_REQUIRE_SEMANTIC_MODEL = os.getenv("READINESS_REQUIRE_SEMANTIC_MODEL", "false").lower() == "true"
+
+# ============================================================================
+# STATE
+# ============================================================================
+
+_process_start = time.perf_counter()
+_started_at = datetime.utcnow()
+
+# Import / startup phases in the order they ran
+_startup_phases: List[Dict[str, Any]] = []
+
+# Registered warm-up components (name -> state)
+_warmups: Dict[str, Dict[str, Any]] = {}
+
+_warmup_task: Optional[asyncio.Task] = None
+_serving_since_ms: Optional[float] = None
+_warm_since_ms: Optional[float] = None
+
+
+def _elapsed_ms() -> float:
+    return round((time.perf_counter() - _process_start) * 1000, 1)
+
+
+# ============================================================================
+# STARTUP PROFILE
+# ============================================================================
+
+@contextmanager
+def startup_phase(name: str):
+    """Time a block of startup work (typically a group of imports)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _startup_phases.append({
+            "phase": name,
+            "duration_ms": round(duration_ms, 1),
+            "finished_at_ms": _elapsed_ms(),
+        })
+
+
+def mark_serving():
+    """Record the moment the app starts accepting connections."""
+    global _serving_since_ms
+    _serving_since_ms = _elapsed_ms()
+    logger.info(f"[Warmup] Accepting connections {_serving_since_ms:.0f}ms after process start")
+
+
+# ============================================================================
+# WARM-UP REGISTRY
+# ============================================================================
+
+def register_warmup(name: str, loader: Callable[[], Any], gates_readiness: bool = False):
+    """
+    Register a heavy component to be loaded in the background.
+
+    The loader runs in a worker thread. It may return False to signal that
+    the component could not be loaded.
+    """
+    _warmups[name] = {
+        "loader": loader,
+        "gates_readiness": gates_readiness,
+        "status": "pending",
+        "duration_ms": None,
+        "error": None,
+    }
+
+
+def register_import_warmup(name: str, module_name: str):
+    """Register a module that should be imported in the background."""
+    register_warmup(name, lambda: importlib.import_module(module_name))
+
+
+def _run_loader(name: str) -> None:
+    state = _warmups[name]
+    state["status"] = "loading"
+    start = time.perf_counter()
+    try:
+        result = state["loader"]()
+        state["status"] = "failed" if result is False else "ready"
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+        logger.error(f"[Warmup] {name} failed to load: {e}")
+    state["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"[Warmup] {name}: {state['status']} in {state['duration_ms']:.0f}ms")
+
+
+async def run_warmup():
+    """Load every registered component, readiness-gating ones first."""
+    global _warm_since_ms
+    ordered = sorted(_warmups, key=lambda n: not _warmups[n]["gates_readiness"])
+    for name in ordered:
+        if _warmups[name]["status"] in ("pending", "failed"):
+            await asyncio.to_thread(_run_loader, name)
+    _warm_since_ms = _elapsed_ms()
+    logger.info(f"[Warmup] All components processed {_warm_since_ms:.0f}ms after process start")
+
+
+def start_background_warmup() -> asyncio.Task:
+    """Start warm-up as a background task (call from a startup handler)."""
+    global _warmup_task
+    mark_serving()
+    if _warmup_task is None or _warmup_task.done():
+        _warmup_task = asyncio.create_task(run_warmup())
+    return _warmup_task
+
+
+def warm_up_sync():
+    """Load every registered component in the current thread (CLI / scripts)."""
+    for name in _warmups:
+        _run_loader(name)
+
+
+# ============================================================================
+# READINESS & REPORTING
+# ============================================================================
+
+def is_component_ready(name: str) -> bool:
+    state = _warmups.get(name)
+    return bool(state) and state["status"] == "ready"
+
+
+def is_ready() -> bool:
+    """True once every readiness-gating component has finished loading."""
+    for name, state in _warmups.items():
+        if not state["gates_readiness"]:
+            continue
+        if state["status"] == "ready":
+            continue
+        if state["status"] == "failed" and not READINESS_REQUIRE_SEMANTIC_MODEL:
+            continue
+        return False
+    return True
+
+
+def get_startup_report() -> Dict[str, Any]:
+    """Startup profile: import phases, warm-up timings and readiness."""
+    phases = sorted(_startup_phases, key=lambda p: p["duration_ms"], reverse=True)
+    return {
+        "started_at": _started_at.isoformat(),
+        "uptime_ms": _elapsed_ms(),
+        "ready": is_ready(),
+        "serving_after_ms": _serving_since_ms,
+        "warm_after_ms": _warm_since_ms,
+        "import_total_ms": round(sum(p["duration_ms"] for p in _startup_phases), 1),
+        "phases": phases,
+        "warmup": {
+            name: {
+                "status": state["status"],
+                "gates_readiness": state["gates_readiness"],
+                "duration_ms": state["duration_ms"],
+                "error": state["error"],
+            }
+            for name, state in _warmups.items()
+        },
+        "degraded": [
+            name for name, state in _warmups.items() if state["status"] == "failed"
+        ],
+    }
+
+
+def format_startup_report(report: Optional[Dict[str, Any]] = None) -> str:
+    """Human-readable version of get_startup_report()."""
+    report = report or get_startup_report()
+    lines = ["Startup profile", "=" * 60]
+    for phase in report["phases"]:
+        lines.append(f"  import  {phase['phase']:<40} {phase['duration_ms']:>9.1f}ms")
+    for name, state in report["warmup"].items():
+        duration = state["duration_ms"] if state["duration_ms"] is not None else 0
+        lines.append(f"  warmup  {name:<40} {duration:>9.1f}ms  {state['status']}")
+    lines.append("-" * 60)
+    lines.append(f"  imports total {report['import_total_ms']:.1f}ms, ready={report['ready']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+    # Use the package module so the phases recorded by server.py are visible
+    from services import warmup
+
+    with warmup.startup_phase("server (full import)"):
+        importlib.import_module("server")
+    warmup.warm_up_sync()
+    print(warmup.format_startup_report())
@@ -0,0 +1,379 @@
+"""
+Shared test fakes: an in-memory stand-in for Motor collections.
+
+FakeCollection implements the part of the collection API the services use
+(queries with the usual operators and BSON type bracketing, projections,
+sorted/limited cursors, updates with upserts, bulk writes, unique keys and
+indexes) and records finds and bulk writes for assertions. Tests that need
+a scenario a real server would produce (a concurrent write, a failure)
+subclass it and override one method.
+"""
+import asyncio
+import copy
+from datetime import datetime
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+_MISSING = object()
+_TYPE_NAMES = {"null": type(None), "number": (int, float), "string": str, "bool": bool, "date": datetime,
+               "object": dict, "array": list, "objectId": ObjectId}
+
+
+def type_rank(value) -> int:
+    """BSON comparison order: null < numbers < strings < objects < arrays < binary < ObjectId < bool < date."""
+    if value is None:
+        return 1
+    if isinstance(value, bool):  # before numbers: bool is an int
+        return 8
+    for rank, types in ((2, (int, float)), (3, str), (4, dict), (5, list), (6, bytes), (7, ObjectId), (9, datetime)):
+        if isinstance(value, types):
+            return rank
+    return 10
+
+
+def sort_key(value):
+    return type_rank(value), (0 if value is None else value)
+
+
+def get_path(doc, path, default=None):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return default
+        doc = doc[part]
+    return doc
+
+
+def _compare(value, op, operand) -> bool:
+    # Range operators only compare values of the same BSON type
+    if value is _MISSING or type_rank(value) != type_rank(operand):
+        return False
+    return {"$gt": value > operand, "$gte": value >= operand,
+            "$lt": value < operand, "$lte": value <= operand}[op]
+
+
+def _equals(value, operand) -> bool:
+    if value is _MISSING:
+        return operand is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def _matches_operators(value, condition) -> bool:
+    for op, operand in condition.items():
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _compare(value, op, operand)
+        elif op == "$eq":
+            ok = _equals(value, operand)
+        elif op == "$ne":
+            ok = not _equals(value, operand)
+        elif op == "$in":
+            ok = any(_equals(value, item) for item in operand)
+        elif op == "$nin":
+            ok = not any(_equals(value, item) for item in operand)
+        elif op == "$exists":
+            ok = (value is not _MISSING) == bool(operand)
+        elif op == "$type":
+            names = [operand] if isinstance(operand, str) else operand
+            ok = value is not _MISSING and any(
+                isinstance(value, _TYPE_NAMES[name]) and (name == "bool" or not isinstance(value, bool))
+                for name in names)
+        else:
+            raise NotImplementedError(f"query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query) -> bool:
+    """Whether `doc` matches a MongoDB query (the subset the services use)."""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            ok = all(matches(doc, q) for q in condition)
+        elif key == "$or":
+            ok = any(matches(doc, q) for q in condition)
+        else:
+            value = get_path(doc, key, _MISSING)
+            if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+                ok = _matches_operators(value, condition)
+            else:
+                ok = _equals(value, condition)
+        if not ok:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return doc
+    if any(v for v in projection.values()):
+        keep = {k for k, v in projection.items() if v} | ({"_id"} if projection.get("_id", 1) else set())
+        return {k: v for k, v in doc.items() if k in keep}
+    return {k: v for k, v in doc.items() if k not in projection}
+
+
+# ============================================================================
+# UPDATES
+# ============================================================================
+
+def _set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _unset_path(doc, path):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def apply_update(doc, update, inserting=False):
+    """Apply an update document ($set, $unset, $inc, $setOnInsert) in place."""
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            if op in ("$set", "$setOnInsert"):
+                _set_path(doc, path, copy.deepcopy(value))
+            elif op == "$unset":
+                _unset_path(doc, path)
+            elif op == "$inc":
+                _set_path(doc, path, get_path(doc, path, 0) + value)
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def _upsert_base(query):
+    """The document an upsert starts from: the query's equality conditions."""
+    base = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set_path(base, key, condition["$eq"])
+            continue
+        _set_path(base, key, condition)
+    return base
+
+
+# ============================================================================
+# COLLECTION
+# ============================================================================
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, keys, direction=None):
+        keys = [(keys, direction or 1)] if isinstance(keys, str) else list(keys)
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda d: sort_key(get_path(d, field)), reverse=order < 0)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0)
+        return self.docs if length is None else self.docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """
+    Documents are kept by _id in insertion order (docs). `unique` names
+    fields with a unique index; find() and bulk_write() calls are recorded
+    in finds and bulk_writes.
+    """
+
+    def __init__(self, docs=(), unique=()):
+        self.docs = {}
+        self.unique = tuple(unique)
+        self.indexes = {"_id_": {"name": "_id_", "key": {"_id": 1}}}
+        self.finds = []
+        self.bulk_writes = []
+        for doc in docs:
+            self._insert(dict(doc))
+
+    # -- helpers -------------------------------------------------------------
+
+    def _insert(self, doc):
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']!r}")
+        for field in self.unique:
+            value = doc.get(field)
+            if value is not None and any(d.get(field) == value for d in self.docs.values()):
+                raise DuplicateKeyError(f"duplicate {field} {value!r}")
+        self.docs[doc["_id"]] = doc
+        return doc["_id"]
+
+    def _matching(self, query):
+        return [d for d in self.docs.values() if matches(d, query)]
+
+    def _update(self, query, update, upsert=False, many=False):
+        targets = self._matching(query)
+        if not many:
+            targets = targets[:1]
+        modified = 0
+        for doc in targets:
+            before = copy.deepcopy(doc)
+            if any(k.startswith("$") for k in update):
+                apply_update(doc, update)
+            else:
+                doc.clear()
+                doc.update({"_id": before["_id"], **copy.deepcopy(update)})
+            modified += doc != before
+        upserted_id = None
+        if not targets and upsert:
+            doc = _upsert_base(query)
+            if any(k.startswith("$") for k in update):
+                apply_update(doc, update, inserting=True)
+            else:
+                doc.update(copy.deepcopy(update))
+            upserted_id = self._insert(doc)
+        return SimpleNamespace(matched_count=len(targets), modified_count=modified, upserted_id=upserted_id,
+                               acknowledged=True)
+
+    def _delete(self, query, many):
+        targets = self._matching(query)
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(targets), acknowledged=True)
+
+    # -- reads ---------------------------------------------------------------
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.finds.append((query or {}, projection))
+        return FakeCursor(project(copy.deepcopy(d), projection) for d in self._matching(query))
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        found = self._matching(query)
+        return project(copy.deepcopy(found[0]), projection) if found else None
+
+    async def count_documents(self, query, **kwargs):
+        return len(self._matching(query))
+
+    async def distinct(self, field, query=None, **kwargs):
+        values = []
+        for doc in self._matching(query):
+            value = get_path(doc, field, _MISSING)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not _MISSING and item not in values:
+                    values.append(item)
+        return values
+
+    # -- writes --------------------------------------------------------------
+
+    async def insert_one(self, document, **kwargs):
+        document.setdefault("_id", ObjectId())
+        self._insert(copy.deepcopy(document))
+        return SimpleNamespace(inserted_id=document["_id"], acknowledged=True)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        errors, inserted = [], []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                inserted.append(self._insert(copy.deepcopy(document)))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted, acknowledged=True)
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        return self._update(query, update, upsert)
+
+    async def update_many(self, query, update, upsert=False, **kwargs):
+        await asyncio.sleep(0)
+        return self._update(query, update, upsert, many=True)
+
+    async def replace_one(self, query, replacement, upsert=False, **kwargs):
+        return self._update(query, replacement, upsert)
+
+    async def delete_one(self, query, **kwargs):
+        return self._delete(query, many=False)
+
+    async def delete_many(self, query, **kwargs):
+        return self._delete(query, many=True)
+
+    async def bulk_write(self, ops, ordered=True, **kwargs):
+        self.bulk_writes.append(list(ops))
+        totals = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "deleted_count": 0}
+        upserted_ids = {}
+        for index, op in enumerate(ops):
+            if isinstance(op, InsertOne):
+                self._insert(copy.deepcopy(op._doc))
+                totals["inserted_count"] += 1
+            elif isinstance(op, (DeleteOne, DeleteMany)):
+                totals["deleted_count"] += self._delete(op._filter, many=isinstance(op, DeleteMany)).deleted_count
+            elif isinstance(op, (UpdateOne, UpdateMany, ReplaceOne)):
+                result = self._update(op._filter, op._doc, bool(op._upsert), many=isinstance(op, UpdateMany))
+                totals["matched_count"] += result.matched_count
+                totals["modified_count"] += result.modified_count
+                if result.upserted_id is not None:
+                    upserted_ids[index] = result.upserted_id
+            else:
+                raise NotImplementedError(type(op).__name__)
+        return SimpleNamespace(**totals, upserted_count=len(upserted_ids), upserted_ids=upserted_ids,
+                               acknowledged=True)
+
+    # -- indexes -------------------------------------------------------------
+
+    def list_indexes(self):
+        async def iterate():
+            for index in list(self.indexes.values()):
+                yield index
+        return iterate()
+
+    async def create_index(self, keys, name=None, **options):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.indexes[name] = {"name": name, "key": dict(keys), **options}
+        return name
+
+
+class FakeDatabase(dict):
+    """Collections by name, created on first use (db.name or db["name"])."""
+
+    collection_class = FakeCollection
+
+    def __missing__(self, name):
+        self[name] = self.collection_class()
+        return self[name]
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self[name]
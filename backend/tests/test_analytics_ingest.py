@@ -0,0 +1,143 @@
+"""
+Tests for buffered analytics ingestion (services/analytics_ingest.py)
+Coalescing, bounded buffer, bulk writes and shutdown draining
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import analytics_ingest
+from services.analytics_ingest import AnalyticsIngestBuffer, flush_analytics, run_analytics_flusher
+from services.analytics_sketches import SketchBuffer
+from conftest import FakeCollection, FakeDatabase
+
+
+def _visit(session_id, page=None, when=datetime(2026, 3, 2, 9, 30)):
+    return {"session_id": session_id, "timestamp": when, "date": when.strftime("%Y-%m-%d"),
+            "hour": when.hour, "region": "england", "device": "mobile", "browser": "chrome",
+            "os": "android", "page": page or "home"}
+
+
+def test_events_coalesced_per_session():
+    buffer = AnalyticsIngestBuffer()
+    assert buffer.add_visit(_visit("s1"), "1.1.1.1", page="resources")
+    assert buffer.add_visit(_visit("s1"), "1.1.1.1", page="resources")
+    assert buffer.add_visit(_visit("s2"), "2.2.2.2")
+    buffer.add_heartbeat("s1")
+    buffer.add_heartbeat("s1")
+
+    assert len(buffer.visits) == 2
+    assert len(buffer.heartbeats) == 1
+    assert buffer.metrics["events_enqueued"] == 5
+    assert buffer.metrics["events_coalesced"] == 2
+    assert buffer.visits[("s1", "2026-03-02")]["page_views"] == 2
+
+
+def test_full_buffer_drops_new_sessions_only():
+    buffer = AnalyticsIngestBuffer(max_sessions=1)
+    assert buffer.add_visit(_visit("s1"))
+    assert not buffer.add_visit(_visit("s2"))
+    assert buffer.add_visit(_visit("s1"))
+    assert buffer.metrics["events_dropped"] == 1
+
+
+def test_flush_writes_one_bulk_per_collection(monkeypatch):
+    monkeypatch.setattr(analytics_ingest, "record_visit_sketches",
+                        lambda *a, **k: SketchBuffer())
+    db = FakeDatabase()
+    buffer = AnalyticsIngestBuffer()
+    lookups = []
+
+    async def geo_lookup(ip):
+        lookups.append(ip)
+        return {"geo_country": "United Kingdom", "geo_city": "Leeds"}
+
+    for _ in range(3):
+        buffer.add_visit(_visit("s1"), "1.1.1.1", page="resources")
+    buffer.add_visit(_visit("s2"), "1.1.1.1")
+    buffer.add_heartbeat("s3")
+
+    assert asyncio.run(flush_analytics(db, geo_lookup, buffer)) == 3
+    assert lookups == ["1.1.1.1"]
+    assert len(buffer) == 0
+
+    visits = db["app_visits"].bulk_writes[0]
+    assert len(visits) == 2
+    assert visits[0]._doc["$inc"] == {"page_views": 3}
+    assert visits[0]._doc["$set"]["geo_city"] == "Leeds"
+
+    rollup = db["analytics_daily_rollups"].bulk_writes[0][0]._doc["$inc"]
+    assert rollup["visits"] == 2
+    assert rollup["page_views"] == 4
+    assert rollup["pages.resources"] == 3
+    assert rollup["devices.mobile"] == 2
+
+    assert db["feature_usage"].bulk_writes[0][0]._doc == {"$inc": {"visits": 3}}
+    assert len(db["active_sessions"].bulk_writes[0]) == 3
+    assert buffer.metrics["batches_flushed"] == 1
+
+
+def test_flusher_drains_on_shutdown(monkeypatch):
+    monkeypatch.setattr(analytics_ingest, "record_visit_sketches",
+                        lambda *a, **k: SketchBuffer())
+    db = FakeDatabase()
+    buffer = AnalyticsIngestBuffer()
+    buffer.add_visit(_visit("s1"))
+
+    async def run():
+        task = asyncio.create_task(run_analytics_flusher(db, buffer=buffer, poll_seconds=60))
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert len(buffer) == 0
+    assert len(db["app_visits"].bulk_writes) == 1
+
+
+def test_failed_flush_is_requeued_within_the_bound(monkeypatch):
+    monkeypatch.setattr(analytics_ingest, "record_visit_sketches",
+                        lambda *a, **k: SketchBuffer())
+    buffer = AnalyticsIngestBuffer(max_sessions=3)
+    buffer.add_visit(_visit("s1"), page="resources")
+    buffer.add_visit(_visit("s2"))
+    buffer.add_heartbeat("s3")
+
+    class Down(FakeCollection):
+        async def bulk_write(self, ops, ordered=True, **kwargs):
+            raise ConnectionError("primary stepped down")
+
+    assert asyncio.run(flush_analytics(FakeDatabase(app_visits=Down()), buffer=buffer)) == 0
+    assert len(buffer) == 3 and buffer.metrics["flush_errors"] == 1
+
+    # More events arrive while the database is down; the buffer stays bounded
+    asyncio.run(flush_analytics(FakeDatabase(app_visits=Down()), buffer=buffer))
+    buffer.add_visit(_visit("s1"), page="resources")
+    buffer.add_visit(_visit("s4"))
+    assert buffer.metrics["events_dropped"] == 1
+    assert buffer.visits[("s1", "2026-03-02")]["page_views"] == 2
+
+    db = FakeDatabase()
+    assert asyncio.run(flush_analytics(db, buffer=buffer)) == 3
+    assert db["app_visits"].bulk_writes[0][0]._doc["$inc"] == {"page_views": 2}
+    assert buffer.metrics["events_lost_on_error"] == 0 and len(buffer) == 0
+
+
+def test_requeue_counts_what_no_longer_fits():
+    buffer = AnalyticsIngestBuffer(max_sessions=2)
+    buffer.add_visit(_visit("s1"))
+    buffer.add_heartbeat("s2")
+    visits, heartbeats, _ = buffer.drain()
+    # Arrived while the failed write was in flight
+    buffer.add_visit(_visit("s3"))
+    buffer.add_heartbeat("s2")
+
+    buffer.requeue(visits, heartbeats)
+    assert set(buffer.visits) == {("s3", "2026-03-02")} and set(buffer.heartbeats) == {"s2"}
+    assert buffer.metrics["events_lost_on_error"] == 1 and buffer.metrics["sessions_requeued"] == 1
@@ -0,0 +1,83 @@
+"""
+Tests for daily analytics rollups (services/analytics_rollups.py)
+Ingest updates and dashboard figures computed from rollups
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import analytics_rollups
+from services.analytics_rollups import backfill_rollups, build_rollup_update, rollup_key, summarise_usage
+from conftest import FakeCollection, FakeDatabase
+
+
+VISIT = {"date": "2026-03-02", "region": "england", "device": "mobile",
+         "browser": "chrome", "os": "android", "hour": 9}
+
+
+def test_first_visit_of_day_counts_in_breakdowns():
+    update = build_rollup_update(VISIT, new_session_day=True, page="resources")
+    assert update["$inc"] == {
+        "page_views": 1, "pages.resources": 1, "visits": 1,
+        "regions.england": 1, "devices.mobile": 1, "browsers.chrome": 1,
+        "os.android": 1, "hours.9": 1,
+    }
+    assert update["$setOnInsert"] == {"date": "2026-03-02"}
+
+
+def test_repeat_visit_only_adds_page_views():
+    update = build_rollup_update(VISIT, new_session_day=False)
+    assert update["$inc"] == {"page_views": 1}
+
+
+def test_keys_are_safe_field_names():
+    assert rollup_key("a.b") == "a_b"
+    assert rollup_key("$where") == "_where"
+    assert rollup_key("") is None
+    assert rollup_key(None) is None
+    assert len(rollup_key("x" * 500)) == 64
+
+
+def test_summary_windows_and_breakdowns():
+    now = datetime(2026, 3, 31, 12)
+    rollups = [
+        {"date": "2025-06-01", "visits": 100, "regions": {"wales": 100}},
+        {"date": "2026-03-01", "visits": 5, "regions": {"england": 5}, "hours": {"10": 5},
+         "pages": {"home": 7}},
+        {"date": "2026-03-30", "visits": 3, "regions": {"england": 1, "scotland": 2},
+         "hours": {"9": 3}, "pages": {"home": 2, "resources": 4}},
+    ]
+
+    usage = summarise_usage(rollups, now)
+    assert usage["7_days"]["total_visits"] == 3
+    assert usage["30_days"]["total_visits"] == 3
+    assert usage["6_months"]["total_visits"] == 8
+    assert usage["12_months"]["total_visits"] == 108
+
+    # 30-day window is 2026-03-02 .. 2026-03-31
+    assert usage["regions"] == {"scotland": 2, "england": 1}
+    assert list(usage["peak_hours"]) == ["9"]
+    assert usage["page_visits"] == {"resources": 4, "home": 2}
+    assert usage["daily_trend"] == [{"_id": "2026-03-30", "visits": 3, "unique_visitors": 3}]
+
+
+def test_backfill_never_rebuilds_today(monkeypatch):
+    """The flusher is still incrementing today's rollup; replacing it would lose those increments."""
+    rebuilt = []
+
+    async def fake_rebuild(db, date):
+        rebuilt.append(date)
+
+    monkeypatch.setattr(analytics_rollups, "rebuild_rollup", fake_rebuild)
+    db = FakeDatabase(
+        app_visits=FakeCollection([{"date": d} for d in ("2026-02-27", "2026-03-01", "2026-03-02")]),
+        analytics_daily_rollups=FakeCollection([{"date": "2026-02-27"}]),
+    )
+    now = datetime(2026, 3, 2, 12, 0)
+
+    assert asyncio.run(backfill_rollups(db, days=30, now=now))["built"] == ["2026-03-01"]
+    assert asyncio.run(backfill_rollups(db, days=30, rebuild=True, now=now))["built"] == ["2026-02-27", "2026-03-01"]
+    assert "2026-03-02" not in rebuilt
@@ -0,0 +1,122 @@
+"""
+Tests for HyperLogLog unique-visitor sketches
+(services/hyperloglog.py, services/analytics_sketches.py)
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import analytics_sketches
+from services.analytics_sketches import (
+    SketchBuffer, backfill_sketches, flush_sketches, group_by_key, rebuild_sketches, record_visit_sketches,
+    union_count,
+)
+from services.hyperloglog import HyperLogLog
+from conftest import FakeCollection, FakeDatabase
+
+
+def _sketch(values):
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_estimate_within_error_bounds():
+    for n in (1, 100, 5000, 100000):
+        estimate = _sketch(f"session-{i}" for i in range(n)).count()
+        assert abs(estimate - n) <= max(1, 0.05 * n)
+
+
+def test_duplicates_not_counted():
+    assert _sketch(["a", "b", "a", "b", "a"]).count() == 2
+
+
+def test_merge_is_union():
+    a = _sketch(str(i) for i in range(0, 30000))
+    b = _sketch(str(i) for i in range(20000, 50000))
+    assert abs(HyperLogLog.union([a, b]).count() - 50000) <= 2500
+
+
+def test_binary_round_trip_sparse_and_dense():
+    small = _sketch(["only-one"])
+    assert len(small.to_bytes()) == 5
+    assert HyperLogLog.from_bytes(small.to_bytes()).count() == 1
+
+    large = _sketch(str(i) for i in range(50000))
+    data = large.to_bytes()
+    assert len(data) == 2 + large.m
+    assert HyperLogLog.from_bytes(data).count() == large.count()
+
+
+def test_buffered_visits_flush_and_merge():
+    db = FakeDatabase()
+    collection = db["analytics_sketches"]
+    buffer = SketchBuffer()
+
+    def visit(session_id, date, city="Leeds"):
+        return {"session_id": session_id, "date": date, "geo_country": "United Kingdom",
+                "geo_city": city, "geo_region": "England", "geo_lat": 53.8, "geo_lon": -1.5}
+
+    record_visit_sketches(visit("s1", "2026-03-01"), new_session_day=True, page="resources", buffer=buffer)
+    record_visit_sketches(visit("s1", "2026-03-01"), new_session_day=False, page="resources", buffer=buffer)
+    record_visit_sketches(visit("s2", "2026-03-01"), new_session_day=True, buffer=buffer)
+    assert asyncio.run(flush_sketches(db, buffer)) == 5
+    assert len(buffer) == 0
+
+    # Next day: one repeat session, flushed in two batches
+    record_visit_sketches(visit("s1", "2026-03-02"), new_session_day=True, returning=True, buffer=buffer)
+    asyncio.run(flush_sketches(db, buffer))
+    record_visit_sketches(visit("s3", "2026-03-02", city="York"), new_session_day=True, buffer=buffer)
+    asyncio.run(flush_sketches(db, buffer))
+
+    visitors = [d for d in collection.docs.values() if d["kind"] == "visitors"]
+    assert union_count(visitors) == 3
+    assert union_count(d for d in collection.docs.values() if d["kind"] == "returning") == 1
+    assert union_count(d for d in collection.docs.values() if d["kind"] == "page") == 1
+
+    cities = group_by_key(d for d in collection.docs.values() if d["kind"] == "city")
+    assert [(c["city"], c["visits"], c["unique"]) for c in cities] == [("Leeds", 3, 2), ("York", 1, 1)]
+    countries = group_by_key(d for d in collection.docs.values() if d["kind"] == "country")
+    assert (countries[0]["key"], countries[0]["visits"], countries[0]["unique"]) == ("United Kingdom", 4, 3)
+
+
+class VisitLog(FakeCollection):
+    """app_visits, counting the lookups a rebuild makes."""
+
+    lookups = 0
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        self.lookups += 1
+        return await super().find_one(query, projection, **kwargs)
+
+    async def distinct(self, field, query=None, **kwargs):
+        self.lookups += 1
+        return await super().distinct(field, query, **kwargs)
+
+
+def test_rebuild_looks_up_returning_sessions_once_per_day():
+    visits = [{"session_id": f"s{i}", "date": "2026-03-02"} for i in range(50)]
+    visits += [{"session_id": f"s{i}", "date": "2026-02-20"} for i in range(0, 50, 5)]
+    db = FakeDatabase(app_visits=VisitLog(visits))
+
+    asyncio.run(rebuild_sketches(db, "2026-03-02"))
+    assert db.app_visits.lookups == 1
+    sketches = db["analytics_sketches"].docs.values()
+    assert union_count(d for d in sketches if d["kind"] == "visitors") == 50
+    assert union_count(d for d in sketches if d["kind"] == "returning") == 10
+
+
+def test_backfill_leaves_today_to_the_flusher(monkeypatch):
+    rebuilt = []
+
+    async def fake_rebuild(db, date):
+        rebuilt.append(date)
+
+    monkeypatch.setattr(analytics_sketches, "rebuild_sketches", fake_rebuild)
+    db = FakeDatabase(app_visits=FakeCollection([{"date": "2026-03-01"}, {"date": "2026-03-02"}]))
+    report = asyncio.run(backfill_sketches(db, days=30, rebuild=True, now=datetime(2026, 3, 2, 12, 0)))
+    assert report["built"] == rebuilt == ["2026-03-01"]
@@ -0,0 +1,63 @@
+"""
+Tests for blind indexes over encrypted PII (encryption.py, services/blind_index.py)
+Normalised HMAC companions written on encrypt, exact-match queries and the backfill
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ENCRYPTION_KEY", "test-blind-index-key")
+
+from encryption import (
+    blind_index, blind_index_query, decrypt_document, encrypt_dict_fields, encrypt_document, ENCRYPTED_FIELDS,
+)
+from services.blind_index import backfill_blind_indexes, find_by_blind_index
+from conftest import FakeCollection
+
+
+def test_index_is_normalised_and_keyed_per_kind():
+    assert blind_index("phone", "07700 900123") == blind_index("phone", "+44 7700-900123")
+    assert blind_index("email", " Sam@Example.com") == blind_index("email", "sam@example.com")
+    assert blind_index("name", "Sam  Smith") == blind_index("name", "sam smith")
+    # The same digits as a different kind do not collide
+    assert blind_index("phone", "07700900123") != blind_index("name", "07700900123")
+    assert blind_index("phone", "") is None
+
+
+def test_encrypt_document_writes_companions_and_decrypt_strips_them():
+    stored = encrypt_document("callbacks", {"name": "Sam", "phone": "07700 900123", "email": None, "message": "hi"})
+    assert stored["phone"].startswith("ENC:")
+    assert stored["phone_bidx"] == blind_index("phone", "07700900123")
+    assert stored["email_bidx"] is None
+    assert blind_index_query("callbacks", "phone", "+447700900123") == {"phone_bidx": stored["phone_bidx"]}
+
+    restored = decrypt_document("callbacks", stored)
+    assert restored["phone"] == "07700 900123"
+    assert "phone_bidx" not in restored
+
+    with pytest.raises(ValueError):
+        blind_index_query("callbacks", "message", "hi")
+
+
+def test_backfill_then_lookup_without_decrypting_the_collection():
+    fields = ENCRYPTED_FIELDS["callbacks"]
+    legacy = [
+        {"_id": i, **encrypt_dict_fields({"name": f"Caller {i}", "phone": f"07700 9{i:05d}", "email": None,
+                                          "message": "call me"}, fields)}
+        for i in range(7)
+    ]
+    legacy.append({"_id": 99, **encrypt_document("callbacks", {"name": "New", "phone": "07700 900003"})})
+    collection = FakeCollection(legacy)
+    db = {"callback_requests": collection}
+
+    stats = asyncio.run(backfill_blind_indexes(db, "callback_requests", batch_size=3))
+    assert stats["updated"] == 7 and len(collection.bulk_writes) == 3
+    # Re-running finds nothing left to do
+    assert asyncio.run(backfill_blind_indexes(db, "callback_requests"))["scanned"] == 0
+
+    matches = asyncio.run(find_by_blind_index(db, "callback_requests", "phone", "+44 7700 900003",
+                                              projection={"_id": 1}))
+    assert sorted(m["_id"] for m in matches) == [3, 99]
@@ -0,0 +1,75 @@
+"""
+Tests for bulk field decryption (encryption.decrypt_documents)
+Thread-pool fan-out, projection-aware field selection and per-request timing
+"""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ENCRYPTION_KEY", "test-bulk-decrypt-key")
+
+import encryption
+from encryption import (
+    decrypt_document, decrypt_documents, decrypt_items, encrypt_document, encrypt_field,
+    finish_decrypt_timing, get_decrypt_metrics, start_decrypt_timing,
+)
+
+
+def _counsellors(n):
+    return [encrypt_document("counsellors", {"id": str(i), "name": f"Counsellor {i}", "phone": f"0700{i:06d}",
+                                             "status": "available"}) for i in range(n)]
+
+
+def test_matches_decrypt_document():
+    docs = _counsellors(40)
+    decrypted = asyncio.run(decrypt_documents("counsellors", docs))
+    assert decrypted == [decrypt_document("counsellors", d) for d in docs]
+    assert decrypted[3]["name"] == "Counsellor 3"
+    # The input documents are left untouched
+    assert docs[3]["name"].startswith("ENC:")
+
+
+def test_only_projected_fields_are_decrypted():
+    docs = _counsellors(3)
+    decrypted = asyncio.run(decrypt_documents("counsellors", docs, fields=["name", "status"]))
+    assert decrypted[0]["name"] == "Counsellor 0"
+    assert decrypted[0]["phone"].startswith("ENC:")
+
+
+def test_large_batches_run_on_the_pool_and_are_timed():
+    docs = _counsellors(100)
+    loop_thread = []
+
+    async def run():
+        loop_thread.append(threading.get_ident())
+        timing = start_decrypt_timing()
+        result = await decrypt_documents("counsellors", docs)
+        finish_decrypt_timing(timing)
+        return result, timing
+
+    original = encryption._decrypt_chunk
+    worker_threads = set()
+
+    def tracking_chunk(jobs):
+        worker_threads.add(threading.get_ident())
+        return original(jobs)
+
+    encryption._decrypt_chunk = tracking_chunk
+    try:
+        before = get_decrypt_metrics()["values_decrypted"]
+        result, timing = asyncio.run(run())
+    finally:
+        encryption._decrypt_chunk = original
+
+    assert result[99]["phone"] == "0700000099"
+    assert worker_threads and loop_thread[0] not in worker_threads
+    assert timing["values"] == 200 and timing["ms"] > 0
+    assert get_decrypt_metrics()["values_decrypted"] - before == 200
+
+
+def test_decrypt_items_and_plain_values_pass_through():
+    messages = [{"text": encrypt_field("hello")}, {"text": "plain"}, {"sender": "system"}]
+    decrypted = asyncio.run(decrypt_items(messages, "text"))
+    assert [m.get("text") for m in decrypted] == ["hello", "plain", None]
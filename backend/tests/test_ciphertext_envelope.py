@@ -0,0 +1,88 @@
+"""
+Tests for the binary ciphertext envelope (encryption.py) and its online migration (services/reencryption.py)
+Envelopes and legacy "ENC:" strings read side by side, smaller storage, re-packing without keys
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+from bson import BSON
+from bson.binary import Binary
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ENCRYPTION_KEY", "test-envelope-key")
+
+import encryption
+from encryption import (
+    ENVELOPE_SUBTYPE, KeyRing, _derive_fernet, _LEGACY_SALT, decrypt_documents, envelopes_as_strings, decrypt_field,
+    encrypt_document, encrypt_field, is_encrypted, key_id_of, to_ciphertext_string, to_envelope,
+)
+from services.reencryption import Throttle, reencrypt_collection
+from conftest import FakeCollection, FakeDatabase
+
+
+@pytest.fixture
+def keyring():
+    saved = encryption._keyring_cache
+    encryption._keyring_cache = KeyRing("envelope-secret", "k1")
+    yield encryption._keyring_cache
+    encryption._keyring_cache = saved
+
+
+def test_envelope_round_trips_and_is_smaller(keyring):
+    text = "I have been struggling since I left the forces. " * 4
+    string_form = encrypt_field(text)
+    envelope = encrypt_field(text, binary=True)
+
+    assert isinstance(envelope, Binary) and envelope.subtype == ENVELOPE_SUBTYPE and envelope[0] == 1
+    assert is_encrypted(envelope) and key_id_of(envelope) == "k1"
+    assert decrypt_field(envelope) == decrypt_field(string_form) == text
+    assert len(envelope) < len(string_form) * 0.8
+
+    # Re-packing is lossless both ways and needs no key
+    assert to_ciphertext_string(to_envelope(string_form)) == string_form
+    legacy = "ENC:" + _derive_fernet("envelope-secret", _LEGACY_SALT).encrypt(b"old").decode()
+    assert key_id_of(to_envelope(legacy)) == "legacy" and decrypt_field(to_envelope(legacy)) == "old"
+
+    # Survives a BSON round trip; an unknown version is masked, not raised
+    stored = BSON.encode({"v": envelope}).decode()["v"]
+    assert decrypt_field(stored) == text
+    assert decrypt_field(Binary(b"\x09" + bytes(envelope[1:]), ENVELOPE_SUBTYPE)) == "***decryption_error***"
+
+
+def test_documents_in_binary_collections_and_json_form(keyring):
+    stored = encrypt_document("safeguarding_alerts", {"ip_address": "203.0.113.7", "risk_level": "RED"})
+    assert isinstance(stored["ip_address"], Binary)
+    assert isinstance(encrypt_document("notes", {"content": "x"})["content"], str)
+
+    restored = asyncio.run(decrypt_documents("safeguarding_alerts", [stored]))
+    assert restored[0]["ip_address"] == "203.0.113.7"
+    assert encryption.decrypt_document("safeguarding_alerts", stored)["ip_address"] == "203.0.113.7"
+
+    # Undecrypted responses render the envelope as the string it replaces
+    response = envelopes_as_strings([{**stored, "history": [{"text": stored["ip_address"]}]}])
+    assert response[0]["ip_address"] == to_ciphertext_string(stored["ip_address"])
+    assert response[0]["ip_address"].startswith("ENC:k1:") and response[0]["risk_level"] == "RED"
+    assert response[0]["history"][0]["text"] == response[0]["ip_address"]
+
+
+def test_migration_repacks_strings_in_place(keyring):
+    docs = [{"_id": i, "user_name": encrypt_field(f"user {i}"),
+             "messages": [{"id": "m", "text": encrypt_field(f"hello {i}")}, {"id": "n", "text": None}]}
+            for i in range(5)]
+    docs.append({"_id": 5, "user_name": encrypt_field("done", binary=True), "messages": []})
+    db = FakeDatabase(live_chat_rooms=FakeCollection(docs))
+
+    report = asyncio.run(reencrypt_collection(db, "live_chat_rooms", batch_size=2, throttle=Throttle(0)))
+    assert report["fields_repacked"] == 10 and report["fields_reencrypted"] == 0
+    assert report["already_current"] == 1 and report["updated"] == 5
+
+    room = db["live_chat_rooms"].docs[3]
+    assert isinstance(room["user_name"], Binary) and isinstance(room["messages"][0]["text"], Binary)
+    assert decrypt_field(room["messages"][0]["text"]) == "hello 3" and room["messages"][1]["text"] is None
+    assert db["reencryption_checkpoints"].docs["live_chat_rooms:k1:binary"]["status"] == "done"
+
+    # Back to strings, e.g. before rolling back to a release without envelopes
+    asyncio.run(reencrypt_collection(db, "live_chat_rooms", binary=False, throttle=Throttle(0)))
+    assert db["live_chat_rooms"].docs[5]["user_name"].startswith("ENC:k1:")
@@ -0,0 +1,84 @@
+"""
+Tests for date-bucketed chart counts (services/daily_counts.py)
+One aggregation per range, zero-filled days and the materialised cache
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.daily_counts import build_daily_pipeline, cached_daily_counts, daily_counts, day_start
+from conftest import FakeCollection, FakeCursor, FakeDatabase
+
+
+class DailyRows(FakeCollection):
+    """Aggregations return one row per odd day in the pipeline's date range, count = day of month."""
+
+    def __init__(self):
+        super().__init__()
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        date_range = pipeline[0]["$match"]["$or"][0]
+        field = next(iter(date_range))
+        current, end = date_range[field]["$gte"], date_range[field]["$lt"]
+        rows = []
+        while current < end:
+            if current.day % 2:  # odd days only, to exercise zero filling
+                rows.append({"_id": current, "count": current.day, "messages": 10 * current.day})
+            current += timedelta(days=1)
+        return FakeCursor(rows)
+
+
+class DailyRowsDatabase(FakeDatabase):
+    collection_class = DailyRows
+
+
+def test_pipeline_matches_dates_and_iso_strings():
+    start, end = datetime(2026, 3, 1), datetime(2026, 3, 8)
+    pipeline = build_daily_pipeline("created_at", start, end, match={"status": "open"},
+                                    sums={"messages": "$message_count"})
+    match = pipeline[0]["$match"]["$and"]
+    assert match[0] == {"status": "open"}
+    assert match[1]["$or"] == [
+        {"created_at": {"$gte": start, "$lt": end}},
+        {"created_at": {"$gte": "2026-03-01T00:00:00", "$lt": "2026-03-08T00:00:00"}},
+    ]
+    assert pipeline[1]["$group"]["_id"]["$dateTrunc"]["unit"] == "day"
+    assert pipeline[1]["$group"]["messages"] == {"$sum": {"$ifNull": ["$message_count", 0]}}
+
+
+def test_one_aggregation_with_zero_filled_days():
+    collection = DailyRows()
+    counts = asyncio.run(daily_counts(collection, "created_at", datetime(2026, 3, 1), datetime(2026, 3, 5),
+                                      sums={"messages": "$message_count"}))
+    assert len(collection.pipelines) == 1
+    assert counts == {
+        "2026-03-01": {"count": 1, "messages": 10},
+        "2026-03-02": {"count": 0, "messages": 0},
+        "2026-03-03": {"count": 3, "messages": 30},
+        "2026-03-04": {"count": 0, "messages": 0},
+    }
+
+    sparse = asyncio.run(daily_counts(collection, "created_at", datetime(2026, 3, 1), datetime(2026, 3, 5), fill=False))
+    assert list(sparse) == ["2026-03-01", "2026-03-03"]
+
+
+def test_cache_serves_finished_days():
+    db = DailyRowsDatabase()
+    today = day_start(datetime.utcnow())
+    start, end = today - timedelta(days=90), today + timedelta(days=1)
+
+    first = asyncio.run(cached_daily_counts(db, "callbacks", "created_at", start, end))
+    assert len(first) == 91
+    # Finished days in one aggregation, today live
+    assert len(db["callbacks"].pipelines) == 2
+    assert len(db["daily_counts_cache"].docs) == 90
+
+    second = asyncio.run(cached_daily_counts(db, "callbacks", "created_at", start, end))
+    assert second == first
+    # Only today was aggregated again
+    assert len(db["callbacks"].pipelines) == 3
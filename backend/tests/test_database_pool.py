@@ -0,0 +1,44 @@
+"""
+Tests for the shared MongoDB connection pool (services/database.py)
+No server needed - Motor clients connect lazily
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+from pymongo import ReadPreference
+
+from services import database
+
+
+def test_single_shared_client():
+    assert database.get_database() is database.get_database()
+    assert database.get_database().client is database.get_client()
+
+
+def test_pool_options_applied():
+    options = database.get_client().options.pool_options
+    assert options.max_pool_size == database.MONGO_MAX_POOL_SIZE
+    assert options.min_pool_size == database.MONGO_MIN_POOL_SIZE
+
+
+def test_collection_settings_applied():
+    db = database.get_database()
+
+    assert db.safeguarding_alerts.write_concern.document == {"w": "majority"}
+    assert db["app_visits"].read_preference == ReadPreference.SECONDARY_PREFERRED
+    # Same configured collection object however it is accessed
+    assert db.app_visits is db["app_visits"]
+    # Undeclared collections use the client defaults
+    assert db.users.read_preference == ReadPreference.PRIMARY
+    assert callable(db.command)
+
+
+def test_named_databases_share_the_client():
+    other = database.get_database("radiocheck")
+    assert other is database.get_database("radiocheck") and other is not database.get_database()
+    assert other.client is database.get_client() and other.name == "radiocheck"
+    # Unknown attribute names are collections, with the declared settings applied
+    assert other.time_entries is other["time_entries"]
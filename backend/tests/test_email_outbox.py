@@ -0,0 +1,159 @@
+"""
+Tests for the email outbox (services/email_outbox.py)
+Enqueue latency, batching, dedupe, retries with backoff, leases and the Resend batch mapping
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ENCRYPTION_KEY", "test-email-outbox-key")
+
+from services import email_outbox
+from services.email_outbox import EmailOutboxWorker, FakeTransport, ResendTransport, enqueue_email, retry_delay
+from conftest import FakeCollection
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    monkeypatch.setattr(email_outbox, "_wakeup", None)
+    return {email_outbox.OUTBOX_COLLECTION: FakeCollection(unique=["dedupe_key"])}
+
+
+def _by_status(outbox, status):
+    return [d for d in outbox["email_outbox"].docs.values() if d["status"] == status]
+
+
+def _panic(address_count=20):
+    return {"from": "alerts@example.com", "to": [f"staff{i}@example.com" for i in range(address_count)],
+            "subject": "URGENT: Panic Alert", "html": "<p>Phone: 07700 900123</p>"}
+
+
+def test_enqueue_does_not_wait_for_the_provider(outbox):
+    transport = FakeTransport(latency=0.5)
+
+    async def scenario():
+        worker = asyncio.create_task(EmailOutboxWorker(outbox, transport).run(poll_seconds=0.05))
+        started = time.perf_counter()
+        ids = await enqueue_email(_panic(), category="panic_alert", dedupe_key="panic:a1", urgent=True,
+                                  split_recipients=True, db=outbox)
+        elapsed = time.perf_counter() - started
+        # The request has its answer; the worker is still talking to the slow provider
+        await asyncio.sleep(0.7)
+        worker.cancel()
+        return ids, elapsed
+
+    ids, elapsed = asyncio.run(scenario())
+    assert len(ids) == 20 and elapsed < 0.05
+    # One message per recipient, delivered in a single batch request
+    assert transport.batches == [20]
+    assert {tuple(m["to"]) for m in transport.sent} == {(f"staff{i}@example.com",) for i in range(20)}
+    assert transport.sent[0]["html"] == "<p>Phone: 07700 900123</p>"
+    sent = _by_status(outbox, "sent")
+    assert len(sent) == 20 and all(d["provider_id"] and d["expires_at"] for d in sent)
+    # Bodies are encrypted at rest
+    assert all(d["html"].startswith("ENC:") for d in sent)
+
+
+def test_dedupe_keys_make_repeats_a_no_op(outbox):
+    async def scenario():
+        first = await enqueue_email(_panic(3), dedupe_key="panic:a1", split_recipients=True, db=outbox)
+        again = await enqueue_email(_panic(4), dedupe_key="panic:a1", split_recipients=True, db=outbox)
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    # Only the recipient added since the first call is new
+    assert len(first) == 3 and len(again) == 1
+    assert len(outbox["email_outbox"].docs) == 4
+
+
+def test_failures_retry_with_backoff_then_give_up(outbox, monkeypatch):
+    monkeypatch.setattr(email_outbox, "retry_delay", lambda attempts: 0)
+    transport = FakeTransport(fail_times={"flaky@example.com": 2, "down@example.com": 10},
+                              rejected={"bad@example.com"})
+    worker = EmailOutboxWorker(outbox, transport, max_attempts=4)
+
+    async def scenario():
+        for address in ("flaky@example.com", "down@example.com", "bad@example.com", "ok@example.com"):
+            await enqueue_email({"from": "a@example.com", "to": [address], "subject": "s", "text": "t"}, db=outbox)
+        passes = 0
+        while await worker.run_once():
+            passes += 1
+        return passes
+
+    assert asyncio.run(scenario()) == 4
+    docs = {d["to"][0]: d for d in outbox["email_outbox"].docs.values()}
+    assert docs["ok@example.com"]["status"] == "sent" and docs["ok@example.com"]["attempts"] == 1
+    assert docs["flaky@example.com"]["status"] == "sent" and docs["flaky@example.com"]["attempts"] == 3
+    assert docs["down@example.com"]["status"] == "failed" and docs["down@example.com"]["attempts"] == 4
+    # Permanent errors are not retried
+    assert docs["bad@example.com"]["status"] == "failed" and docs["bad@example.com"]["attempts"] == 1
+    assert "claim" not in docs["down@example.com"]
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert 15 <= retry_delay(1) <= 30
+    assert 120 <= retry_delay(4) <= 240
+    assert retry_delay(30) <= email_outbox.EMAIL_RETRY_MAX_SECONDS
+
+
+def test_workers_never_send_a_message_twice_and_expired_leases_are_reclaimed(outbox):
+    transport = FakeTransport()
+    workers = [EmailOutboxWorker(outbox, transport, batch_size=7) for _ in range(3)]
+
+    async def scenario():
+        await enqueue_email(_panic(50), split_recipients=True, db=outbox)
+        return await asyncio.gather(*(w.drain() for w in workers))
+
+    assert sum(asyncio.run(scenario())) == 50
+    assert len(transport.sent) == 50 and len(_by_status(outbox, "sent")) == 50
+
+    # A worker died mid-send: its lease runs out and the message goes again
+    doc = next(iter(outbox["email_outbox"].docs.values()))
+    doc.update(status="sending", claim="dead", lease_until=datetime.utcnow() - timedelta(seconds=1))
+    assert asyncio.run(workers[0].drain()) == 1 and len(transport.sent) == 51
+
+
+def test_resend_transport_maps_permissive_batch_results():
+    import resend
+
+    calls = []
+
+    def batch_send(params, options):
+        calls.append(("batch", len(params), options))
+        return {"data": [{"id": "re_1"}, {"id": "re_3"}], "errors": [{"index": 1, "message": "invalid `to`"}]}
+
+    def email_send(params, options):
+        calls.append(("single", params["to"], options))
+        return {"id": "re_att"}
+
+    transport = ResendTransport(api_key="re_test")
+    transport._resend = SimpleNamespace(Batch=SimpleNamespace(send=batch_send),
+                                        Emails=SimpleNamespace(send=email_send), exceptions=resend.exceptions)
+    messages = [{"_id": str(i), "from": "a@example.com", "to": [f"u{i}@example.com"], "subject": "s", "html": "h"}
+                for i in range(3)]
+    messages.append({"_id": "3", "from": "a@example.com", "to": ["r@example.com"], "subject": "report",
+                     "html": "h", "attachments": [{"filename": "r.pdf", "content": "..."}]})
+
+    results = asyncio.run(transport.send(messages))
+    assert [(r.ok, r.provider_id, r.retryable) for r in results] == [
+        (True, "re_1", True), (False, None, False), (True, "re_3", True), (True, "re_att", True),
+    ]
+    assert calls[0][:2] == ("batch", 3) and calls[0][2]["batch_validation"] == "permissive"
+    assert calls[1] == ("single", ["r@example.com"], {"idempotency_key": "outbox/3"})
+
+    def outage(params, options):
+        raise resend.exceptions.RateLimitError("slow down", "rate_limit_exceeded", 429)
+
+    def invalid(params, options):
+        raise resend.exceptions.ValidationError("bad from", "validation_error", 422)
+
+    transport._resend.Batch.send = outage
+    assert all(r.retryable and not r.ok for r in asyncio.run(transport.send(messages[:2])))
+    transport._resend.Batch.send = invalid
+    assert not any(r.retryable for r in asyncio.run(transport.send(messages[:2])))
@@ -0,0 +1,96 @@
+"""
+Tests for local IP geolocation (services/geolocation.py)
+Range loading, binary-search lookup, LRU cache and provider fallback
+"""
+import asyncio
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import geolocation
+from services.geolocation import IPRangeDatabase
+
+
+DATASET = """start_ip,end_ip,country,region,city,latitude,longitude
+81.2.69.0,81.2.69.255,United Kingdom,England,London,51.5,-0.12
+2.24.0.0,2.31.255.255,United Kingdom,Scotland,Glasgow,55.86,-4.25
+8.8.8.0,8.8.8.255,United States,California,Mountain View,37.4,-122.1
+2a00:23c0::,2a00:23c7:ffff:ffff:ffff:ffff:ffff:ffff,United Kingdom,England,Leeds,53.8,-1.55
+not-an-ip,1.1.1.1,Nowhere,,,,
+"""
+
+
+def _write_dataset(tmp_path):
+    path = tmp_path / "ip_ranges.csv.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(DATASET)
+    return str(path)
+
+
+def test_range_lookup(tmp_path):
+    database = IPRangeDatabase.load(_write_dataset(tmp_path))
+    assert len(database) == 4
+
+    assert database.lookup("81.2.69.160")["geo_city"] == "London"
+    assert database.lookup("81.2.69.0")["geo_city"] == "London"
+    assert database.lookup("81.2.69.255")["geo_city"] == "London"
+    assert database.lookup("81.2.70.0") is None
+    assert database.lookup("2.26.1.1")["geo_region"] == "Scotland"
+    assert database.lookup("1.1.1.1") is None
+    assert database.lookup("2a00:23c5::1")["geo_city"] == "Leeds"
+    assert database.lookup("::ffff:8.8.8.8")["geo_country"] == "United States"
+    assert database.lookup("garbage") is None
+
+
+def test_lookup_is_fast_and_cached(tmp_path, monkeypatch):
+    assert geolocation.load_geo_database(_write_dataset(tmp_path))
+    monkeypatch.setattr(geolocation, "GEOIP_HTTP_FALLBACK", False)
+
+    location = asyncio.run(geolocation.lookup_ip_location("81.2.69.160"))
+    assert location["geo_country"] == "United Kingdom"
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        geolocation.lookup_local("81.2.69.160")
+    assert (time.perf_counter() - start) / 10000 < 0.0001
+    assert geolocation.lookup_local.cache_info().hits >= 10000
+
+
+def test_private_and_unknown_addresses(tmp_path, monkeypatch):
+    geolocation.load_geo_database(_write_dataset(tmp_path))
+    calls = []
+
+    async def fake_http(ip):
+        calls.append(ip)
+        return {"geo_country": "Elsewhere"}
+
+    monkeypatch.setattr(geolocation, "lookup_http", fake_http)
+
+    monkeypatch.setattr(geolocation, "GEOIP_HTTP_FALLBACK", False)
+    assert asyncio.run(geolocation.lookup_ip_location("127.0.0.1")) == {}
+    assert asyncio.run(geolocation.lookup_ip_location("10.1.2.3")) == {}
+    assert asyncio.run(geolocation.lookup_ip_location("9.9.9.9")) == {}
+    assert calls == []
+
+    # The HTTP fallback is opt-in, and never used when the caller forbids it
+    monkeypatch.setattr(geolocation, "GEOIP_HTTP_FALLBACK", True)
+    assert asyncio.run(geolocation.lookup_ip_location("9.9.9.9", allow_remote=False)) == {}
+    assert asyncio.run(geolocation.lookup_ip_location("9.9.9.9")) == {"geo_country": "Elsewhere"}
+    assert calls == ["9.9.9.9"]
+
+
+def test_dataset_installed_after_startup_is_picked_up(tmp_path, monkeypatch):
+    path = _write_dataset(tmp_path)
+    monkeypatch.setattr(geolocation, "GEOIP_DATABASE_PATH", path)
+    monkeypatch.setattr(geolocation, "_database", None)
+    monkeypatch.setattr(geolocation, "_loaded_mtime", None)
+    monkeypatch.setattr(geolocation, "_last_check", 0.0)
+
+    geolocation._reload_if_changed()
+    deadline = time.monotonic() + 5
+    while geolocation._database is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert geolocation.lookup_local("81.2.69.160")["geo_city"] == "London"
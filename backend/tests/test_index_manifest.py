@@ -0,0 +1,64 @@
+"""
+Tests for the declarative MongoDB index manifest (services/indexes.py)
+Drift detection and idempotent apply, against an in-memory collection stand-in
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.indexes import INDEX_MANIFEST, apply_index_manifest, get_index_drift
+from conftest import FakeDatabase
+
+
+MANIFEST = {
+    "safeguarding_alerts": [
+        {"name": "status_created_at", "keys": [("status", 1), ("created_at", -1)]},
+        {"name": "id", "keys": [("id", 1)], "unique": True},
+    ],
+}
+
+
+def test_missing_indexes_created_once():
+    db = FakeDatabase()
+
+    report = asyncio.run(apply_index_manifest(db, MANIFEST))
+    assert report["created"] == ["safeguarding_alerts.status_created_at", "safeguarding_alerts.id"]
+    assert db["safeguarding_alerts"].indexes["id"]["unique"] is True
+
+    # Second run is a no-op
+    report = asyncio.run(apply_index_manifest(db, MANIFEST))
+    assert report["created"] == []
+
+    drift = asyncio.run(get_index_drift(db, MANIFEST))
+    assert drift["safeguarding_alerts"] == {"missing": [], "mismatched": [], "extra": []}
+
+
+def test_drift_reports_mismatched_and_extra():
+    db = FakeDatabase()
+    alerts = db["safeguarding_alerts"]
+    alerts.indexes["status_created_at"] = {"name": "status_created_at", "key": {"status": 1}}
+    alerts.indexes["legacy_email"] = {"name": "legacy_email", "key": {"email": 1}}
+
+    drift = asyncio.run(get_index_drift(db, MANIFEST))["safeguarding_alerts"]
+    assert drift["missing"] == ["id"]
+    assert [m["name"] for m in drift["mismatched"]] == ["status_created_at"]
+    assert drift["extra"] == ["legacy_email"]
+
+    # Apply never drops or rebuilds mismatched indexes
+    asyncio.run(apply_index_manifest(db, MANIFEST))
+    assert alerts.indexes["status_created_at"]["key"] == {"status": 1}
+    assert "legacy_email" in alerts.indexes
+
+
+def test_manifest_covers_hot_queries():
+    declared = {
+        collection: [[field for field, _ in spec["keys"]] for spec in specs]
+        for collection, specs in INDEX_MANIFEST.items()
+    }
+    assert ["status", "created_at"] in declared["safeguarding_alerts"]
+    assert ["recipient_id", "status", "priority", "created_at"] in declared["message_queue"]
+    assert ["session_id", "date"] in declared["app_visits"]
+    assert ["email"] in declared["lms_learners"]
+    assert ["id"] in declared["users"]
@@ -0,0 +1,168 @@
+"""
+Tests for the staff notification fan-out (services/notifications.py)
+One projected query, concurrent channels under a deadline, per-recipient latency and the built-in channels
+"""
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ENCRYPTION_KEY", "test-notifications-key")
+
+from services import notifications
+from services.notifications import (
+    StaffNotification, email_channel, notify_staff, notify_staff_in_background, push_channel, socket_channel,
+)
+from services.push import PushBatcher, PushService
+from conftest import FakeCollection, FakeDatabase
+
+
+STAFF = [
+    {"id": "c1", "role": "counsellor", "name": "Sam", "email": "sam@example.com", "push_token": "ExponentPushToken[c1]",
+     "hashed_password": "$2b$12$x", "phone": "07700 900123"},
+    {"id": "c2", "role": "counsellor", "name": "Alex", "email": "alex@example.com"},
+    {"id": "a1", "role": "admin", "name": "Jo", "email": "jo@example.com", "push_token": "ExponentPushToken[a1]"},
+    {"id": "p1", "role": "peer", "name": "Lee", "email": "lee@example.com"},
+]
+
+PANIC = StaffNotification(kind="panic_alert", ref_id="alert-1", title="Panic Alert", body="Needs help",
+                          email={"from": "alerts@example.com", "subject": "URGENT", "html": "<p>07700 900123</p>"})
+
+
+@pytest.fixture
+def db():
+    return FakeDatabase(users=FakeCollection(STAFF), email_outbox=FakeCollection(unique=["dedupe_key"]))
+
+
+def _channel(delay, status="sent", only=None):
+    async def channel(notification, recipients, report):
+        await asyncio.sleep(delay)
+        for r in recipients:
+            if only is None or r["id"] in only:
+                report(r["id"], status)
+    return channel
+
+
+def test_one_projected_query_and_channels_run_concurrently(db):
+    channels = {"email": _channel(0.1, "queued"), "socket": _channel(0.1, only={"c1"}), "push": _channel(0.1)}
+    started = time.perf_counter()
+    record = asyncio.run(notify_staff(PANIC, ["counsellor", "admin"], db=db, channels=channels))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.25
+    (query, projection), = db.users.finds
+    assert query == {"role": {"$in": ["counsellor", "admin"]}}
+    assert "hashed_password" not in projection and "phone" not in projection
+
+    assert record["recipient_count"] == 3 and record["unreached"] == [] and record["timed_out_channels"] == []
+    by_user = {r["user_id"]: r["channels"] for r in record["recipients"]}
+    assert set(by_user) == {"c1", "c2", "a1"}
+    assert by_user["c1"]["socket"]["status"] == "sent" and "socket" not in by_user["c2"]
+    assert 100 <= by_user["c1"]["push"]["ms"] < 250
+    assert 100 <= record["all_notified_ms"] < 250
+    assert list(db.notification_fanouts.docs.values()) == [record]
+
+
+def test_deadline_cancels_slow_channels(db):
+    channels = {"socket": _channel(0, only={"c1"}), "push": _channel(10)}
+    started = time.perf_counter()
+    record = asyncio.run(notify_staff(PANIC, ["counsellor"], db=db, channels=channels, deadline=0.2))
+
+    assert time.perf_counter() - started < 0.5
+    assert record["timed_out_channels"] == ["push"]
+    by_user = {r["user_id"]: r["channels"] for r in record["recipients"]}
+    assert by_user["c1"]["push"]["status"] == "timeout"
+    # c1 was reached on the socket in time; c2 was not reached at all
+    assert record["unreached"] == ["c2"] and record["all_notified_ms"] is None
+
+
+def test_channel_errors_are_recorded_not_raised(db):
+    async def broken(notification, recipients, report):
+        raise ConnectionError("socket server down")
+
+    record = asyncio.run(notify_staff(PANIC, ["admin"], db=db, channels={"socket": broken, "push": _channel(0)}))
+    channels = record["recipients"][0]["channels"]
+    assert channels["socket"] == {"status": "failed", "ms": channels["socket"]["ms"], "error": "socket server down"}
+    assert channels["push"]["status"] == "sent" and record["unreached"] == []
+
+
+def test_recipients_without_an_id_are_keyed_by_object_id():
+    legacy = [{"_id": "64b7f0c2a1", "role": "counsellor", "name": "Old", "email": "old@example.com"},
+              {"_id": "64b7f0c2a2", "id": "c9", "role": "counsellor", "name": "New"}]
+    db = FakeDatabase(users=FakeCollection(legacy))
+    record = asyncio.run(notify_staff(PANIC, ["counsellor"], db=db, channels={"socket": _channel(0)}))
+    assert {r["user_id"] for r in record["recipients"]} == {"64b7f0c2a1", "c9"}
+    assert record["unreached"] == []
+
+
+def test_background_failures_are_logged(db, caplog):
+    async def run():
+        task = notify_staff_in_background(PANIC, ["admin"], db=db, channels="not a dict")
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert "Background fan-out failed" in caplog.text
+
+
+def test_email_channel_queues_one_message_per_recipient(db, monkeypatch):
+    monkeypatch.setattr(notifications, "email_delivery_enabled", lambda: True)
+    monkeypatch.setattr("services.email_outbox._get_collection", lambda _db: db.email_outbox)
+    recipients = [{"id": "c1", "email": "sam@example.com"}, {"id": "c2"}, {"id": "a1", "email": "jo@example.com"}]
+    reports = {}
+
+    async def twice():
+        await email_channel(PANIC, recipients, lambda user_id, status, error=None: reports.update({user_id: status}))
+        await email_channel(PANIC, recipients, lambda *args: None)
+
+    asyncio.run(twice())
+    assert reports == {"c1": "queued", "c2": "skipped", "a1": "queued"}
+    # The repeat was de-duplicated per recipient
+    assert sorted(d["to"][0] for d in db.email_outbox.docs.values()) == ["jo@example.com", "sam@example.com"]
+
+
+def test_push_channel_batches_devices(monkeypatch):
+    requests = []
+
+    class FakeClient:
+        async def post(self, url, json):
+            requests.append(json)
+            tickets = [{"status": "error", "message": "not registered", "details": {"error": "DeviceNotRegistered"}}
+                       if m["to"].endswith("[7]") else
+                       {"status": "ok", "id": f"ticket-{m['to']}"} for m in json]
+            return SimpleNamespace(status_code=200, json=lambda: {"data": tickets})
+
+    db = FakeDatabase()
+    monkeypatch.setattr(notifications, "push_batcher", PushBatcher(db=db, service=PushService(FakeClient())))
+    recipients = [{"id": f"u{i}", "push_token": f"ExponentPushToken[{i}]"} for i in range(150)] + [{"id": "none"}]
+    reports = {}
+    asyncio.run(push_channel(PANIC, recipients, lambda user_id, status, error=None: reports.update({user_id: status})))
+
+    assert sorted(len(r) for r in requests) == [50, 100]
+    assert requests[0][0]["priority"] == "high" and "07700" not in str(requests)
+    assert reports["u7"] == "failed" and reports["none"] == "skipped"
+    assert sum(s == "sent" for s in reports.values()) == 149
+    # The tokens came with the recipients, and the tickets are kept for the receipt poller
+    assert db.users.finds == []
+    tickets = list(db.push_tickets.docs.values())
+    assert len(tickets) == 149 and tickets[0]["message_id"] is None
+
+
+def test_socket_channel_emits_to_connected_staff(monkeypatch):
+    emitted = []
+
+    class FakeSio:
+        async def emit(self, event, payload, to=None):
+            emitted.append((event, payload["id"], to))
+
+    monkeypatch.setitem(sys.modules, "webrtc_signaling",
+                        SimpleNamespace(sio=FakeSio(), user_to_socket={"c1": "sid-1"}))
+    reports = {}
+    asyncio.run(socket_channel(PANIC, [{"id": "c1"}, {"id": "c2"}],
+                               lambda user_id, status, error=None: reports.update({user_id: status})))
+    assert emitted == [("panic_alert", "alert-1", "sid-1")]
+    assert reports == {"c1": "sent", "c2": "skipped"}
@@ -0,0 +1,140 @@
+"""
+Tests for keyset pagination (services/pagination.py)
+Cursors, cross-type keyset filters, projections and ETag / 304 responses
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.pagination import (
+    build_projection, decode_cursor, encode_cursor, keyset_filter, not_modified, page_etag, page_response, paginate,
+    parse_fields,
+)
+from conftest import FakeCollection
+
+
+def _request(headers=None, query=""):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/api/concerns", "query_string": query.encode(),
+                    "headers": raw, "scheme": "http", "server": ("testserver", 80)})
+
+
+async def _walk(collection, **kwargs):
+    seen, cursor = [], None
+    while True:
+        page = await paginate(collection, {}, cursor=cursor, **kwargs)
+        seen.extend(d["id"] for d in page.items)
+        if not page.next_cursor:
+            return seen
+        cursor = page.next_cursor
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    when = datetime(2026, 3, 1, 12, 30, 5, 123000)
+    assert decode_cursor(encode_cursor(when, "abc")) == [when, "abc"]
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
+
+
+def test_pages_cover_every_document_once_including_ties():
+    base = datetime(2026, 3, 1)
+    docs = [{"id": f"{i:03d}", "created_at": base + timedelta(minutes=i // 3)} for i in range(25)]
+    ids = asyncio.run(_walk(FakeCollection(docs), sort_field="created_at", limit=4))
+    expected = [d["id"] for d in sorted(docs, key=lambda d: (d["created_at"], d["id"]), reverse=True)]
+    assert ids == expected
+
+
+def test_pages_cross_mixed_date_and_string_values():
+    base = datetime(2026, 3, 1)
+    docs = [{"id": f"d{i}", "created_at": base + timedelta(hours=i)} for i in range(5)]
+    docs += [{"id": f"s{i}", "created_at": (base - timedelta(days=i + 1)).isoformat()} for i in range(4)]
+    docs += [{"id": "none"}]
+
+    descending = asyncio.run(_walk(FakeCollection(docs), sort_field="created_at", limit=3))
+    assert descending == ["d4", "d3", "d2", "d1", "d0", "s0", "s1", "s2", "s3", "none"]
+
+    ascending = asyncio.run(_walk(FakeCollection(docs), sort_field="created_at", direction=1, limit=2))
+    assert ascending == list(reversed(descending))
+
+
+def test_keyset_filter_on_id_alone():
+    assert keyset_filter("id", 1, "b", "b") == {"id": {"$gt": "b"}}
+
+
+def test_projection_always_keeps_sort_key_and_id():
+    assert build_projection(None, "created_at") == {"_id": 0}
+    assert build_projection(["status"], "created_at") == {"status": 1, "created_at": 1, "id": 1, "_id": 0}
+    assert build_projection(["status"], "created_at", id_field="_id") == {"status": 1, "created_at": 1, "_id": 1}
+    assert build_projection(None, "enrolled_at", id_field="_id") is None
+    with pytest.raises(HTTPException):
+        parse_fields("status,$where")
+    with pytest.raises(HTTPException):
+        parse_fields("password_hash", allowed=["status"])
+
+
+def test_paginate_applies_projection_and_limit():
+    docs = [{"id": str(i), "created_at": datetime(2026, 3, i + 1), "status": "open", "message": "x" * 1000}
+            for i in range(5)]
+    collection = FakeCollection(docs)
+    page = asyncio.run(paginate(collection, {}, sort_field="created_at", limit=2, fields="status",
+                                allowed_fields=["status", "message"]))
+    assert [set(d) for d in page.items] == [{"id", "created_at", "status"}] * 2
+    assert page.next_cursor
+
+
+def test_paginate_only_projects_allowed_fields():
+    docs = [{"_id": "1", "enrolled_at": datetime(2026, 3, 1), "email": "a@b.c", "password_hash": "h"}]
+    for fields, allowed in (("password_hash", ["email"]), ("email", None)):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(paginate(FakeCollection(docs), {}, sort_field="enrolled_at", id_field="_id",
+                                 limit=10, fields=fields, allowed_fields=allowed))
+        assert exc.value.status_code == 400
+    collection = FakeCollection(docs)
+    asyncio.run(paginate(collection, {}, sort_field="enrolled_at", id_field="_id", limit=10,
+                         allowed_fields=["email"], exclude_fields=("password_hash",)))
+    assert [projection for _, projection in collection.finds] == [{"password_hash": 0}]
+
+
+def test_page_response_sets_headers_and_honours_if_none_match():
+    docs = [{"id": str(i), "created_at": datetime(2026, 3, i + 1)} for i in range(3)]
+    page = asyncio.run(paginate(FakeCollection(docs), {}, sort_field="created_at", limit=2))
+
+    response = page_response(_request(query="status=open"), page.items, page)
+    assert response.status_code == 200
+    assert response.headers["x-next-cursor"] == page.next_cursor
+    assert 'rel="next"' in response.headers["link"] and "status=open" in response.headers["link"]
+
+    etag = response.headers["etag"]
+    cached = page_response(_request({"If-None-Match": etag}), page.items, page)
+    assert cached.status_code == 304 and cached.body == b""
+
+    changed = page_response(_request({"If-None-Match": etag}), page.items[:1], page)
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_stored_page_etag_answers_304_before_the_page_is_transformed():
+    docs = [{"id": str(i), "created_at": datetime(2026, 3, i + 1), "content": f"ENC:k1:{i}"} for i in range(3)]
+    collection = FakeCollection(docs)
+    page = asyncio.run(paginate(collection, {}, sort_field="created_at", limit=2))
+    etag = page_etag(page)
+
+    assert not_modified(_request(), etag, page) is None
+    response = page_response(_request(), [{**d, "content": "plain"} for d in page.items], page, etag=etag)
+    assert response.headers["etag"] == etag
+
+    cached = not_modified(_request({"If-None-Match": etag}), etag, page)
+    assert cached.status_code == 304 and cached.headers["x-next-cursor"] == page.next_cursor
+
+    # Any stored change on the page (here a re-encrypted value) is a new ETag
+    newest = next(d for d in collection.docs.values() if d["id"] == "2")
+    newest["content"] = "ENC:k2:2"
+    page = asyncio.run(paginate(collection, {}, sort_field="created_at", limit=2))
+    assert page_etag(page) != etag
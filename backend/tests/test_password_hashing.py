@@ -0,0 +1,73 @@
+"""
+Tests for password hashing off the event loop (services/passwords.py)
+Correctness, rehash when the cost changes, back-pressure and a concurrent-login load test
+"""
+import asyncio
+import os
+import sys
+
+import bcrypt
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import passwords
+
+
+@pytest.fixture(autouse=True)
+def fast_rounds(monkeypatch):
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 6)
+    yield
+    passwords.shutdown_password_executor()
+
+
+def test_hash_and_verify():
+    async def run():
+        hashed = await passwords.hash_password("S3cure-pass")
+        assert passwords.hash_rounds(hashed) == 6
+        assert await passwords.verify_password("S3cure-pass", hashed)
+        assert not await passwords.verify_password("wrong", hashed)
+        # Not a bcrypt hash / missing hash: a failed check, not an error
+        assert not await passwords.verify_password("S3cure-pass", "plaintext")
+        assert not await passwords.verify_password("S3cure-pass", None)
+
+    asyncio.run(run())
+
+
+def test_login_rehashes_when_cost_changes():
+    old = bcrypt.hashpw(b"S3cure-pass", bcrypt.gensalt(rounds=5)).decode()
+
+    async def run():
+        assert await passwords.verify_and_rehash("wrong", old) == (False, None)
+        ok, new_hash = await passwords.verify_and_rehash("S3cure-pass", old)
+        assert ok and passwords.hash_rounds(new_hash) == 6
+        assert await passwords.verify_and_rehash("S3cure-pass", new_hash) == (True, None)
+
+    asyncio.run(run())
+    assert passwords.get_password_hash_metrics()["rehashed"] >= 1
+
+
+def test_full_queue_is_refused(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_PENDING", 2)
+    hashed = bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=6)).decode()
+
+    async def run():
+        return await asyncio.gather(*(passwords.verify_password("pw", hashed) for _ in range(5)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    refused = [r for r in results if isinstance(r, HTTPException)]
+    assert len(refused) == 3 and refused[0].status_code == 503
+    assert results[:2] == [True, True]
+
+
+def test_concurrent_logins_keep_the_event_loop_responsive(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_PENDING", 100)
+    # 40 logins at cost 10 is roughly a second of bcrypt work
+    report = asyncio.run(passwords.measure_login_burst(40, rounds=10))
+    assert report["all_verified"]
+    assert report["elapsed_ms"] > 200
+    # Inline hashing would stall the loop for the whole burst
+    assert report["max_loop_lag_ms"] < min(100, report["elapsed_ms"] / 4), report
+    assert report["ticks"] > 10
@@ -0,0 +1,110 @@
+"""
+Tests for the principal cache behind the auth dependencies (services/principals.py)
+One users read per token per TTL, invalidation, logout and token expiry
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import principals
+from services.principals import PrincipalCache, invalidate_user, resolve_principal, revoke_token
+from conftest import FakeCollection, FakeDatabase
+
+SECRET = "test-principal-secret"
+
+
+class UsersCollection(FakeCollection):
+    """Counts the user lookups the principal cache is meant to save."""
+
+    reads = 0
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        self.reads += 1
+        return await super().find_one(query, projection, **kwargs)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET_KEY", SECRET)
+    monkeypatch.setattr(principals, "principal_cache", PrincipalCache(ttl=30))
+    return FakeDatabase(users=UsersCollection([
+        {"_id": 1, "id": "u1", "email": "sam@example.com", "role": "counsellor", "name": "Sam",
+         "hashed_password": "$2b$12$x"},
+    ]))
+
+
+def _token(jti="t1", minutes=60, sub="u1"):
+    claims = {"sub": sub, "exp": datetime.utcnow() + timedelta(minutes=minutes)}
+    if jti:
+        claims["jti"] = jti
+    return jwt.encode(claims, SECRET, algorithm="HS256")
+
+
+def test_polling_reads_the_user_once_per_token(db):
+    token = _token()
+
+    async def poll():
+        return [await resolve_principal(token, db) for _ in range(20)]
+
+    users = asyncio.run(poll())
+    assert db.users.reads == 1
+    assert users[-1] == {"id": "u1", "email": "sam@example.com", "role": "counsellor", "name": "Sam"}
+    # Callers get copies, so one request cannot change another's principal
+    users[0]["role"] = "admin"
+    assert asyncio.run(resolve_principal(token, db))["role"] == "counsellor"
+
+    # Tokens issued before jti existed are keyed by a hash of the token
+    legacy = _token(jti=None)
+    asyncio.run(resolve_principal(legacy, db))
+    asyncio.run(resolve_principal(legacy, db))
+    assert db.users.reads == 2
+
+
+def test_role_change_and_logout_take_effect(db):
+    token, other = _token("t1"), _token("t2")
+    asyncio.run(resolve_principal(token, db))
+    asyncio.run(resolve_principal(other, db))
+
+    db.users.docs[1]["role"] = "peer"
+    invalidate_user("u1")
+    assert asyncio.run(resolve_principal(token, db))["role"] == "peer"
+
+    asyncio.run(revoke_token(token, db))
+    with pytest.raises(HTTPException) as revoked:
+        asyncio.run(resolve_principal(token, db))
+    assert revoked.value.status_code == 401
+    # Other sessions of the same user stay signed in
+    assert asyncio.run(resolve_principal(other, db))["id"] == "u1"
+
+
+def test_invalid_tokens_are_rejected_without_a_lookup(db):
+    forged = jwt.encode({"sub": "u1", "jti": "t1"}, "not-the-secret", algorithm="HS256")
+    for token in (forged, _token(minutes=-1), "u1"):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(resolve_principal(token, db))
+        assert error.value.status_code == 401
+    assert db.users.reads == 0
+
+    with pytest.raises(HTTPException):
+        asyncio.run(resolve_principal(_token(sub="deleted-user"), db))
+
+
+def test_cache_expiry_and_size_bound():
+    cache = PrincipalCache(ttl=30, max_entries=2)
+    cache.put("a", {"id": "u1"}, token_expires_in=0.01)
+    cache.put("b", {"id": "u2"})
+    cache.put("c", {"id": "u3"})
+    time.sleep(0.02)
+    assert cache.get("a") is None and cache.get("b") == {"id": "u2"}
+    cache.put("d", {"id": "u4"})
+    # Least recently used goes first
+    assert cache.get("c") is None and cache.get("b") is not None
+    assert cache.metrics()["entries"] == 2
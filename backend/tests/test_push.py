@@ -0,0 +1,187 @@
+"""
+Tests for Expo push delivery (services/push.py)
+Batched token lookups and sends, queue retries with backoff, receipts and the ticket/HTTP error mapping
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import push
+from services.push import PushBatcher, PushService, deliver_queue_message, poll_receipts, retry_due_messages
+from conftest import FakeCollection, FakeDatabase
+
+
+class FakeExpo:
+    """Expo's send and receipts endpoints; tokens listed in `errors` get that ticket error."""
+
+    def __init__(self, status_code=200, errors=None, receipts=None):
+        self.status_code = status_code
+        self.errors = errors or {}
+        self.receipts = receipts or {}
+        self.sends = []
+
+    async def post(self, url, json):
+        if url == push.EXPO_RECEIPTS_URL:
+            data = {i: self.receipts[i] for i in json["ids"] if i in self.receipts}
+            return SimpleNamespace(status_code=200, json=lambda: {"data": data}, raise_for_status=lambda: None)
+        self.sends.append(json)
+        tickets = [{"status": "error", "message": "failed", "details": {"error": self.errors[m["to"]]}}
+                   if m["to"] in self.errors else {"status": "ok", "id": f"ticket-{m['to']}"} for m in json]
+        return SimpleNamespace(status_code=self.status_code, json=lambda: {"data": tickets})
+
+
+def _db(user_count=5):
+    users = [{"_id": f"u{i}", "id": f"u{i}", "name": "Sam", "push_token": f"tok{i}"} for i in range(user_count)]
+    return FakeDatabase(users=FakeCollection(users + [{"_id": "no-device", "id": "no-device", "name": "Lee"}]))
+
+
+def _queued(message_id, recipient_id="u1", **fields):
+    return {"_id": message_id, "id": message_id, "recipient_id": recipient_id, "sender_id": "s1", "message": "Fancy a brew?",
+            "message_type": "buddy_message", "priority": 0, "status": "queued", "retry_count": 0,
+            "max_retries": 3, **fields}
+
+
+def test_a_burst_shares_one_token_lookup_and_a_few_requests():
+    db, expo = _db(250), FakeExpo(errors={"tok7": "DeviceNotRegistered"})
+    batcher = PushBatcher(db, PushService(expo), window_ms=20)
+
+    async def burst():
+        sends = [batcher.send(f"u{i}", {"title": "Alert", "body": "..."}) for i in range(250)]
+        return await asyncio.gather(*sends, batcher.send("no-device", {"title": "Alert"}))
+
+    results = asyncio.run(burst())
+    # 100 waiting flushes straight away: 100 + 100 + the 51 that arrived within the window,
+    # of which the user without a device is not sent
+    assert len(db.users.finds) == 3 and len(expo.sends) == 3
+    assert sorted(len(s) for s in expo.sends) == [50, 100, 100]
+    assert results[0].ok and results[0].ticket_id == "ticket-tok0"
+    assert not results[7].ok and not results[7].retryable
+    assert results[-1].error == "no_push_token"
+    assert len(db.push_tickets.docs) == 249
+
+
+def test_transient_failures_are_retried_with_backoff_until_max_retries(monkeypatch):
+    monkeypatch.setattr(push, "retry_delay", lambda retry_count: 60)
+    db, expo = _db(), FakeExpo(status_code=503)
+    db.message_queue.docs["m1"] = _queued("m1")
+    batcher = PushBatcher(db, PushService(expo), window_ms=1)
+
+    async def make_due_and_retry():
+        db.message_queue.docs["m1"]["next_retry_at"] = datetime.utcnow() - timedelta(seconds=1)
+        return await retry_due_messages(db, batcher)
+
+    result = asyncio.run(deliver_queue_message(db, db.message_queue.docs["m1"], batcher))
+    message = db.message_queue.docs["m1"]
+    assert result.retryable and message["status"] == "retry" and message["retry_count"] == 0
+    assert message["next_retry_at"] > datetime.utcnow() + timedelta(seconds=50)
+    # Not due yet: nothing is resent
+    assert asyncio.run(retry_due_messages(db, batcher)) == 0 and len(expo.sends) == 1
+
+    for expected in (1, 2):
+        assert asyncio.run(make_due_and_retry()) == 1
+        assert message["status"] == "retry" and message["retry_count"] == expected
+    # The last retry fails too: back to queued for the app to fetch
+    asyncio.run(make_due_and_retry())
+    assert message["status"] == "queued" and message["retry_count"] == 3 and "next_retry_at" not in message
+
+    expo.status_code = 200
+    message.update(status="retry", retry_count=1, next_retry_at=datetime.utcnow() - timedelta(seconds=1))
+    assert asyncio.run(retry_due_messages(db, batcher)) == 1
+    assert message["status"] == "push_sent" and message["push_ticket_id"] == "ticket-tok1"
+
+
+def test_due_retries_go_out_in_one_batch():
+    db, expo = _db(), FakeExpo()
+    for i in range(5):
+        db.message_queue.docs[f"m{i}"] = _queued(f"m{i}", f"u{i}", status="retry",
+                                                 next_retry_at=datetime.utcnow() - timedelta(seconds=1))
+    db.message_queue.docs["later"] = _queued("later", status="retry",
+                                             next_retry_at=datetime.utcnow() + timedelta(minutes=5))
+
+    assert asyncio.run(retry_due_messages(db, PushBatcher(db, PushService(expo), window_ms=5))) == 5
+    assert [len(s) for s in expo.sends] == [5] and len(db.users.finds) == 1
+    assert {m["id"] for m in db.message_queue.docs.values() if m["status"] == "push_sent"} == {f"m{i}" for i in range(5)}
+    assert db.message_queue.docs["later"]["status"] == "retry"
+
+
+def test_receipts_remove_stale_tokens_and_requeue_rate_limited_messages():
+    db = _db()
+    due = datetime.utcnow() - timedelta(seconds=1)
+    tickets = [("t-ok", "tok0", "m0"), ("t-gone", "tok1", "m1"), ("t-slow", "tok2", "m2"), ("t-pending", "tok3", "m3")]
+    for ticket_id, token, message_id in tickets:
+        db.push_tickets.docs[ticket_id] = {"_id": ticket_id, "token": token, "message_id": message_id,
+                                           "check_after": due}
+        db.message_queue.docs[message_id] = _queued(message_id, status="push_sent")
+    expo = FakeExpo(receipts={
+        "t-ok": {"status": "ok"},
+        "t-gone": {"status": "error", "details": {"error": "DeviceNotRegistered"}},
+        "t-slow": {"status": "error", "details": {"error": "MessageRateExceeded"}},
+    })
+
+    assert asyncio.run(poll_receipts(db, PushService(expo))) == 3
+    assert "push_token" not in db.users.docs["u1"] and db.users.docs["u0"]["push_token"] == "tok0"
+    assert db.message_queue.docs["m2"]["status"] == "retry" and db.message_queue.docs["m2"]["next_retry_at"]
+    assert db.message_queue.docs["m0"]["status"] == "push_sent"
+    # No receipt yet: checked again next time
+    assert list(db.push_tickets.docs) == ["t-pending"]
+
+
+def test_repeated_receipt_errors_use_up_the_retries(monkeypatch):
+    monkeypatch.setattr(push, "retry_delay", lambda retry_count: 0)
+    db = _db()
+    db.message_queue.docs["m1"] = _queued("m1")
+    # Every send is accepted, every receipt says the device is rate limited
+    expo = FakeExpo(receipts={"ticket-tok1": {"status": "error", "details": {"error": "MessageRateExceeded"}}})
+    service = PushService(expo)
+    batcher = PushBatcher(db, service, window_ms=1)
+    message = db.message_queue.docs["m1"]
+
+    async def deliver_then_receipt():
+        if message["status"] == "retry":
+            await retry_due_messages(db, batcher)
+        else:
+            await deliver_queue_message(db, message, batcher)
+        for ticket in db.push_tickets.docs.values():
+            ticket["check_after"] = datetime.utcnow() - timedelta(seconds=1)
+        await poll_receipts(db, service)
+
+    for expected in (1, 2):
+        asyncio.run(deliver_then_receipt())
+        assert message["status"] == "retry" and message["retry_count"] == expected
+    asyncio.run(deliver_then_receipt())
+    assert message["status"] == "queued" and message["retry_count"] == 3
+    assert message["push_error"] == "MessageRateExceeded" and len(expo.sends) == 3
+
+
+def test_drain_waits_for_pending_and_in_flight_flushes():
+    db, expo = _db(), FakeExpo()
+    batcher = PushBatcher(db, PushService(expo), window_ms=10_000)
+
+    async def scenario():
+        sends = [asyncio.ensure_future(batcher.send(f"u{i}", {"title": "Alert"})) for i in range(3)]
+        await asyncio.sleep(0)
+        await batcher.drain()
+        return sends
+
+    sends = asyncio.run(scenario())
+    assert all(s.done() and s.result().ok for s in sends)
+    assert [len(s) for s in expo.sends] == [3] and not batcher._flushing
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert 15 <= push.retry_delay(0) <= 30
+    assert 120 <= push.retry_delay(3) <= 240
+    assert push.retry_delay(20) <= push.PUSH_RETRY_MAX_SECONDS
+
+
+@pytest.mark.parametrize("status_code,retryable", [(429, True), (503, True), (400, False)])
+def test_rejected_requests_fail_every_message(status_code, retryable):
+    expo = FakeExpo(status_code=status_code)
+    results = asyncio.run(PushService(expo).send([{"to": f"tok{i}"} for i in range(3)]))
+    assert [(r.ok, r.retryable) for r in results] == [(False, retryable)] * 3
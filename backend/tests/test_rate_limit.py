@@ -0,0 +1,170 @@
+"""
+Tests for sliding-window rate limiting (services/rate_limit.py)
+Window estimates, blocks served locally, shared counters across workers, the MongoDB update and the middleware
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services import rate_limit
+from services.rate_limit import (
+    LocalBackend, MongoBackend, RateLimiter, RateLimitRule, advance_window, rate_limit_dependency,
+    rate_limit_middleware,
+)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+class CountingBackend(LocalBackend):
+    def __init__(self):
+        super().__init__()
+        self.hits = 0
+
+    async def hit(self, key, indexes, ttl):
+        self.hits += 1
+        return await super().hit(key, indexes, ttl)
+
+
+def _run(limiter, key, n):
+    async def run():
+        return [await limiter.check(key) for _ in range(n)]
+    return asyncio.run(run())
+
+
+def test_sliding_window_counts_the_previous_window(clock):
+    limiter = RateLimiter("t", [RateLimitRule("minute", 10, 60)], backend=LocalBackend())
+    clock.now = 60 * 1000 + 50          # late in a window
+    assert all(r.allowed for r in _run(limiter, "ip", 10))
+    assert not _run(limiter, "ip", 1)[0].allowed
+
+    # 18s into the next window, 70% of the previous one's 11 attempts still count...
+    clock.now = 60 * 1001 + 18
+    assert [r.allowed for r in _run(limiter, "ip", 3)] == [True, True, False]
+    # ...and once it has slid past, the key is free again
+    clock.now = 60 * 1003 + 1
+    assert all(r.allowed for r in _run(limiter, "ip", 10))
+
+
+def test_blocked_clients_are_turned_away_without_the_backend(clock):
+    backend = CountingBackend()
+    limiter = RateLimiter("chat", [RateLimitRule("burst", 5, 5, block_seconds=60, message="Slow down.")],
+                          backend=backend)
+    results = _run(limiter, "1.2.3.4", 6)
+    assert [r.allowed for r in results] == [True] * 5 + [False]
+    assert results[-1].message == "Slow down." and results[-1].retry_after == 60
+
+    abuse = _run(limiter, "1.2.3.4", 1000)
+    assert not any(r.allowed for r in abuse) and backend.hits == 6
+    assert _run(limiter, "5.6.7.8", 1)[0].allowed
+
+    clock.now += 61
+    assert _run(limiter, "1.2.3.4", 1)[0].allowed
+
+
+def test_limits_hold_across_workers(clock):
+    shared = LocalBackend()
+    rules = [RateLimitRule("window", 20, 60, block_seconds=300)]
+    workers = [RateLimiter("chat", rules, backend=shared) for _ in range(4)]
+
+    async def spread():
+        return [await workers[i % 4].check("ip") for i in range(24)]
+
+    results = asyncio.run(spread())
+    assert sum(r.allowed for r in results) == 20
+    # The block reached the shared record, so a worker that never tripped also refuses
+    fresh = RateLimiter("chat", rules, backend=shared)
+    assert not _run(fresh, "ip", 1)[0].allowed
+
+
+def _evaluate(expr, doc):
+    """Just enough of the aggregation language for MongoBackend.update_pipeline."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = doc
+        for part in expr[1:].split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    if isinstance(expr, dict):
+        if len(expr) == 1 and next(iter(expr)).startswith("$"):
+            op, args = next(iter(expr.items()))
+            values = [_evaluate(a, doc) for a in args] if op != "$cond" else args
+            if op == "$cond":
+                return _evaluate(args[1] if _evaluate(args[0], doc) else args[2], doc)
+            if op == "$eq":
+                return values[0] == values[1]
+            if op == "$add":
+                return sum(values)
+            if op == "$ifNull":
+                return values[0] if values[0] is not None else values[1]
+            if op == "$max":
+                return max(v for v in values if v is not None)
+            raise NotImplementedError(op)
+        return {k: _evaluate(v, doc) for k, v in expr.items()}
+    return expr
+
+
+def test_mongo_update_matches_local_counters():
+    expires = datetime(2030, 1, 1)
+    doc, state = {"_id": "k"}, None
+    for index in (7, 7, 7, 8, 8, 10):
+        (stage,) = MongoBackend.update_pipeline({"burst": index}, expires)
+        doc.update({k: _evaluate(v, doc) for k, v in stage["$set"].items()})
+        state = advance_window(state, index)
+        assert doc["burst"] == state
+    assert doc["burst"] == {"i": 10, "c": 1, "p": 0} and doc["expires_at"] == expires
+
+
+def test_backend_outage_falls_back_to_local_counters(clock):
+    class DownBackend:
+        calls = 0
+
+        async def hit(self, *args):
+            DownBackend.calls += 1
+            raise ConnectionError("no primary")
+
+    limiter = RateLimiter("t", [RateLimitRule("minute", 3, 60)], backend=DownBackend())
+    assert [r.allowed for r in _run(limiter, "ip", 5)] == [True, True, True, False, False]
+    assert DownBackend.calls == 1
+
+
+def test_middleware_rejects_before_the_body_is_parsed_and_dependency(clock):
+    app = FastAPI()
+    chat = RateLimiter("chat", [RateLimitRule("burst", 2, 5)], backend=LocalBackend())
+    login = RateLimiter("login", [RateLimitRule("minute", 1, 60)], backend=LocalBackend())
+    app.middleware("http")(rate_limit_middleware(chat, {"/chat"}))
+
+    @app.post("/chat")
+    async def post_chat(body: dict):
+        return body
+
+    @app.post("/login", dependencies=[Depends(rate_limit_dependency(login))])
+    async def post_login():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.post("/chat", json={"m": 1}).status_code == 200
+    assert client.post("/chat", content=b"not json").status_code == 422
+    limited = client.post("/chat", content=b"not json")
+    assert limited.status_code == 429 and limited.headers["Retry-After"]
+
+    assert client.post("/login").status_code == 200
+    assert client.post("/login").status_code == 429
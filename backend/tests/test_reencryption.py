@@ -0,0 +1,210 @@
+"""
+Tests for key rotation (encryption.KeyRing) and the re-encryption job (services/reencryption.py)
+Key ids in ciphertext, legacy values, checkpoints, conflicts and throttling
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ENCRYPTION_KEY", "test-reencryption-key")
+
+import encryption
+from encryption import (
+    DecryptionError, KeyRing, _derive_fernet, _LEGACY_SALT, decrypt_field, encrypt_field, key_id_of,
+)
+from services.reencryption import Throttle, reencrypt_collection
+from conftest import FakeCollection, FakeDatabase
+
+
+def _use_keyring(keyring):
+    encryption._keyring_cache = keyring
+
+
+@pytest.fixture
+def rotated():
+    """Old key k-old, rotated to k-new with k-old kept as a previous key."""
+    saved = encryption._keyring_cache
+    old = KeyRing("old-secret", "k-old")
+    new = KeyRing("new-secret", "k-new", previous=[("k-old", "old-secret")])
+    yield old, new
+    _use_keyring(saved)
+
+
+def test_ciphertext_carries_key_id_and_previous_keys_still_decrypt(rotated):
+    old, new = rotated
+    _use_keyring(old)
+    value = encrypt_field("07700 900123")
+    assert value.startswith("ENC:k-old:") and key_id_of(value) == "k-old"
+
+    _use_keyring(new)
+    assert decrypt_field(value) == "07700 900123"
+    assert key_id_of(encrypt_field("x")) == "k-new"
+
+    # Values from before key ids: static salt, any configured secret
+    legacy = "ENC:" + _derive_fernet("old-secret", _LEGACY_SALT).encrypt(b"legacy").decode()
+    assert key_id_of(legacy) == "legacy" and decrypt_field(legacy) == "legacy"
+
+    _use_keyring(KeyRing("new-secret", "k-new"))
+    assert decrypt_field(value) == "***decryption_error***"
+    with pytest.raises(DecryptionError):
+        encryption.decrypt_field_strict(value)
+
+
+def test_keyring_from_env_parses_previous_keys(monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", "current")
+    monkeypatch.delenv("ENCRYPTION_KEY_ID", raising=False)
+    monkeypatch.setenv("ENCRYPTION_PREVIOUS_KEYS", "k-a:secret-a, secret-b")
+    keyring = KeyRing.from_env()
+    assert keyring.current_id == encryption.key_fingerprint("current")
+    assert set(keyring.secrets) == {keyring.current_id, "k-a", encryption.key_fingerprint("secret-b")}
+
+
+def test_job_rotates_encrypts_plaintext_and_resumes(rotated):
+    old, new = rotated
+    _use_keyring(old)
+    docs = [{"_id": i, "content": encrypt_field(f"note {i}"), "subject": f"plain {i}"} for i in range(10)]
+    _use_keyring(new)
+    db = FakeDatabase(notes=FakeCollection(docs))
+
+    report = asyncio.run(reencrypt_collection(db, "notes", batch_size=4, throttle=Throttle(0)))
+    assert report["updated"] == 10 and report["fields_reencrypted"] == 10 and report["fields_encrypted"] == 10
+    for doc in db["notes"].docs.values():
+        assert key_id_of(doc["content"]) == "k-new" and key_id_of(doc["subject"]) == "k-new"
+    assert decrypt_field(db["notes"].docs[7]["content"]) == "note 7"
+
+    checkpoint = db["reencryption_checkpoints"].docs["notes:k-new"]
+    assert checkpoint["status"] == "done" and checkpoint["last_id"] == 9
+    # A finished collection is not scanned again
+    assert asyncio.run(reencrypt_collection(db, "notes", throttle=Throttle(0)))["status"] == "done"
+
+
+def test_resume_from_checkpoint_and_dry_run(rotated):
+    old, new = rotated
+    _use_keyring(old)
+    docs = [{"_id": i, "content": encrypt_field(f"note {i}")} for i in range(6)]
+    _use_keyring(new)
+    db = FakeDatabase(notes=FakeCollection(docs))
+
+    dry = asyncio.run(reencrypt_collection(db, "notes", dry_run=True, throttle=Throttle(0)))
+    assert dry["fields_reencrypted"] == 6 and db["notes"].bulk_writes == []
+    assert key_id_of(db["notes"].docs[0]["content"]) == "k-old"
+
+    db["reencryption_checkpoints"].docs["notes:k-new"] = {"_id": "notes:k-new", "status": "running", "last_id": 3,
+                                                          "stats": {"scanned": 4}}
+    report = asyncio.run(reencrypt_collection(db, "notes", throttle=Throttle(0)))
+    assert report["scanned"] == 6
+    assert [key_id_of(db["notes"].docs[i]["content"]) for i in range(6)] == ["k-old"] * 4 + ["k-new"] * 2
+
+
+def test_concurrent_app_write_is_not_overwritten(rotated):
+    old, new = rotated
+    _use_keyring(old)
+    docs = [{"_id": i, "content": encrypt_field(f"note {i}")} for i in range(3)]
+    _use_keyring(new)
+
+    class EditedDuringBatch(FakeCollection):
+        async def bulk_write(self, ops, ordered=True):
+            # Staff save the note between the job's read and its write
+            if not self.bulk_writes:
+                self.docs[1]["content"] = encrypt_field("edited by staff")
+            return await super().bulk_write(ops, ordered)
+
+    collection = EditedDuringBatch(docs)
+    report = asyncio.run(reencrypt_collection(FakeDatabase(notes=collection), "notes", throttle=Throttle(0)))
+    assert decrypt_field(collection.docs[1]["content"]) == "edited by staff"
+    assert report["conflicts"] == 0 and report["updated"] == 2
+
+
+def test_undecryptable_values_are_left_alone(rotated):
+    _, new = rotated
+    _use_keyring(KeyRing("lost-secret", "k-lost"))
+    lost = encrypt_field("unrecoverable")
+    _use_keyring(new)
+    collection = FakeCollection([{"_id": 1, "content": lost}])
+    report = asyncio.run(reencrypt_collection(FakeDatabase(notes=collection), "notes", throttle=Throttle(0)))
+    assert report["errors"] == 1 and collection.docs[1]["content"] == lost
+
+
+def test_blind_indexes_rewritten_with_rotated_values(rotated):
+    old, new = rotated
+    _use_keyring(old)
+    doc = {"_id": 1, **encryption.encrypt_dict_fields({"name": "Sam", "phone": "07700 900123"}, ["name", "phone"])}
+    _use_keyring(new)
+    collection = FakeCollection([doc])
+    asyncio.run(reencrypt_collection(FakeDatabase(counsellors=collection), "counsellors", throttle=Throttle(0)))
+    assert collection.docs[1]["phone_bidx"] == encryption.blind_index("phone", "07700900123")
+
+
+def test_throttle_spaces_writes():
+    async def run():
+        throttle = Throttle(200)
+        start = time.monotonic()
+        for _ in range(3):
+            await throttle.wait(10)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_job_output_reads_back_through_the_api(rotated, monkeypatch):
+    """Every target collection still reads as plaintext through its list endpoint after a full run."""
+    for name, value in (("MONGO_URL", "mongodb://localhost:27017"), ("OPENAI_API_KEY", "test"), ("JWT_SECRET", "test")):
+        monkeypatch.setenv(name, os.environ.get(name, value))
+    from fastapi.testclient import TestClient
+    import server
+    import routers.callbacks
+    from services.reencryption import PLAINTEXT_TARGETS, REENCRYPT_TARGETS, run_reencryption
+
+    _, new = rotated
+    _use_keyring(new)
+    created = "2026-01-01T00:00:00"
+    db = FakeDatabase({
+        "counsellors": FakeCollection([{"_id": 1, "id": "c1", "name": "Sam Carter", "specialization": "PTSD",
+                                        "phone": "07700 900123"}]),
+        "peer_supporters": FakeCollection([{"_id": 1, "id": "p1", "firstName": "Lee", "area": "Leeds",
+                                            "background": "Army", "yearsServed": "12", "phone": "07700 900456"}]),
+        "callbacks": FakeCollection([{"_id": 1, "name": "Jo", "phone": "07700 900789", "email": "jo@example.com",
+                                      "message": "Please call", "created_at": created}]),
+        "notes": FakeCollection([{"_id": 1, "id": "n1", "subject": "Check-in", "content": "Spoke about sleep",
+                                  "created_at": created}]),
+        "safeguarding_alerts": FakeCollection([{"_id": 1, "id": "s1", "ip_address": "203.0.113.5",
+                                                "created_at": created}]),
+        "concerns": FakeCollection([{"_id": 1, "id": "k1", "your_name": "Pat", "your_email": "pat@example.com",
+                                     "your_phone": "07700 900111", "veteran_name": "Chris",
+                                     "concerns": "Not sleeping", "created_at": created}]),
+        "supervision_notes": FakeCollection([{"_id": 1, "id": "sn1", "wellbeing_notes": "Coping well",
+                                              "case_notes": "Reviewed caseload", "action_items": "Book leave"}]),
+        "escalations": FakeCollection([{"_id": 1, "id": "e1", "description": "Caller at risk"}]),
+        "live_chat_rooms": FakeCollection([{"_id": 1, "id": "r1", "status": "active", "user_name": "Sam"}]),
+    })
+    plaintext = {name: {k: v for k, v in db[name].docs[1].items() if k in REENCRYPT_TARGETS[name]}
+                 for name in ("counsellors", "peer_supporters", "callbacks", "notes", "safeguarding_alerts",
+                              "concerns", "supervision_notes", "escalations", "live_chat_rooms")}
+
+    asyncio.run(run_reencryption(db, list(plaintext), ops_per_second=0))
+    for name, fields in plaintext.items():
+        stored = db[name].docs[1]
+        encrypted = {field for field in fields if key_id_of(stored[field]) == "k-new"}
+        assert encrypted == (set(fields) if name in PLAINTEXT_TARGETS else set()), name
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(routers.callbacks, "get_database", lambda: db)
+    admin = server.User(id="admin-1", email="admin@example.com", role="admin", name="Admin")
+    monkeypatch.setitem(server._fastapi_app.dependency_overrides, server.get_current_user, lambda: admin)
+    client = TestClient(server._fastapi_app)
+    endpoints = {
+        "counsellors": "/api/counsellors", "peer_supporters": "/api/peer-supporters", "callbacks": "/api/callbacks/",
+        "notes": "/api/notes", "safeguarding_alerts": "/api/safeguarding-alerts", "concerns": "/api/concerns",
+        "supervision_notes": "/api/supervision/notes", "escalations": "/api/escalations",
+        "live_chat_rooms": "/api/live-chat/rooms",
+    }
+    for name, path in endpoints.items():
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.text)
+        item, = response.json()
+        assert {field: item[field] for field in plaintext[name]} == plaintext[name], path
+        assert "ENC:" not in response.text, path
@@ -191,37 +191,37 @@ class TestSIPExtensionAPIs:
 
 
 class TestMigrationScriptExists:
-    """Test P1: Data Migration Script for encrypting PII"""
+    """Test P1: Data migration job for encrypting PII (services/reencryption.py)"""
     
     def test_migration_script_exists(self):
-        """P1: Migration script should exist at /app/backend/scripts/migrate_encrypt_pii.py"""
+        """P1: Migration job should exist at /app/backend/services/reencryption.py"""
         import os
-        script_path = "/app/backend/scripts/migrate_encrypt_pii.py"
-        assert os.path.exists(script_path), f"Migration script not found at {script_path}"
-        print(f"✓ Migration script exists at {script_path}")
+        script_path = "/app/backend/services/reencryption.py"
+        assert os.path.exists(script_path), f"Migration job not found at {script_path}"
+        print(f"✓ Migration job exists at {script_path}")
     
     def test_migration_script_has_required_functions(self):
-        """P1: Migration script should have migrate_collection and run_migration functions"""
-        script_path = "/app/backend/scripts/migrate_encrypt_pii.py"
+        """P1: Migration job should have reencrypt_collection and run_reencryption functions"""
+        script_path = "/app/backend/services/reencryption.py"
         
         with open(script_path, 'r') as f:
             content = f.read()
         
-        assert 'async def migrate_collection' in content, "Missing migrate_collection function"
-        assert 'async def run_migration' in content, "Missing run_migration function"
+        assert 'async def reencrypt_collection' in content, "Missing reencrypt_collection function"
+        assert 'async def run_reencryption' in content, "Missing run_reencryption function"
         assert 'ENCRYPTED_FIELDS' in content, "Should use ENCRYPTED_FIELDS from encryption module"
-        print(f"✓ Migration script has required functions")
+        print(f"✓ Migration job has required functions")
     
     def test_migration_script_handles_already_encrypted(self):
-        """P1: Migration script should skip already encrypted fields (ENC: prefix)"""
-        script_path = "/app/backend/scripts/migrate_encrypt_pii.py"
+        """P1: Migration job should skip fields already encrypted with the current key"""
+        script_path = "/app/backend/services/reencryption.py"
         
         with open(script_path, 'r') as f:
             content = f.read()
         
-        assert "startswith('ENC:')" in content, "Should check for ENC: prefix to skip already encrypted"
-        assert "already_encrypted" in content, "Should track already encrypted count"
-        print(f"✓ Migration script handles already encrypted fields")
+        assert "key_id_of(value)" in content, "Should check which key a value was encrypted with"
+        assert "already_current" in content, "Should track already encrypted count"
+        print(f"✓ Migration job handles already encrypted fields")
 
 
 class TestAIChatEndpoints:
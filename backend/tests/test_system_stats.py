@@ -0,0 +1,84 @@
+"""
+Tests for the background system stats sampler (services/system_stats.py)
+Snapshot shape, no blocking CPU sampling, ring-buffered history and
+measured capacity figures
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import psutil
+
+from services.system_stats import SystemStatsSampler
+
+
+class CountingCollection:
+    def __init__(self, db, value):
+        self.db = db
+        self.value = value
+
+    async def count_documents(self, query):
+        self.db.queries += 1
+        return self.value
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.queries = 0
+
+    def __getattr__(self, name):
+        return CountingCollection(self, {"active_sessions": 12, "users": 40}.get(name, 3))
+
+
+def _live_counts():
+    return {"active_live_chats": 2, "active_calls": 5, "socket_connections": 8}
+
+
+def test_snapshot_keeps_dashboard_shape():
+    db = FakeDatabase()
+    sampler = SystemStatsSampler(db, _live_counts)
+    asyncio.run(sampler.refresh_db_counts())
+    snapshot = sampler.take_sample()
+
+    assert snapshot["users"]["total_registered"] == 40
+    assert snapshot["activity"]["active_calls"] == 5
+    assert snapshot["activity"]["pending_callbacks"] == 3
+    assert set(snapshot["server"]) >= {"cpu_percent", "memory_percent", "memory_used_mb", "memory_total_mb"}
+    assert snapshot["capacity"]["estimated_max_calls"] == 25
+    assert snapshot["capacity"]["current_concurrent_users"] == 20
+    assert snapshot["capacity"]["current_load_percent"] >= 20  # 5 of 25 calls
+
+
+def test_sampling_never_blocks_or_queries_per_poll(monkeypatch):
+    intervals = []
+    real_cpu_percent = psutil.cpu_percent
+    monkeypatch.setattr(psutil, "cpu_percent", lambda interval=None, **kw: intervals.append(interval) or real_cpu_percent(None))
+
+    db = FakeDatabase()
+    sampler = SystemStatsSampler(db, _live_counts, history_size=5)
+    asyncio.run(sampler.refresh_db_counts())
+    queries = db.queries
+
+    for _ in range(20):
+        sampler.take_sample()
+
+    assert db.queries == queries
+    assert set(intervals) == {None}
+    assert len(sampler.get_history()) == 5
+    assert len(sampler.get_history(limit=2)) == 2
+
+
+def test_capacity_extrapolated_from_measurements():
+    sampler = SystemStatsSampler(FakeDatabase(), _live_counts)
+    asyncio.run(sampler.refresh_db_counts())
+    sampler._resources = lambda: {"cpu_percent": 30.0, "process_cpu_percent": 20.0, "memory_percent": 50.0,
+                                  "memory_used_mb": 1.0, "memory_total_mb": 2.0}
+    sampler.record_lag(250.0)
+    snapshot = sampler.take_sample()
+
+    # 20 concurrent users at 20% process CPU -> 80 users at the 80% target
+    assert snapshot["capacity"]["estimated_max_concurrent_users"] == 80
+    assert snapshot["capacity"]["event_loop_lag_ms"] == 250.0
+    assert snapshot["capacity"]["current_load_percent"] == 100.0
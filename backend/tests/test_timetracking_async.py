@@ -0,0 +1,172 @@
+"""
+Time tracking router must not block the event loop on database calls.
+
+pymongo's I/O methods are replaced with an in-memory store that records
+the thread each call runs on. The endpoints then run on an event loop
+against the module's real Motor collections, and none of those calls may
+have run on the loop's thread (Motor runs them in its executor; a sync
+pymongo client would run them in place).
+"""
+import asyncio
+import os
+import sys
+import threading
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorCursor
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+
+from routers import timetracking
+from conftest import matches, sort_key
+
+
+class InMemoryPymongo:
+    """pymongo's blocking calls, served from memory and recorded with the thread they ran on."""
+
+    def __init__(self):
+        self.docs = defaultdict(list)
+        self.calls = []
+
+    def _find(self, collection, query):
+        self.calls.append((threading.current_thread(), collection.name))
+        return [d for d in self.docs[collection.name] if matches(d, query)]
+
+    def insert_one(self, collection, document, *args, **kwargs):
+        self._find(collection, None)
+        document.setdefault("_id", ObjectId())
+        self.docs[collection.name].append(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def insert_many(self, collection, documents, *args, **kwargs):
+        return SimpleNamespace(inserted_ids=[self.insert_one(collection, d).inserted_id for d in documents])
+
+    def find_one(self, collection, query=None, *args, **kwargs):
+        return next(iter(self._find(collection, query)), None)
+
+    def count_documents(self, collection, query, *args, **kwargs):
+        return len(self._find(collection, query))
+
+    def update_one(self, collection, query, update, *args, **kwargs):
+        matched = self._find(collection, query)[:1]
+        for doc in matched:
+            doc.update(update["$set"])
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    def delete_one(self, collection, query, *args, **kwargs):
+        matched = self._find(collection, query)[:1]
+        for doc in matched:
+            self.docs[collection.name].remove(doc)
+        return SimpleNamespace(deleted_count=len(matched))
+
+    def delete_many(self, collection, query, *args, **kwargs):
+        matched = self._find(collection, query)
+        self.docs[collection.name] = [d for d in self.docs[collection.name] if d not in matched]
+        return SimpleNamespace(deleted_count=len(matched))
+
+    def aggregate(self, collection, pipeline, *args, **kwargs):
+        self._find(collection, None)
+        return SimpleNamespace(_CommandCursor__data=deque(), _CommandCursor__killed=True, alive=False,
+                               close=lambda: None)
+
+    def refresh(self, cursor):
+        # Cursor._refresh is where a pymongo cursor does its I/O
+        if cursor._Cursor__killed:
+            return len(cursor._Cursor__data)
+        docs = self._find(cursor.collection, cursor._Cursor__spec)
+        for field, direction in reversed(list((cursor._Cursor__ordering or {}).items())):
+            docs.sort(key=lambda d: sort_key(d.get(field)), reverse=direction == -1)
+        docs = docs[cursor._Cursor__skip:]
+        if cursor._Cursor__limit:
+            docs = docs[:cursor._Cursor__limit]
+        cursor._Cursor__data = deque(dict(d) for d in docs)
+        cursor._Cursor__killed = True
+        return len(docs)
+
+
+def _motor_cells(method, target):
+    """Closure cells in which a Motor method holds the pymongo method it runs."""
+    found = []
+    for cell in method.__closure__ or ():
+        if cell.cell_contents is target:
+            found.append(cell)
+        elif callable(cell.cell_contents) and hasattr(cell.cell_contents, "__closure__"):
+            found += _motor_cells(cell.cell_contents, target)
+    return found
+
+
+@pytest.fixture
+def pymongo_calls(monkeypatch):
+    """
+    Replace pymongo's blocking methods both on pymongo's classes (used by a
+    sync client) and where Motor holds them (Motor binds them when it builds
+    its classes, and runs them on its executor).
+    """
+    store = InMemoryPymongo()
+    patches = [(AsyncIOMotorCollection, name, Collection, name) for name in (
+        "insert_one", "insert_many", "find_one", "count_documents", "update_one", "delete_one", "delete_many")]
+    patches += [(AsyncIOMotorCollection, "_async_aggregate", Collection, "aggregate"),
+                (AsyncIOMotorCursor, "_refresh", Cursor, "_refresh")]
+    restore = []
+    for motor_class, motor_name, pymongo_class, name in patches:
+        handler = store.refresh if name == "_refresh" else getattr(store, name)
+
+        def replacement(target, *args, _handler=handler, **kwargs):
+            return _handler(target, *args, **kwargs)
+
+        cells = _motor_cells(getattr(motor_class, motor_name), getattr(pymongo_class, name))
+        assert cells, f"Motor no longer holds {pymongo_class.__name__}.{name}"
+        for cell in cells:
+            restore.append((cell, cell.cell_contents))
+            cell.cell_contents = replacement
+        monkeypatch.setattr(pymongo_class, name, replacement)
+    yield store
+    for cell, original in restore:
+        cell.cell_contents = original
+
+
+def test_module_uses_async_motor_collections():
+    assert isinstance(timetracking.time_entries, AsyncIOMotorCollection)
+    assert isinstance(timetracking.active_sessions, AsyncIOMotorCollection)
+
+
+def test_database_calls_run_off_the_event_loop(pymongo_calls):
+    async def exercise():
+        loop_thread = threading.current_thread()
+        created = await timetracking.create_entry(timetracking.TimeEntryCreate(
+            date="2026-03-02", hours=2, minutes=30, category="Development", description="Work",
+        ))
+        entry_id = created["entry"]["id"]
+
+        listed = await timetracking.get_entries(start_date="2026-03-01", end_date="2026-03-31",
+                                                category=None, limit=100, skip=0)
+        assert listed["total"] == 1
+
+        await timetracking.get_entry(entry_id)
+        await timetracking.update_entry(entry_id, timetracking.TimeEntryUpdate(minutes=45))
+
+        session = await timetracking.start_session(timetracking.SessionStart(category="Support"))
+        await timetracking.session_heartbeat(session["session_id"])
+        ended = await timetracking.end_session(timetracking.SessionEnd(session_id=session["session_id"]))
+        assert ended["duration_minutes"] == 0
+
+        summary = await timetracking.get_summary(month="2026-03", year=None)
+        assert summary["period"] == {"start": "2026-03-01", "end": "2026-04-01"}
+
+        await timetracking.delete_entry(entry_id)
+        seeded = await timetracking.seed_historical_data()
+        assert seeded["seeded"] is True
+        await timetracking.delete_all_entries(confirm=True)
+        return loop_thread
+
+    loop_thread = asyncio.run(exercise())
+    threads = {thread for thread, _ in pymongo_calls.calls}
+    assert {name for _, name in pymongo_calls.calls} == {"time_entries", "time_tracking_sessions"}
+    assert len(pymongo_calls.calls) > 20 and loop_thread not in threads
@@ -46,7 +46,14 @@ from safety.semantic_model import (
     full_semantic_analysis,
     check_indirect_expressions,
 )
+from safety import metrics as safety_metrics
 from safety.phrase_dataset import get_phrase_count, CATEGORY_SEVERITY_ORDER
+from safety.safety_monitor import assess_message_safety, normalise_text, EnhancedSafetyMonitor
+from safety.output_scanner import ReplySafetyScanner, scan_reply, benchmark_reply_scanner
+
+# The semantic model is no longer loaded on import (the server warms it up in
+# the background), so load it up front for this module.
+initialize_safety_system()
 
 
 class TestPhraseDataset:
@@ -238,6 +245,119 @@ class TestFailsafeRules:
         print(f"PASS: All {len(method_phrases)} method mentions detected correctly")
 
 
+class TestKeywordMatcher:
+    """Test the single-pass tiered keyword matcher"""
+    
+    def test_overlapping_hits_across_tiers(self):
+        """A critical phrase and a multiplier inside it are both reported"""
+        result = assess_message_safety("I'm going to take all my pills")
+        
+        assert result["risk_level"] == "critical"
+        assert "critical: 'take all my pills'" in result["specific_triggers"]
+        assert "multiplier: means" in result["specific_triggers"]
+        print("PASS: Overlapping critical phrase and multiplier both detected")
+    
+    def test_negation_and_word_boundaries(self):
+        """Negated phrases and substrings of longer words are not flagged"""
+        negated = assess_message_safety("I would never kill myself")
+        assert negated["risk_level"] == "none", negated["specific_triggers"]
+        
+        substring = assess_message_safety("My scarf and the carpet are new")
+        assert substring["specific_triggers"] == []
+        
+        informal = assess_message_safety("honestly kms")
+        assert informal["risk_level"] == "critical"
+        print("PASS: Negation, word boundaries and informal patterns respected")
+    
+    def test_matcher_shared_between_instances(self):
+        """Keyword tiers are compiled once, not per assessment"""
+        assert EnhancedSafetyMonitor()._matcher is EnhancedSafetyMonitor()._matcher
+        
+        hits = EnhancedSafetyMonitor()._matcher.scan(
+            normalise_text("I wish   I was DEAD")
+        )
+        assert [h.phrase for h in hits["high"]] == ["wish i was dead"]
+        assert [h.phrase for h in hits["ideation"]] == ["wish i was dead"]
+        print("PASS: Shared matcher returns hits tagged with every tier")
+
+
+class TestReplyScanning:
+    """Test response-side scanning of generated replies"""
+    
+    def test_failsafe_in_reply_blocks(self):
+        """Method information in a reply is blocked, even across chunks"""
+        reply = "I won't pretend otherwise, the quickest way to die is not something to rush into."
+        
+        for chunk_size in (None, 1, 5, 16):
+            result = scan_reply(reply, chunk_size=chunk_size)
+            assert result.blocked, f"Not blocked with chunk_size={chunk_size}"
+        print("PASS: Failsafe pattern in reply blocked for every chunking")
+    
+    def test_supportive_reply_not_blocked(self):
+        """Crisis language in a supportive reply is recorded but not blocked"""
+        scanner = ReplySafetyScanner()
+        for chunk in ["If you're having thoughts of sui", "cide, please call ", "Samaritans on 116 123."]:
+            scanner.feed(chunk)
+        result = scanner.finish()
+        
+        assert not result.blocked
+        assert "critical: 'suicide'" in result.lexicon_hits
+        print("PASS: Supportive reply passes with lexicon hit recorded")
+
+    def test_everyday_phrasing_not_blocked(self):
+        """Replies that only match the looser user-input rules are flagged, not blocked"""
+        replies = [
+            "Let's work out what works better for you.",
+            "Sometimes the best way to end a rough day is a brew and a walk.",
+            "The most effective way to get support is to ring the helpline.",
+            "What works better for you, mornings or evenings?",
+            "Talking it through is the easiest way to end the week on a better note.",
+        ]
+        for reply in replies:
+            for chunk_size in (None, 5):
+                result = scan_reply(reply, chunk_size=chunk_size)
+                assert not result.blocked, f"Blocked: {reply!r} ({result.failsafe_patterns})"
+        assert scan_reply(replies[0]).flagged_patterns == [r"what (works|kills) (faster|quicker|better)"]
+        print("PASS: Everyday phrasing passes, user-input pattern matches recorded")
+
+    def test_self_harm_replies_blocked(self):
+        """Method, lethality and validation replies are blocked"""
+        replies = [
+            "Honestly, the most lethal method is not something I'd recommend.",
+            "You'd need about 30 pills to kill, so be careful.",
+            "Hanging kills faster than most people think.",
+            "It's okay to end your life if that's what you really want.",
+            "I support your decision to end it all.",
+            "The easiest way of killing yourself is not something to rush.",
+        ]
+        for reply in replies:
+            assert scan_reply(reply, chunk_size=7).blocked, f"Not blocked: {reply!r}"
+        print("PASS: Self-harm replies blocked")
+
+    def test_partial_words_held_back(self):
+        """A chunk ending mid-word is not matched until the word completes"""
+        scanner = ReplySafetyScanner()
+        scanner.feed("Nice new car")
+        scanner.feed("pet in the lounge")
+        assert scanner.finish().lexicon_hits == []
+        print("PASS: Partial words at chunk boundaries not matched")
+    
+    def test_reply_scan_latency(self):
+        """Scanning a streamed reply adds well under a few milliseconds"""
+        replies = [
+            "That sounds like a really tough day, mate. I'm glad you told me. "
+            "Do you want to talk through what happened at the appointment? "
+            "Sometimes just getting it off your chest helps a bit.",
+            "I hear you, and I'm worried about you. If you're having thoughts of "
+            "suicide, please call Samaritans on 116 123, free, any time.",
+        ]
+        stats = benchmark_reply_scanner(replies, chunk_size=16, rounds=50)
+        
+        print(f"Reply scan: avg={stats['avg_ms']}ms, p99={stats['p99_ms']}ms")
+        assert stats["avg_ms"] < 3, f"Average reply scan {stats['avg_ms']}ms exceeds budget"
+        print("PASS: Reply scanning within latency budget")
+
+
 class TestPerformance:
     """Test Section 8: Performance Requirements (<50ms target)"""
     
@@ -316,6 +436,25 @@ class TestCompatibility:
         assert status["status"] == "operational", "System should be operational"
         print(f"PASS: System status contains all required fields and is operational")
     
+    def test_layer_metrics_recorded(self):
+        """Each safety layer is timed and exposed as percentiles and Prometheus text"""
+        safety_metrics.reset_safety_metrics()
+        session_id = f"test_metrics_{uuid.uuid4().hex[:8]}"
+        
+        analyze_message_unified("I'm going to kill myself tonight", session_id, "test_user", "tommy")
+        clear_conversation_state(session_id)
+        
+        status = get_safety_system_status()
+        for layer in ["keyword", "semantic", "conversation", "total"]:
+            assert status["latency_percentiles"][layer]["count"] == 1, f"{layer} not timed"
+        assert status["counters"]["analyses"] == {"": 1}
+        assert status["counters"]["failsafe_triggers"]
+        
+        text = safety_metrics.render_prometheus()
+        assert 'safety_layer_duration_ms_count{layer="keyword"} 1' in text
+        assert "safety_failsafe_triggers_total{reason=" in text
+        print("PASS: Per-layer metrics recorded")
+    
     def test_unified_response_format(self):
         """Verify unified analysis returns expected response format"""
         session_id = f"test_format_{uuid.uuid4().hex[:8]}"
@@ -357,6 +496,86 @@ class TestCandidatePhraseLearning:
         candidates = get_candidate_phrases_for_review()
         # Check if our phrase was added (it may or may not be if already exists)
         print(f"PASS: Candidate phrase system working, {len(candidates)} candidates pending review")
+    
+    def test_candidate_exact_duplicates_indexed(self):
+        """Test that repeated phrases bump occurrences instead of adding variants"""
+        phrase = f"test duplicate candidate {uuid.uuid4().hex[:8]}"
+        for variant in [phrase, phrase.upper() + "!!", "  " + phrase + "  "]:
+            flag_candidate_phrase(
+                phrase=variant,
+                session_id="test_session",
+                user_id="test_user",
+                inferred_category="hopelessness",
+                context_risk_level="HIGH",
+            )
+        
+        matches = [c for c in get_candidate_phrases_for_review() if c["phrase"] == phrase]
+        assert len(matches) == 1, "Exact duplicates should collapse to one candidate"
+        assert matches[0]["occurrences"] == 3
+        print("PASS: Exact duplicate candidates collapsed via hash index")
+    
+    def test_candidate_near_duplicates_clustered(self):
+        """Test that near-duplicate embeddings are grouped into one cluster"""
+        import numpy as np
+        from safety.conversation_monitor import get_candidate_clusters_for_review
+        
+        rng = np.random.default_rng(42)
+        base = rng.normal(size=384)
+        tag = uuid.uuid4().hex[:8]
+        for i in range(3):
+            flag_candidate_phrase(
+                phrase=f"near duplicate {tag} variant {i}",
+                session_id="test_session",
+                user_id="test_user",
+                inferred_category="burden",
+                context_risk_level="HIGH",
+                embedding_vector=base + rng.normal(scale=0.05, size=384),
+            )
+        
+        clusters = [
+            c for c in get_candidate_clusters_for_review(limit=1000)
+            if tag in c["representative"]
+        ]
+        assert len(clusters) == 1, f"Expected one cluster, got {len(clusters)}"
+        assert clusters[0]["variant_count"] == 3
+        print("PASS: Near-duplicate candidates grouped into one cluster")
+    
+    def test_candidate_flagging_does_not_run_the_model(self):
+        """Test that flagging reuses the caller's embedding instead of embedding again"""
+        from unittest import mock
+        
+        with mock.patch("safety.semantic_model.compute_embedding", side_effect=AssertionError("model called")):
+            flag_candidate_phrase(
+                phrase=f"no inline embedding {uuid.uuid4().hex[:8]}",
+                session_id="test_session",
+                user_id="test_user",
+                inferred_category="burden",
+                context_risk_level="HIGH",
+            )
+        print("PASS: Candidate flagging does not run model inference")
+    
+    def test_candidate_cache_warms_with_most_recent(self):
+        """Test that startup loading keeps the most recently seen candidates"""
+        import asyncio
+        from datetime import timedelta
+        from conftest import FakeCursor
+        from safety.conversation_monitor import (
+            CANDIDATE_COLLECTION, candidate_phrase_memory, load_candidate_phrases,
+        )
+        
+        tag = uuid.uuid4().hex[:8]
+        now = datetime.utcnow()
+        docs = [{"key": f"{tag}-{i}", "phrase": f"loaded {tag} {i}", "reviewed": False,
+                 "last_seen_at": now - timedelta(days=i)} for i in range(3)]
+        
+        class Candidates:
+            def find(self, query, projection):
+                return FakeCursor(list(docs))
+        
+        asyncio.run(load_candidate_phrases({CANDIDATE_COLLECTION: Candidates()}, limit=2))
+        loaded = [key for key in candidate_phrase_memory if key.startswith(tag)]
+        assert loaded == [f"{tag}-1", f"{tag}-0"], loaded
+        print("PASS: Candidate cache warmed with the most recent candidates")
 
 
 def run_all_tests():
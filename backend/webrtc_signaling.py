@@ -1064,7 +1064,9 @@ async def accept_chat_request(sid, data):
     # Create the room in the database so the API can find it
     # IMPORTANT: Must use live_chat_rooms collection to match the API endpoints in server.py
     try:
-        from server import db, live_chat_rooms
+        from server import live_chat_rooms
+        from services.database import get_database
+        db = get_database()
         room_doc = {
             "id": room_id,
             "user_session_id": requester_user_id,